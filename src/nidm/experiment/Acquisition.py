@@ -68,6 +68,9 @@ class Acquisition(pm.ProvActivity, Core):
 
         # list to store acquisition objects associated with this activity
         self._acquisition_objects = []
+        # functions read_nidm(lazy=True) leaves to read the acquisition objects the
+        # first time they are needed
+        self._acquisition_object_loaders = []
         # if constructor is called with a session object then add this acquisition to the session
 
         # add acquisition to session
@@ -80,12 +83,19 @@ class Acquisition(pm.ProvActivity, Core):
         :param acquisition: object of type "AcquisitionObject" from nidm API
 
         """
+        self._load_acquisition_objects()
         # add acquisition object to self._acquisitions list
         self._acquisition_objects.extend([acquisition_object])
         # create links in graph
         self.graph.wasGeneratedBy(acquisition_object, self)
 
+    def _load_acquisition_objects(self):
+        loaders, self._acquisition_object_loaders = self._acquisition_object_loaders, []
+        for loader in loaders:
+            loader()
+
     def get_acquisition_objects(self):
+        self._load_acquisition_objects()
         return self._acquisition_objects
 
     def acquisition_object_exists(self, uuid):
@@ -94,6 +104,7 @@ class Acquisition(pm.ProvActivity, Core):
         :param uuid: full uuid of acquisition
         :return: True if exists, False otherwise
         """
+        self._load_acquisition_objects()
         return bool(uuid in self._acquisition_objects)
 
     def __str__(self):
@@ -1,15 +1,14 @@
 import hashlib
 from os import environ, path
-import pickle
-import tempfile
 from rdflib import Graph
 from nidm.core import Constants
+from nidm.experiment import Cache
 import nidm.experiment.Query
 from nidm.util import urlretrieve
 
 
 def download_cde_files():
-    cde_dir = tempfile.gettempdir()
+    cde_dir = Cache.getCacheDir()
 
     for url in Constants.CDE_FILE_LOCATIONS:
         urlretrieve(url, f"{cde_dir}/{url.split('/')[-1]}")
@@ -25,11 +24,11 @@ def getCDEs(file_list=None):
     hasher.update(str(file_list).encode("utf-8"))
     h = hasher.hexdigest()
 
-    cache_file_name = tempfile.gettempdir() + f"/cde_graph.{h}.pickle"
+    cache_file_name = Cache.cachePath("cde_graph", h, "pickle")
 
-    if path.isfile(cache_file_name):
-        with open(cache_file_name, "rb") as fp:
-            rdf_graph = pickle.load(fp)
+    rdf_graph = Cache.readPickle(cache_file_name)
+    if rdf_graph is not None:
+        Cache.useEntry(cache_file_name, "cde_graph")
         getCDEs.cache = rdf_graph
         return rdf_graph
 
@@ -59,8 +58,8 @@ def getCDEs(file_list=None):
             cde_graph = nidm.experiment.Query.OpenGraph(fname)
             rdf_graph = rdf_graph + cde_graph
 
-    with open(cache_file_name, "wb") as cache_file:
-        pickle.dump(rdf_graph, cache_file)
+    Cache.writePickle(rdf_graph, cache_file_name)
+    Cache.addEntry(cache_file_name, "cde_graph")
 
     getCDEs.cache = rdf_graph
     return rdf_graph
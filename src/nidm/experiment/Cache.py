@@ -0,0 +1,364 @@
+"""On-disk cache of parsed NIDM and CDE graphs.
+
+Everything pynidm caches between runs lives in one directory, NIDM_CACHE_DIR or
+the TMP dir if that isn't set:
+
+- rdf_graph.<digest>.store: binary triple store of one NIDM file (see TripleStore)
+- rdf_union.<digest>.store: binary triple store of several files queried together
+- cde_graph.<digest>.pickle: the CDE graph built by getCDEs
+- model_fit.<digest>.pickle: a regularized model fit by pynidm linear-regression
+- cluster_sweep.<digest>.pickle: cluster number scores of pynidm k-means and gmm
+- synonym_index.<digest>.pickle: DataElement synonym index of a project (see
+  Query.getSynonymIndex)
+- nidm_cache.sqlite: file digests plus hit and miss counts for each kind of entry
+
+Entries are stamped with a format version (stores in their meta.json, pickles in a
+header written ahead of the pickled object) and entries from another version are
+rebuilt rather than loaded.  The modification time of an entry is the time it was
+last used and once the entries take up more than NIDM_CACHE_SIZE (default 4G) the
+least recently used ones are removed.
+
+File digests are remembered with the path, inode, size and modification time of
+the file so unchanged files are never read again just to find their cache entry.
+"""
+
+from collections import namedtuple
+import logging
+import os
+from os import path
+import pickle
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import rdflib
+from nidm import __version__
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = "4G"
+ENTRY_KINDS = (
+    "rdf_graph",
+    "rdf_union",
+    "cde_graph",
+    "model_fit",
+    "cluster_sweep",
+    "synonym_index",
+)
+
+_ENTRY_RE = re.compile(
+    r"^(rdf_graph|rdf_union|cde_graph|model_fit|cluster_sweep|synonym_index)"
+    r"\.[0-9a-f]+\.(store|pickle)$"
+)
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_DB_NAME = "nidm_cache.sqlite"
+
+CacheEntry = namedtuple("CacheEntry", ["path", "kind", "size", "last_used"])
+
+_connections = {}
+
+
+def getCacheDir():
+    """
+    :return: directory cache entries are kept in, NIDM_CACHE_DIR or the TMP dir
+    """
+    cache_dir = os.environ.get("NIDM_CACHE_DIR")
+    if not cache_dir:
+        return tempfile.gettempdir()
+    cache_dir = path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def getCacheSize():
+    """
+    :return: maximum total size of the cache entries in bytes from NIDM_CACHE_SIZE (e.g.
+        500M, 20G), None if it is 0 or unlimited
+    """
+    return parseSize(os.environ.get("NIDM_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+
+
+def parseSize(size):
+    """
+    :param size: number of bytes with an optional K, M, G or T suffix, or "unlimited"
+    :return: size in bytes, None for 0 or unlimited
+    """
+    if str(size).strip().lower() in ("", "none", "unlimited"):
+        return None
+    m = _SIZE_RE.match(str(size))
+    if m is None:
+        raise ValueError(f"Invalid cache size {size!r}")
+    n = int(float(m.group(1)) * 1024 ** "_kmgt".index(m.group(2).lower() or "_"))
+    return n or None
+
+
+def cachePath(kind, key, extension):
+    """
+    :param kind: kind of entry, one of ENTRY_KINDS
+    :param key: hex digest identifying the entry
+    :param extension: store or pickle
+    :return: path of the cache entry
+    """
+    return path.join(getCacheDir(), f"{kind}.{key}.{extension}")
+
+
+def cacheEntries(cache_dir=None):
+    """
+    :param cache_dir: cache directory, getCacheDir() by default
+    :return: list of CacheEntry, least recently used first
+    """
+    cache_dir = cache_dir or getCacheDir()
+    entries = []
+    for name in os.listdir(cache_dir):
+        m = _ENTRY_RE.match(name)
+        if m is None:
+            continue
+        entry_path = path.join(cache_dir, name)
+        try:
+            entries.append(
+                CacheEntry(
+                    entry_path,
+                    m.group(1),
+                    _entrySize(entry_path),
+                    os.stat(entry_path).st_mtime,
+                )
+            )
+        except OSError:
+            # removed by another process while we looked
+            continue
+    return sorted(entries, key=lambda e: e.last_used)
+
+
+def _entrySize(entry_path):
+    if not path.isdir(entry_path):
+        return os.stat(entry_path).st_size
+    return sum(
+        os.stat(path.join(root, f)).st_size
+        for root, _, files in os.walk(entry_path)
+        for f in files
+    )
+
+
+def useEntry(entry_path, kind):
+    """
+    Records a cache hit, marking the entry as the most recently used
+
+    :param entry_path: path of the cache entry
+    :param kind: kind of entry, one of ENTRY_KINDS
+    """
+    try:
+        os.utime(entry_path)
+    except OSError:
+        pass
+    recordLookup(kind, True)
+
+
+def addEntry(entry_path, kind, keep=()):
+    """
+    Records a cache miss after entry_path was written and evicts least recently used
+    entries if the cache has grown beyond its size limit
+
+    :param entry_path: path of the cache entry just written
+    :param kind: kind of entry, one of ENTRY_KINDS
+    :param keep: paths of other entries that must not be evicted, e.g. the ones that
+        are about to be used together with entry_path
+    """
+    recordLookup(kind, False)
+    evict(keep=[entry_path, *keep])
+
+
+def evict(max_size=None, keep=()):
+    """
+    Removes least recently used entries until the cache is no bigger than max_size
+
+    :param max_size: size limit in bytes, getCacheSize() by default
+    :param keep: paths of entries that must not be removed
+    :return: list of the removed CacheEntry
+    """
+    max_size = max_size if max_size is not None else getCacheSize()
+    if max_size is None:
+        return []
+
+    keep = {path.abspath(p) for p in keep}
+    entries = cacheEntries()
+    total = sum(e.size for e in entries)
+    removed = []
+    for entry in entries:
+        if total <= max_size:
+            break
+        if path.abspath(entry.path) in keep:
+            continue
+        removeEntry(entry.path)
+        total -= entry.size
+        removed.append(entry)
+    return removed
+
+
+def removeEntry(entry_path):
+    """
+    :param entry_path: path of a cache entry to delete
+    """
+    if path.isdir(entry_path):
+        shutil.rmtree(entry_path, ignore_errors=True)
+    else:
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+
+def clear(kinds=ENTRY_KINDS):
+    """
+    Removes cache entries.  Clearing every kind also forgets the file digests and
+    resets the hit and miss counts.
+
+    :param kinds: kinds of entry to remove
+    :return: list of the removed CacheEntry
+    """
+    removed = [e for e in cacheEntries() if e.kind in kinds]
+    for entry in removed:
+        removeEntry(entry.path)
+    if set(ENTRY_KINDS) <= set(kinds):
+        _execute(("DELETE FROM digests", ()), ("DELETE FROM lookups", ()))
+    return removed
+
+
+def writePickle(obj, pickle_path):
+    """
+    Pickles obj behind a header naming the cache format, pynidm and rdflib versions.
+    The file is written next to pickle_path and renamed into place.
+
+    :param obj: object to pickle
+    :param pickle_path: destination file
+    """
+    tmp_path = f"{pickle_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as fp:
+        pickle.dump(_pickleHeader(), fp)
+        pickle.dump(obj, fp)
+    os.replace(tmp_path, pickle_path)
+
+
+def readPickle(pickle_path):
+    """
+    :param pickle_path: file written by writePickle
+    :return: the pickled object, None if the file is missing, was written by other
+        versions of pynidm or rdflib, or can't be read
+    """
+    try:
+        with open(pickle_path, "rb") as fp:
+            if pickle.load(fp) != _pickleHeader():
+                return None
+            return pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning("Ignoring unreadable cache file %s: %s", pickle_path, e)
+        return None
+
+
+def _pickleHeader():
+    return {
+        "format": "nidm-cache",
+        "version": CACHE_VERSION,
+        "pynidm": __version__,
+        "rdflib": rdflib.__version__,
+    }
+
+
+def lookupDigest(file, algorithm="md5"):
+    """
+    :param file: filename
+    :param algorithm: hash algorithm the digest was made with
+    :return: digest recorded by storeDigest if file hasn't changed since, else None
+    """
+    rows = _execute(
+        (
+            "SELECT digest FROM digests WHERE path = ? AND algorithm = ? AND inode = ?"
+            " AND size = ? AND mtime = ?",
+            (path.abspath(file), algorithm, *_fileKey(file)),
+        )
+    )
+    recordLookup("digest", bool(rows))
+    return rows[0][0] if rows else None
+
+
+def storeDigest(file, digest, algorithm="md5"):
+    """
+    :param file: filename
+    :param digest: hex digest of the contents of file
+    :param algorithm: hash algorithm the digest was made with
+    """
+    _execute(
+        (
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+            (path.abspath(file), algorithm, *_fileKey(file), digest),
+        )
+    )
+
+
+def _fileKey(file):
+    st = os.stat(file)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def recordLookup(kind, hit):
+    """
+    :param kind: kind of cache lookup
+    :param hit: True for a cache hit, False for a miss
+    """
+    column = "hits" if hit else "misses"
+    _execute(
+        ("INSERT OR IGNORE INTO lookups VALUES (?, 0, 0)", (kind,)),
+        (f"UPDATE lookups SET {column} = {column} + 1 WHERE kind = ?", (kind,)),
+    )
+
+
+def lookupCounts():
+    """
+    :return: dict of kind of lookup to a (hits, misses) tuple
+    """
+    rows = _execute(("SELECT * FROM lookups ORDER BY kind", ())) or []
+    return {kind: (hits, misses) for kind, hits, misses in rows}
+
+
+def _execute(*statements):
+    # runs (sql, parameters) statements in one transaction, returning the rows of
+    # the last one.  The index only saves work so failures are logged, not raised
+    db = _db()
+    if db is None:
+        return None
+    try:
+        with db:
+            for sql, parameters in statements:
+                cursor = db.execute(sql, parameters)
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        logging.warning("Cache index error: %s", e)
+        return None
+
+
+def _db():
+    # connections can't cross a fork or be used by another thread, so each thread of
+    # each process opens its own
+    db_path = path.join(getCacheDir(), _DB_NAME)
+    key = (os.getpid(), threading.get_ident(), db_path)
+    if key not in _connections:
+        try:
+            db = sqlite3.connect(db_path, timeout=30)
+            # the index only saves work, losing the last writes in a crash is harmless
+            db.execute("PRAGMA synchronous = OFF")
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS digests (path TEXT, algorithm TEXT,"
+                    " inode INTEGER, size INTEGER, mtime INTEGER, digest TEXT,"
+                    " PRIMARY KEY (path, algorithm))"
+                )
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS lookups (kind TEXT PRIMARY KEY,"
+                    " hits INTEGER, misses INTEGER)"
+                )
+        except sqlite3.Error as e:
+            logging.warning("Not using the cache index %s: %s", db_path, e)
+            db = None
+        _connections[key] = db
+    return _connections[key]
@@ -1,5 +1,4 @@
 from collections import OrderedDict
-from io import StringIO
 import json
 import os
 from pathlib import Path
@@ -12,6 +11,7 @@ import tempfile
 import uuid
 from prov.dot import prov_to_dot
 import prov.model as pm
+import prov.serializers
 from pydot import Edge
 from rdflib import RDF, Graph, URIRef
 from ..core import Constants
@@ -30,6 +30,30 @@ def getUUID():
     return uid
 
 
+def prov_to_rdflib_graph(prov_document, identifier=None):
+    """
+    Builds an RDFLib graph straight from the records of a PROV document.  The graph holds
+    the triples the document's PROV-O Turtle serialization would, without writing the
+    Turtle and parsing it back.
+
+    :param prov_document: prov.model.ProvDocument
+    :param identifier: Optional identifier of the graph
+    :return: rdflib Graph
+    """
+    # the same encoder ProvDocument.serialize(format="rdf") writes from
+    container = prov.serializers.get("rdf")(prov_document).encode_document(
+        prov_document
+    )
+    rdf_graph = Graph(identifier=identifier)
+    for prefix, namespace in container.namespaces():
+        rdf_graph.bind(prefix, namespace)
+    # bundles are encoded as named graphs, the Turtle serialization flattens them
+    rdf_graph.addN(
+        (s, p, o, rdf_graph) for s, p, o in container.triples((None, None, None))
+    )
+    return rdf_graph
+
+
 class Core:
     """Base-class for NIDM-Experimenent
 
@@ -371,11 +395,7 @@ class Core:
         metadata = {}
 
         # use RDFLib here for temporary graph making query easier
-        rdf_graph = Graph()
-
-        rdf_graph_parse = rdf_graph.parse(
-            source=StringIO(self.serializeTurtle()), format="turtle"
-        )
+        rdf_graph = rdf_graph_parse = self.to_rdflib_graph()
 
         # get subject uri for object
 
@@ -402,18 +422,34 @@ class Core:
         """
         return self.graph.serialize(None, format="rdf", rdf_format="ttl")
 
+    def to_rdflib_graph(self, identifier=None):
+        """
+        Returns the graph as an RDFLib Graph holding the triples serializeTurtle writes
+        :param identifier: Optional identifier of the graph
+        :return: rdflib Graph
+        """
+        if getattr(self.graph, "_lossless_serialize_installed", False):
+            # documents loaded by read_nidm write the graph they were read from
+            from nidm.experiment.Utils import lossless_rdflib_graph
+
+            source, _ = lossless_rdflib_graph(self.graph)
+            if identifier is None:
+                return source
+            rdf_graph = Graph(identifier=identifier)
+            for prefix, namespace in source.namespaces():
+                rdf_graph.bind(prefix, namespace)
+            rdf_graph.addN((s, p, o, rdf_graph) for s, p, o in source)
+            return rdf_graph
+
+        return prov_to_rdflib_graph(self.graph, identifier=identifier)
+
     def serializeTrig(self, identifier=None):
         """
         Serializes graph to Turtle format
         :param identifier: Optional identifier to use for graph serialization
         :return: text of serialized graph in Turtle format
         """
-        if identifier is not None:
-            rdf_graph = Graph(identifier=identifier)
-            rdf_graph.parse(source=StringIO(self.serializeTurtle()), format="turtle")
-        else:
-            rdf_graph = Graph()
-            rdf_graph.parse(source=StringIO(self.serializeTurtle()), format="turtle")
+        rdf_graph = self.to_rdflib_graph(identifier=identifier)
 
         # return rdf_graph.serialize(format='trig').decode('ASCII')
         return rdf_graph.serialize(format="trig")
@@ -424,12 +460,7 @@ class Core:
         :return: text of serialized graph in JSON-LD format
         """
         # workaround to get JSONLD from RDFLib...
-        rdf_graph = Graph()
-        # rdf_graph_parse = rdf_graph.parse(source=StringIO(self.serializeTurtle()),format='turtle')
-        rdf_graph_parse = rdf_graph.parse(
-            source=StringIO(self.graph.serialize(None, format="rdf", rdf_format="ttl")),
-            format="turtle",
-        )
+        rdf_graph_parse = self.to_rdflib_graph()
 
         # WIP: currently this creates a default JSON-LD context from Constants.py and not in the correct way from the
         # NIDM-E OWL files that that will be the next iteration
@@ -523,7 +554,6 @@ class Core:
     # Required imports at the top of Core.py:
     # Required imports at the top of Core.py:
     # Required imports at the top of Core.py:
-    from io import StringIO
     from pathlib import Path
     from prov.dot import prov_to_dot
     from pydot import Edge
@@ -582,11 +612,7 @@ class Core:
             "minlen": "2",
         }
 
-        rdf_graph = Graph()
-        rdf_graph = rdf_graph.parse(
-            source=StringIO(self.graph.serialize(None, format="rdf", rdf_format="ttl")),
-            format="turtle",
-        )
+        rdf_graph = self.to_rdflib_graph()
 
         url_to_node = {}
         for node_key, node_val in dot.obj_dict["nodes"].items():
@@ -656,7 +682,7 @@ class Core:
                     add_edge_if_found(acquisition_node, session_node)
 
         for _, project_node in project_nodes:
-            for derivative_activity in self._derivatives:
+            for derivative_activity in self.get_derivatives():
                 derivative_uri = str(derivative_activity.identifier.uri)
                 derivative_node = url_to_node.get(derivative_uri)
 
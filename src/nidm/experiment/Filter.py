@@ -0,0 +1,367 @@
+"""Compiled subject filters for the query and REST APIs.
+
+A filter such as ``instruments.AGE gt 12 and not (SITE_ID eq 'CMU' or SITE_ID eq 'NYU')``
+is parsed once into a small expression tree (see compileFilter).  The tree is
+evaluated column-wise over a long table of (scope, subject, term, value) rows
+built with a single pass over each graph (see getFilterTable), so filtering any
+number of subjects costs one vectorized mask per comparison rather than a
+graph walk per subject.
+
+Supported syntax:
+
+- comparisons ``<field> <op> <value>`` where op is one of lt, gt, le, ge, eq, ne
+- fields may be scoped as ``instruments.<term>`` or ``derivatives.<term>``, an
+  unscoped term is looked up in both
+- values may be quoted with ', " or ` to include spaces or keywords
+- ``and``, ``or``, ``not`` and parentheses, with the usual precedence
+"""
+
+import collections
+import functools
+import re
+import numpy as np
+import pandas as pd
+from rdflib import Graph, URIRef
+from nidm.core import Constants
+from nidm.experiment.GraphBackend import fileDigest
+from nidm.experiment.Query import (
+    GetDatatypeSynonyms,
+    GetNameForDataElement,
+    OpenGraph,
+    URITail,
+    getDataTypeInfo,
+    getSoftwareAgents,
+    splitSubject,
+)
+
+isa = URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
+INSTRUMENTS = "instruments"
+DERIVATIVES = "derivatives"
+OPERATORS = ("lt", "gt", "le", "ge", "eq", "ne")
+TABLE_CACHE_SIZE = 16
+TABLE_COLUMNS = ["scope", "subject", "term", "label", "value"]
+
+Comparison = collections.namedtuple("Comparison", ["scope", "term", "op", "value"])
+And = collections.namedtuple("And", ["terms"])
+Or = collections.namedtuple("Or", ["terms"])
+Not = collections.namedtuple("Not", ["term"])
+
+_TOKEN = re.compile(r"""\s*(?:(['"`])(.*?)\1|([()])|([^\s()]+))""")
+_Token = collections.namedtuple("_Token", ["text", "quoted", "start", "end"])
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Invalid filter '{text}' at position {pos}")
+        quote, quoted, paren, word = match.groups()
+        start = match.start(1) if quote else match.start(3 if paren else 4)
+        if quote:
+            tokens.append(_Token(quoted, True, start, match.end()))
+        else:
+            tokens.append(_Token(paren or word, False, start, match.end()))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, filter):  # noqa: A002
+        self.filter = filter.strip()
+        self.tokens = _tokenize(self.filter)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def keyword(self, *words):
+        token = self.peek()
+        if token is not None and not token.quoted and token.text.lower() in words:
+            self.pos += 1
+            return token.text.lower()
+        return None
+
+    def error(self, message):
+        return ValueError(f"Invalid filter '{self.filter}': {message}")
+
+    def parse(self):
+        if not self.tokens:
+            raise self.error("empty filter")
+        expression = self.parseOr()
+        if self.peek() is not None:
+            raise self.error(f"unexpected '{self.peek().text}'")
+        return expression
+
+    def parseOr(self):
+        terms = [self.parseAnd()]
+        while self.keyword("or"):
+            terms.append(self.parseAnd())
+        return terms[0] if len(terms) == 1 else Or(tuple(terms))
+
+    def parseAnd(self):
+        terms = [self.parseNot()]
+        while self.keyword("and"):
+            terms.append(self.parseNot())
+        return terms[0] if len(terms) == 1 else And(tuple(terms))
+
+    def parseNot(self):
+        if self.keyword("not"):
+            return Not(self.parseNot())
+        if self.keyword("("):
+            expression = self.parseOr()
+            if not self.keyword(")"):
+                raise self.error("missing ')'")
+            return expression
+        return self.parseComparison()
+
+    def parseComparison(self):
+        # field names may contain spaces and parentheses (e.g. 'derivatives.Left-Caudate (mm^3) lt 3500')
+        # so take everything up to the operator as written
+        field = []
+        while self.peek() is not None and self.peek().text.lower() not in OPERATORS:
+            field.append(self.peek())
+            self.pos += 1
+        op = self.keyword(*OPERATORS)
+        if not field or op is None:
+            raise self.error("expected '<field> <op> <value>'")
+
+        # likewise unquoted values run up to the next and/or or ')'
+        value = []
+        while self.peek() is not None:
+            token = self.peek()
+            if not token.quoted and token.text.lower() in ("and", "or", ")"):
+                break
+            value.append(token)
+            self.pos += 1
+        if not value:
+            raise self.error(f"missing value after '{op}'")
+
+        scope, term = splitField(self.source(field))
+        return Comparison(scope, term, op, self.source(value))
+
+    def source(self, tokens):
+        if len(tokens) == 1 or not any(t.quoted for t in tokens):
+            # unquoted text keeps its original spacing
+            text = self.filter[tokens[0].start : tokens[-1].end]
+            return tokens[0].text if tokens[0].quoted else text
+        return " ".join(t.text for t in tokens)
+
+
+def splitField(field):
+    """
+    Splits a filter field into its scope and term, e.g. 'instruments.AGE' -> ('instruments', 'AGE')
+
+    :param field: field as written in the filter
+    :return: tuple of scope (INSTRUMENTS, DERIVATIVES or None for both) and term
+    """
+    pieces = splitSubject(field)
+    if len(pieces) >= 2 and pieces[-2] in (INSTRUMENTS, DERIVATIVES):
+        return pieces[-2], pieces[-1]
+    return None, pieces[-1]
+
+
+@functools.lru_cache(maxsize=256)
+def compileFilter(filter):  # noqa: A002
+    """
+    Parses a filter string into an expression tree of Comparison, And, Or and Not tuples
+
+    :param filter: filter string, e.g. "instruments.AGE gt 12 and derivatives.fs_000003 lt 5000"
+    :return: expression tree
+    """
+    return _Parser(filter).parse()
+
+
+def getFilterTable(nidm_file_list):
+    """
+    Returns the table filters are evaluated against: one row per instrument or derivative
+    value of every subject in the files. Tables are cached on the file digests.
+
+    :param nidm_file_list: List of one or more NIDM files (or rdflib Graphs)
+    :return: DataFrame with columns scope, subject, term, label, value and number (the value as a float or NaN)
+    """
+    if any(isinstance(f, Graph) for f in nidm_file_list):
+        return _buildFilterTable(nidm_file_list)
+    return _getFilterTableCached(tuple((f, fileDigest(f)) for f in nidm_file_list))
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def _getFilterTableCached(file_digests):
+    return _buildFilterTable([f for f, _ in file_digests])
+
+
+def _buildFilterTable(nidm_file_list):
+    graphs = [OpenGraph(f) for f in nidm_file_list]
+    names = {}
+    for rdf_graph in graphs:
+        for prefix, namespace in rdf_graph.namespace_manager.namespaces():
+            names.setdefault(namespace, str(prefix))
+
+    rows = []
+    for rdf_graph in graphs:
+        rows.extend(_instrumentRows(rdf_graph, names))
+        rows.extend(_derivativeRows(rdf_graph))
+
+    table = pd.DataFrame(rows, columns=TABLE_COLUMNS, dtype=object)
+    table["number"] = pd.to_numeric(table["value"], errors="coerce").astype(float)
+    return table
+
+
+def _instrumentRows(rdf_graph, names):
+    term_names = {}
+    for acquisition in rdf_graph.subjects(isa, Constants.NIDM["Acquisition"]):
+        instruments = list(
+            rdf_graph.subjects(Constants.PROV["wasGeneratedBy"], acquisition)
+        )
+        if not instruments:
+            continue
+        for blank in rdf_graph.objects(
+            acquisition, Constants.PROV["qualifiedAssociation"]
+        ):
+            for subject in rdf_graph.objects(blank, Constants.PROV["agent"]):
+                for instrument in instruments:
+                    for data_element, value in rdf_graph.predicate_objects(instrument):
+                        name = term_names.get(data_element)
+                        if name is None:
+                            # use the prefix used in the ttl file, if any
+                            name = names.get(data_element) or GetNameForDataElement(
+                                rdf_graph, data_element
+                            )
+                            term_names[data_element] = name
+                        yield INSTRUMENTS, str(subject), name, name, str(value)
+
+
+def _derivativeRows(rdf_graph):
+    sw_agents = set(getSoftwareAgents(rdf_graph))
+    labels = {}
+    for blank, subject in rdf_graph.subject_objects(Constants.PROV["agent"]):
+        if (
+            blank,
+            Constants.PROV["hadRole"],
+            Constants.SIO["Subject"],
+        ) not in rdf_graph:
+            continue
+        for activity in rdf_graph.subjects(
+            Constants.PROV["qualifiedAssociation"], blank
+        ):
+            # only activities run by a software agent produce derivatives
+            if not any(
+                agent in sw_agents
+                for software_blank in rdf_graph.objects(
+                    activity, Constants.PROV["qualifiedAssociation"]
+                )
+                for agent in rdf_graph.objects(software_blank, Constants.PROV["agent"])
+            ):
+                continue
+            for collection in rdf_graph.subjects(
+                Constants.PROV["wasGeneratedBy"], activity
+            ):
+                for datatype, value in rdf_graph.predicate_objects(collection):
+                    if datatype == isa:
+                        continue
+                    if datatype not in labels:
+                        # values without a datatype definition are not data
+                        dti = getDataTypeInfo(rdf_graph, datatype)
+                        labels[datatype] = str(dti["label"]) if dti else None
+                    label = labels[datatype]
+                    if label is not None:
+                        term = URITail(datatype)
+                        yield DERIVATIVES, str(subject), term, label, str(value)
+
+
+def _compare(table, op, value):
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+
+    if op in ("eq", "ne"):
+        equal = table["value"].to_numpy() == value
+        if number is not None:
+            equal |= table["number"].to_numpy() == number
+        return equal if op == "eq" else ~equal & table["value"].notna().to_numpy()
+
+    if number is None:
+        return np.zeros(len(table), dtype=bool)
+    numbers = table["number"].to_numpy()
+    with np.errstate(invalid="ignore"):
+        if op == "lt":
+            return numbers < number
+        if op == "gt":
+            return numbers > number
+        if op == "le":
+            return numbers <= number
+        return numbers >= number
+
+
+class _Evaluator:
+    def __init__(self, nidm_file_list, project, table, subjects):
+        self.nidm_file_list = tuple(nidm_file_list)
+        self.project = project
+        self.table = table
+        self.subjects = subjects
+
+    def evaluate(self, expression):
+        if isinstance(expression, And):
+            mask = np.ones(len(self.subjects), dtype=bool)
+            for term in expression.terms:
+                mask &= self.evaluate(term)
+            return mask
+        if isinstance(expression, Or):
+            mask = np.zeros(len(self.subjects), dtype=bool)
+            for term in expression.terms:
+                mask |= self.evaluate(term)
+            return mask
+        if isinstance(expression, Not):
+            return ~self.evaluate(expression.term)
+        return self.compare(expression)
+
+    def rows(self, scope, term):
+        table = self.table
+        if scope == INSTRUMENTS:
+            synonyms = GetDatatypeSynonyms(self.nidm_file_list, self.project, term)
+            return (table["scope"] == INSTRUMENTS) & table["term"].isin(synonyms)
+        # derivatives match on the URI tail or the exact label
+        return (table["scope"] == DERIVATIVES) & (
+            (table["term"] == term) | (table["label"] == term)
+        )
+
+    def compare(self, comparison):
+        scopes = [comparison.scope] if comparison.scope else [INSTRUMENTS, DERIVATIVES]
+        rows = functools.reduce(
+            lambda a, b: a | b, (self.rows(scope, comparison.term) for scope in scopes)
+        )
+        values = self.table[rows.to_numpy()]
+        matched = values["subject"][_compare(values, comparison.op, comparison.value)]
+        # a subject matches a comparison if any of its values does
+        return self.subjects.isin(set(matched)).to_numpy()
+
+
+def _expandSubject(subject):
+    subject = str(subject)
+    if subject.find("http") < 0:
+        return str(Constants.NIIRI[subject])
+    return subject
+
+
+def FilterSubjects(nidm_file_list, project_id, subjects, filter):  # noqa: A002
+    """
+    Evaluates a filter for many subjects at once
+
+    :param nidm_file_list: List of one or more NIDM files
+    :param project_id: project URI or UUID the filter terms are resolved in
+    :param subjects: list of subject URIs or UUIDs
+    :param filter: filter string, see compileFilter
+    :return: numpy boolean array, True for the subjects matching the filter
+    """
+    subjects = pd.Series([_expandSubject(s) for s in subjects], dtype=object)
+    if not filter:
+        return np.ones(len(subjects), dtype=bool)
+    expression = compileFilter(filter)
+    evaluator = _Evaluator(
+        nidm_file_list, project_id, getFilterTable(nidm_file_list), subjects
+    )
+    return evaluator.evaluate(expression)
@@ -0,0 +1,397 @@
+"""Pluggable storage for the graphs the query layer works on.
+
+Every graph Query, Navigate and the REST API look at comes from the active
+backend (see getBackend / setBackend):
+
+- StoreBackend (the default) parses each file once and keeps it as a binary
+  triple store in the cache dir (see nidm.experiment.TripleStore and
+  nidm.experiment.Cache), so later runs
+  memory-map the store instead of parsing the file again
+- MemoryBackend parses files into plain in-memory rdflib graphs and keeps
+  nothing on disk
+- SPARQLEndpointBackend sends SPARQL queries to a SPARQL 1.1 HTTP endpoint
+  (Blazegraph, Fuseki, GraphDB, ...) after uploading any files the endpoint
+  hasn't seen yet, while graph walks still use the local stores
+
+The backend can also be picked with environment variables:
+NIDM_SPARQL_ENDPOINT (or the older BLAZEGRAPH_URL) selects the SPARQL endpoint
+backend, and NIDM_GRAPH_BACKEND=memory selects the in-memory backend.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import hashlib
+import io
+import logging
+import os
+from os import path
+import threading
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.evaluate import evalQuery
+from rdflib.query import Result, ResultRow
+import requests
+from requests.adapters import HTTPAdapter
+from nidm.experiment import Cache, RDFStream, TripleStore
+
+GRAPH_CACHE_SIZE = 64
+DIGEST_CACHE_SIZE = 4096
+
+# content types used to upload files to a SPARQL endpoint, keyed on rdflib format names
+RDF_CONTENT_TYPES = {
+    "turtle": "text/turtle",
+    "nt": "application/n-triples",
+    "n3": "text/n3",
+    "xml": "application/rdf+xml",
+    "trig": "application/trig",
+    "nquads": "application/n-quads",
+    "json-ld": "application/ld+json",
+}
+
+
+def fileDigest(file):
+    """
+    MD5 digest of a file's contents.  The digest is memoized on the file's path, size
+    and modification time, and recorded in the cache index across runs, so unchanged
+    files aren't rehashed.
+
+    :param file: filename
+    :return: hex digest string
+    """
+    st = os.stat(file)
+    return _fileDigestCached(path.abspath(file), st.st_size, st.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=DIGEST_CACHE_SIZE)
+def _fileDigestCached(file, size, mtime):  # noqa: U100
+    digest = Cache.lookupDigest(file)
+    if digest is not None:
+        return digest
+
+    BLOCKSIZE = 65536
+    hasher = hashlib.md5()
+    with open(file, "rb") as f:
+        buf = f.read(BLOCKSIZE)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = f.read(BLOCKSIZE)
+    digest = hasher.hexdigest()
+    Cache.storeDigest(file, digest)
+    return digest
+
+
+def graphStorePath(file):
+    """
+    :param file: filename
+    :return: path of the binary triple store StoreBackend caches for file
+    """
+    return _graphStorePath(fileDigest(file))
+
+
+def _graphStorePath(digest):
+    return Cache.cachePath("rdf_graph", digest, "store")
+
+
+def parseGraph(file, rdf_graph=None):
+    """
+    Reads file into an in-memory graph.  If the file has already been parsed into a
+    binary triple store (see loadStores) its triples are copied from the store, which
+    is several times faster than parsing the file again.
+
+    :param file: filename
+    :param rdf_graph: Graph to add the contents of file to, a new Graph if not given
+    :return: rdf_graph
+    """
+    if rdf_graph is None:
+        rdf_graph = Graph()
+
+    store_path = graphStorePath(file)
+    if not TripleStore.is_store(store_path):
+        RDFStream.parseFile(file, rdf_graph)
+        return rdf_graph
+
+    Cache.useEntry(store_path, "rdf_graph")
+    stored = TripleStore.open_graph(store_path)
+    for prefix, namespace in stored.namespaces():
+        rdf_graph.bind(prefix, namespace)
+    rdf_graph.addN((s, p, o, rdf_graph) for s, p, o in stored)
+    return rdf_graph
+
+
+def loadStores(nidm_file_list, jobs=1):
+    """
+    Makes sure each file has been parsed into its binary triple store, parsing the
+    files that haven't in up to jobs processes
+
+    :param nidm_file_list: list of NIDM files
+    :param jobs: number of processes to parse files in
+    :return: list of the store paths of the files
+    """
+    store_paths = [graphStorePath(f) for f in nidm_file_list]
+    missing = [
+        f
+        for f, store_path in dict(zip(nidm_file_list, store_paths)).items()
+        if not TripleStore.is_store(store_path)
+    ]
+    # the stores of all the files are kept when a new one makes the cache too big
+    load = functools.partial(_loadStore, keep=tuple(store_paths))
+    if jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(missing))) as pool:
+            # the parsed graphs stay in the workers, only the store paths come back
+            list(pool.map(load, missing))
+    else:
+        for nidm_file in missing:
+            load(nidm_file)
+    return store_paths
+
+
+def _loadStore(file, keep=()):
+    store_path = graphStorePath(file)
+    if TripleStore.is_store(store_path):
+        Cache.useEntry(store_path, "rdf_graph")
+    else:
+        rdf_graph = Graph()
+        RDFStream.parseFile(file, rdf_graph)
+        TripleStore.write_store(rdf_graph, store_path)
+        Cache.addEntry(store_path, "rdf_graph", keep)
+    return store_path
+
+
+class GraphBackend:
+    """
+    Base class for graph backends.  Subclasses provide openGraph, the other
+    methods have defaults built on it.
+    """
+
+    def openGraph(self, file):
+        """
+        :param file: filename
+        :return: Graph with the contents of file
+        """
+        raise NotImplementedError
+
+    def unionGraph(self, nidm_file_list):
+        """
+        :param nidm_file_list: list of NIDM files (or already parsed Graphs)
+        :return: Graph holding the union of all the triples in nidm_file_list
+        """
+        if len(nidm_file_list) == 1:
+            return self._graph(nidm_file_list[0])
+        rdf_graph = Graph()
+        for nidm_file in nidm_file_list:
+            rdf_graph += self._graph(nidm_file)
+        return rdf_graph
+
+    def load(self, nidm_file_list, jobs=1):
+        """
+        Makes sure the files are available to query, e.g. by parsing them into a cache
+        or uploading them to a server
+
+        :param nidm_file_list: list of NIDM files
+        :param jobs: number of processes to use, where the backend supports it
+        """
+
+    def query(self, nidm_file_list, query):
+        """
+        Runs a SPARQL query over the union of the files.  SELECT results are produced lazily
+        so callers can stream them.
+
+        :param nidm_file_list: list of NIDM files (or already parsed Graphs)
+        :param query: SPARQL query string
+        :return: tuple of the list of column names and an iterator of result rows
+        """
+        rdf_graph = self.unionGraph(nidm_file_list)
+        prepared = prepareQuery(query, initNs=dict(rdf_graph.namespaces()))
+        if prepared.algebra.name != "SelectQuery":
+            qres = rdf_graph.query(prepared)
+            return [str(var) for var in qres.vars or []], iter(qres)
+
+        # evaluate directly rather than through Graph.query: iterating its result keeps
+        # every row in memory
+        result = evalQuery(rdf_graph, prepared, {})
+        variables = result["vars_"]
+        rows = (ResultRow(b, variables) for b in result["bindings"] if b)
+        return [str(var) for var in variables], rows
+
+    def _graph(self, file):
+        if isinstance(file, Graph):
+            return file
+        return self.openGraph(file)
+
+
+class MemoryBackend(GraphBackend):
+    """Parses files into in-memory graphs, memoized on the file digests for the life of the backend"""
+
+    def __init__(self):
+        self._openGraph = functools.lru_cache(maxsize=GRAPH_CACHE_SIZE)(self._parse)
+
+    def openGraph(self, file):
+        return self._openGraph(file, fileDigest(file))
+
+    def _parse(self, file, digest):  # noqa: U100
+        return parseGraph(file)
+
+
+class StoreBackend(GraphBackend):
+    """
+    Keeps every file, and every union of files queried together, as a binary triple store in
+    the cache dir.  Files are parsed the first time they are seen and memory-mapped from their
+    store after that, in this process or a later one.
+    """
+
+    def openGraph(self, file):
+        return _openStoreGraph(file, fileDigest(file))
+
+    def load(self, nidm_file_list, jobs=1):
+        loadStores(nidm_file_list, jobs)
+
+    def unionGraph(self, nidm_file_list):
+        if len(nidm_file_list) == 1 or any(
+            isinstance(f, Graph) for f in nidm_file_list
+        ):
+            # graphs passed in directly have no digest so fall back to copying them
+            return super().unionGraph(nidm_file_list)
+        return _unionStoreGraph(
+            tuple((f, fileDigest(f), os.stat(f).st_mtime_ns) for f in nidm_file_list)
+        )
+
+
+@functools.lru_cache(maxsize=GRAPH_CACHE_SIZE)
+def _openStoreGraph(file, digest):
+    store_path = _graphStorePath(digest)
+    if TripleStore.is_store(store_path):
+        Cache.useEntry(store_path, "rdf_graph")
+        return TripleStore.open_graph(store_path)
+
+    rdf_graph = Graph()
+    RDFStream.parseFile(file, rdf_graph)
+    TripleStore.write_store(rdf_graph, store_path)
+    Cache.addEntry(store_path, "rdf_graph")
+    return rdf_graph
+
+
+@functools.lru_cache(maxsize=GRAPH_CACHE_SIZE)
+def _unionStoreGraph(file_keys):
+    hasher = hashlib.md5()
+    for _, digest, mtime in file_keys:
+        hasher.update(f"{digest}:{mtime}\n".encode("utf-8"))
+    union_path = Cache.cachePath("rdf_union", hasher.hexdigest(), "store")
+
+    if TripleStore.is_store(union_path):
+        Cache.useEntry(union_path, "rdf_union")
+    else:
+        # make sure each file has been parsed into its own store
+        store_paths = loadStores([f for f, _, _ in file_keys])
+        TripleStore.merge_stores(store_paths, union_path)
+        Cache.addEntry(union_path, "rdf_union")
+
+    return TripleStore.open_graph(union_path)
+
+
+class SPARQLEndpointBackend(StoreBackend):
+    """
+    Runs SPARQL queries on a SPARQL 1.1 HTTP endpoint.  Files are uploaded the first time they
+    are queried and remembered by content digest so the same data is never sent twice, even
+    under a different file name.  All requests share one pooled HTTP session.
+
+    Graph walks (Navigate, the REST API) still use the local stores of StoreBackend.
+    """
+
+    def __init__(self, query_url, update_url=None, pool_size=10, timeout=None):
+        """
+        :param query_url: URL of the SPARQL query endpoint
+        :param update_url: URL files are POSTed to, defaults to query_url (as used by Blazegraph)
+        :param pool_size: number of connections kept open to the server
+        :param timeout: optional request timeout in seconds
+        """
+        self.query_url = query_url
+        self.update_url = update_url or query_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+    def load(self, nidm_file_list, jobs=1):  # noqa: U100
+        for nidm_file in nidm_file_list:
+            digest = fileDigest(nidm_file)
+            with self._lock:
+                if digest in self._loaded:
+                    continue
+                logging.debug("Loading %s into %s", nidm_file, self.update_url)
+                with RDFStream.openFile(nidm_file) as fp:
+                    # the file is streamed from disk rather than read into memory,
+                    # compressed files in chunks as their uncompressed size isn't known
+                    response = self.session.post(
+                        self.update_url,
+                        data=(
+                            iter(lambda: fp.read(65536), b"")
+                            if RDFStream.isCompressed(nidm_file)
+                            else fp
+                        ),
+                        headers={"Content-Type": self._contentType(nidm_file)},
+                        timeout=self.timeout,
+                    )
+                response.raise_for_status()
+                self._loaded.add(digest)
+
+    def query(self, nidm_file_list, query):
+        if any(isinstance(f, Graph) for f in nidm_file_list):
+            # graphs built in this process aren't sent to the server
+            return super().query(nidm_file_list, query)
+
+        self.load(nidm_file_list)
+        logging.debug("Sending SPARQL query to %s: %s", self.query_url, query)
+        response = self.session.post(
+            self.query_url,
+            data={"query": query},
+            headers={"Accept": "application/sparql-results+json"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        qres = Result.parse(io.BytesIO(response.content), format="json")
+        return [str(var) for var in qres.vars or []], iter(qres)
+
+    @staticmethod
+    def _contentType(file):
+        return RDF_CONTENT_TYPES.get(RDFStream.guessFormat(file), "text/turtle")
+
+
+_backend = None
+
+
+def getBackend():
+    """
+    :return: the GraphBackend in use, see setBackend and the module documentation
+    """
+    if _backend is not None:
+        return _backend
+    return _backendFromEnvironment(
+        os.environ.get("NIDM_SPARQL_ENDPOINT") or os.environ.get("BLAZEGRAPH_URL"),
+        os.environ.get("NIDM_GRAPH_BACKEND", "store"),
+    )
+
+
+def setBackend(backend):
+    """
+    Sets the GraphBackend used from now on
+
+    :param backend: GraphBackend, or None to go back to picking one from the environment
+    """
+    global _backend
+    _backend = backend
+
+
+@functools.lru_cache(maxsize=None)
+def _backendFromEnvironment(endpoint, name):
+    if endpoint:
+        return SPARQLEndpointBackend(endpoint)
+    if name == "memory":
+        return MemoryBackend()
+    if name != "store":
+        raise ValueError(
+            f"Unknown NIDM_GRAPH_BACKEND '{name}', use one of 'store' or 'memory'"
+        )
+    return StoreBackend()
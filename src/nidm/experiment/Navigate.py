@@ -1,13 +1,16 @@
 import collections
 import functools
-from rdflib import URIRef
+import pandas as pd
+from rdflib import Graph, URIRef
 from nidm.core import Constants
 import nidm.experiment.CDE
+from nidm.experiment.GraphBackend import fileDigest
 from nidm.experiment.Query import (
     ACQUISITION_MODALITY,
     IMAGE_CONTRAST_TYPE,
     IMAGE_USAGE_TYPE,
     TASK,
+    GetDatatypeSynonyms,
     OpenGraph,
     URITail,
     expandUUID,
@@ -39,6 +42,13 @@ ValueType = collections.namedtuple(
 ActivityData = collections.namedtuple("ActivityData", ["category", "uuid", "data"])
 QUERY_CACHE_SIZE = 0
 BIG_CACHE_SIZE = 0
+INDEX_CACHE_SIZE = 16
+STAT_COLLECTION_TYPES = (
+    Constants.NIDM["FSStatsCollection"],
+    Constants.NIDM["FSLStatsCollection"],
+    Constants.NIDM["ANTSStatsCollection"],
+    Constants.NIDM["DerivativeCollection"],
+)
 
 
 def makeValueType(
@@ -124,6 +134,170 @@ def expandID(id, namespace):  # noqa: A002
     return id
 
 
+class FileIndex:
+    """
+    Project/session/acquisition/subject structure of a single NIDM file.  The index is
+    built by walking each of the handful of predicates it needs exactly once, rather than
+    re-walking the graph for every Navigate call.
+    """
+
+    def __init__(self, rdf_graph):
+        types = collections.defaultdict(set)
+        for s, o in rdf_graph.subject_objects(isa):
+            types[s].add(o)
+
+        children = collections.defaultdict(list)
+        for s, o in rdf_graph.subject_objects(isPartOf):
+            children[o].append(s)
+
+        associations = collections.defaultdict(list)
+        for s, o in rdf_graph.subject_objects(Constants.PROV["qualifiedAssociation"]):
+            associations[s].append(o)
+
+        agents = collections.defaultdict(list)
+        for s, o in rdf_graph.subject_objects(Constants.PROV["agent"]):
+            agents[s].append(o)
+
+        subject_roles = set(
+            rdf_graph.subjects(Constants.PROV["hadRole"], Constants.SIO["Subject"])
+        )
+
+        self.projects = [s for s, t in types.items() if Constants.NIDM["Project"] in t]
+        self.stat_collections = {
+            s for s, t in types.items() if t.intersection(STAT_COLLECTION_TYPES)
+        }
+        self.acquisition_objects = {
+            s for s, t in types.items() if Constants.NIDM["AcquisitionObject"] in t
+        }
+
+        # project -> sessions, session -> acquisitions
+        self.sessions = collections.defaultdict(list)
+        self.acquisitions = collections.defaultdict(list)
+        for parent, parts in children.items():
+            for part in parts:
+                if Constants.NIDM["Session"] in types.get(part, ()):
+                    self.sessions[parent].append(part)
+                if Constants.NIDM["Acquisition"] in types.get(part, ()):
+                    self.acquisitions[parent].append(part)
+
+        # acquisition -> participant and participant -> activities
+        self.subject = {}
+        self.activities = collections.defaultdict(set)
+        for activity, blanks in associations.items():
+            is_activity = Constants.PROV["Activity"] in types.get(activity, ())
+            for blank in blanks:
+                for agent in agents.get(blank, ()):
+                    if blank in subject_roles:
+                        self.subject.setdefault(activity, agent)
+                    if is_activity:
+                        self.activities[agent].add(activity)
+
+        # participant uuid <-> study subject id
+        self.subject_uuids = collections.defaultdict(list)
+        self.subject_id = {}
+        for s, o in rdf_graph.subject_objects(Constants.NDAR["src_subject_id"]):
+            self.subject_uuids[str(o)].append(URITail(s))
+            self.subject_id.setdefault(s, o)
+
+        # activity -> entities it generated
+        self.generated = collections.defaultdict(list)
+        for s, o in rdf_graph.subject_objects(Constants.PROV["wasGeneratedBy"]):
+            self.generated[o].append(s)
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE * 64)
+def _getFileIndex(file, digest):  # noqa: U100
+    return FileIndex(OpenGraph(file))
+
+
+class ProjectIndex:
+    """
+    Project -> session -> acquisition -> subject hierarchy, subject ID <-> UUID maps and
+    activity -> generated entity maps for a tuple of NIDM files.
+
+    Per-file indexes are cached on the file's digest, so building an index over a file
+    tuple only walks the files that changed since they were last indexed.  Lookups are
+    dictionary accesses against the merged per-file indexes.
+    """
+
+    def __init__(self, nidm_file_tuples):
+        self.files = tuple(nidm_file_tuples)
+        self.file_indexes = [self._indexFile(f) for f in self.files]
+        self._merge()
+
+    @staticmethod
+    def _indexFile(file):
+        if isinstance(file, Graph):
+            return FileIndex(file)
+        return _getFileIndex(file, fileDigest(file))
+
+    def invalidate(self, file):
+        """
+        Re-index one of the files in this index, e.g. after it was modified in place
+
+        :param file: one of the files this index was built from
+        """
+        for i, f in enumerate(self.files):
+            if f == file:
+                self.file_indexes[i] = self._indexFile(f)
+        self._merge()
+
+    def _merge(self):
+        self.projects = []
+        self.stat_collections = set()
+        self.sessions = collections.defaultdict(list)
+        self.acquisitions = collections.defaultdict(list)
+        self.subject = {}
+        self.activities = collections.defaultdict(set)
+        self.subject_uuids = collections.defaultdict(list)
+        self.subject_id = {}
+        self.generated = collections.defaultdict(list)
+
+        # the earliest file wins wherever the original per-file walks returned the first match
+        for index in self.file_indexes:
+            self.projects.extend(index.projects)
+            self.stat_collections.update(index.stat_collections)
+            for key, value in index.sessions.items():
+                self.sessions[key].extend(value)
+            for key, value in index.acquisitions.items():
+                self.acquisitions[key].extend(value)
+            for key, value in index.subject.items():
+                self.subject.setdefault(key, value)
+            for key, value in index.activities.items():
+                self.activities[key].update(value)
+            for key, value in index.subject_uuids.items():
+                self.subject_uuids[key].extend(value)
+            for key, value in index.subject_id.items():
+                self.subject_id.setdefault(key, value)
+            for key, value in index.generated.items():
+                self.generated[key].extend(value)
+
+    def getSubjects(self, project_uri):
+        subjects = set()
+        for session in self.sessions.get(project_uri, ()):
+            for acq in self.acquisitions.get(session, ()):
+                subjects.add(self.subject.get(acq))
+        return subjects
+
+
+def getProjectIndex(nidm_file_tuples):
+    """
+    Returns the (cached) ProjectIndex for a list of NIDM files
+
+    :param nidm_file_tuples: list or tuple of NIDM files
+    :return: ProjectIndex
+    """
+    nidm_file_tuples = tuple(nidm_file_tuples)
+    if any(isinstance(f, Graph) for f in nidm_file_tuples):
+        return ProjectIndex(nidm_file_tuples)
+    return _getProjectIndexCached(tuple((f, fileDigest(f)) for f in nidm_file_tuples))
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _getProjectIndexCached(file_keys):
+    return ProjectIndex(f for f, _ in file_keys)
+
+
 @functools.lru_cache(maxsize=BIG_CACHE_SIZE)
 def simplifyURIWithPrefix(nidm_file_tuples, uri):
     """
@@ -155,107 +329,41 @@ def simplifyURIWithPrefix(nidm_file_tuples, uri):
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getProjects(nidm_file_tuples):
-    projects = []
-
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        # find all the sessions
-        for project, _, _ in rdf_graph.triples((None, isa, Constants.NIDM["Project"])):
-            projects.append(project)
-
-    return projects
+    return list(getProjectIndex(nidm_file_tuples).projects)
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getSessions(nidm_file_tuples, project_id):
     project_uri = expandID(project_id, Constants.NIIRI)
-    sessions = []
-
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        # find all the sessions
-        for session, _, _ in rdf_graph.triples((None, isa, Constants.NIDM["Session"])):
-            # check if it is part of our project
-            if (session, isPartOf, project_uri) in rdf_graph:
-                sessions.append(session)
-
-    return sessions
+    return list(getProjectIndex(nidm_file_tuples).sessions.get(project_uri, ()))
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getAcquisitions(nidm_file_tuples, session_id):
     session_uri = expandID(session_id, Constants.NIIRI)
-    acquisitions = []
-
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        # find all the sessions
-        for acq, _, _ in rdf_graph.triples((None, isPartOf, session_uri)):
-            # check if it is a acquisition
-            if (acq, isa, Constants.NIDM["Acquisition"]) in rdf_graph:
-                acquisitions.append(acq)
-
-    return acquisitions
+    return list(getProjectIndex(nidm_file_tuples).acquisitions.get(session_uri, ()))
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getSubject(nidm_file_tuples, acquisition_id):
     acquisition_uri = expandID(acquisition_id, Constants.NIIRI)
-
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        # find all the sessions
-        for _, _, blank in rdf_graph.triples(
-            (acquisition_uri, Constants.PROV["qualifiedAssociation"], None)
-        ):
-            for _, _, sub in rdf_graph.triples((blank, Constants.PROV["agent"], None)):
-                if (
-                    blank,
-                    Constants.PROV["hadRole"],
-                    Constants.SIO["Subject"],
-                ) in rdf_graph:
-                    return sub
-    return None
+    return getProjectIndex(nidm_file_tuples).subject.get(acquisition_uri)
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getSubjects(nidm_file_tuples, project_id):
-    subjects = set([])
     project_uri = expandID(project_id, Constants.NIIRI)
-
-    sessions = getSessions(nidm_file_tuples, project_uri)
-    for s in sessions:
-        acquisitions = getAcquisitions(nidm_file_tuples, s)
-        for acq in acquisitions:
-            sub = getSubject(nidm_file_tuples, acq)
-            subjects.add(sub)
-    return subjects
+    return getProjectIndex(nidm_file_tuples).getSubjects(project_uri)
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getSubjectUUIDsfromID(nidm_file_tuples, sub_id):
-    uuids = []
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-
-        result = rdf_graph.triples((None, Constants.NDAR["src_subject_id"], None))
-        for s, _, o in result:
-            if str(o) == str(sub_id):
-                uuids.append(URITail(s))
-
-    return uuids
+    return list(getProjectIndex(nidm_file_tuples).subject_uuids.get(str(sub_id), ()))
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def getSubjectIDfromUUID(nidm_file_tuples, subject_uuid):
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        id_generator = rdf_graph.objects(
-            subject=subject_uuid, predicate=Constants.NDAR["src_subject_id"]
-        )
-        for id_ in id_generator:
-            return id_
-    return None
+    return getProjectIndex(nidm_file_tuples).subject_id.get(subject_uuid)
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
@@ -275,33 +383,16 @@ def getActivities(nidm_file_tuples, subject_id):
     else:
         sub_uris = getSubjectUUIDsfromID(nidm_file_tuples, subject_id)
 
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        for subject_uri in sub_uris:
-            subject_uri = expandID(subject_uri, Constants.NIIRI)
-            for blank_node in rdf_graph.subjects(
-                predicate=Constants.PROV["agent"], object=subject_uri
-            ):
-                for activity in rdf_graph.subjects(
-                    predicate=Constants.PROV["qualifiedAssociation"], object=blank_node
-                ):
-                    if (activity, isa, Constants.PROV["Activity"]) in rdf_graph:
-                        activities.add(activity)
+    index = getProjectIndex(nidm_file_tuples)
+    for subject_uri in sub_uris:
+        subject_uri = expandID(subject_uri, Constants.NIIRI)
+        activities.update(index.activities.get(subject_uri, ()))
     return activities
 
 
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def isAStatCollection(nidm_file_tuples, uri):
-    for file in nidm_file_tuples:
-        rdf_graph = OpenGraph(file)
-        if (
-            ((uri, isa, Constants.NIDM["FSStatsCollection"]) in rdf_graph)
-            or ((uri, isa, Constants.NIDM["FSLStatsCollection"]) in rdf_graph)
-            or ((uri, isa, Constants.NIDM["ANTSStatsCollection"]) in rdf_graph)
-            or ((uri, isa, Constants.NIDM["DerivativeCollection"]) in rdf_graph)
-        ):
-            return True
-    return False
+    return uri in getProjectIndex(nidm_file_tuples).stat_collections
 
 
 # def getDataElementInfo(nidm_file_list, id):
@@ -385,6 +476,84 @@ def getActivityData(nidm_file_tuples, acquisition_id):
     )
 
 
+def GetFieldValuesForProject(nidm_file_tuples, project_id, fields, subjects=None):
+    """
+    Returns every value recorded for the given fields across the subjects of a project.
+
+    The field synonyms are resolved once up front and the values are then pulled from
+    the ProjectIndex (subject -> activities -> generated entities) in a single pass, looking
+    up the DataElement details of each predicate only once.
+
+    :param nidm_file_tuples: tuple of NIDM files
+    :param project_id: project UUID or URI
+    :param fields: list of field names (anything GetDatatypeSynonyms understands)
+    :param subjects: optional list of subject UUIDs to restrict the result to, defaults to all subjects in the project
+    :return: pandas DataFrame with an "activity" column plus one column per ValueType field
+    """
+    nidm_file_tuples = tuple(nidm_file_tuples)
+    index = getProjectIndex(nidm_file_tuples)
+
+    field_synonyms = set()
+    for field in fields:
+        field_synonyms.update(GetDatatypeSynonyms(nidm_file_tuples, project_id, field))
+
+    if subjects is None:
+        subjects = [
+            URITail(s)
+            for s in index.getSubjects(expandID(project_id, Constants.NIIRI))
+            if s is not None
+        ]
+
+    graphs = [OpenGraph(f) for f in nidm_file_tuples]
+    # (file position, predicate) -> data type info if the predicate is one of the requested fields
+    matches = {}
+    rows = []
+    for subject in subjects:
+        for activity in getActivities(nidm_file_tuples, subject):
+            for i, file_index in enumerate(index.file_indexes):
+                rdf_graph = graphs[i]
+                for data_object in file_index.generated.get(activity, ()):
+                    if data_object in file_index.acquisition_objects:
+                        instrument = True
+                    elif data_object in index.stat_collections:
+                        instrument = False
+                    else:
+                        continue
+                    for _, p, o in rdf_graph.triples((data_object, None, None)):
+                        if (i, p) not in matches:
+                            dti = getDataTypeInfo(rdf_graph, p)
+                            matches[(i, p)] = (
+                                dti
+                                if dti and dti["dataElement"] in field_synonyms
+                                else None
+                            )
+                        dti = matches[(i, p)]
+                        if dti is None:
+                            continue
+                        value = trimWellKnownURIPrefix(o) if instrument else str(o)
+                        value_type = makeValueTypeFromDataTypeInfo(
+                            value=value, data_type_info_tuple=dict(dti)
+                        )
+                        rows.append(
+                            (str(activity),) + value_type._replace(subject=subject)
+                        )
+
+    return pd.DataFrame(rows, columns=["activity"] + list(ValueType._fields))
+
+
+def valueTypesFromFrame(df):
+    """
+    Converts the rows of a GetFieldValuesForProject DataFrame back into ValueType tuples
+
+    :param df: DataFrame with the ValueType columns
+    :return: list of ValueType
+    """
+    return [
+        ValueType(*row)
+        for row in df[list(ValueType._fields)].itertuples(index=False, name=None)
+    ]
+
+
 @functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def GetProjectAttributes(nidm_files_tuple, project_id):
     result = {
@@ -71,10 +71,16 @@ class Project(pm.ProvActivity, Core):
         self.graph._add_record(self)
         # create empty sessions list
         self._sessions = []
+        # identifiers of the sessions, so adding a new session doesn't compare it with every other one
+        self._session_identifiers = set()
         # create empty derivatives list
         self._derivatives = []
         # create empty data elements list
         self._dataelements = []
+        # set by read_nidm(lazy=True) to functions reading the derivatives and data
+        # elements of the project the first time they are needed
+        self._derivative_loader = None
+        self._dataelement_loader = None
 
         if add_default_type:
             self.add_attributes({pm.PROV_TYPE: Constants.NIDM_PROJECT})
@@ -87,11 +93,14 @@ class Project(pm.ProvActivity, Core):
         :return true if session object added to project, false if session object is already in project
 
         """
-        if session in self._sessions:
+        if session.identifier in self._session_identifiers and (
+            session in self._sessions
+        ):
             return False
         else:
             # add session to self.sessions list
             self._sessions.extend([session])
+            self._session_identifiers.add(session.identifier)
             # get qname for niiri prefix and uuid...already in graph as we're adding a session and niiri added
             # when adding parent project
             niiri_qname = self.graph.valid_qualified_name("niiri:" + self.get_uuid())
@@ -114,10 +123,22 @@ class Project(pm.ProvActivity, Core):
     def get_sessions(self):
         return self._sessions
 
+    def _load_derivatives(self):
+        loader, self._derivative_loader = self._derivative_loader, None
+        if loader is not None:
+            loader()
+
+    def _load_dataelements(self):
+        loader, self._dataelement_loader = self._dataelement_loader, None
+        if loader is not None:
+            loader()
+
     def get_derivatives(self):
+        self._load_derivatives()
         return self._derivatives
 
     def get_dataelements(self):
+        self._load_dataelements()
         return self._dataelements
 
     def add_derivatives(self, derivative):
@@ -126,6 +147,7 @@ class Project(pm.ProvActivity, Core):
         :param derivative: object of type "Derivative" from nidm API
         :return true if derivative object added to project, false if derivative object is already in project
         """
+        self._load_derivatives()
         if derivative in self._derivatives:
             return False
         else:
@@ -157,6 +179,7 @@ class Project(pm.ProvActivity, Core):
         :param dataelement: object of type "DataElement" from nidm API
         :return true if derivative object added to project, false if derivative object is already in project
         """
+        self._load_dataelements()
         if dataelement in self._dataelements:
             return False
         else:
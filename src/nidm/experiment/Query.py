@@ -5,15 +5,13 @@ import hashlib
 import json
 import logging
 import os
-from os import environ, path
-import pickle
 import re
-import tempfile
+import weakref
 import pandas as pd
 import rdflib
-from rdflib import Graph, URIRef, util
-import requests
+from rdflib import Graph, URIRef
 from nidm.core import Constants
+from nidm.experiment import Cache, GraphBackend, TripleStore
 import nidm.experiment.CDE
 from nidm.util import urlretrieve
 
@@ -24,49 +22,42 @@ ACQUISITION_MODALITY = "AcquisitionModality"
 IMAGE_CONTRAST_TYPE = "ImageContrastType"
 IMAGE_USAGE_TYPE = "ImageUsageType"
 TASK = "Task"
+SPARQL_CHUNKSIZE = 100000
 
 
-def sparql_query_nidm(nidm_file_list, query, output_file=None, return_graph=False):
+def sparql_query_nidm(
+    nidm_file_list,
+    query,
+    output_file=None,
+    return_graph=False,
+    chunksize=None,
+    jobs=1,
+):
     """
 
     :param nidm_file_list: List of NIDM.ttl files to execute query on
     :param query:  SPARQL query string
-    :param output_file:  Optional output file to write results
+    :param output_file:  Optional output file to write results, written as Parquet if it ends in .parquet and CSV otherwise
     :param return_graph: WIP - not working right now but for some queries we prefer to return a graph instead of a dataframe
+    :param chunksize: Optional number of rows per chunk. If set, the results are streamed rather than collected: they
+        are written to output_file chunk by chunk and the number of rows is returned, or without an output_file an
+        iterator of dataframe chunks is returned (see sparql_query_nidm_chunks)
+    :param jobs: number of processes to parse the files in, if they haven't been parsed before
     :return: dataframe | graph depending on return_graph parameter
     """
 
-    if "BLAZEGRAPH_URL" in environ:
-        try:
-            # first make sure all files are loaded into blazegraph
-            for nidm_file in nidm_file_list:
-                OpenGraph(nidm_file)
-            logging.debug("Sending sparql to blazegraph: %s", query)
-            r2 = requests.post(
-                url=environ["BLAZEGRAPH_URL"],
-                params={"query": query},
-                headers={"Accept": "application/sparql-results+json"},
-            )
-            content = json.loads(r2.content)
-            columns = {}
-            for key in content["head"]["vars"]:
-                columns[key] = [x[key]["value"] for x in content["results"]["bindings"]]
-            df = pd.DataFrame(data=columns)
-            if output_file is not None:
-                df.to_csv(output_file)
-            return df
-
-        except Exception as e:
-            print(
-                f"Exception while communicating with blazegraph at {environ['BLAZEGRAPH_URL']}: {e}"
-            )
+    if jobs > 1:
+        GraphBackend.getBackend().load(nidm_file_list, jobs)
 
-    # query result list
-    results = []
+    if chunksize is not None and not return_graph:
+        chunks = sparql_query_nidm_chunks(nidm_file_list, query, chunksize)
+        if output_file is None:
+            return chunks
+        return writeQueryResults(chunks, output_file)
 
     logging.info("Query: %s", query)
 
-    # Merge all supplied NIDM files into a single graph and run the query once.
+    # Run the query once over the union of all the supplied NIDM files.
     #
     # Previously each file was opened and queried in isolation and the row
     # results were concatenated.  That silently dropped any match whose graph
@@ -77,29 +68,112 @@ def sparql_query_nidm(nidm_file_list, query, output_file=None, return_graph=Fals
     # nothing because neither file satisfied the full pattern on its own.
     # Unioning the files first makes those cross-file joins resolve while
     # leaving single-file and independent-per-file queries unchanged.
-    rdf_graph_parse = Graph()
-    for nidm_file in nidm_file_list:
-        rdf_graph_parse += OpenGraph(nidm_file)
+    #
+    # The graph backend (see nidm.experiment.GraphBackend) decides where the
+    # union lives: by default it is cached on disk so repeating a query over the
+    # same files doesn't copy every triple into a fresh graph again.
+    if return_graph:
+        qres = GetUnionGraph(nidm_file_list).query(query)
+        return qres.serialize(format="turtle")
 
-    qres = rdf_graph_parse.query(query)
+    # grab the SPARQL bound variable names for the dataframe column headings
+    columns, rows = GraphBackend.getBackend().query(nidm_file_list, query)
 
-    if not return_graph:
-        # grab the SPARQL bound variable names for the dataframe column headings
-        columns = [str(var) for var in qres.vars]
+    # convert results to Pandas DataFrame and return
+    df = pd.DataFrame([list(row) for row in rows], columns=columns)
 
-        # append each result row to the result list
-        for row in qres:
-            results.append(list(row))
+    # if output file parameter specified
+    if output_file is not None:
+        writeQueryResults([df], output_file)
+    return df
 
-        # convert results list to Pandas DataFrame and return
-        df = pd.DataFrame(results, columns=columns)
 
-        # if output file parameter specified
-        if output_file is not None:
-            df.to_csv(output_file)
-        return df
-    else:
-        return qres.serialize(format="turtle")
+def sparql_query_nidm_rows(nidm_file_list, query):
+    """
+    Runs a SPARQL SELECT query and yields the result rows as they are produced, without collecting them.
+    Queries that aren't SELECT queries yield the rows of their (complete) result.
+
+    :param nidm_file_list: List of NIDM.ttl files to execute query on
+    :param query: SPARQL query string
+    :return: iterator of rdflib ResultRow, which can be indexed by position or variable name
+    """
+    _, rows = GraphBackend.getBackend().query(nidm_file_list, query)
+    yield from rows
+
+
+def sparql_query_nidm_chunks(nidm_file_list, query, chunksize=SPARQL_CHUNKSIZE):
+    """
+    Runs a SPARQL query and yields the results as dataframes of at most chunksize rows, so memory use is bound
+    by the chunk size rather than the size of the result. Chunks are indexed by row number across the whole result.
+    An empty result yields a single empty dataframe with the query's columns.
+
+    :param nidm_file_list: List of NIDM.ttl files to execute query on
+    :param query: SPARQL query string
+    :param chunksize: maximum number of rows per chunk
+    :return: iterator of dataframes
+    """
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be a positive number, not {chunksize}")
+
+    columns, rows = GraphBackend.getBackend().query(nidm_file_list, query)
+    start = 0
+    chunk = []
+    for row in rows:
+        chunk.append(list(row))
+        if len(chunk) == chunksize:
+            yield pd.DataFrame(
+                chunk, columns=columns, index=range(start, start + len(chunk))
+            )
+            start += len(chunk)
+            chunk = []
+    if chunk or start == 0:
+        yield pd.DataFrame(
+            chunk, columns=columns, index=range(start, start + len(chunk))
+        )
+
+
+def writeQueryResults(chunks, output_file):
+    """
+    Writes query results chunk by chunk. Files ending in .parquet are written as Parquet, anything else as CSV
+    (with the same layout as DataFrame.to_csv)
+
+    :param chunks: iterable of dataframes with the same columns
+    :param output_file: file to write
+    :return: number of rows written
+    """
+    if str(output_file).endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        rows = 0
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    schema = pa.schema([(str(c), pa.string()) for c in chunk.columns])
+                    writer = pq.ParquetWriter(output_file, schema)
+                table = pa.table(
+                    {
+                        str(c): [None if v is None else str(v) for v in chunk[c]]
+                        for c in chunk.columns
+                    },
+                    schema=schema,
+                )
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    rows = 0
+    header = True
+    with open(output_file, "w", encoding="utf-8", newline="") as fp:
+        for chunk in chunks:
+            chunk.to_csv(fp, header=header)
+            header = False
+            rows += len(chunk)
+    return rows
 
 
 def GetProjectsUUID(nidm_file_list, output_file=None):
@@ -496,6 +570,105 @@ def GetParticipantUUIDFromSubjectID(nidm_file_list, subject_id):
     return df
 
 
+def GetParticipantUUIDsForSubjectIDs(nidm_file_list):
+    """
+    This function will return the prov:Agent of every subject ID in nidm_file_list, so many subject IDs can be
+    looked up with one query instead of a GetParticipantUUIDFromSubjectID query each
+    :return: dataframe with person_uuid and ID columns
+    """
+
+    query = f"""
+
+                    prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                    prefix prov: <http://www.w3.org/ns/prov#>
+                    prefix ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/>
+
+                    select distinct ?person_uuid ?ID
+
+                    where {{
+                            ?person_uuid rdf:type prov:Agent ;
+                                rdf:type prov:Person ;
+                                {Constants.NIDM_SUBJECTID} ?ID .
+                    }}
+
+                """
+
+    df = sparql_query_nidm(nidm_file_list, query, output_file=None)
+
+    return df
+
+
+def GetParticipantSessionNumbers(nidm_file_list):
+    """
+    This function will return the bids:session_number of the sessions of every subject ID in nidm_file_list
+    (see GetParticipantSessionsMetadata for the metadata of a single subject's sessions)
+    :return: dataframe with ID, session_uuid and session_number columns
+    """
+
+    query = """
+
+            prefix nidm: <http://purl.org/nidash/nidm#>
+            prefix dct: <http://purl.org/dc/terms/>
+            prefix prov: <http://www.w3.org/ns/prov#>
+            prefix ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/>
+            prefix bids: <http://bids.neuroimaging.io/>
+
+            select distinct ?ID ?session_uuid ?session_number
+
+            where {
+                    ?session_uuid  a nidm:Session ;
+                        bids:session_number ?session_number .
+                    ?acq_act dct:isPartOf ?session_uuid ;
+                        prov:qualifiedAssociation [prov:agent [ndar:src_subject_id ?ID]] .
+            }
+
+        """
+
+    df = sparql_query_nidm(nidm_file_list, query, output_file=None)
+
+    return df
+
+
+def GetAcquisitionEntitiesTaskRun(nidm_file_list):
+    """
+    This function will return the acquisition activities and entities of every participant in nidm_file_list
+    along with the session they are part of and their task and run metadata, the batched form of the
+    GetAcquisitionEntityFromSubjectSession* queries
+    :return: dataframe with ID, session_uuid, acq_activity, acq_entity, task and run columns, task and run are
+        None for acquisitions without them
+    """
+
+    query = f"""
+
+                prefix nidm: <http://purl.org/nidash/nidm#>
+                prefix dct: <http://purl.org/dc/terms/>
+                prefix prov: <http://www.w3.org/ns/prov#>
+                prefix ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/>
+                prefix sio: <http://semanticscience.org/ontology/sio.owl#>
+
+                select distinct ?ID ?session_uuid ?acq_activity ?acq_entity ?task ?run
+
+                where {{
+                        ?acq_activity dct:isPartOf ?session_uuid ;
+                            prov:qualifiedAssociation _:blanknode .
+
+                         _:blanknode prov:hadRole {Constants.NIDM_PARTICIPANT} ;
+                            prov:agent ?uuid  .
+
+                        ?uuid {Constants.NIDM_SUBJECTID} ?ID .
+
+                        ?acq_entity prov:wasGeneratedBy ?acq_activity .
+                        OPTIONAL {{ ?acq_entity nidm:Task ?task . }}
+                        OPTIONAL {{ ?acq_entity nidm:AcquisitionObject ?run . }}
+                }}
+
+            """
+
+    df = sparql_query_nidm(nidm_file_list, query, output_file=None)
+
+    return df
+
+
 def GetAcquisitionEntityMetadataFromUUID(nidm_file_list, entity_uuid):
     """
     This function will return all metadata from Acquisition entity metadata
@@ -790,10 +963,19 @@ def GetParticipantDetails(nidm_file_list, project_id, participant_id, output_fil
     return result
 
 
-def GetMergedGraph(nidm_file_list):
+def GetMergedGraph(nidm_file_list, jobs=1):
+    """
+    Returns a new in-memory graph holding the triples of all the files
+
+    :param nidm_file_list: List of one or more NIDM files
+    :param jobs: number of processes to parse the files in
+    :return: Graph
+    """
+    if jobs > 1:
+        GraphBackend.loadStores(nidm_file_list, jobs)
     rdf_graph = Graph()
     for f in nidm_file_list:
-        rdf_graph.parse(f, format=util.guess_format(f))
+        GraphBackend.parseGraph(f, rdf_graph)
     return rdf_graph
 
 
@@ -912,6 +1094,7 @@ def GetParticipantUUIDsForProjectCached(
 
     for file in nidm_file_list:
         rdf_graph = OpenGraph(file)
+        candidates = []
         # find all the sessions
         for session, _, _ in rdf_graph.triples(
             (None, None, Constants.NIDM["Session"])
@@ -932,38 +1115,37 @@ def GetParticipantUUIDsForProjectCached(
                             Constants.PROV["hadRole"],
                             Constants.SIO["Subject"],
                         ) in rdf_graph:
-                            for participant in rdf_graph.objects(
-                                subject=blank, predicate=Constants.PROV["agent"]
-                            ):
-                                uuid = (str(participant)).split("/")[
-                                    -1
-                                ]  # strip off the http://whatever/whatever/
-                                if (uuid not in participants) and (
-                                    (not filter)
-                                    or CheckSubjectMatchesFilter(
-                                        tuple([file]), project, participant, filter
-                                    )
-                                ):
-                                    ### added by DBK for subject IDs as well ###
-                                    for id_ in rdf_graph.objects(
-                                        subject=participant,
-                                        predicate=URIRef(Constants.NIDM_SUBJECTID.uri),
-                                    ):
-                                        subid = (str(id_)).split("/")[
-                                            -1
-                                        ]  # strip off the http://whatever/whatever/
-
-                                        ### added by DBK for subject IDs as well ###
-                                        # participants.append(uuid)
-                                        if uuid not in participants["uuid"]:
-                                            try:
-                                                participants["uuid"].append(uuid)
-                                                participants["subject id"].append(subid)
-                                            # just in case there's no subject id in the file...
-                                            except Exception:
-                                                # participants.append(uuid)
-                                                participants["uuid"].append(uuid)
-                                                participants["subject id"].append("")
+                            candidates.extend(
+                                rdf_graph.objects(
+                                    subject=blank, predicate=Constants.PROV["agent"]
+                                )
+                            )
+
+        if filter:
+            # evaluate the filter for all the file's participants at once
+            from nidm.experiment.Filter import FilterSubjects
+
+            mask = FilterSubjects((file,), project, candidates, filter)
+            candidates = [p for p, keep in zip(candidates, mask) if keep]
+
+        for participant in candidates:
+            uuid = (str(participant)).split("/")[
+                -1
+            ]  # strip off the http://whatever/whatever/
+            ### added by DBK for subject IDs as well ###
+            for id_ in rdf_graph.objects(
+                subject=participant,
+                predicate=URIRef(Constants.NIDM_SUBJECTID.uri),
+            ):
+                subid = (str(id_)).split("/")[
+                    -1
+                ]  # strip off the http://whatever/whatever/
+
+                ### added by DBK for subject IDs as well ###
+                # participants.append(uuid)
+                if uuid not in participants["uuid"]:
+                    participants["uuid"].append(uuid)
+                    participants["subject id"].append(subid)
 
     return participants
 
@@ -1011,6 +1193,147 @@ def getProjectAcquisitionObjects(nidm_file_list, project_id):
     return acq_objects
 
 
+def _synonymMatchFields(dti):
+    """
+    :param dti: getDataTypeInfo dict of a DataElement
+    :return: strings a datatype is looked for in to decide if the DataElement is a synonym
+    """
+    return [
+        str(x)
+        for x in [
+            dti["source_variable"],
+            dti["label"],
+            dti["datumType"],
+            dti["measureOf"],
+            URITail(dti["measureOf"]),
+            str(dti["isAbout"]),
+            URITail(dti["isAbout"]),
+            dti["dataElement"],
+            dti["dataElementURI"],
+            dti["prefix"],
+        ]
+    ]
+
+
+def _synonymNames(dti):
+    """
+    :param dti: getDataTypeInfo dict of a DataElement
+    :return: names the DataElement adds to the synonyms of a datatype it matches
+    """
+    return [
+        str(dti["source_variable"]),
+        str(dti["label"]),
+        str(dti["datumType"]),
+        str(dti["measureOf"]),
+        URITail(dti["measureOf"]),
+        str(dti["isAbout"]),
+        str(dti["dataElement"]),
+        str(dti["dataElementURI"]),
+    ]
+
+
+class SynonymIndex:
+    """
+    Index of the DataElements of a project for finding the synonyms of a datatype (see
+    GetDatatypeSynonyms).  A DataElement matches a datatype if the datatype is a
+    substring of one of its fields, so every distinct field value is indexed by the
+    trigrams (3 character substrings) in it and only the values holding all the
+    trigrams of a datatype are checked for it.
+    """
+
+    GRAM = 3
+
+    def __init__(self, data_elements):
+        """
+        :param data_elements: GetProjectDataElements dict of the project
+        """
+        self.data_elements = data_elements
+        # distinct field values, the DataElements having each one and the values
+        # holding each trigram, all by value index
+        self.values = []
+        self.value_elements = []
+        self.grams = {}
+        # names each DataElement adds to the synonyms of a datatype it matches
+        self.names = []
+
+        value_ids = {}
+        for dti in data_elements["data_type_info"]:
+            if not isinstance(dti, dict):
+                # skip anything that isn’t a dict
+                continue
+            element = len(self.names)
+            self.names.append(frozenset(_synonymNames(dti)))
+            for value in _synonymMatchFields(dti):
+                value_id = value_ids.get(value)
+                if value_id is None:
+                    value_id = value_ids[value] = len(self.values)
+                    self.values.append(value)
+                    self.value_elements.append(set())
+                    for gram in self._grams(value):
+                        self.grams.setdefault(gram, set()).add(value_id)
+                self.value_elements[value_id].add(element)
+
+    def _grams(self, string):
+        return {string[i : i + self.GRAM] for i in range(len(string) - self.GRAM + 1)}
+
+    def synonyms(self, datatype):
+        """
+        :param datatype: datatype string
+        :return: set of datatype and the names of the DataElements it matches
+        """
+        datatype = str(datatype)
+        grams = self._grams(datatype)
+        if grams:
+            postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+            candidates = set.intersection(*postings)
+        else:
+            # too short to have a trigram
+            candidates = range(len(self.values))
+
+        elements = set()
+        for value_id in candidates:
+            if datatype in self.values[value_id]:
+                elements.update(self.value_elements[value_id])
+
+        all_synonyms = {datatype}
+        for element in elements:
+            all_synonyms.update(self.names[element])
+        all_synonyms.discard("")  # remove the empty string in case that is in there
+        return all_synonyms
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def getSynonymIndex(nidm_file_list, project_id):
+    """
+    Returns the SynonymIndex of the DataElements of a project.  The index is built once
+    and kept in the cache dir next to the graph stores, named by the project and the
+    digests of the files, so later runs over the same files load it rather than
+    collecting the DataElements again.
+
+    :param nidm_file_list: tuple of NIDM files
+    :param project_id: project UUID or URI
+    :return: SynonymIndex
+    """
+    cache_file_name = None
+    # graphs passed in directly have no digest to name the cache entry by
+    if not any(isinstance(f, Graph) for f in nidm_file_list):
+        hasher = hashlib.md5()
+        hasher.update(str(project_id).encode("utf-8"))
+        for file in nidm_file_list:
+            hasher.update(GraphBackend.fileDigest(file).encode("utf-8"))
+        cache_file_name = Cache.cachePath("synonym_index", hasher.hexdigest(), "pickle")
+        index = Cache.readPickle(cache_file_name)
+        if index is not None:
+            Cache.useEntry(cache_file_name, "synonym_index")
+            return index
+
+    index = SynonymIndex(_projectDataElements(nidm_file_list, project_id))
+    if cache_file_name is not None:
+        Cache.writePickle(index, cache_file_name)
+        Cache.addEntry(cache_file_name, "synonym_index")
+    return index
+
+
 @functools.lru_cache(maxsize=LARGEST_CACHE_SIZE)
 def GetDatatypeSynonyms(nidm_file_list, project_id, datatype):
     """
@@ -1027,49 +1350,21 @@ def GetDatatypeSynonyms(nidm_file_list, project_id, datatype):
         datatype = datatype[12:]
     if datatype.startswith("derivatives."):
         datatype = datatype[12:]
-    project_data_elements = GetProjectDataElements(nidm_file_list, project_id)
-    all_synonyms = set([datatype])
-    for dti in project_data_elements["data_type_info"]:
-        if not isinstance(dti, dict):
-            # skip anything that isn’t a dict
-            continue
-
-        # modified by DBK 7/25/2022
-        # if str(datatype) in [ str(x) for x in [dti['source_variable'], dti['label'], dti['datumType'], dti['measureOf'], URITail(dti['measureOf']), str(dti['isAbout']), URITail(dti['isAbout']), dti['dataElement'], dti['dataElementURI'], dti['prefix']] ]:
-        if any(
-            str(datatype) in str(x)
-            for x in [
-                dti["source_variable"],
-                dti["label"],
-                dti["datumType"],
-                dti["measureOf"],
-                URITail(dti["measureOf"]),
-                str(dti["isAbout"]),
-                URITail(dti["isAbout"]),
-                dti["dataElement"],
-                dti["dataElementURI"],
-                dti["prefix"],
-            ]
-        ):
-            all_synonyms = all_synonyms.union(
-                set(
-                    [
-                        str(dti["source_variable"]),
-                        str(dti["label"]),
-                        str(dti["datumType"]),
-                        str(dti["measureOf"]),
-                        URITail(dti["measureOf"]),
-                        str(dti["isAbout"]),
-                        str(dti["dataElement"]),
-                        str(dti["dataElementURI"]),
-                    ]
-                )
-            )
-            all_synonyms.remove("")  # remove the empty string in case that is in there
-    return all_synonyms
+    return getSynonymIndex(tuple(nidm_file_list), project_id).synonyms(datatype)
 
 
 def GetProjectDataElements(nidm_file_list, project_id):
+    """
+    :param nidm_file_list: list of NIDM files
+    :param project_id: project UUID or URI
+    :return: dict of lists of the uuid, label and getDataTypeInfo dict (data_type_info)
+        of the DataElements of the project, out of its SynonymIndex
+    """
+    data_elements = getSynonymIndex(tuple(nidm_file_list), project_id).data_elements
+    return {key: list(values) for key, values in data_elements.items()}
+
+
+def _projectDataElements(nidm_file_list, project_id):
     ### added by DBK...changing to dictionary to support labels along with uuids
     # result = []
     result = {}
@@ -1197,6 +1492,8 @@ def CheckSubjectMatchesFilter(
     """
     filter should look something like:
        instruments.AGE gt 12 and instruments.SITE_ID eq CMU
+    see nidm.experiment.Filter for the full syntax. To check many subjects use
+    nidm.experiment.Filter.FilterSubjects, which evaluates the filter for all of them at once
 
     :param nidm_file_list:
     :param project_uuid:
@@ -1205,87 +1502,13 @@ def CheckSubjectMatchesFilter(
     :return:
     """
 
-    if filter is None:
+    if not filter:
         return True
 
-    # filter can have multiple and clauses, break them up and test each one
-    tests = filter.split("and")
-
-    for test in tests:
-        found_match = False
-        split_array = test.split(" ")
-        # TODO: I need to fix this here.  When there is a space inside the value the splitter gets more than 3 values
-        # ex: 'projects.subjects.instruments.WISC_IV_VOCAB_SCALED eq \'not a match\''
-        # in this case we must have spaces in identifier: 'projects.subjects.instruments.age at scan eq 21
-        # not guaranteed to always be an 'eq' separator.
-        # TODO: Make more robust!
-        # if len(split_array) > 3:
-        #    split_array = test.split('eq')
-        #    compound_sub = split_array[0]
-        #    op = 'eq'
-        #    value = ' '.join(split_array[1:])
-        # else:
-        compound_sub = split_array[0]
-        op = split_array[1]
-        value = " ".join(split_array[2:])
-
-        # if the value is a string, it will have quotes around it.  Strip them out now
-        for quote in ["'", '"', "`"]:
-            if value[0] == quote and value[-1] == quote:
-                value = value[1:-1]
-
-        sub_pieces = splitSubject(compound_sub)
-
-        # figure out what we are filtering on
-        term = None
-        if len(sub_pieces) == 1:
-            # no instruments or derivatives prefix was entered, so test in both
-            term = sub_pieces[0]
-
-        if (len(sub_pieces) == 2 and sub_pieces[0] == "instruments") or len(
-            sub_pieces
-        ) == 1:
-            if len(sub_pieces) == 2:
-                term = sub_pieces[1]  # 'AGE_AT_SCAN' for example
-            synonyms = GetDatatypeSynonyms(tuple(nidm_file_list), project_uuid, term)
-            instrument_details = GetParticipantInstrumentData(
-                nidm_file_list, project_uuid, subject_uuid
-            )
-            for terms in instrument_details.values():
-                for instrument_term, v in terms.items():
-                    if instrument_term in synonyms:
-                        found_match = filterCompare(v, op, value)
-                    if found_match:
-                        break
-
-        if (len(sub_pieces) == 2 and sub_pieces[0] == "derivatives") or len(
-            sub_pieces
-        ) == 1:
-            if len(sub_pieces) == 2:
-                term = sub_pieces[1]  # 'ilx:0102597' for example
-            derivatives_details = GetDerivativesDataForSubject(
-                nidm_file_list, project_uuid, subject_uuid
-            )
-            for details in derivatives_details.values():
-                derivatives = details["values"]
-                for (
-                    vkey
-                ) in (
-                    derivatives
-                ):  # values will be in the form { http://example.com/a/b/c#fs_00001 : { datumType: '', label: '', value: '', units:'' }, ... }
-                    short_key = URITail(vkey)
-                    if short_key == term:
-                        found_match = filterCompare(
-                            derivatives[vkey]["value"], op, value
-                        )
-                    if found_match:
-                        break
-
-        # check after each test if we got false because the tests are joined with 'and'
-        if not found_match:
-            return False
+    # imported here since the filter engine is built on the queries in this module
+    from nidm.experiment.Filter import FilterSubjects
 
-    return True
+    return bool(FilterSubjects(nidm_file_list, project_uuid, [subject_uuid], filter)[0])
 
 
 def filterCompare(left, op, right):
@@ -1636,90 +1859,188 @@ def getDerivativesNodesForSubject(rdf_graph, subject):
     return derivatives_uris
 
 
+# DataElement predicates by the suffix that identifies them, whatever their namespace.
+# Suffixes in DATA_ELEMENT_NOCASE_FIELDS are matched case-insensitively
+DATA_ELEMENT_FIELDS = {
+    "label": "label",
+    "source_variable": "source_variable",
+    "sourceVariable": "source_variable",
+    "description": "description",
+    "hasUnit": "hasUnit",
+    "datumType": "datumType",
+    "measureOf": "measureOf",
+    "isAbout": "isAbout",
+}
+DATA_ELEMENT_NOCASE_FIELDS = {"hasunit": "hasUnit", "isabout": "isAbout"}
+
+
 @functools.lru_cache(maxsize=LARGEST_CACHE_SIZE)
+def dataElementField(predicate):
+    """
+    :param predicate: predicate URI of a DataElement triple
+    :return: name of the getDataTypeInfo field the predicate sets, None if it sets none
+    """
+    predicate = str(predicate)
+    for suffix, field in DATA_ELEMENT_FIELDS.items():
+        if predicate.endswith(suffix):
+            return field
+    for suffix, field in DATA_ELEMENT_NOCASE_FIELDS.items():
+        if predicate.lower().endswith(suffix):
+            return field
+    return None
+
+
+class PrefixTrie:
+    """Character trie of namespace URIs for finding the prefix bound to a URI"""
+
+    def __init__(self, namespaces):
+        """
+        :param namespaces: iterable of (prefix, namespace) tuples as given by Graph.namespaces()
+        """
+        self.root = {}
+        for rank, (prefix, namespace) in enumerate(namespaces):
+            node = self.root
+            for c in str(namespace):
+                node = node.setdefault(c, {})
+            # like a scan of the namespaces, the first binding of a namespace wins
+            node.setdefault(None, (rank, prefix))
+
+    def prefix(self, uri):
+        """
+        :param uri: URI to find the prefix of
+        :return: prefix of the first bound namespace uri starts with, "" if there is none
+        """
+        matches = []
+        node = self.root
+        for c in str(uri):
+            if None in node:
+                matches.append(node[None])
+            node = node.get(c)
+            if node is None:
+                break
+        else:
+            if None in node:
+                matches.append(node[None])
+        return min(matches)[1] if matches else ""
+
+
+class DataElementTable:
+    """
+    DataElement metadata of a graph, built once per graph.  The DataElements of the graph
+    are found up front and the getDataTypeInfo dict of each one is built the first time
+    it's asked for.
+    """
+
+    def __init__(self, rdf_graph):
+        isa = URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
+        self.graph = rdf_graph
+        self.elements = set(
+            rdf_graph.subjects(predicate=isa, object=Constants.NIDM["DataElement"])
+        )
+        self.elements.update(
+            rdf_graph.subjects(
+                predicate=isa, object=Constants.NIDM["PersonalDataElement"]
+            )
+        )
+        self._prefixes = None
+        self._info = {}
+
+    def info(self, datatype):
+        """
+        :param datatype: URIRef of the DataElement
+        :return: getDataTypeInfo dict of the DataElement, False if the graph doesn't describe it
+        """
+        if datatype not in self._info:
+            self._info[datatype] = self._build(datatype)
+        return self._info[datatype]
+
+    def _build(self, datatype):
+        info = {
+            "label": "",
+            "hasUnit": "",
+            "datumType": "",
+            "measureOf": "",
+            "isAbout": "",
+            "source_variable": "",
+            "description": "",
+        }
+        found = None
+        # have to scan all triples because the label can be in any namespace
+        for s, p, o in self.graph.triples((datatype, None, None)):
+            found = s
+            field = dataElementField(p)
+            if field == "datumType":
+                info[field] = str(o).split("/")[-1]
+            elif field is not None:
+                info[field] = o
+
+        if found is None:
+            return False
+
+        if self._prefixes is None:
+            self._prefixes = PrefixTrie(self.graph.namespaces())
+        return {
+            "label": info["label"],
+            "hasUnit": info["hasUnit"],
+            "datumType": info["datumType"],
+            "measureOf": info["measureOf"],
+            "isAbout": info["isAbout"],
+            "dataElement": str(URITail(found)),
+            "dataElementURI": found,
+            "description": info["description"],
+            "prefix": self._prefixes.prefix(datatype),
+            "source_variable": info["source_variable"],
+        }
+
+
+_data_element_tables = weakref.WeakKeyDictionary()
+
+
+def getDataElementTable(rdf_graph):
+    """
+    Returns the DataElementTable of a graph.  Graphs backed by a binary triple store share
+    the table of their store, which is named by the digest of its contents, so reopening
+    the same file reuses the table.  Other graphs keep theirs for as long as they live.
+
+    :param rdf_graph: rdflib Graph
+    :return: DataElementTable
+    """
+    store_path = getattr(rdf_graph.store, "store_path", None)
+    if store_path is not None:
+        return _storeDataElementTable(store_path)
+    table = _data_element_tables.get(rdf_graph)
+    if table is None:
+        table = _data_element_tables[rdf_graph] = DataElementTable(rdf_graph)
+    return table
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _storeDataElementTable(store_path):
+    return DataElementTable(TripleStore.open_graph(store_path))
+
+
 def getDataTypeInfo(source_graph, datatype):
     """
-    Scans all the triples with subject of datatype (isa DataElement in the graph) and looks for entries
-    with specific predicates necessary to define it's type
+    Looks up the DataElement datatype in source_graph, or in the CDE graph if source_graph
+    doesn't define it, and collects the entries with the predicates necessary to define
+    it's type
 
-    :param rdf_graph:
-    :param dt: URI of the DataElement
+    :param source_graph: rdflib Graph, or None to only look in the CDE graph
+    :param datatype: URI of the DataElement
     :return: { 'label': label, 'hasUnit': hasUnit, 'typeURI': typeURI}
     """
-    isa = URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
-
     expanded_datatype = datatype
     if expanded_datatype.find("http") < 0:
         expanded_datatype = Constants.NIIRI[expanded_datatype]
+    expanded_datatype = URIRef(expanded_datatype)
 
     # check to see if the datatype is in the main graph. If not, look in the CDE graph
-    if (
-        source_graph
-        and (expanded_datatype, isa, Constants.NIDM["DataElement"]) in source_graph
-    ):
-        rdf_graph = source_graph
-    # check if datatype is a personal data element
-    elif (
-        source_graph
-        and (expanded_datatype, isa, Constants.NIDM["PersonalDataElement"])
-        in source_graph
-    ):
-        rdf_graph = source_graph
-    else:
-        rdf_graph = nidm.experiment.CDE.getCDEs()
-
-    typeURI = ""
-    hasUnit = ""
-    label = ""
-    description = ""
-    measureOf = ""
-    isAbout = ""
-    prefix = ""
-    source_variable = ""
-
-    found = None
-
-    # have to scan all tripples because the label can be in any namespace
-    for s, p, o in rdf_graph.triples((expanded_datatype, None, None)):
-        found = s
-        if re.search(r"label$", str(p)) is not None:
-            label = o
-        if re.search(r"source_variable$", str(p)) is not None:
-            source_variable = o
-        elif re.search(r"sourceVariable$", str(p)) is not None:
-            source_variable = o
-        if re.search(r"description$", str(p)) is not None:
-            description = o
-        if re.search(r"hasUnit$", str(p), flags=re.IGNORECASE) is not None:
-            hasUnit = o
-        if re.search(r"datumType$", str(p)) is not None:
-            typeURI = str(o).split("/")[-1]
-        if re.search(r"measureOf$", str(p)) is not None:
-            measureOf = o
-        if re.search(r"isAbout$", str(p), flags=re.IGNORECASE) is not None:
-            isAbout = o
-
-    possible_prefix = [
-        x for x in rdf_graph.namespaces() if expanded_datatype.startswith(x[1])
-    ]
-    if len(possible_prefix) > 0:
-        prefix = possible_prefix[0][0]
+    if source_graph is not None:
+        table = getDataElementTable(source_graph)
+        if expanded_datatype in table.elements:
+            return table.info(expanded_datatype)
 
-    if found is None:
-        return False
-    else:
-        return {
-            "label": label,
-            "hasUnit": hasUnit,
-            "datumType": typeURI,
-            "measureOf": measureOf,
-            "isAbout": isAbout,
-            "dataElement": str(URITail(found)),
-            "dataElementURI": found,
-            "description": description,
-            "prefix": prefix,
-            "source_variable": source_variable,
-        }
+    return getDataElementTable(nidm.experiment.CDE.getCDEs()).info(expanded_datatype)
 
 
 def getStatsCollectionForNode(rdf_graph, derivatives_node):
@@ -1745,13 +2066,13 @@ def getStatsCollectionForNode(rdf_graph, derivatives_node):
     return data
 
 
-@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
 def OpenGraph(file):
     """
     Returns a parsed RDFLib Graph object for the given file
-    The file will be hashed and if a pickled copy is found in the TMP dir, that will be used
-    Otherwise the graph will be computed and then saved in the TMP dir as a pickle file
-    We also use functools.lru_cache to cache results in memory during a run
+    The graph comes from the active graph backend (see nidm.experiment.GraphBackend). By default the file is
+    hashed and if a binary triple store for it is found in the TMP dir, a read-only graph memory-mapped from
+    that store will be returned (see nidm.experiment.TripleStore), otherwise the graph will be parsed and then
+    saved in the TMP dir as a binary triple store
 
     :param file: filename
     :return: Graph
@@ -1761,40 +2082,21 @@ def OpenGraph(file):
     if isinstance(file, rdflib.graph.Graph):
         return file
 
-    # If we have a Blazegraph instance, load the data then do the rest
-    if "BLAZEGRAPH_URL" in environ:
-        try:
-            with open(file, encoding="utf-8") as f:
-                data = f.read()
-            logging.debug("Sending %s to blazegraph", file)
-            requests.post(
-                url=environ["BLAZEGRAPH_URL"],
-                data=data,
-                headers={"Content-type": "application/x-turtle"},
-            )
-        except Exception as e:
-            logging.error("Exception %s loading %s into Blazegraph.", e, file)
+    return GraphBackend.getBackend().openGraph(file)
 
-    BLOCKSIZE = 65536
-    hasher = hashlib.md5()
-    with open(file, "rb") as f:
-        buf = f.read(BLOCKSIZE)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = f.read(BLOCKSIZE)
-    digest = hasher.hexdigest()
-
-    pickle_file = f"{tempfile.gettempdir()}/rdf_graph.{digest}.pickle"
-    if path.isfile(pickle_file):
-        with open(pickle_file, "rb") as fp:
-            return pickle.load(fp)
 
-    rdf_graph = Graph()
-    rdf_graph.parse(file, format=util.guess_format(file))
-    with open(pickle_file, "wb") as fp:
-        pickle.dump(rdf_graph, fp)
+def GetUnionGraph(nidm_file_list):
+    """
+    Returns a graph holding the union of all the triples in nidm_file_list.
 
-    return rdf_graph
+    With the default backend the union is materialized once as a read-only binary triple store keyed on
+    the digests and modification times of the files (in the order given) so repeated queries over the
+    same file list, in this process or a later one, don't copy triples into a new graph.
+
+    :param nidm_file_list: list of NIDM files (or already parsed Graphs)
+    :return: Graph
+    """
+    return GraphBackend.getBackend().unionGraph(list(nidm_file_list))
 
 
 def GetDerivativesDataForSubject(files, project, subject):
@@ -1849,7 +2151,7 @@ def getSoftwareAgents(rdf_graph):
 
 
 def download_cde_files():
-    cde_dir = tempfile.gettempdir()
+    cde_dir = Cache.getCacheDir()
 
     for url in Constants.CDE_FILE_LOCATIONS:
         urlretrieve(url, f"{cde_dir}/{url.split('/')[-1]}")
@@ -1865,11 +2167,11 @@ def getCDEs(file_list=None):
     hasher.update(str(file_list).encode("utf-8"))
     h = hasher.hexdigest()
 
-    cache_file_name = tempfile.gettempdir() + f"/cde_graph.{h}.pickle"
+    cache_file_name = Cache.cachePath("cde_graph", h, "pickle")
 
-    if path.isfile(cache_file_name):
-        with open(cache_file_name, "rb") as fp:
-            rdf_graph = pickle.load(fp)
+    rdf_graph = Cache.readPickle(cache_file_name)
+    if rdf_graph is not None:
+        Cache.useEntry(cache_file_name, "cde_graph")
         getCDEs.cache = rdf_graph
         return rdf_graph
 
@@ -1900,8 +2202,8 @@ def getCDEs(file_list=None):
             cde_graph = OpenGraph(fname)
             rdf_graph = rdf_graph + cde_graph
 
-    with open(cache_file_name, "wb") as cache_file:
-        pickle.dump(rdf_graph, cache_file)
+    Cache.writePickle(rdf_graph, cache_file_name)
+    Cache.addEntry(cache_file_name, "cde_graph")
 
     getCDEs.cache = rdf_graph
     return rdf_graph
@@ -0,0 +1,419 @@
+"""Reading and writing NIDM files in line-based RDF formats.
+
+rdflib's Turtle serializer sorts and groups the whole graph before it writes
+anything, which takes a long time and a lot of memory on very large exports.
+TripleWriter writes triples as they are handed to it instead, in one of the
+STREAM_FORMATS:
+
+- nt: N-Triples
+- nq: N-Quads, triples can be written into named graphs
+- ttl-stream: Turtle with one triple per line, prefixed names are used for the
+  namespaces bound to the writer
+
+Any of the files can be gzip compressed.  parseFile reads them all back,
+gzip compressed or not, and is what the query layer parses files with.
+
+A TripleWriter opened with unique=True leaves out the triples it has already
+written, keeping their digests in a TripleSet on disk rather than in memory, so
+any number of files can be merged into one file a file at a time.  Blank nodes
+only identify something within their file, relabelBlankNodes gives them labels
+of their own before the triples of several files are written together.
+"""
+
+import gzip
+import hashlib
+import re
+import sqlite3
+from rdflib import BNode, ConjunctiveGraph, Graph, Literal, URIRef, util
+
+STREAM_FORMATS = ("nt", "nq", "ttl-stream")
+OUTPUT_FORMATS = ("turtle",) + STREAM_FORMATS
+
+# file extension of each output format
+EXTENSIONS = {
+    "turtle": ".ttl",
+    "ttl-stream": ".ttl",
+    "nt": ".nt",
+    "nq": ".nq",
+    "json-ld": ".json",
+    "pretty-xml": ".xml",
+    "n3": ".n3",
+    "trig": ".trig",
+}
+
+# formats whose files can hold named graphs, parsed through a ConjunctiveGraph
+QUAD_FORMATS = ("nquads", "trig", "trix")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+# prefixed names are only written for local names every Turtle parser reads back
+_LOCAL_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+_PREFIX_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_-]*$")
+
+# number of triples a unique TripleWriter looks up in its TripleSet at once
+DEDUP_BATCH_SIZE = 50000
+# memory the SQLite page cache of a TripleSet may use, in KiB
+DEDUP_CACHE_KIB = 65536
+# number of digests per SQL statement, below SQLite's limit on query parameters
+_SQL_CHUNK = 500
+
+
+def outputFilename(base, output_format, compress=False):
+    """
+    :param base: path of the file without extension
+    :param output_format: one of OUTPUT_FORMATS or an rdflib serializer name
+    :param compress: True if the file will be gzip compressed
+    :return: base with the extension for output_format
+    """
+    return (
+        base
+        + EXTENSIONS.get(output_format, "." + output_format)
+        + (".gz" if compress else "")
+    )
+
+
+def isCompressed(file):
+    """
+    :param file: filename
+    :return: True if file is gzip compressed
+    """
+    try:
+        with open(file, "rb") as fp:
+            return fp.read(2) == _GZIP_MAGIC
+    except (OSError, TypeError):
+        # URLs and such are left to rdflib
+        return False
+
+
+def guessFormat(file):
+    """
+    rdflib.util.guess_format that also knows the formats of gzip compressed files
+    (e.g. nidm.nt.gz)
+
+    :param file: filename
+    :return: rdflib parser name or None
+    """
+    file = str(file)
+    if file.endswith(".gz"):
+        file = file[: -len(".gz")]
+    return util.guess_format(file)
+
+
+def openFile(file):
+    """
+    :param file: filename
+    :return: binary file object reading the (uncompressed) contents of file
+    """
+    if isCompressed(file):
+        return gzip.open(file, "rb")
+    return open(file, "rb")
+
+
+def parseFile(file, rdf_graph=None):
+    """
+    Parses an RDF file, which may be gzip compressed, into rdf_graph.  The triples
+    of all the graphs in N-Quads and TriG files are added.
+
+    :param file: filename
+    :param rdf_graph: Graph to add the contents of file to, a new Graph if not given
+    :return: rdf_graph
+    """
+    if rdf_graph is None:
+        rdf_graph = Graph()
+
+    rdf_format = guessFormat(file)
+    compressed = isCompressed(file)
+    if rdf_format not in QUAD_FORMATS and not compressed:
+        rdf_graph.parse(file, format=rdf_format)
+        return rdf_graph
+
+    with openFile(file) as source:
+        if rdf_format not in QUAD_FORMATS:
+            rdf_graph.parse(source=source, format=rdf_format)
+            return rdf_graph
+        dataset = ConjunctiveGraph()
+        dataset.parse(source=source, format=rdf_format)
+    for prefix, namespace in dataset.namespaces():
+        rdf_graph.bind(prefix, namespace, override=False)
+    rdf_graph.addN((s, p, o, rdf_graph) for s, p, o in dataset.triples((None,) * 3))
+    return rdf_graph
+
+
+def relabelBlankNodes(triples, label):
+    """
+    Gives the blank nodes of triples new labels made from label and the order they
+    are found in.  Labelling the blank nodes of each input by its position in the
+    list of inputs keeps blank nodes of different inputs apart when they are written
+    to one file, even if the same file is given twice.  The numbers depend on the
+    order the triples come in, which differs between reading a file and its cached
+    store, so a label must only be used for one read of a file.
+
+    :param triples: iterable of (subject, predicate, object), e.g. the Graph of a file
+    :param label: string of letters and digits that starts with a letter, different
+        for every input
+    :return: generator of the relabelled triples
+    """
+    labels = {}
+
+    def relabel(node):
+        if not isinstance(node, BNode):
+            return node
+        new = labels.get(node)
+        if new is None:
+            new = labels[node] = BNode(f"{label}b{len(labels)}")
+        return new
+
+    return ((relabel(s), p, relabel(o)) for s, p, o in triples)
+
+
+class TripleSet:
+    """
+    Set of triple digests in a temporary SQLite database, which is deleted when the
+    set is closed.  Only DEDUP_CACHE_KIB of it are held in memory, the rest stays on
+    disk, so the set can hold the triples of more files than fit in memory.
+    """
+
+    def __init__(self):
+        # an empty name is a private on-disk database, deleted when it is closed
+        self._db = sqlite3.connect("")
+        self._db.execute(f"PRAGMA cache_size = -{DEDUP_CACHE_KIB}")
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.count = 0
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def digest(triple, context=None):
+        """
+        :param triple: (subject, predicate, object)
+        :param context: IRI of the named graph the triple is in, if any
+        :return: 16 byte digest of triple
+        """
+        key = "\0".join(node.n3() for node in triple)
+        if context is not None:
+            key += "\0" + str(context)
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def addNew(self, digests):
+        """
+        Adds digests to the set
+
+        :param digests: collection of distinct digests
+        :return: set of the digests that weren't in the set yet
+        """
+        digests = list(digests)
+        seen = set()
+        for i in range(0, len(digests), _SQL_CHUNK):
+            chunk = digests[i : i + _SQL_CHUNK]
+            seen.update(
+                row[0]
+                for row in self._db.execute(
+                    "SELECT digest FROM seen WHERE digest IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+        new = set(digests) - seen
+        self._db.executemany("INSERT INTO seen VALUES (?)", ((d,) for d in new))
+        self.count += len(new)
+        return new
+
+
+class TripleWriter:
+    """
+    Writes triples to a file as they are given, nothing is kept in memory.  Use as a
+    context manager or call close() when done.
+    """
+
+    def __init__(self, destination, output_format="nt", compress=False, unique=False):
+        """
+        :param destination: filename
+        :param output_format: one of STREAM_FORMATS
+        :param compress: gzip compress the file
+        :param unique: leave out triples that have already been written (into the
+            same named graph), remembered in a TripleSet
+        """
+        if output_format not in STREAM_FORMATS:
+            raise ValueError(
+                f"Unsupported streaming format {output_format!r}, use one of "
+                + ", ".join(STREAM_FORMATS)
+            )
+        self.output_format = output_format
+        self.count = 0
+        self.duplicates = 0
+        self._seen = TripleSet() if unique else None
+        self._prefixes = {}
+        self._namespaces = {}
+        if compress:
+            self._file = gzip.open(destination, "wt", encoding="utf-8")
+        else:
+            self._file = open(destination, "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):  # noqa: U100
+        self.close()
+
+    def close(self):
+        self._file.close()
+        if self._seen is not None:
+            self._seen.close()
+
+    def bind(self, prefix, namespace):
+        """
+        Declares a prefix for the triples written after it.  Only used by ttl-stream,
+        prefixes that are already bound are left alone.
+
+        :param prefix: prefix
+        :param namespace: namespace IRI
+        """
+        if self.output_format != "ttl-stream":
+            return
+        prefix, namespace = str(prefix), str(namespace)
+        if (
+            prefix in self._prefixes
+            or namespace in self._namespaces
+            or not (prefix == "" or _PREFIX_RE.match(prefix))
+            or namespace[-1:] not in ("/", "#")
+        ):
+            return
+        self._prefixes[prefix] = namespace
+        self._namespaces[namespace] = prefix
+        self._file.write(f"@prefix {prefix}: <{namespace}> .\n")
+
+    def write(self, triples, context=None):
+        """
+        :param triples: iterable of (subject, predicate, object)
+        :param context: IRI of the named graph the triples are written into (nq only),
+            the default graph if None
+        """
+        if self.output_format != "nq":
+            context = None
+        if self._seen is not None:
+            for batch in _batches(triples, DEDUP_BATCH_SIZE):
+                self._write(self._unseen(batch, context), context)
+        else:
+            self._write(triples, context)
+
+    def _unseen(self, triples, context):
+        """
+        :return: list of the triples that haven't been written yet, each only once
+        """
+        digests = {}
+        for triple in triples:
+            digests.setdefault(TripleSet.digest(triple, context), triple)
+        new = self._seen.addNew(digests)
+        self.duplicates += len(triples) - len(new)
+        return [triple for digest, triple in digests.items() if digest in new]
+
+    def _write(self, triples, context):
+        suffix = " ."
+        if context is not None:
+            suffix = f" {URIRef(context).n3()} ."
+        term = self._term
+        write = self._file.write
+        for s, p, o in triples:
+            write(f"{term(s)} {term(p)} {term(o)}{suffix}\n")
+            self.count += 1
+
+    def writeGraph(self, rdf_graph, context=None):
+        """
+        Binds the namespaces of rdf_graph and writes its triples
+
+        :param rdf_graph: Graph
+        :param context: IRI of the named graph the triples are written into (nq only)
+        """
+        for prefix, namespace in rdf_graph.namespaces():
+            self.bind(prefix, namespace)
+        self.write(rdf_graph, context)
+
+    def _term(self, node):
+        if isinstance(node, Literal):
+            # N-Triples string escapes, Turtle would allow multi-line strings
+            lexical = (
+                str(node)
+                .replace("\\", "\\\\")
+                .replace("\n", "\\n")
+                .replace('"', '\\"')
+                .replace("\r", "\\r")
+            )
+            if node.language:
+                return f'"{lexical}"@{node.language}'
+            if node.datatype:
+                return f'"{lexical}"^^{self._iri(node.datatype)}'
+            return f'"{lexical}"'
+        if isinstance(node, URIRef):
+            return self._iri(node)
+        return node.n3()
+
+    def _iri(self, iri):
+        if self._namespaces:
+            cut = max(iri.rfind("#"), iri.rfind("/")) + 1
+            prefix = self._namespaces.get(iri[:cut])
+            if prefix is not None and _LOCAL_NAME_RE.match(iri[cut:]):
+                return f"{prefix}:{iri[cut:]}"
+        return iri.n3()
+
+
+def _batches(iterable, size):
+    """
+    :return: generator of lists of up to size consecutive items of iterable
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def writeGraphs(graphs, destination, output_format="turtle", compress=False):
+    """
+    Writes the union of graphs to destination.  The streaming formats write each
+    graph in turn, leaving out triples an earlier graph already wrote, instead of
+    copying the graphs into one.
+
+    :param graphs: list of Graph
+    :param destination: filename
+    :param output_format: one of OUTPUT_FORMATS or the name of an rdflib serializer
+    :param compress: gzip compress the file
+    :return: destination
+    """
+    if output_format in STREAM_FORMATS:
+        with TripleWriter(destination, output_format, compress) as writer:
+            for i, rdf_graph in enumerate(graphs):
+                for prefix, namespace in rdf_graph.namespaces():
+                    writer.bind(prefix, namespace)
+                earlier = graphs[:i]
+                writer.write(t for t in rdf_graph if not any(t in g for g in earlier))
+        return destination
+
+    rdf_graph = graphs[0]
+    for other in graphs[1:]:
+        rdf_graph = rdf_graph + other
+    return writeGraph(rdf_graph, destination, output_format, compress)
+
+
+def writeGraph(rdf_graph, destination, output_format="turtle", compress=False, **args):
+    """
+    :param rdf_graph: Graph to write
+    :param destination: filename
+    :param output_format: one of OUTPUT_FORMATS or the name of an rdflib serializer
+    :param compress: gzip compress the file
+    :param args: passed on to the rdflib serializer
+    :return: destination
+    """
+    if output_format in STREAM_FORMATS:
+        with TripleWriter(destination, output_format, compress) as writer:
+            writer.writeGraph(rdf_graph)
+    elif compress:
+        with gzip.open(destination, "wb") as fp:
+            rdf_graph.serialize(destination=fp, format=output_format, **args)
+    else:
+        rdf_graph.serialize(destination=destination, format=output_format, **args)
+    return destination
@@ -55,8 +55,17 @@ class Session(pm.ProvActivity, Core):
 
         # list of acquisitions associated with this session
         self._acquisitions = []
+        # set by read_nidm(lazy=True) to a function reading the acquisitions of the session
+        # the first time they are needed
+        self._acquisition_loader = None
+
+    def _load_acquisitions(self):
+        loader, self._acquisition_loader = self._acquisition_loader, None
+        if loader is not None:
+            loader()
 
     def add_acquisition(self, acquisition):
+        self._load_acquisitions()
         self._acquisitions.extend([acquisition])
         # create links in graph
         acquisition.add_attributes(
@@ -64,6 +73,7 @@ class Session(pm.ProvActivity, Core):
         )
 
     def get_acquisitions(self):
+        self._load_acquisitions()
         return self._acquisitions
 
     def acquisition_exist(self, uuid):
@@ -73,6 +83,7 @@ class Session(pm.ProvActivity, Core):
         :return: True if exists, False otherwise
         """
         # print(f"Query uuid: {uuid}")
+        self._load_acquisitions()
         for acquisitions in self._acquisitions:
             # print(acquisitions._identifier._localpart)
             if str(uuid) == acquisitions._identifier._localpart:
@@ -0,0 +1,395 @@
+"""Compact on-disk encoding of an RDF graph for fast, memory-mapped reopening.
+
+A store is a directory holding a dictionary-encoded term table plus three
+integer triple arrays sorted in SPO, POS and OSP order.  Every array is a
+plain ``.npy`` file opened with ``numpy.load(mmap_mode="r")`` so reopening a
+store costs a few page faults rather than a full parse or unpickle, and
+several processes reading the same store share the OS page cache.
+
+``BinaryTripleStore`` wraps such a directory as a read-only rdflib ``Store`` so
+the result of ``open_graph`` can be used anywhere a parsed ``Graph`` is used
+(triple pattern matching, SPARQL, ``graph + graph``, ...).
+"""
+
+import json
+import os
+from os import path
+import shutil
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.store import Store
+
+STORE_FORMAT = "nidm-triple-store"
+STORE_VERSION = 1
+
+_TERMS = "terms.bin"
+_OFFSETS = "offsets.npy"
+_META = "meta.json"
+_NAMESPACES = "namespaces.json"
+
+# index name -> order of the (s, p, o) columns stored in that index
+_INDEXES = {"spo": (0, 1, 2), "pos": (1, 2, 0), "osp": (2, 0, 1)}
+
+
+def encode_term(term):
+    """
+    Encodes an rdflib term as bytes.  The first byte tags the term kind, literals
+    carry their language and datatype ahead of the lexical form.
+
+    :param term: URIRef, BNode or Literal
+    :return: bytes
+    """
+    if isinstance(term, URIRef):
+        return b"U" + str(term).encode("utf-8")
+    if isinstance(term, BNode):
+        return b"B" + str(term).encode("utf-8")
+    if isinstance(term, Literal):
+        return b"\x00".join(
+            [
+                b"L" + (term.language or "").encode("utf-8"),
+                str(term.datatype or "").encode("utf-8"),
+                str(term).encode("utf-8"),
+            ]
+        )
+    raise TypeError(f"Cannot encode RDF term {term!r} of type {type(term)}")
+
+
+def decode_term(data):
+    """
+    Inverse of encode_term
+
+    :param data: bytes produced by encode_term
+    :return: URIRef, BNode or Literal
+    """
+    kind = data[:1]
+    if kind == b"U":
+        return URIRef(data[1:].decode("utf-8"))
+    if kind == b"B":
+        return BNode(data[1:].decode("utf-8"))
+    if kind == b"L":
+        language, datatype, lexical = data[1:].split(b"\x00", 2)
+        return Literal(
+            lexical.decode("utf-8"),
+            lang=language.decode("utf-8") or None,
+            datatype=URIRef(datatype.decode("utf-8")) if datatype else None,
+        )
+    raise ValueError(f"Unknown term encoding {data[:16]!r}")
+
+
+def write_store(triples, store_path, namespaces=()):
+    """
+    Writes triples to a store directory.  The directory is built next to
+    store_path and renamed into place so readers never see a partial store.
+
+    :param triples: rdflib Graph or iterable of (s, p, o) tuples
+    :param store_path: destination directory
+    :param namespaces: iterable of (prefix, namespace) bindings, taken from the graph if not given
+    :return: store_path
+    """
+    if isinstance(triples, Graph) and not namespaces:
+        namespaces = triples.namespaces()
+
+    term_ids = {}
+    rows = []
+    for triple in triples:
+        row = []
+        for term in triple:
+            enc = encode_term(term)
+            tid = term_ids.get(enc)
+            if tid is None:
+                tid = term_ids[enc] = len(term_ids)
+            row.append(tid)
+        rows.append(row)
+
+    # renumber terms so ids follow the sorted encodings, which lets readers
+    # resolve a term to its id with a binary search over the term table
+    encodings = sorted(term_ids)
+    remap = np.empty(len(encodings), dtype=np.int64)
+    for new_id, enc in enumerate(encodings):
+        remap[term_ids[enc]] = new_id
+
+    return _write_arrays(
+        store_path,
+        encodings,
+        remap[np.asarray(rows, dtype=np.int64).reshape(-1, 3)],
+        namespaces,
+    )
+
+
+def merge_stores(store_paths, store_path):
+    """
+    Writes the union of several stores to a new store without going through
+    rdflib.  Term tables are merged, ids remapped and duplicate triples dropped.
+
+    :param store_paths: list of store directories
+    :param store_path: destination directory
+    :return: store_path
+    """
+    stores = [BinaryTripleStore(p) for p in store_paths]
+    encodings = sorted(
+        set().union(*(s.terms.encodings() for s in stores)) if stores else set()
+    )
+    position = {enc: i for i, enc in enumerate(encodings)}
+
+    parts = []
+    namespaces = {}
+    for store in stores:
+        remap = np.fromiter(
+            (position[enc] for enc in store.terms.encodings()),
+            dtype=np.int64,
+            count=len(store.terms),
+        )
+        parts.append(remap[np.asarray(store.index("spo")).T])
+        for prefix, namespace in store.namespaces():
+            namespaces.setdefault(prefix, namespace)
+
+    rows = np.concatenate(parts) if parts else np.empty((0, 3), dtype=np.int64)
+    return _write_arrays(store_path, encodings, rows, namespaces.items())
+
+
+def _write_arrays(store_path, encodings, rows, namespaces):
+    tmp_path = f"{store_path}.tmp-{os.getpid()}"
+    if path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    offsets = np.zeros(len(encodings) + 1, dtype=np.int64)
+    with open(path.join(tmp_path, _TERMS), "wb") as fp:
+        for i, enc in enumerate(encodings):
+            fp.write(enc)
+            offsets[i + 1] = offsets[i] + len(enc)
+    np.save(path.join(tmp_path, _OFFSETS), offsets)
+
+    dtype = np.int32 if len(encodings) < np.iinfo(np.int32).max else np.int64
+    rows = np.unique(rows, axis=0) if len(rows) else rows
+    for name, order in _INDEXES.items():
+        columns = rows[:, order].T
+        if len(rows):
+            columns = columns[:, np.lexsort(columns[::-1])]
+        np.save(path.join(tmp_path, f"{name}.npy"), columns.astype(dtype))
+
+    with open(path.join(tmp_path, _NAMESPACES), "w", encoding="utf-8") as fp:
+        json.dump([[str(p), str(n)] for p, n in namespaces], fp)
+    with open(path.join(tmp_path, _META), "w", encoding="utf-8") as fp:
+        json.dump(
+            {
+                "format": STORE_FORMAT,
+                "version": STORE_VERSION,
+                "terms": len(encodings),
+                "triples": len(rows),
+            },
+            fp,
+        )
+
+    if path.isdir(store_path) and not is_store(store_path):
+        # left behind by an older version or an interrupted write
+        shutil.rmtree(store_path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, store_path)
+    except OSError:
+        # another process finished writing the same store first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not is_store(store_path):
+            raise
+    return store_path
+
+
+def is_store(store_path):
+    """
+    :param store_path: directory
+    :return: True if store_path holds a store in the current format
+    """
+    try:
+        with open(path.join(store_path, _META), encoding="utf-8") as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == STORE_FORMAT and meta.get("version") == STORE_VERSION
+
+
+def open_graph(store_path):
+    """
+    :param store_path: store directory written by write_store or merge_stores
+    :return: read-only rdflib Graph backed by the memory-mapped store
+    """
+    # the store already holds every binding of the graph it was written from, don't
+    # let rdflib's default prefixes override them
+    return Graph(store=BinaryTripleStore(store_path), bind_namespaces="none")
+
+
+def _load(array_path):
+    # a plain ndarray view of the memmap keeps the pages shared but skips the
+    # per-slice overhead of numpy.memmap.__getitem__
+    return np.load(array_path, mmap_mode="r").view(np.ndarray)
+
+
+class _TermTable:
+    """Sorted, memory-mapped table of encoded terms"""
+
+    def __init__(self, store_path):
+        self.offsets = _load(path.join(store_path, _OFFSETS))
+        if len(self.offsets) > 1 and self.offsets[-1] > 0:
+            self.blob = np.memmap(path.join(store_path, _TERMS), mode="r").view(
+                np.ndarray
+            )
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+        self._terms = {}
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def encoding(self, tid):
+        return self.blob[self.offsets[tid] : self.offsets[tid + 1]].tobytes()
+
+    def encodings(self):
+        return (self.encoding(i) for i in range(len(self)))
+
+    def term(self, tid):
+        term = self._terms.get(tid)
+        if term is None:
+            term = self._terms[tid] = decode_term(self.encoding(tid))
+        return term
+
+    def id(self, term):  # noqa: A003
+        """
+        :return: the id of term or None if the store doesn't contain it
+        """
+        tid = self._ids.get(term, -1)
+        if tid != -1:
+            return tid
+        try:
+            enc = encode_term(term)
+        except TypeError:
+            return None
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.encoding(mid) < enc:
+                lo = mid + 1
+            else:
+                hi = mid
+        tid = lo if lo < len(self) and self.encoding(lo) == enc else None
+        self._ids[term] = tid
+        return tid
+
+
+class BinaryTripleStore(Store):
+    """
+    Read-only rdflib Store over a directory written by write_store.  Triple
+    patterns are answered with a binary search over whichever sorted index
+    has the bound terms as its leading columns.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super().__init__(configuration=None)
+        self.identifier = identifier
+        self._indexes = {}
+        self._namespace = {}
+        self._prefix = {}
+        if configuration is not None:
+            self.open(configuration)
+
+    def open(self, configuration, create=False):  # noqa: U100
+        if not is_store(configuration):
+            raise ValueError(f"{configuration} is not a {STORE_FORMAT} directory")
+        self.store_path = configuration
+        self.terms = _TermTable(configuration)
+        for name in _INDEXES:
+            self._indexes[name] = _load(path.join(configuration, f"{name}.npy"))
+        with open(path.join(configuration, _NAMESPACES), encoding="utf-8") as fp:
+            for prefix, namespace in json.load(fp):
+                self.bind(prefix, URIRef(namespace))
+        return None
+
+    def index(self, name):
+        """
+        :param name: one of "spo", "pos" or "osp"
+        :return: 3 x N array of term ids sorted in that column order
+        """
+        return self._indexes[name]
+
+    def __len__(self, context=None):  # noqa: U100
+        return self._indexes["spo"].shape[1]
+
+    def triples(self, triple_pattern, context=None):  # noqa: U100
+        ids = []
+        for term in triple_pattern:
+            if term is None:
+                ids.append(None)
+                continue
+            tid = self.terms.id(term)
+            if tid is None:
+                return
+            ids.append(tid)
+
+        s, p, o = ids
+        if s is not None:
+            name = "osp" if p is None and o is not None else "spo"
+        elif p is not None:
+            name = "pos"
+        elif o is not None:
+            name = "osp"
+        else:
+            name = "spo"
+        order = _INDEXES[name]
+        keys = [ids[col] for col in order]
+
+        index = self._indexes[name]
+        lo, hi = 0, index.shape[1]
+        for column, key in enumerate(keys):
+            if key is None:
+                break
+            # keys must share the index dtype or numpy copies the column to cast it
+            bounds = np.array((key, key + 1), dtype=index.dtype)
+            start, end = np.searchsorted(index[column, lo:hi], bounds)
+            lo, hi = lo + int(start), lo + int(end)
+            if lo >= hi:
+                return
+
+        term = self.terms.term
+        chunk = 65536
+        for start in range(lo, hi, chunk):
+            block = index[:, start : min(start + chunk, hi)].tolist()
+            for row in zip(*block):
+                triple = [None, None, None]
+                for column, tid in zip(order, row):
+                    triple[column] = term(tid)
+                yield tuple(triple), iter(())
+
+    def contexts(self, triple=None):  # noqa: U100
+        return iter(())
+
+    def add(self, triple, context, quoted=False):  # noqa: U100
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    def addN(self, quads):  # noqa: U100
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    def remove(self, triple, context=None):  # noqa: U100
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    def bind(self, prefix, namespace, override=True):
+        bound_prefix = self._prefix.get(namespace)
+        if bound_prefix is not None and not override:
+            return
+        if bound_prefix is not None:
+            self._namespace.pop(bound_prefix, None)
+        self._prefix.pop(self._namespace.get(prefix), None)
+        self._namespace[prefix] = namespace
+        self._prefix[namespace] = prefix
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace)
+
+    def namespaces(self):
+        yield from self._namespace.items()
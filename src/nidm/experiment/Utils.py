@@ -1,4 +1,5 @@
 from binascii import crc32
+import functools
 import getpass
 import json
 import logging
@@ -18,15 +19,17 @@ from prov.model import Identifier
 from prov.model import Namespace as provNamespace
 from prov.model import QualifiedName
 from rapidfuzz import fuzz
-from rdflib import RDF, RDFS, BNode, Graph, Literal, Namespace, URIRef, util
+from rdflib import RDF, RDFS, BNode, Graph, Literal, Namespace, URIRef
 from rdflib.namespace import XSD, split_uri
 from rdflib.resource import Resource
 import requests
 import validators
+from . import GraphBackend, RDFStream
 from .Acquisition import Acquisition
 from .AcquisitionObject import AcquisitionObject
 from .AssessmentAcquisition import AssessmentAcquisition
 from .AssessmentObject import AssessmentObject
+from .Core import prov_to_rdflib_graph
 from .DataElement import DataElement
 from .Derivative import Derivative
 from .DerivativeObject import DerivativeObject
@@ -371,7 +374,7 @@ def _import_unmodeled_prov_branch(project, rdf_graph, record_map=None):
     Import generic PROV nodes and edges that the specialized NIDM readers do not
     reconstruct, such as export provenance from bidsmri2nidm.py.
     """
-    namespaces = project.graph.namespaces
+    namespaces = _BundleNamespaces(project.graph)
     cache = {}
 
     candidates = set()
@@ -488,15 +491,21 @@ def _import_unmodeled_prov_branch(project, rdf_graph, record_map=None):
 
 def _record_by_id(prov_graph, identifier):
     """Return the first PROV record with this identifier, or None."""
-    ident_str = str(identifier)
     try:
-        for rec in prov_graph.get_records():
+        records = prov_graph._records
+        # records are only ever appended to a bundle, so the index of the records by
+        # identifier kept on it just has to catch up with the ones added since
+        indexed, index = getattr(prov_graph, "_records_by_id", (0, {}))
+        if indexed > len(records):
+            indexed, index = 0, {}
+        for rec in records[indexed:]:
             rec_id = getattr(rec, "identifier", None)
-            if rec_id is not None and str(rec_id) == ident_str:
-                return rec
+            if rec_id is not None:
+                index.setdefault(str(rec_id), rec)
+        prov_graph._records_by_id = (len(records), index)
+        return index.get(str(identifier))
     except Exception:
-        pass
-    return None
+        return None
 
 
 def _has_existing_qualified_association(nidm_obj, agent_identifier, role_value):
@@ -586,6 +595,65 @@ def _has_existing_qualified_association(nidm_obj, agent_identifier, role_value):
     return False
 
 
+class _BundleNamespaces:
+    """
+    The namespaces registered in a PROV bundle, looked up by URI.  read_nidm() passes
+    it to the helpers below in place of bundle.namespaces, so the QualifiedNames they
+    make out of RDF terms are computed once per term until a namespace is added.
+    """
+
+    def __init__(self, bundle):
+        # live view of the registered namespaces
+        self._registered = bundle._namespaces.get_registered_namespaces()
+        self._count = None
+        self._by_uri = {}
+        self._conversions = {}
+
+    def __iter__(self):
+        return iter(list(self._registered))
+
+    def _refresh(self):
+        if self._count != len(self._registered):
+            self._count = len(self._registered)
+            self._by_uri = {str(ns.uri): ns for ns in self._registered}
+            self._conversions.clear()
+
+    def find(self, uri):
+        """
+        :param uri: namespace URI
+        :return: registered Namespace with this URI, None if there is none
+        """
+        self._refresh()
+        return self._by_uri.get(str(uri))
+
+    def convert(self, function, term):
+        """
+        :return: function(term, self), cached
+        """
+        self._refresh()
+        key = (function, term)
+        try:
+            return self._conversions[key]
+        except KeyError:
+            value = self._conversions[key] = function(term, self)
+            return value
+
+
+def _cached_conversion(function):
+    """
+    Makes function(term, namespaces) cache its results in namespaces if it is a
+    _BundleNamespaces
+    """
+
+    @functools.wraps(function)
+    def convert(term, namespaces):
+        if isinstance(namespaces, _BundleNamespaces):
+            return namespaces.convert(function, term)
+        return function(term, namespaces)
+
+    return convert
+
+
 def _safe_role_value(role_identifier, namespaces):
     try:
         obj_nm, obj_term = split_uri(role_identifier)
@@ -609,6 +677,7 @@ def _safe_role_value(role_identifier, namespaces):
     return Identifier(str(role_identifier))
 
 
+@_cached_conversion
 def _safe_qname_or_identifier(value, namespaces):
     try:
         nm, term = split_uri(value)
@@ -632,6 +701,7 @@ def _safe_qname_or_identifier(value, namespaces):
     return Identifier(str(value))
 
 
+@_cached_conversion
 def _predicate_to_prov(predicate, namespaces):
     try:
         pred_nm, pred_term = split_uri(predicate)
@@ -712,18 +782,35 @@ def _copy_bnode_metadata(rdf_graph, bnode, namespaces, nidm_obj, seen=None):
                     pass
 
 
-def _rdflib_graph_from_prov_graph(prov_graph, rdf_format="ttl"):
+class _RecordSlice:
     """
-    Serialize a pyPROV graph to an RDFLib graph.
+    The records of a pyPROV bundle from a position on, as a container the PROV-O
+    encoder can encode by themselves
     """
-    g = Graph()
-    try:
-        data = prov_graph._prov_serialize_original(
-            None, format="rdf", rdf_format=rdf_format
-        )
-    except AttributeError:
-        data = prov_graph.serialize(None, format="rdf", rdf_format=rdf_format)
-    g.parse(data=data, format=rdf_format)
+
+    bundles = ()
+
+    def __init__(self, bundle, start):
+        self._bundle = bundle
+        self._records = bundle._records[start:]
+
+    def get_registered_namespaces(self):
+        return self._bundle.get_registered_namespaces()
+
+    def get_default_namespace(self):
+        return self._bundle.get_default_namespace()
+
+
+def _rdflib_graph_from_prov_graph(prov_graph, rdf_format="ttl", start=0):  # noqa: U100
+    """
+    Convert a pyPROV graph to an RDFLib graph.
+
+    :param start: only convert the records added to prov_graph from this position on
+    """
+    # encoded directly, the text serialize() would write parses back to the same triples
+    if start:
+        prov_graph = _RecordSlice(prov_graph, start)
+    g = prov_to_rdflib_graph(prov_graph)
 
     try:
         for subj, obj in list(g.subject_objects(URIRef(Constants.PROV["label"]))):
@@ -891,7 +978,11 @@ def add_export_provenance(
 
 
 def _install_lossless_serialize(
-    prov_graph, original_rdf_graph, original_text=None, original_format="turtle"
+    prov_graph,
+    original_rdf_graph,
+    original_text=None,
+    original_format="turtle",
+    original_file=None,
 ):
     """
     Make prov_graph.serialize(format='rdf', rdf_format='ttl') as lossless as possible.
@@ -899,7 +990,9 @@ def _install_lossless_serialize(
     Behavior:
     - If there are no post-read modifications relative to the baseline object graph,
       return the ORIGINAL Turtle text byte-for-byte (preserves qnames, prefix names,
-      blank-node labels, angle-bracket rendering, etc.).
+      blank-node labels, angle-bracket rendering, etc.).  The text is either given as
+      original_text or read from original_file when needed, as long as the file
+      hasn't changed since.
     - If there are modifications, start from the ORIGINAL parsed RDF graph and apply
       only the delta between the current object-generated graph and the baseline graph.
       Reuse the original namespace bindings/order when serializing.
@@ -908,13 +1001,19 @@ def _install_lossless_serialize(
         return prov_graph
 
     prov_graph._prov_serialize_original = prov_graph.serialize
-    prov_graph._original_rdf_graph = Graph()
-    for t in original_rdf_graph:
-        prov_graph._original_rdf_graph.add(t)
+    # only read from, the merged graph is built in lossless_rdflib_graph()
+    prov_graph._original_rdf_graph = original_rdf_graph
 
     prov_graph._original_namespaces = list(original_rdf_graph.namespaces())
     prov_graph._original_text = original_text
     prov_graph._original_format = original_format
+    prov_graph._original_file = None
+    if original_text is None and original_file is not None:
+        try:
+            st = os.stat(original_file)
+            prov_graph._original_file = (original_file, st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
 
     # Capture baseline object-generated graph after read_nidm() construction is complete
     try:
@@ -934,21 +1033,11 @@ def _install_lossless_serialize(
                 **kwargs,
             )
 
-        try:
-            current_graph = _rdflib_graph_from_prov_graph(self, rdf_format=rdf_format)
-        except Exception:
-            current_graph = Graph()
-
-        baseline = getattr(self, "_baseline_rdf_graph", Graph())
-        current_triples = set(current_graph)
-        baseline_triples = set(baseline)
-
-        delta_added = current_triples - baseline_triples
-        delta_removed = baseline_triples - current_triples
+        merged, changed = lossless_rdflib_graph(self, rdf_format=rdf_format)
 
         # If nothing changed after read_nidm(), return original text exactly.
-        if not delta_added and not delta_removed:
-            original_text_local = getattr(self, "_original_text", None)
+        if not changed:
+            original_text_local = _original_text(self)
             if original_text_local is not None and str(rdf_format).lower() in (
                 "ttl",
                 "turtle",
@@ -959,29 +1048,6 @@ def _install_lossless_serialize(
                     f.write(original_text_local)
                 return None
 
-        # Otherwise: start from the original parsed graph and apply only the object-model delta.
-        merged = Graph()
-
-        # Preserve original namespace bindings/order as much as RDFLib allows.
-        for prefix, ns in getattr(self, "_original_namespaces", []):
-            try:
-                if prefix is not None:
-                    merged.bind(prefix, ns, override=True, replace=True)
-            except Exception:
-                pass
-
-        for t in self._original_rdf_graph:
-            merged.add(t)
-
-        for t in delta_removed:
-            try:
-                merged.remove(t)
-            except Exception:
-                pass
-
-        for t in delta_added:
-            merged.add(t)
-
         if destination is None:
             return merged.serialize(format=rdf_format)
         merged.serialize(destination=destination, format=rdf_format)
@@ -992,383 +1058,366 @@ def _install_lossless_serialize(
     return prov_graph
 
 
-def read_nidm(nidmDoc):
+def _original_text(prov_graph):
     """
-    Loads nidmDoc file into NIDM-Experiment structures and returns objects
+    :param prov_graph: pyPROV graph read_nidm() installed the lossless serializer on
+    :return: text of the document it was read from, None if it isn't known or the
+        file has changed since
+    """
+    text = getattr(prov_graph, "_original_text", None)
+    original_file = getattr(prov_graph, "_original_file", None)
+    if text is not None or original_file is None:
+        return text
+    file_name, size, mtime_ns = original_file
+    try:
+        st = os.stat(file_name)
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            return None
+        with open(file_name, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        return None
 
-    :nidmDoc: a valid RDF NIDM-experiment document (deserialization formats supported by RDFLib)
 
-    :return: NIDM Project
+def lossless_rdflib_graph(prov_graph, rdf_format="ttl"):
+    """
+    RDFLib graph of a document loaded by read_nidm(): the original parsed graph with
+    only the changes made to the object model since applied to it.
 
+    :param prov_graph: pyPROV graph read_nidm() installed the lossless serializer on
+    :param rdf_format: RDF format the PROV document is encoded in
+    :return: tuple of the graph and whether the object model was changed
     """
+    try:
+        current_graph = _rdflib_graph_from_prov_graph(prov_graph, rdf_format=rdf_format)
+    except Exception:
+        current_graph = Graph()
+
+    baseline = getattr(prov_graph, "_baseline_rdf_graph", Graph())
+    current_triples = set(current_graph)
+    baseline_triples = set(baseline)
+
+    delta_added = current_triples - baseline_triples
+    delta_removed = baseline_triples - current_triples
 
-    original_guess_format = util.guess_format(nidmDoc)
-    original_text = None
-    if str(original_guess_format).lower() in ("ttl", "turtle"):
+    # start from the original parsed graph and apply only the object-model delta.
+    merged = Graph()
+
+    # Preserve original namespace bindings/order as much as RDFLib allows.
+    for prefix, ns in getattr(prov_graph, "_original_namespaces", []):
         try:
-            with open(nidmDoc, "r", encoding="utf-8") as f:
-                original_text = f.read()
+            if prefix is not None:
+                merged.bind(prefix, ns, override=True, replace=True)
         except Exception:
-            original_text = None
+            pass
 
-    # read RDF file into temporary graph
-    rdf_graph = Graph()
-    rdf_graph_parse = rdf_graph.parse(nidmDoc, format=original_guess_format)
+    for t in prov_graph._original_rdf_graph:
+        merged.add(t)
 
-    # registry of RDF subject URI -> loaded wrapper/record
-    record_map = {}
+    for t in delta_removed:
+        try:
+            merged.remove(t)
+        except Exception:
+            pass
 
-    # Query graph for project metadata and create project level objects
-    # Get subject URI for project
-    proj_id = None
-    for s in rdf_graph_parse.subjects(
-        predicate=RDF.type, object=URIRef(Constants.NIDM_PROJECT.uri)
-    ):
-        # print(s)
-        proj_id = s
+    for t in delta_added:
+        merged.add(t)
 
-    if proj_id is None:
-        print(f"Error reading NIDM-Exp Document {nidmDoc}, Must have Project Object")
-        print()
-        create_obj = input("Should read_nidm create a Project object for you [yes]: ")
-        if create_obj in ("yes", ""):
-            project = Project(empty_graph=True, add_default_type=True)
-            # add namespaces to prov graph
-            for name, namespace in rdf_graph_parse.namespaces():
-                # skip these default namespaces in prov Document
-                # if name not in ("prov", "xsd", "nidm", "niiri"):
-                if name not in ("prov", "xsd"):
-                    project.graph.add_namespace(name, namespace)
+    return merged, bool(delta_added or delta_removed)
+
+
+def _index_subject_types(rdf_graph):
+    """
+    Classifies the subjects of rdf_graph by rdf:type in a single pass over its
+    rdf:type triples
+
+    :param rdf_graph: RDFLib graph
+    :return: dict of subject -> set of its types, dict of type -> list of its subjects
+    """
+    subject_types = {}
+    subjects_by_type = {}
+    for subject, _, rdf_type in rdf_graph.triples((None, RDF.type, None)):
+        subject_types.setdefault(subject, set()).add(rdf_type)
+        subjects_by_type.setdefault(rdf_type, []).append(subject)
+    return subject_types, subjects_by_type
+
+
+class _TypeLookup:
+    """
+    Looks rdf:type triples up in an RDFLib graph as they are asked for, with the get()
+    of the dicts _index_subject_types() returns, so reading part of a graph doesn't
+    need the types of all its subjects
+    """
 
+    def __init__(self, rdf_graph, by_type=False):
+        """
+        :param rdf_graph: RDFLib graph
+        :param by_type: if True get() takes a type and returns the list of its
+            subjects, else it takes a subject and returns the set of its types
+        """
+        self.rdf_graph = rdf_graph
+        self.by_type = by_type
+
+    def get(self, key, default=None):
+        if self.by_type:
+            found = list(self.rdf_graph.subjects(RDF.type, key))
         else:
-            sys.exit(1)
-    else:
-        # Split subject URI into namespace, term
-        _, project_uuid = split_uri(proj_id)
+            found = set(self.rdf_graph.objects(key, RDF.type))
+        return found or default
 
-        # create empty prov graph
-        project = Project(empty_graph=True, uuid=project_uuid, add_default_type=False)
 
-        # add namespaces to prov graph
-        for name, namespace in rdf_graph_parse.namespaces():
-            # skip these default namespaces in prov Document
-            # if name not in ("prov", "xsd", "nidm", "niiri"):
-            if name not in ("prov", "xsd"):
-                project.graph.add_namespace(name, namespace)
+def _subclass_closure(rdf_graph, rdf_class):
+    """
+    :param rdf_graph: RDFLib graph
+    :param rdf_class: class URI
+    :return: set of rdf_class and all its (indirect) rdfs:subClassOf subclasses
+    """
+    classes = set()
+    stack = [rdf_class]
+    while stack:
+        cls = stack.pop()
+        if cls not in classes:
+            classes.add(cls)
+            stack.extend(rdf_graph.subjects(RDFS.subClassOf, cls))
+    return classes
 
-        # Cycle through Project metadata adding to prov graph
-        add_metadata_for_subject(
-            rdf_graph_parse, proj_id, project.graph.namespaces, project
-        )
-        _register_loaded_record(record_map, proj_id, project)
 
-    # Query graph for sessions, instantiate session objects, and add to project._session list
-    # Get subject URI for sessions
-    for s in rdf_graph_parse.subjects(
-        predicate=RDF.type, object=URIRef(Constants.NIDM_SESSION.uri)
-    ):
-        # print(f"session: {s}")
+def _baseline_loader(prov_graph, load):
+    """
+    :param prov_graph: pyPROV graph of a project read by read_nidm(lazy=True)
+    :param load: function adding objects read from the graph of the project
+    :return: function calling load that adds the triples of the records load added
+        to prov_graph to the baseline of the lossless serializer, so objects read on
+        demand don't count as changes to the document
+    """
 
-        # Split subject URI for session into namespace, uuid
-        _, session_uuid = split_uri(s)
+    def loader():
+        start = len(prov_graph._records)
+        load()
+        baseline = getattr(prov_graph, "_baseline_rdf_graph", None)
+        if baseline is not None:
+            baseline += _rdflib_graph_from_prov_graph(prov_graph, start=start)
 
-        # print(f"session uuid= {session_uuid}")
+    return loader
 
-        # instantiate session with this uuid
-        session = Session(project=project, uuid=session_uuid, add_default_type=False)
 
-        # add session to project
-        project.add_sessions(session)
+def _read_acquisition_object(
+    rdf_graph,
+    subject_types,
+    acquisition,
+    acq_obj,
+    object_class,
+    namespaces,
+    record_map,
+    **kwargs,
+):
+    """
+    Adds acquisition object acq_obj of rdf_graph to acquisition, along with the
+    stimulus response files attributed to it if it's an MRI acquisition object
 
-        # now get remaining metadata in session object and add to session
-        # Cycle through Session metadata adding to prov graph
-        add_metadata_for_subject(rdf_graph_parse, s, project.graph.namespaces, session)
-        _register_loaded_record(record_map, s, session)
+    :param acq_obj: subject URI of the acquisition object
+    :param object_class: class of the acquisition object
+    :param kwargs: more arguments of the object_class constructor
+    """
+    # Split subject URI for acquisition object (entity) into namespace, uuid
+    _, acq_obj_uuid = split_uri(acq_obj)
+    # print("acquisition object uuid:", acq_obj_uuid)
+
+    # and add acquisition object
+    acquisition_obj = object_class(acquisition=acquisition, uuid=acq_obj_uuid, **kwargs)
+    acquisition.add_acquisition_object(acquisition_obj)
+    # Cycle through remaining metadata for acquisition entity and add attributes
+    add_metadata_for_subject(rdf_graph, acq_obj, namespaces, acquisition_obj)
+    _register_loaded_record(record_map, acq_obj, acquisition_obj)
+
+    if object_class is not MRObject:
+        return
 
-        # Query graph for acquisitions dct:isPartOf the session
-        for acq in rdf_graph_parse.subjects(
-            predicate=Constants.DCT["isPartOf"], object=s
+    # MRI acquisitions may have an associated stimulus file so let's see if there is an entity
+    # prov:wasAttributedTo this acquisition_obj
+    for assoc_acq in rdf_graph.subjects(
+        predicate=Constants.PROV["wasAttributedTo"],
+        object=acq_obj,
+    ):
+        # get rdf:type of this entity and check if it's a nidm:StimulusResponseFile or not
+        # if rdf_graph_parse.triples((assoc_acq, RDF.type, URIRef("http://purl.org/nidash/nidm#StimulusResponseFile"))):
+        if URIRef(Constants.NIDM_MRI_BOLD_EVENTS._uri) in subject_types.get(
+            assoc_acq, ()
         ):
-            # Split subject URI for session into namespace, uuid
-            _, acq_uuid = split_uri(acq)
-            # print("acquisition uuid:", acq_uuid)
-
-            # query for whether this is an AssessmentAcquisition of other Acquisition, etc.
-            for rdf_type in rdf_graph_parse.objects(subject=acq, predicate=RDF.type):
-                # if this is an acquisition activity, which kind?
-                if str(rdf_type) == Constants.NIDM_ACQUISITION_ACTIVITY.uri:
-                    # first find the entity generated by this acquisition activity
-                    for acq_obj in rdf_graph_parse.subjects(
-                        predicate=Constants.PROV["wasGeneratedBy"], object=acq
-                    ):
-                        # Split subject URI for acquisition object (entity) into namespace, uuid
-                        _, acq_obj_uuid = split_uri(acq_obj)
-                        # print("acquisition object uuid:", acq_obj_uuid)
-
-                        # query for whether this is an MRI acquisition by way of looking at the generated entity and determining
-                        # if it has the tuple [uuid Constants.NIDM_ACQUISITION_MODALITY Constants.NIDM_MRI]
-                        if (
-                            acq_obj,
-                            URIRef(Constants.NIDM_ACQUISITION_MODALITY._uri),
-                            URIRef(Constants.NIDM_MRI._uri),
-                        ) in rdf_graph:
-                            # check whether this acquisition activity has already been instantiated (maybe if there are multiple acquisition
-                            # entities prov:wasGeneratedBy the acquisition
-                            if not session.acquisition_exist(acq_uuid):
-                                acquisition = MRAcquisition(
-                                    session=session,
-                                    uuid=acq_uuid,
-                                    add_default_type=False,
-                                )
-                                session.add_acquisition(acquisition)
-                                # Cycle through remaining metadata for acquisition activity and add attributes
-                                add_metadata_for_subject(
-                                    rdf_graph_parse,
-                                    acq,
-                                    project.graph.namespaces,
-                                    acquisition,
-                                )
-                                _register_loaded_record(record_map, acq, acquisition)
-
-                            # and add acquisition object
-                            acquisition_obj = MRObject(
-                                acquisition=acquisition,
-                                uuid=acq_obj_uuid,
-                                add_default_type=False,
-                            )
-                            acquisition.add_acquisition_object(acquisition_obj)
-                            # Cycle through remaining metadata for acquisition entity and add attributes
-                            add_metadata_for_subject(
-                                rdf_graph_parse,
-                                acq_obj,
-                                project.graph.namespaces,
-                                acquisition_obj,
-                            )
-                            _register_loaded_record(
-                                record_map, acq_obj, acquisition_obj
-                            )
+            # Split subject URI for associated acquisition entity for nidm:StimulusResponseFile into namespace, uuid
+            _, assoc_acq_uuid = split_uri(assoc_acq)
+            # print("associated acquisition object (stimulus file) uuid:", assoc_acq_uuid)
+            # if so then add this entity and associate it with acquisition activity and MRI entity
+            events_obj = AcquisitionObject(acquisition=acquisition, uuid=assoc_acq_uuid)
+            # link it to appropriate MR acquisition entity
+            events_obj.wasAttributedTo(acquisition_obj)
+            # cycle through rest of metadata
+            add_metadata_for_subject(rdf_graph, assoc_acq, namespaces, events_obj)
+            _register_loaded_record(record_map, assoc_acq, events_obj)
+
+
+def _read_session_acquisitions(
+    rdf_graph,
+    subject_types,
+    session,
+    session_uri,
+    namespaces,
+    record_map,
+    lazy=False,
+):
+    """
+    Adds the acquisitions of rdf_graph that are dct:isPartOf session_uri to session,
+    with the acquisition objects they generated
 
-                            # MRI acquisitions may have an associated stimulus file so let's see if there is an entity
-                            # prov:wasAttributedTo this acquisition_obj
-                            for assoc_acq in rdf_graph_parse.subjects(
-                                predicate=Constants.PROV["wasAttributedTo"],
-                                object=acq_obj,
-                            ):
-                                # get rdf:type of this entity and check if it's a nidm:StimulusResponseFile or not
-                                # if rdf_graph_parse.triples((assoc_acq, RDF.type, URIRef("http://purl.org/nidash/nidm#StimulusResponseFile"))):
-                                if (
-                                    assoc_acq,
-                                    RDF.type,
-                                    URIRef(Constants.NIDM_MRI_BOLD_EVENTS._uri),
-                                ) in rdf_graph:
-                                    # Split subject URI for associated acquisition entity for nidm:StimulusResponseFile into namespace, uuid
-                                    _, assoc_acq_uuid = split_uri(assoc_acq)
-                                    # print("associated acquisition object (stimulus file) uuid:", assoc_acq_uuid)
-                                    # if so then add this entity and associate it with acquisition activity and MRI entity
-                                    events_obj = AcquisitionObject(
-                                        acquisition=acquisition, uuid=assoc_acq_uuid
-                                    )
-                                    # link it to appropriate MR acquisition entity
-                                    events_obj.wasAttributedTo(acquisition_obj)
-                                    # cycle through rest of metadata
-                                    add_metadata_for_subject(
-                                        rdf_graph_parse,
-                                        assoc_acq,
-                                        project.graph.namespaces,
-                                        events_obj,
-                                    )
-                                    _register_loaded_record(
-                                        record_map, assoc_acq, events_obj
-                                    )
+    :param subject_types: dict of subject -> set of its types (see _index_subject_types)
+    :param lazy: if True the acquisition objects of an acquisition are only read the
+        first time they are needed
+    """
 
-                        elif (
-                            acq_obj,
-                            RDF.type,
-                            URIRef(Constants.NIDM_MRI_BOLD_EVENTS._uri),
-                        ) in rdf_graph:
-                            # If this is a stimulus response file
-                            # elif str(acq_modality) == Constants.NIDM_MRI_BOLD_EVENTS:
-                            acquisition = Acquisition(session=session, uuid=acq_uuid)
-                            if not session.acquisition_exist(acq_uuid):
-                                session.add_acquisition(acquisition)
-                                # Cycle through remaining metadata for acquisition activity and add attributes
-                                add_metadata_for_subject(
-                                    rdf_graph_parse,
-                                    acq,
-                                    project.graph.namespaces,
-                                    acquisition,
-                                )
-                                _register_loaded_record(record_map, acq, acquisition)
+    def add_acquisition_object(acquisition, acq_obj, object_class, **kwargs):
+        read = functools.partial(
+            _read_acquisition_object,
+            rdf_graph,
+            subject_types,
+            acquisition,
+            acq_obj,
+            object_class,
+            namespaces,
+            record_map,
+            **kwargs,
+        )
+        if lazy:
+            acquisition._acquisition_object_loaders.append(
+                _baseline_loader(session.graph, read)
+            )
+        else:
+            read()
 
-                            # and add acquisition object
-                            acquisition_obj = AcquisitionObject(
-                                acquisition=acquisition, uuid=acq_obj_uuid
-                            )
-                            acquisition.add_acquisition_object(acquisition_obj)
-                            # Cycle through remaining metadata for acquisition entity and add attributes
-                            add_metadata_for_subject(
-                                rdf_graph_parse,
-                                acq_obj,
-                                project.graph.namespaces,
-                                acquisition_obj,
-                            )
-                            _register_loaded_record(
-                                record_map, acq_obj, acquisition_obj
-                            )
+    def add_acquisition(acquisition, acq):
+        session.add_acquisition(acquisition)
+        # Cycle through remaining metadata for acquisition activity and add attributes
+        add_metadata_for_subject(rdf_graph, acq, namespaces, acquisition)
+        _register_loaded_record(record_map, acq, acquisition)
 
-                        # check if this is a PET acquisition object
-                        elif (
-                            acq_obj,
-                            RDF.type,
-                            URIRef(Constants.NIDM_PET._uri),
-                        ) in rdf_graph:
-                            acquisition = PETAcquisition(session=session, uuid=acq_uuid)
-                            if not session.acquisition_exist(acq_uuid):
-                                session.add_acquisition(acquisition)
-                                # Cycle through remaining metadata for acquisition activity and add attributes
-                                add_metadata_for_subject(
-                                    rdf_graph_parse,
-                                    acq,
-                                    project.graph.namespaces,
-                                    acquisition,
-                                )
-                                _register_loaded_record(record_map, acq, acquisition)
+    # Query graph for acquisitions dct:isPartOf the session
+    for acq in rdf_graph.subjects(
+        predicate=Constants.DCT["isPartOf"], object=session_uri
+    ):
+        # Split subject URI for session into namespace, uuid
+        _, acq_uuid = split_uri(acq)
+        # print("acquisition uuid:", acq_uuid)
 
-                            # and add acquisition object
-                            acquisition_obj = PETObject(
-                                acquisition=acquisition,
-                                uuid=acq_obj_uuid,
-                                add_default_type=False,
-                            )
-                            acquisition.add_acquisition_object(acquisition_obj)
-                            # Cycle through remaining metadata for acquisition entity and add attributes
-                            add_metadata_for_subject(
-                                rdf_graph_parse,
-                                acq_obj,
-                                project.graph.namespaces,
-                                acquisition_obj,
-                            )
-                            _register_loaded_record(
-                                record_map, acq_obj, acquisition_obj
-                            )
+        # query for whether this is an AssessmentAcquisition of other Acquisition, etc.
+        # if this is an acquisition activity, which kind?
+        if URIRef(Constants.NIDM_ACQUISITION_ACTIVITY.uri) not in subject_types.get(
+            acq, ()
+        ):
+            continue
+        # first find the entity generated by this acquisition activity
+        for acq_obj in rdf_graph.subjects(
+            predicate=Constants.PROV["wasGeneratedBy"], object=acq
+        ):
+            acq_obj_types = subject_types.get(acq_obj, ())
+
+            # query for whether this is an MRI acquisition by way of looking at the generated entity and determining
+            # if it has the tuple [uuid Constants.NIDM_ACQUISITION_MODALITY Constants.NIDM_MRI]
+            if (
+                acq_obj,
+                URIRef(Constants.NIDM_ACQUISITION_MODALITY._uri),
+                URIRef(Constants.NIDM_MRI._uri),
+            ) in rdf_graph:
+                # check whether this acquisition activity has already been instantiated (maybe if there are multiple acquisition
+                # entities prov:wasGeneratedBy the acquisition
+                if not session.acquisition_exist(acq_uuid):
+                    acquisition = MRAcquisition(
+                        session=session,
+                        uuid=acq_uuid,
+                        add_default_type=False,
+                    )
+                    add_acquisition(acquisition, acq)
+                add_acquisition_object(
+                    acquisition, acq_obj, MRObject, add_default_type=False
+                )
 
-                        # query whether this is an assessment acquisition by way of looking at the generated entity and determining
-                        # if it has the rdf:type Constants.NIDM_ASSESSMENT_ENTITY
-                        # for acq_modality in rdf_graph_parse.objects(subject=acq_obj,predicate=RDF.type):
-                        elif (
-                            acq_obj,
-                            RDF.type,
-                            URIRef(Constants.NIDM_ASSESSMENT_ENTITY._uri),
-                        ) in rdf_graph:
-                            # if str(acq_modality) == Constants.NIDM_ASSESSMENT_ENTITY._uri:
-                            acquisition = AssessmentAcquisition(
-                                session=session, uuid=acq_uuid, add_default_type=False
-                            )
-                            # Cycle through remaining metadata for acquisition activity and add attributes
-                            add_metadata_for_subject(
-                                rdf_graph_parse,
-                                acq,
-                                project.graph.namespaces,
-                                acquisition,
-                            )
+            elif URIRef(Constants.NIDM_MRI_BOLD_EVENTS._uri) in acq_obj_types:
+                # If this is a stimulus response file
+                # elif str(acq_modality) == Constants.NIDM_MRI_BOLD_EVENTS:
+                acquisition = Acquisition(session=session, uuid=acq_uuid)
+                if not session.acquisition_exist(acq_uuid):
+                    add_acquisition(acquisition, acq)
+                add_acquisition_object(acquisition, acq_obj, AcquisitionObject)
+
+            # check if this is a PET acquisition object
+            elif URIRef(Constants.NIDM_PET._uri) in acq_obj_types:
+                acquisition = PETAcquisition(session=session, uuid=acq_uuid)
+                if not session.acquisition_exist(acq_uuid):
+                    add_acquisition(acquisition, acq)
+                add_acquisition_object(
+                    acquisition, acq_obj, PETObject, add_default_type=False
+                )
 
-                            # and add acquisition object
-                            acquisition_obj = AssessmentObject(
-                                acquisition=acquisition,
-                                uuid=acq_obj_uuid,
-                                add_default_type=False,
-                            )
-                            acquisition.add_acquisition_object(acquisition_obj)
-                            # Cycle through remaining metadata for acquisition entity and add attributes
-                            add_metadata_for_subject(
-                                rdf_graph_parse,
-                                acq_obj,
-                                project.graph.namespaces,
-                                acquisition_obj,
-                            )
-                            _register_loaded_record(
-                                record_map, acq_obj, acquisition_obj
-                            )
-                        # if this is a DWI scan then we could have b-value and b-vector files associated
-                        elif (
-                            (
-                                acq_obj,
-                                RDF.type,
-                                URIRef(Constants.NIDM_MRI_DWI_BVAL._uri),
-                            )
-                            in rdf_graph
-                        ) or (
-                            (
-                                acq_obj,
-                                RDF.type,
-                                URIRef(Constants.NIDM_MRI_DWI_BVEC._uri),
-                            )
-                            in rdf_graph
-                        ):
-                            # If this is a b-values filev
-                            acquisition = Acquisition(session=session, uuid=acq_uuid)
-                            if not session.acquisition_exist(acq_uuid):
-                                session.add_acquisition(acquisition)
-                                # Cycle through remaining metadata for acquisition activity and add attributes
-                                add_metadata_for_subject(
-                                    rdf_graph_parse,
-                                    acq,
-                                    project.graph.namespaces,
-                                    acquisition,
-                                )
-                                _register_loaded_record(record_map, acq, acquisition)
+            # query whether this is an assessment acquisition by way of looking at the generated entity and determining
+            # if it has the rdf:type Constants.NIDM_ASSESSMENT_ENTITY
+            # for acq_modality in rdf_graph_parse.objects(subject=acq_obj,predicate=RDF.type):
+            elif URIRef(Constants.NIDM_ASSESSMENT_ENTITY._uri) in acq_obj_types:
+                # if str(acq_modality) == Constants.NIDM_ASSESSMENT_ENTITY._uri:
+                acquisition = AssessmentAcquisition(
+                    session=session, uuid=acq_uuid, add_default_type=False
+                )
+                # Cycle through remaining metadata for acquisition activity and add attributes
+                add_metadata_for_subject(rdf_graph, acq, namespaces, acquisition)
+                add_acquisition_object(
+                    acquisition, acq_obj, AssessmentObject, add_default_type=False
+                )
 
-                            # and add acquisition object
-                            acquisition_obj = AcquisitionObject(
-                                acquisition=acquisition, uuid=acq_obj_uuid
-                            )
-                            acquisition.add_acquisition_object(acquisition_obj)
-                            # Cycle through remaining metadata for acquisition entity and add attributes
-                            add_metadata_for_subject(
-                                rdf_graph_parse,
-                                acq_obj,
-                                project.graph.namespaces,
-                                acquisition_obj,
-                            )
-                            _register_loaded_record(
-                                record_map, acq_obj, acquisition_obj
-                            )
+            # if this is a DWI scan then we could have b-value and b-vector files associated
+            elif (URIRef(Constants.NIDM_MRI_DWI_BVAL._uri) in acq_obj_types) or (
+                URIRef(Constants.NIDM_MRI_DWI_BVEC._uri) in acq_obj_types
+            ):
+                # If this is a b-values filev
+                acquisition = Acquisition(session=session, uuid=acq_uuid)
+                if not session.acquisition_exist(acq_uuid):
+                    add_acquisition(acquisition, acq)
+                add_acquisition_object(acquisition, acq_obj, AcquisitionObject)
 
-                # This skips rdf_type PROV['Activity']
-                else:
-                    continue
 
-    # Query graph for nidm:DataElements and instantiate a nidm:DataElement class and add them to the project
-    query = """
-                prefix nidm: <http://purl.org/nidash/nidm#>
-                prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                select distinct ?uuid
-                where {
-                    ?uuid a/rdfs:subClassOf* nidm:DataElement .
+def _read_data_elements(
+    project, rdf_graph, subject_types, subjects_by_type, namespaces, record_map
+):
+    """
+    Adds the nidm:DataElements of rdf_graph (subjects whose type is nidm:DataElement or
+    one of its subclasses) to project, with the labels of the concepts they are about
 
-                }
-                """
+    :param subject_types: dict of subject -> set of its types (see _index_subject_types)
+    :param subjects_by_type: dict of type -> list of its subjects
+    """
+    data_elements = dict.fromkeys(
+        subject
+        for data_element_type in _subclass_closure(
+            rdf_graph, URIRef(Constants.NIDM_DATAELEMENT.uri)
+        )
+        for subject in subjects_by_type.get(data_element_type, [])
+    )
 
     # add all nidm:DataElements in graph
-    qres = rdf_graph_parse.query(query)
-    for row in qres:
-        # print(f"Reading data element: {row}")
+    for de_uri in data_elements:
+        # print(f"Reading data element: {de_uri}")
         # instantiate a data element class assigning it the existing uuid
-        obj_nm, obj_term = split_uri(row["uuid"])
+        obj_nm, obj_term = split_uri(de_uri)
 
         # Resolve the original namespace so the DataElement identifier is
         # lossless (e.g. fmriprep:csf_mean stays fmriprep:, not niiri:).
         de_ns = None
         if str(obj_nm) != str(Constants.NIIRI):
             found_uri, found_nm = find_in_namespaces(
-                search_uri=URIRef(obj_nm), namespaces=project.graph.namespaces
+                search_uri=URIRef(obj_nm), namespaces=namespaces
             )
             if found_uri:
                 de_ns = found_nm
             else:
                 # Namespace not yet registered — create one from the prefix
                 # used in the RDF file.
-                for prefix, ns_uri in rdf_graph_parse.namespaces():
+                for prefix, ns_uri in rdf_graph.namespaces():
                     if str(ns_uri) == str(obj_nm):
                         de_ns = pm.Namespace(prefix, str(obj_nm))
                         break
@@ -1382,30 +1431,17 @@ def read_nidm(nidmDoc):
             namespace=de_ns,
         )
         # get the rest of the attributes for this data element and store
-        add_metadata_for_subject(
-            rdf_graph_parse, row["uuid"], project.graph.namespaces, de
-        )
-        _register_loaded_record(record_map, row["uuid"], de)
+        add_metadata_for_subject(rdf_graph, de_uri, namespaces, de)
+        _register_loaded_record(record_map, de_uri, de)
 
         # now we need to check if there are labels for data element isAbout entries, if so add them.
-        query2 = f"""
-
-                prefix nidm: <http://purl.org/nidash/nidm#>
-                prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-                prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                prefix prov: <http://www.w3.org/ns/prov#>
-
-                select distinct ?id ?label
-                where {{
-                    <{row["uuid"]}> nidm:isAbout ?id .
-
-                    ?id rdf:type prov:Entity ;
-                        rdfs:label ?label .
-                }}
-
-            """
-        # print(query2)
-        qres2 = rdf_graph_parse.query(query2)
+        # (the labels of the prov:Entity concepts the data element is about)
+        qres2 = [
+            (concept, label)
+            for concept in rdf_graph.objects(de_uri, Constants.NIDM["isAbout"])
+            if URIRef(Constants.PROV["Entity"]) in subject_types.get(concept, ())
+            for label in rdf_graph.objects(concept, RDFS.label)
+        ]
 
         # find rdfs namespace in graph otherwise add it
         rdfs_ns = project.find_namespace_with_uri(str(Constants.RDFS))
@@ -1456,69 +1492,219 @@ def read_nidm(nidmDoc):
                 #    {pm.QualifiedName(rdfs_ns, "label"): row2[1]},
                 # )
 
-    # check for Derivatives.
+
+def _read_derivatives(project, rdf_graph, subjects_by_type, namespaces, record_map):
+    """
+    Adds the derivative objects of rdf_graph to project, with the activities that
+    generated them
+
+    :param subjects_by_type: dict of type -> list of its subjects (see
+        _index_subject_types)
+    """
     # WIP: Currently FSL, Freesurfer, and ANTS tools add these derivatives as nidm:FSStatsCollection,
     # nidm:FSLStatsCollection, or nidm:ANTSStatsCollection which are subclasses of nidm:Derivatives
     # this should probably be explicitly indicated in the graphs but currently isn't
 
-    # Query graph for any of the above Derivatives
-    query = """
-            prefix nidm: <http://purl.org/nidash/nidm#>
-            prefix prov: <http://www.w3.org/ns/prov#>
-            select distinct ?uuid ?parent_act
-            where {
-                {?uuid a nidm:DerivativeObject ;
-                    prov:wasGeneratedBy ?parent_act .}
-                    UNION
-                    {?uuid a nidm:FSStatsCollection ;
-                    prov:wasGeneratedBy ?parent_act .}
-                    UNION
-                    {?uuid a nidm:FSLStatsCollection ;
-                    prov:wasGeneratedBy ?parent_act .}
-                    UNION
-                    {?uuid a nidm:ANTSStatsCollection ;
-                    prov:wasGeneratedBy ?parent_act .}
-            }
-
-        """
-    qres = rdf_graph_parse.query(query)
-    for row in qres:
+    # Find any of the above Derivatives and the activities that generated them
+    derivatives = {}
+    for derivative_type in (
+        "DerivativeObject",
+        "FSStatsCollection",
+        "FSLStatsCollection",
+        "ANTSStatsCollection",
+    ):
+        for uuid in subjects_by_type.get(URIRef(Constants.NIDM[derivative_type]), []):
+            for parent_act in rdf_graph.objects(uuid, Constants.PROV["wasGeneratedBy"]):
+                derivatives.setdefault((uuid, parent_act), None)
+    for uuid, parent_act in derivatives:
         # if the parent activity of the derivative object (entity) doesn't exist in the graph then create it
-        if row["parent_act"] not in project.derivatives:
-            deract_nm, deract_term = split_uri(row["parent_act"])
+        if parent_act not in project.derivatives:
+            deract_nm, deract_term = split_uri(parent_act)
             deriv_act = Derivative(project=project, uuid=deract_term)
             # add additional triples
-            add_metadata_for_subject(
-                rdf_graph_parse, row["parent_act"], project.graph.namespaces, deriv_act
-            )
-            _register_loaded_record(record_map, row["parent_act"], deriv_act)
+            add_metadata_for_subject(rdf_graph, parent_act, namespaces, deriv_act)
+            _register_loaded_record(record_map, parent_act, deriv_act)
         else:
             for d in project.get_derivatives:
-                if row["parent_act"] == d.get_uuid():
+                if parent_act == d.get_uuid():
                     deriv_act = d
 
         # check if derivative object already created and if not create it
         # if derivobj_uuid not in deriv_act.get_derivative_objects():
         # now instantiate the derivative object and add all triples
-        derobj_nm, derobj_term = split_uri(row["uuid"])
+        derobj_nm, derobj_term = split_uri(uuid)
         derobj_uuid = derobj_term
         deriv_obj = DerivativeObject(derivative=deriv_act, uuid=derobj_uuid)
-        add_metadata_for_subject(
-            rdf_graph_parse, row["uuid"], project.graph.namespaces, deriv_obj
+        add_metadata_for_subject(rdf_graph, uuid, namespaces, deriv_obj)
+        _register_loaded_record(record_map, uuid, deriv_obj)
+
+
+def read_nidm(nidmDoc, lazy=False):
+    """
+    Loads nidmDoc file into NIDM-Experiment structures and returns objects
+
+    With lazy the project and its sessions are read from the graph of nidmDoc the
+    active graph backend keeps (see nidm.experiment.GraphBackend), which is
+    memory-mapped from the cache when nidmDoc has been read before.  The acquisitions
+    of a session, the acquisition objects of an acquisition and the data elements and
+    derivatives of the project are only read from the graph when they are first asked
+    for or added to, so reading a large document to look at part of it is quick and
+    only the parts looked at take up memory.  PROV records the NIDM classes don't
+    model aren't read at all, they are still written back when the project is
+    serialized.
+
+    :nidmDoc: a valid RDF NIDM-experiment document (deserialization formats supported by RDFLib)
+    :param lazy: if True, read the parts of the document as they are needed
+
+    :return: NIDM Project
+
+    """
+
+    original_guess_format = RDFStream.guessFormat(nidmDoc)
+    # the text of an unchanged Turtle document is written back as is, it's only read
+    # from nidmDoc when the project is serialized
+    original_file = None
+    if str(original_guess_format).lower() in (
+        "ttl",
+        "turtle",
+    ) and not RDFStream.isCompressed(nidmDoc):
+        original_file = nidmDoc
+
+    if lazy:
+        # look the types up as they are needed instead of indexing the whole graph
+        rdf_graph_parse = GraphBackend.getBackend().openGraph(nidmDoc)
+        subject_types = _TypeLookup(rdf_graph_parse)
+        subjects_by_type = _TypeLookup(rdf_graph_parse, by_type=True)
+    else:
+        # read RDF file into temporary graph
+        rdf_graph_parse = RDFStream.parseFile(nidmDoc, Graph())
+        # classify the subjects by rdf:type once, the objects are built from this index
+        subject_types, subjects_by_type = _index_subject_types(rdf_graph_parse)
+
+    # registry of RDF subject URI -> loaded wrapper/record
+    record_map = {}
+
+    # Query graph for project metadata and create project level objects
+    # Get subject URI for project
+    proj_id = None
+    for s in subjects_by_type.get(URIRef(Constants.NIDM_PROJECT.uri), []):
+        # print(s)
+        proj_id = s
+
+    if proj_id is None:
+        print(f"Error reading NIDM-Exp Document {nidmDoc}, Must have Project Object")
+        print()
+        create_obj = input("Should read_nidm create a Project object for you [yes]: ")
+        if create_obj in ("yes", ""):
+            project = Project(empty_graph=True, add_default_type=True)
+            # add namespaces to prov graph
+            for name, namespace in rdf_graph_parse.namespaces():
+                # skip these default namespaces in prov Document
+                # if name not in ("prov", "xsd", "nidm", "niiri"):
+                if name not in ("prov", "xsd"):
+                    project.graph.add_namespace(name, namespace)
+
+        else:
+            sys.exit(1)
+    else:
+        # Split subject URI into namespace, term
+        _, project_uuid = split_uri(proj_id)
+
+        # create empty prov graph
+        project = Project(empty_graph=True, uuid=project_uuid, add_default_type=False)
+
+        # add namespaces to prov graph
+        for name, namespace in rdf_graph_parse.namespaces():
+            # skip these default namespaces in prov Document
+            # if name not in ("prov", "xsd", "nidm", "niiri"):
+            if name not in ("prov", "xsd"):
+                project.graph.add_namespace(name, namespace)
+
+    # namespaces of the prov graph, caching the QualifiedNames made for RDF terms
+    namespaces = _BundleNamespaces(project.graph)
+
+    if proj_id is not None:
+        # Cycle through Project metadata adding to prov graph
+        add_metadata_for_subject(rdf_graph_parse, proj_id, namespaces, project)
+        _register_loaded_record(record_map, proj_id, project)
+
+    # Query graph for sessions, instantiate session objects, and add to project._session list
+    # Get subject URI for sessions
+    for s in subjects_by_type.get(URIRef(Constants.NIDM_SESSION.uri), []):
+        # print(f"session: {s}")
+
+        # Split subject URI for session into namespace, uuid
+        _, session_uuid = split_uri(s)
+
+        # print(f"session uuid= {session_uuid}")
+
+        # instantiate session with this uuid, which adds it to the project
+        session = Session(project=project, uuid=session_uuid, add_default_type=False)
+
+        # now get remaining metadata in session object and add to session
+        # Cycle through Session metadata adding to prov graph
+        add_metadata_for_subject(rdf_graph_parse, s, namespaces, session)
+        _register_loaded_record(record_map, s, session)
+
+        read_acquisitions = functools.partial(
+            _read_session_acquisitions,
+            rdf_graph_parse,
+            subject_types,
+            session,
+            s,
+            namespaces,
+            record_map,
+            lazy,
         )
-        _register_loaded_record(record_map, row["uuid"], deriv_obj)
+        if lazy:
+            session._acquisition_loader = _baseline_loader(
+                project.graph, read_acquisitions
+            )
+        else:
+            read_acquisitions()
 
-    # Import generic PROV records not covered by the specialized NIDM object readers.
-    try:
-        _import_unmodeled_prov_branch(project, rdf_graph_parse, record_map=record_map)
-    except Exception as e:
-        logger.warning("Failed importing generic PROV branch for visualization: %s", e)
+    read_data_elements = functools.partial(
+        _read_data_elements,
+        project,
+        rdf_graph_parse,
+        subject_types,
+        subjects_by_type,
+        namespaces,
+        record_map,
+    )
+    # check for Derivatives.
+    read_derivatives = functools.partial(
+        _read_derivatives,
+        project,
+        rdf_graph_parse,
+        subjects_by_type,
+        namespaces,
+        record_map,
+    )
+    if lazy:
+        project._dataelement_loader = _baseline_loader(
+            project.graph, read_data_elements
+        )
+        project._derivative_loader = _baseline_loader(project.graph, read_derivatives)
+    else:
+        read_data_elements()
+        read_derivatives()
+
+        # Import generic PROV records not covered by the specialized NIDM object readers.
+        try:
+            _import_unmodeled_prov_branch(
+                project, rdf_graph_parse, record_map=record_map
+            )
+        except Exception as e:
+            logger.warning(
+                "Failed importing generic PROV branch for visualization: %s", e
+            )
 
     _install_lossless_serialize(
         project.graph,
         rdf_graph_parse,
-        original_text=original_text,
         original_format=original_guess_format,
+        original_file=original_file,
     )
 
     # Make project.serializeTurtle() use the lossless graph serializer too.
@@ -1557,6 +1743,9 @@ def find_in_namespaces(search_uri, namespaces):
     Looks through namespaces for search_uri
     :return: URI if found else False
     """
+    if isinstance(namespaces, _BundleNamespaces):
+        found = namespaces.find(search_uri)
+        return (True, found) if found is not None else (False, None)
 
     for uris in namespaces:
         if URIRef(uris.uri) == URIRef(search_uri):
@@ -3887,7 +4076,15 @@ def DD_to_nidm(dd_struct, cde_namespace=None):
     return g
 
 
-def add_attributes_with_cde(prov_object, cde, row_variable, value):
+def get_cde_attribute_names(prov_object, cde, row_variable):
+    """
+    Finds the CDEs in cde whose nidm:sourceVariable is row_variable
+    :param prov_object: prov object the attributes will be added to
+    :param cde: rdflib graph of CDEs
+    :param row_variable: source variable (e.g. CSV column name)
+    :return: list of prov QualifiedName to store the values of row_variable with
+    """
+    names = []
     # find the ID in cdes where nidm:source_variable matches the row_variable
     # qres = cde.subjects(predicate=Constants.RDFS['label'],object=Literal(row_variable))
     qres = cde.subjects(
@@ -3904,17 +4101,9 @@ def add_attributes_with_cde(prov_object, cde, row_variable, value):
         # if entity_nm is not in namespaces then it must just be part of some URI in the triple
         # so just add it as a prov.Identifier
         if not found_uri:
-            prov_object.add_attributes(
-                {
-                    pm.QualifiedName(
-                        provNamespace(entity_nm, entity_term), ""
-                    ): get_RDFliteral_type(value)
-                }
-            )
+            names.append(pm.QualifiedName(provNamespace(entity_nm, entity_term), ""))
         else:
-            prov_object.add_attributes(
-                {pm.QualifiedName(found_nm, entity_term): get_RDFliteral_type(value)}
-            )
+            names.append(pm.QualifiedName(found_nm, entity_term))
 
         # for prefix, namespace in cde.namespaces():
         #    # if namespace == URIRef(entity_id.rsplit("/", 1)[0] + "/"):
@@ -3932,6 +4121,12 @@ def add_attributes_with_cde(prov_object, cde, row_variable, value):
         #        )
         #        # prov_object.add_attributes({QualifiedName(Constants.NIIRI,entity_id):value})
         #        break
+    return names
+
+
+def add_attributes_with_cde(prov_object, cde, row_variable, value):
+    for name in get_cde_attribute_names(prov_object, cde, row_variable):
+        prov_object.add_attributes({name: get_RDFliteral_type(value)})
 
 
 def addDataladDatasetUUID(project_uuid, bidsroot_directory, graph):
@@ -0,0 +1,363 @@
+"""
+Data for the pynidm analysis tools (linear-regression, k-means, gmm, ...).
+
+load_model_frame pulls the values of a list of variables out of NIDM files and
+returns them as a wide pandas DataFrame, one row per subject and one column per
+variable, ready to be handed to statsmodels or scikit-learn.
+
+fit_regularized picks the weight of an L1 or L2 penalty by cross-validation over
+REGULARIZATION_ALPHAS and caches the fitted model.  cluster_sweep scores k-means or
+Gaussian mixture clusterings over a range of cluster numbers for the criteria used to
+pick the best one, and caches the scores too.  gap_cluster_number picks the number of
+clusters from the gap statistic of a sweep.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.cluster import KMeans
+from sklearn.linear_model import LassoCV, RidgeCV
+from sklearn.metrics import (
+    calinski_harabasz_score,
+    davies_bouldin_score,
+    silhouette_score,
+)
+from sklearn.mixture import GaussianMixture
+from nidm.experiment import Cache, Navigate
+from nidm.experiment.Query import URITail
+
+# value strings that stand for a missing value
+MISSING_VALUES = ("", "nan", "none")
+
+# penalty weights tried by fit_regularized and the number of cross-validation folds
+MAX_ALPHA = 700
+REGULARIZATION_ALPHAS = np.logspace(-3, np.log10(MAX_ALPHA), 100)
+CV_FOLDS = 10
+
+# criteria cluster_sweep can compute for each kind of clustering
+CLUSTER_CRITERIA = {
+    "kmeans": ("inertia", "gap", "silhouette", "calinski_harabasz", "davies_bouldin"),
+    "gmm": ("silhouette", "aic", "bic"),
+}
+# number of uniform reference data sets the gap statistic compares a clustering to
+GAP_REFERENCES = 10
+
+
+class VariablesNotFoundError(ValueError):
+    """
+    Raised by load_model_frame if some of the variables have no values in a NIDM file
+    """
+
+    def __init__(self, missing):
+        """
+        :param missing: dict of NIDM file -> list of the column names of the variables
+            that weren't found in it
+        """
+        self.missing = missing
+        super().__init__(
+            "; ".join(
+                f"{', '.join(variables)} not found in {nidm_file}"
+                for nidm_file, variables in missing.items()
+            )
+        )
+
+
+def column_name(variable):
+    """
+    :param variable: variable name as given to load_model_frame, e.g. age or
+        http://uri.interlex.org/ilx_0100400
+    :return: name of the variable's column, the end of a URL with spaces replaced by
+        underscores (e.g. ilx_0100400) so it can be used in a model formula
+    """
+    return str(variable).strip().split("/")[-1].replace(" ", "_")
+
+
+def _variable_rows(values, variable):
+    """
+    :param values: GetFieldValuesForProject DataFrame
+    :param variable: variable name
+    :return: boolean Series, True for the rows of values that are values of variable
+    """
+    names = {variable, variable.split("/")[-1]}
+    return (
+        values["sourceVariable"].isin(names)
+        | values["label"].isin(names)
+        | values["dataElement"].isin(names)
+        | values["isAbout"].isin(names)
+        | values["isAbout"].map(URITail, na_action="ignore").eq(URITail(variable))
+    )
+
+
+def _typed(column):
+    """
+    :param column: Series of value strings
+    :return: column converted to numbers if all its values are numbers, else column
+    """
+    try:
+        return pd.to_numeric(column)
+    except (ValueError, TypeError):
+        return column
+
+
+def load_model_frame(files, variables):
+    """
+    Returns the values of variables for all the subjects of the projects in files.
+
+    A value belongs to a variable if the variable is its source variable, label,
+    data element or (the end of) the concept it is about.  Every subject gets a row,
+    or one row per measurement if it has more than one value for a variable, with
+    missing values (including the MISSING_VALUES strings) left as NaN.  Columns whose
+    values are all numbers are numeric, the other ones hold the value strings (see
+    encode_categorical).
+
+    :param files: list of NIDM files
+    :param variables: list of variable names (source variables, labels, data
+        elements or concept URLs)
+    :return: pandas DataFrame indexed by subject UUID with a column per variable,
+        named by column_name
+    :raises VariablesNotFoundError: if a variable has no values in one of the files
+    """
+    columns = {}
+    for variable in variables:
+        columns.setdefault(column_name(variable), variable.strip())
+
+    frames = []
+    missing = {}
+    for nidm_file in files:
+        nidm_file_tuple = (nidm_file,)
+        values = pd.concat(
+            [
+                Navigate.GetFieldValuesForProject(
+                    nidm_file_tuple, URITail(project), list(columns.values())
+                )
+                for project in Navigate.getProjects(nidm_file_tuple)
+            ]
+            or [pd.DataFrame(columns=list(Navigate.ValueType._fields))]
+        )
+        long = pd.concat(
+            [
+                values.loc[
+                    _variable_rows(values, variable), ["subject", "value"]
+                ].assign(variable=column)
+                for column, variable in columns.items()
+            ]
+        )
+        # empty CSV cells end up as "nan" values
+        long = long[~long["value"].str.lower().isin(MISSING_VALUES)]
+        not_found = [c for c in columns if c not in set(long["variable"])]
+        if not_found:
+            missing[nidm_file] = not_found
+            continue
+        # repeated measurements of a subject are lined up in the order they were found
+        long["measurement"] = long.groupby(["subject", "variable"]).cumcount()
+        frames.append(
+            long.pivot(
+                index=["subject", "measurement"], columns="variable", values="value"
+            )
+        )
+    if missing:
+        raise VariablesNotFoundError(missing)
+
+    frame = pd.concat(frames).droplevel("measurement").reindex(columns=list(columns))
+    frame.columns.name = None
+    return frame.apply(_typed)
+
+
+def encode_categorical(frame):
+    """
+    Replaces the values of the non-numeric columns of frame by integer codes, in the
+    sorted order of the values like sklearn's LabelEncoder
+
+    :param frame: DataFrame (e.g. from load_model_frame)
+    :return: new DataFrame with only numeric columns
+    """
+    frame = frame.copy()
+    for column in frame.columns:
+        if not pd.api.types.is_numeric_dtype(frame[column]):
+            frame[column] = pd.factorize(frame[column].astype(str), sort=True)[0]
+    return frame
+
+
+def _digest(*parts):
+    """
+    :param parts: strings and numpy arrays
+    :return: hex digest of parts, for cache keys
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            h.update(part.encode() + b"\0")
+        else:
+            h.update(str(part.shape).encode() + part.tobytes())
+    return h.hexdigest()
+
+
+def fit_regularized(X, y, method, jobs=1):
+    """
+    Fits a Lasso (L1) or Ridge (L2) regression with the penalty weight out of
+    REGULARIZATION_ALPHAS that gives the best cross-validation score.  Lasso walks
+    the whole regularization path of each of the CV_FOLDS folds with warm starts,
+    Ridge uses efficient leave-one-out cross-validation.  The fitted model is cached
+    under a digest of the method, the design matrix and the dependent variable, so
+    refitting a model on the same data is free.
+
+    :param X: design matrix (DataFrame, patsy DesignMatrix or array) without an
+        intercept column
+    :param y: dependent variable
+    :param method: "L1" or "L2"
+    :param jobs: number of processes fitting the Lasso folds
+    :return: fitted LassoCV or RidgeCV, alpha_ is the chosen penalty weight
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    y = np.ascontiguousarray(np.ravel(y), dtype=float)
+    cache_file_name = Cache.cachePath(
+        "model_fit",
+        _digest(
+            method, sklearn.__version__, str(CV_FOLDS), REGULARIZATION_ALPHAS, X, y
+        ),
+        "pickle",
+    )
+    model = Cache.readPickle(cache_file_name)
+    if model is not None:
+        Cache.useEntry(cache_file_name, "model_fit")
+        return model
+
+    if method == "L1":
+        model = LassoCV(alphas=REGULARIZATION_ALPHAS, cv=CV_FOLDS, n_jobs=jobs)
+    else:
+        model = RidgeCV(alphas=REGULARIZATION_ALPHAS)
+    model.fit(X, y)
+    Cache.writePickle(model, cache_file_name)
+    Cache.addEntry(cache_file_name, "model_fit")
+    return model
+
+
+def cluster_model(kind, k, random_state=0):
+    """
+    :param kind: kmeans or gmm
+    :param k: number of clusters
+    :param random_state: seed of the initialization
+    :return: unfitted KMeans or GaussianMixture
+    """
+    if kind == "kmeans":
+        return KMeans(
+            n_clusters=k,
+            init="k-means++",
+            max_iter=300,
+            n_init=10,
+            random_state=random_state,
+        )
+    return GaussianMixture(
+        n_components=k, init_params="kmeans", random_state=random_state
+    )
+
+
+def _score_clustering(X, kind, k, criteria, random_state):
+    """
+    :return: dict of criterion -> score of the clustering of X into k clusters
+    """
+    model = cluster_model(kind, k, random_state).fit(X)
+    labels = model.predict(X)
+    scores = {}
+    for criterion in criteria:
+        if criterion == "inertia":
+            scores[criterion] = model.inertia_
+        elif criterion == "silhouette":
+            scores[criterion] = silhouette_score(X, labels)
+        elif criterion == "calinski_harabasz":
+            scores[criterion] = calinski_harabasz_score(X, labels)
+        elif criterion == "davies_bouldin":
+            scores[criterion] = davies_bouldin_score(X, labels)
+        elif criterion == "aic":
+            scores[criterion] = model.aic(X)
+        elif criterion == "bic":
+            scores[criterion] = model.bic(X)
+        elif criterion == "gap":
+            # reference data sets drawn uniformly from the bounding box of X, with a
+            # stream of random numbers of their own for every k
+            rng = np.random.default_rng([random_state, k])
+            low, high = X.min(axis=0), X.max(axis=0)
+            log_dispersions = [
+                np.log(
+                    cluster_model(kind, k, random_state)
+                    .fit(rng.uniform(low, high, size=X.shape))
+                    .inertia_
+                )
+                for _ in range(GAP_REFERENCES)
+            ]
+            scores["gap"] = np.mean(log_dispersions) - np.log(model.inertia_)
+            scores["gap_sd"] = np.std(log_dispersions) * np.sqrt(1 + 1 / GAP_REFERENCES)
+    return scores
+
+
+def cluster_sweep(X, kind, k_values, criteria, jobs=1, random_state=0):
+    """
+    Scores the clusterings of X into each number of clusters in k_values.  Every k is
+    clustered once for all the criteria, in up to jobs processes, and the scores are
+    cached under a digest of X, so other criteria asked for later (e.g. by another
+    -m of nidm_kmeans) only compute what is missing.
+
+    :param X: data to cluster (DataFrame or array)
+    :param kind: kmeans or gmm
+    :param k_values: numbers of clusters to try
+    :param criteria: criteria from CLUSTER_CRITERIA[kind] to compute; gap also adds a
+        gap_sd column with the standard error of the gap
+    :param jobs: number of processes clustering in parallel
+    :param random_state: seed of the clusterings and the gap reference data sets
+    :return: DataFrame indexed by k with a column per criterion
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    k_values = [int(k) for k in k_values]
+    cache_file_name = Cache.cachePath(
+        "cluster_sweep",
+        _digest(kind, sklearn.__version__, str(random_state), str(GAP_REFERENCES), X),
+        "pickle",
+    )
+    sweep = Cache.readPickle(cache_file_name)
+    if sweep is None:
+        sweep = pd.DataFrame(index=pd.Index([], name="k", dtype=int))
+    todo = {
+        k: [
+            c
+            for c in criteria
+            if c not in sweep.columns or k not in sweep.index or pd.isna(sweep.at[k, c])
+        ]
+        for k in k_values
+    }
+    todo = {k: missing for k, missing in todo.items() if missing}
+    if not todo:
+        Cache.useEntry(cache_file_name, "cluster_sweep")
+        return sweep.loc[k_values]
+
+    arguments = [(X, kind, k, missing, random_state) for k, missing in todo.items()]
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as pool:
+            results = list(pool.map(_score_clustering, *zip(*arguments)))
+    else:
+        results = [_score_clustering(*a) for a in arguments]
+    sweep = sweep.combine_first(
+        pd.DataFrame(results, index=pd.Index(list(todo), name="k"))
+    )
+    Cache.writePickle(sweep, cache_file_name)
+    Cache.addEntry(cache_file_name, "cluster_sweep")
+    return sweep.loc[k_values]
+
+
+def gap_cluster_number(sweep):
+    """
+    Picks the number of clusters by the gap statistic rule of Tibshirani, Walther and
+    Hastie (2001): the smallest k whose gap is at least the gap of the next k minus the
+    standard error of that gap.  If no k passes, the k with the largest gap is used.
+
+    :param sweep: DataFrame returned by cluster_sweep with the gap and gap_sd columns,
+        for consecutive numbers of clusters
+    :return: number of clusters
+    """
+    sweep = sweep.sort_index()
+    next_gap = sweep["gap"].shift(-1) - sweep["gap_sd"].shift(-1)
+    passing = sweep.index[sweep["gap"] >= next_gap]
+    if len(passing) == 0:
+        return int(sweep["gap"].idxmax())
+    return int(passing[0])
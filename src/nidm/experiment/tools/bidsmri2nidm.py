@@ -7,15 +7,19 @@ to the associated json data dictionary file.
 __version__ = "1.0.0"
 
 from argparse import ArgumentParser, RawTextHelpFormatter
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import csv
+import functools
 import glob
 import hashlib
-from io import StringIO
 import json
 import logging
+import mmap
 import os
 from os.path import isfile, join
 import sys
+import tempfile
 import bids
 from pandas import DataFrame
 from prov.model import PROV_TYPE, Namespace, QualifiedName
@@ -26,9 +30,11 @@ from nidm.experiment import (
     AcquisitionObject,
     AssessmentAcquisition,
     AssessmentObject,
+    Cache,
     MRAcquisition,
     MRObject,
     Project,
+    RDFStream,
     Session,
 )
 from nidm.experiment.Core import getUUID
@@ -57,16 +63,89 @@ def getRelPathToBIDS(filepath, bids_root, bidsuri_format=False):
     return file_relpath
 
 
+# files are hashed in blocks of this size
+HASH_BLOCK_SIZE = 16 * 1024 * 1024
+
+# futures of the digests of the files being hashed, by process, path, inode, size
+# and modification time.  Finished digests are dropped, they are looked up in the
+# cache after that.
+_digests = {}
+# thread pool hashing files in each process
+_hash_pools = {}
+
+
 def getsha512(filename):
     """
-    This function computes the SHA512 sum of a file
+    This function computes the SHA512 sum of a file.  Digests are remembered with
+    the path, inode, size and modification time of the file in the pynidm cache
+    (see nidm.experiment.Cache) so unchanged files are only read once, also across
+    runs.
     :param filename: path+filename of file to compute SHA512 sum for
     :return: hexadecimal sha512 sum of file.
     """
-    sha512_hash = hashlib.sha512()
+    return _digestFuture(filename).result()
+
+
+def prefetchDigests(filenames):
+    """
+    Starts computing the SHA512 sums of files in background threads, getsha512
+    then waits for them rather than reading the files itself
+    :param filenames: paths of files whose SHA512 sums will be needed
+    """
+    for filename in filenames:
+        try:
+            _digestFuture(filename)
+        except OSError:
+            # getsha512 will report it if the file is ever hashed
+            pass
+
+
+def _digestFuture(filename):
+    st = os.stat(filename)
+    filename = os.path.abspath(filename)
+    key = (os.getpid(), filename, st.st_ino, st.st_size, st.st_mtime_ns)
+    future = _digests.get(key)
+    if future is None:
+        pool = _hash_pools.get(os.getpid())
+        if pool is None:
+            pool = _hash_pools[os.getpid()] = ThreadPoolExecutor(
+                thread_name_prefix="sha512"
+            )
+        future = _digests[key] = pool.submit(_cachedSha512, filename)
+        future.add_done_callback(functools.partial(_forgetDigest, key))
+    return future
+
+
+def _forgetDigest(key, future):
+    # a later future of the same file is kept
+    if _digests.get(key) is future:
+        _digests.pop(key, None)
+
+
+def _cachedSha512(filename):
+    digest = Cache.lookupDigest(filename, algorithm="sha512")
+    if digest is None:
+        digest = _sha512(filename)
+        Cache.storeDigest(filename, digest, algorithm="sha512")
+    return digest
+
+
+def _sha512(filename):
     with open(filename, "rb") as f:
-        #  Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f.read(4096), b""):
+        try:
+            # hashlib releases the GIL while it hashes large blocks, so the files
+            # are read through a memory map, without copying the blocks
+            sha512_hash = hashlib.sha512()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for start in range(0, len(view), HASH_BLOCK_SIZE):
+                        sha512_hash.update(view[start : start + HASH_BLOCK_SIZE])
+            return sha512_hash.hexdigest()
+        except (OSError, ValueError):
+            # empty files and file systems that can't be memory mapped
+            f.seek(0)
+        sha512_hash = hashlib.sha512()
+        for byte_block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
             sha512_hash.update(byte_block)
     return sha512_hash.hexdigest()
 
@@ -159,9 +238,50 @@ and API Keys.  Then set the environment variable INTERLEX_API_KEY with your key.
         "beneath it).  When combined with -bidsignore, each sub-<id>/nidm.ttl path is added to .bidsignore "
         "so the dataset remains BIDS-valid.",
     )
+    parser.add_argument(
+        "-jobs",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes converting subjects in parallel in -per_subject or -incremental mode (default 1)",
+    )
+    parser.add_argument(
+        "-incremental",
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="If flag set, only subjects added or changed since the last -incremental run are converted.  A "
+        "manifest of the input files (paths, sizes, modification times and SHA-512 digests) is kept next to the "
+        "output as .<output file name>.manifest.json.  Without -per_subject the NIDM graph of each subject is "
+        "also kept, in the hidden .<output file name>.subjects directory, and merged into the NIDM file.  Only "
+        "subjects with a sub-<id> directory are converted.",
+    )
+    parser.add_argument(
+        "-format",
+        "--format",
+        dest="output_format",
+        choices=RDFStream.OUTPUT_FORMATS,
+        default="turtle",
+        help="Format of the NIDM file.  turtle (the default) is pretty-printed, nt (N-Triples), nq (N-Quads) and "
+        "ttl-stream (Turtle with one triple per line) are written a triple at a time, which is much faster and "
+        "uses less memory for very large datasets.  The default output file name (nidm.ttl) takes the "
+        "extension of the format.",
+    )
+    parser.add_argument(
+        "-gzip",
+        "--gzip",
+        action="store_true",
+        default=False,
+        help="If flag set, the NIDM file is gzip compressed and .gz is added to the default output file name",
+    )
 
     args = parser.parse_args()
     directory = args.directory
+    if args.jobs < 1:
+        parser.error("-jobs must be at least 1")
+    if args.jobs > 1 and not (args.per_subject or args.incremental):
+        # a single NIDM file is written by one process
+        parser.error("-jobs needs -per_subject or -incremental")
 
     if args.logfile is not None:
         logging.basicConfig(
@@ -206,53 +326,67 @@ and API Keys.  Then set the environment variable INTERLEX_API_KEY with your key.
                 directory,
             )
 
-        # Pre-generate shared identifiers so every per-subject file references
-        # the same nidm:Project activity and the same bids:Dataset collection.
-        shared_project_uuid = getUUID()
-        shared_dataset_uuid = getUUID()
+        nidm_filename = RDFStream.outputFilename("nidm", args.output_format, args.gzip)
+        manifest_file = manifestPath(os.path.join(out_dir, nidm_filename))
 
-        subjects = bids.BIDSLayout(directory).get_subjects()
-        for subj in subjects:
-            if subj.startswith("."):
-                continue
-            logging.info("Building NIDM file for subject %s", subj)
-            project, collection, cde, cde_pheno = bidsmri2project(
-                directory,
-                args,
-                subject_filter=subj,
-                project_uuid=shared_project_uuid,
-                dataset_uuid=shared_dataset_uuid,
+        with tempfile.TemporaryDirectory() as database_path:
+            # the dataset is indexed and its variables mapped once for all subjects,
+            # worker processes open the layout from the saved index
+            bids_dataset = loadBidsDataset(
+                directory, args, database_path=database_path if args.jobs > 1 else None
+            )
+            subjects = sorted(
+                s for s in bids_dataset.layout.get_subjects() if not s.startswith(".")
             )
             # BIDS-friendly layout: write each subject's NIDM file into that
             # subject's directory as nidm.ttl (i.e. BIDS_ROOT/sub-<id>/nidm.ttl)
             # rather than a flat sub-<id>_nidm.ttl in the output root.
-            subj_dir = os.path.join(out_dir, "sub-" + subj)
-            os.makedirs(subj_dir, exist_ok=True)
-            outputfile = os.path.join(subj_dir, "nidm.ttl")
-
-            if args.bidsignore and out_inside_bids:
-                # path relative to BIDS root, e.g. "sub-<id>/nidm.ttl"
-                bidsignore_name = os.path.relpath(os.path.abspath(outputfile), abs_bids)
+            outputfiles = {
+                subj: os.path.join(out_dir, "sub-" + subj, nidm_filename)
+                for subj in subjects
+            }
+            if args.incremental:
+                converted, _, failed = convertIncremental(
+                    directory,
+                    args,
+                    bids_dataset,
+                    outputfiles,
+                    manifest_file,
+                    database_path,
+                )
             else:
-                bidsignore_name = None
+                converted = subjects
+                # Pre-generate shared identifiers so every per-subject file references
+                # the same nidm:Project activity and the same bids:Dataset collection.
+                failed = convertSubjects(
+                    directory,
+                    args,
+                    bids_dataset,
+                    outputfiles,
+                    database_path,
+                    getUUID(),
+                    getUUID(),
+                )
 
-            _write_nidm_graph(
-                project=project,
-                collection=collection,
-                cde=cde,
-                cde_pheno=cde_pheno,
-                outputfile=outputfile,
-                bidsignore=bidsignore_name is not None,
-                directory=directory,
-                bidsignore_name=bidsignore_name,
-            )
-    else:
-        project, collection, cde, cde_pheno = bidsmri2project(directory, args)
+        # .bidsignore is only written here, in subject order, so workers never race
+        # on it
+        if args.bidsignore and out_inside_bids:
+            for subj in converted:
+                if subj not in failed:
+                    # path relative to BIDS root, e.g. "sub-<id>/nidm.ttl"
+                    addbidsignore(
+                        directory,
+                        os.path.relpath(os.path.abspath(outputfiles[subj]), abs_bids),
+                    )
 
+        _reportFailedSubjects(failed, len(converted))
+    else:
         # if args.outputfile was defined by user then use it else use default which is args.directory/nidm.ttl
         if args.outputfile == "nidm.ttl":
-            outputfile = os.path.join(directory, args.outputfile)
-            bidsignore_name = args.outputfile
+            bidsignore_name = RDFStream.outputFilename(
+                "nidm", args.output_format, args.gzip
+            )
+            outputfile = os.path.join(directory, bidsignore_name)
         else:
             # Support relative -o paths (and ~): resolve against the current
             # working directory and create the parent directory if needed.
@@ -268,16 +402,23 @@ and API Keys.  Then set the environment variable INTERLEX_API_KEY with your key.
             else:
                 bidsignore_name = os.path.basename(outputfile)
 
-        _write_nidm_graph(
-            project=project,
-            collection=collection,
-            cde=cde,
-            cde_pheno=cde_pheno,
-            outputfile=outputfile,
-            bidsignore=args.bidsignore,
-            directory=directory,
-            bidsignore_name=bidsignore_name,
-        )
+        if args.incremental:
+            updateNidmFile(directory, args, outputfile, bidsignore_name)
+        else:
+            project, collection, cde, cde_pheno = bidsmri2project(directory, args)
+
+            _write_nidm_graph(
+                project=project,
+                collection=collection,
+                cde=cde,
+                cde_pheno=cde_pheno,
+                outputfile=outputfile,
+                bidsignore=args.bidsignore,
+                directory=directory,
+                bidsignore_name=bidsignore_name,
+                output_format=args.output_format,
+                compress=args.gzip,
+            )
 
     # serialize NIDM file
     # with open(outputfile,'w', encoding="utf-8") as f:
@@ -1027,6 +1168,462 @@ def addimagingsessions(
             # link bval and bvec acquisition object entities together or is their association with DWI scan...
 
 
+def convertSubject(
+    directory,
+    args,
+    subject,
+    outputfile,
+    bids_dataset,
+    project_uuid,
+    dataset_uuid,
+    fragment=False,
+):
+    """
+    Writes the NIDM file of one subject of a BIDS dataset (--per_subject mode)
+
+    :param directory: BIDS directory
+    :param args: bidsmri2nidm arguments
+    :param subject: BIDS subject label, without sub-
+    :param outputfile: NIDM file to write
+    :param bids_dataset: BidsDataset from loadBidsDataset
+    :param project_uuid: UUID of the nidm:Project shared by all subjects
+    :param dataset_uuid: UUID of the bids:Dataset shared by all subjects
+    :param fragment: write the subject's part of a NIDM file made of several subjects
+        (see updateNidmFile) as ttl-stream, without export provenance
+    :return: outputfile
+    """
+    logging.info("Building NIDM file for subject %s", subject)
+    project, collection, cde, cde_pheno = bidsmri2project(
+        directory,
+        args,
+        subject_filter=subject,
+        project_uuid=project_uuid,
+        dataset_uuid=dataset_uuid,
+        bids_dataset=bids_dataset,
+    )
+    os.makedirs(os.path.dirname(outputfile), exist_ok=True)
+    if fragment:
+        RDFStream.writeGraphs(
+            [project.to_rdflib_graph(), cde, *cde_pheno], outputfile, "ttl-stream"
+        )
+        return outputfile
+    _write_nidm_graph(
+        project=project,
+        collection=collection,
+        cde=cde,
+        cde_pheno=cde_pheno,
+        outputfile=outputfile,
+        bidsignore=False,
+        directory=directory,
+        output_format=args.output_format,
+        compress=args.gzip,
+    )
+    return outputfile
+
+
+def convertSubjects(
+    directory,
+    args,
+    bids_dataset,
+    outputfiles,
+    database_path,
+    project_uuid,
+    dataset_uuid,
+    fragment=False,
+):
+    """
+    Writes the NIDM files of subjects, in args.jobs processes
+
+    :param directory: BIDS directory
+    :param args: bidsmri2nidm arguments
+    :param bids_dataset: BidsDataset from loadBidsDataset
+    :param outputfiles: dict of subject to the NIDM file to write
+    :param database_path: directory bids_dataset.layout was saved in if args.jobs > 1
+    :param project_uuid: UUID of the nidm:Project shared by all subjects
+    :param dataset_uuid: UUID of the bids:Dataset shared by all subjects
+    :param fragment: see convertSubject
+    :return: dict of subject to the exception converting it raised
+    """
+    failed = {}
+    if args.jobs > 1 and len(outputfiles) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(args.jobs, len(outputfiles)),
+            initializer=_initSubjectWorker,
+            initargs=(directory, bids_dataset._replace(layout=None), database_path),
+        ) as executor:
+            futures = {
+                subj: executor.submit(
+                    _convertSubjectInWorker,
+                    directory,
+                    args,
+                    subj,
+                    outputfile,
+                    project_uuid,
+                    dataset_uuid,
+                    fragment,
+                )
+                for subj, outputfile in outputfiles.items()
+            }
+            for subj, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[subj] = e
+    else:
+        for subj, outputfile in outputfiles.items():
+            try:
+                convertSubject(
+                    directory,
+                    args,
+                    subj,
+                    outputfile,
+                    bids_dataset,
+                    project_uuid,
+                    dataset_uuid,
+                    fragment,
+                )
+            except Exception as e:
+                failed[subj] = e
+    return failed
+
+
+def _reportFailedSubjects(failed, count):
+    for subj, e in failed.items():
+        logging.error("Failed to build NIDM file for subject %s: %s", subj, e)
+        print(f"Error: failed to build NIDM file for subject {subj}: {e}")
+    if failed:
+        print(f"{len(failed)} of {count} subjects failed: " + ", ".join(failed))
+        sys.exit(1)
+
+
+# BidsDataset of a --per_subject --jobs worker process, see _initSubjectWorker
+_worker_dataset = None
+
+
+def _initSubjectWorker(directory, bids_dataset, database_path):
+    # BIDSLayout objects can't be pickled so each worker opens the layout from the
+    # index the main process saved in database_path
+    global _worker_dataset
+    bids.config.set_option("extension_initial_dot", True)
+    _worker_dataset = bids_dataset._replace(
+        layout=bids.BIDSLayout(directory, database_path=database_path)
+    )
+
+
+def _convertSubjectInWorker(
+    directory, args, subject, outputfile, project_uuid, dataset_uuid, fragment
+):
+    return convertSubject(
+        directory,
+        args,
+        subject,
+        outputfile,
+        _worker_dataset,
+        project_uuid,
+        dataset_uuid,
+        fragment,
+    )
+
+
+# version of the --incremental manifest format, older manifests are rebuilt
+MANIFEST_VERSION = 1
+
+
+def manifestPath(outputfile):
+    """
+    :param outputfile: NIDM file, or the file name used for each subject in
+        --per_subject mode
+    :return: path of the --incremental manifest kept next to outputfile
+    """
+    head, tail = os.path.split(outputfile)
+    return os.path.join(head, "." + tail + ".manifest.json")
+
+
+def readManifest(manifest_file):
+    """
+    :param manifest_file: manifest written by an earlier --incremental run
+    :return: the manifest dict, None if there is no usable manifest
+    """
+    try:
+        with open(manifest_file, encoding="utf-8") as fp:
+            manifest = json.load(fp)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable manifest %s: %s", manifest_file, e)
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def writeManifest(manifest_file, manifest):
+    """
+    :param manifest_file: destination, written next to it and renamed into place
+    :param manifest: manifest dict from buildManifest
+    """
+    tmp_file = f"{manifest_file}.tmp-{os.getpid()}"
+    with open(tmp_file, "w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def buildManifest(
+    directory, args, bids_dataset, outputfiles, previous=None, manifest_dir=None
+):
+    """
+    Records the inputs of a conversion: the files and participants.tsv and phenotype
+    rows of each subject, and the files every subject's conversion depends on (the
+    JSON files in the BIDS root and phenotype directory and the -json_map file).
+
+    :param directory: BIDS directory
+    :param args: bidsmri2nidm arguments
+    :param bids_dataset: BidsDataset from loadBidsDataset
+    :param outputfiles: dict of subject to its NIDM file, these are never inputs
+    :param previous: manifest of the last run, only files that changed are hashed
+    :param manifest_dir: directory of the manifest file, output paths are relative
+        to it
+    :return: manifest dict
+    """
+    previous = previous or {}
+    exclude = {os.path.abspath(f) for f in outputfiles.values()}
+
+    def records(files, old):
+        # the size, modification time (ns) and SHA-512 digest of each file, the
+        # digest of the last run is reused if the size and modification time match
+        result = {}
+        changed = {}
+        for f in sorted(files):
+            if os.path.abspath(f) in exclude:
+                continue
+            rel = os.path.relpath(f, directory)
+            st = os.stat(f)
+            record = old.get(rel)
+            if (
+                record is not None
+                and record["size"] == st.st_size
+                and record["mtime"] == st.st_mtime_ns
+            ):
+                result[rel] = record
+            else:
+                result[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns}
+                changed[rel] = f
+        prefetchDigests(changed.values())
+        for rel, f in changed.items():
+            result[rel]["sha512"] = getsha512(f)
+        return result
+
+    # the NIDM files themselves may be in the BIDS root, only JSON files there are
+    # read by the conversion
+    shared_files = glob.glob(os.path.join(directory, "*.json"))
+    shared_files += glob.glob(os.path.join(directory, "phenotype", "*.json"))
+    if args.json_map:
+        shared_files.append(args.json_map)
+
+    # participants.tsv and phenotype rows by subject, with leading zeros stripped
+    # as bidsmri2project matches them
+    tables = [(tsv_file, rows) for tsv_file, rows, _ in bids_dataset.phenotypes]
+    if bids_dataset.participants is not None:
+        tables.insert(0, ("participants.tsv", bids_dataset.participants[0]))
+    subject_rows = {}
+    for tsv_file, rows in tables:
+        for row in rows:
+            temp = row["participant_id"].split("-")
+            sid = temp[1] if len(temp) > 1 else temp[0]
+            subject_rows.setdefault(sid.lstrip("0"), []).append(
+                [os.path.basename(tsv_file), row]
+            )
+
+    old_subjects = previous.get("subjects", {})
+    subjects = {}
+    for subj, outputfile in outputfiles.items():
+        rows = json.dumps(subject_rows.get(subj.lstrip("0"), []), sort_keys=True)
+        subjects[subj] = {
+            "files": records(
+                bids_dataset.layout.get(subject=subj, return_type="filename"),
+                old_subjects.get(subj, {}).get("files", {}),
+            ),
+            "rows": hashlib.sha512(rows.encode("utf-8")).hexdigest(),
+            "output": os.path.relpath(outputfile, manifest_dir or directory),
+        }
+
+    return {
+        "version": MANIFEST_VERSION,
+        "project_uuid": previous.get("project_uuid") or getUUID(),
+        "dataset_uuid": previous.get("dataset_uuid") or getUUID(),
+        "settings": {
+            "pynidm": pynidm_version,
+            "no_concepts": args.no_concepts,
+            "json_map": args.json_map,
+            "output_format": args.output_format,
+            "gzip": args.gzip,
+        },
+        "shared": records(shared_files, previous.get("shared", {})),
+        "subjects": subjects,
+    }
+
+
+def changedSubjects(previous, manifest, manifest_dir):
+    """
+    :param previous: manifest of the last run or None
+    :param manifest: manifest of this run
+    :param manifest_dir: directory of the manifest file
+    :return: subjects of manifest whose inputs differ from previous, or whose NIDM
+        file is missing.  All of them if the shared inputs or settings changed.
+    """
+
+    def digests(records):
+        return {f: record["sha512"] for f, record in records.items()}
+
+    if (
+        previous is None
+        or previous["settings"] != manifest["settings"]
+        or digests(previous["shared"]) != digests(manifest["shared"])
+    ):
+        return list(manifest["subjects"])
+    changed = []
+    for subj, entry in manifest["subjects"].items():
+        old = previous["subjects"].get(subj)
+        if (
+            old is None
+            or old["rows"] != entry["rows"]
+            or digests(old["files"]) != digests(entry["files"])
+            or not os.path.isfile(os.path.join(manifest_dir, entry["output"]))
+        ):
+            changed.append(subj)
+    return changed
+
+
+def convertIncremental(
+    directory,
+    args,
+    bids_dataset,
+    outputfiles,
+    manifest_file,
+    database_path,
+    fragment=False,
+):
+    """
+    --incremental conversion: only the subjects that were added or changed since
+    the run that wrote manifest_file are converted, files of subjects that are gone
+    are removed and the manifest is updated.
+
+    :param directory: BIDS directory
+    :param args: bidsmri2nidm arguments
+    :param bids_dataset: BidsDataset from loadBidsDataset
+    :param outputfiles: dict of subject to its NIDM file
+    :param manifest_file: manifest of the NIDM files, see manifestPath
+    :param database_path: see convertSubjects
+    :param fragment: see convertSubject
+    :return: (list of the subjects converted, list of the subjects removed, dict of
+        failed subject to exception)
+    """
+    manifest_dir = os.path.dirname(manifest_file)
+    previous = readManifest(manifest_file)
+    manifest = buildManifest(
+        directory, args, bids_dataset, outputfiles, previous, manifest_dir
+    )
+    converted = changedSubjects(previous, manifest, manifest_dir)
+    logging.info(
+        "%d of %d subjects changed: %s",
+        len(converted),
+        len(outputfiles),
+        ", ".join(converted),
+    )
+    failed = convertSubjects(
+        directory,
+        args,
+        bids_dataset,
+        {subj: outputfiles[subj] for subj in converted},
+        database_path,
+        manifest["project_uuid"],
+        manifest["dataset_uuid"],
+        fragment=fragment,
+    )
+
+    removed = [
+        subj
+        for subj in (previous or {}).get("subjects", {})
+        if subj not in manifest["subjects"]
+    ]
+    for subj in removed:
+        logging.info("Removing NIDM file of subject %s", subj)
+        outputfile = os.path.join(manifest_dir, previous["subjects"][subj]["output"])
+        try:
+            os.remove(outputfile)
+            # the sub-<id> directory too, if nothing else is left in it
+            os.rmdir(os.path.dirname(outputfile))
+        except OSError:
+            pass
+    # failed subjects are left out so the next run tries them again
+    for subj in failed:
+        del manifest["subjects"][subj]
+    writeManifest(manifest_file, manifest)
+    return converted, removed, failed
+
+
+def updateNidmFile(directory, args, outputfile, bidsignore_name):
+    """
+    --incremental conversion of a BIDS dataset into one NIDM file.  Each subject's
+    part of the graph is kept in a hidden directory next to outputfile, only the
+    subjects that changed are converted again and then the parts are merged into
+    outputfile.
+
+    :param directory: BIDS directory
+    :param args: bidsmri2nidm arguments
+    :param outputfile: NIDM file to write
+    :param bidsignore_name: name outputfile is added to .bidsignore with
+    """
+    head, tail = os.path.split(outputfile)
+    fragment_dir = os.path.join(head, "." + tail + ".subjects")
+    with tempfile.TemporaryDirectory() as database_path:
+        bids_dataset = loadBidsDataset(
+            directory, args, database_path=database_path if args.jobs > 1 else None
+        )
+        fragments = {
+            subj: os.path.join(fragment_dir, "sub-" + subj + ".ttl")
+            for subj in sorted(bids_dataset.layout.get_subjects())
+            if not subj.startswith(".")
+        }
+        converted, removed, failed = convertIncremental(
+            directory,
+            args,
+            bids_dataset,
+            fragments,
+            manifestPath(outputfile),
+            database_path,
+            fragment=True,
+        )
+
+    if failed:
+        # outputfile is left as it was rather than written without these subjects
+        _reportFailedSubjects(failed, len(converted))
+    if not converted and not removed and os.path.isfile(outputfile):
+        print(f"{outputfile} is up to date")
+        return
+
+    rdf_graph = Graph()
+    for fragment in fragments.values():
+        RDFStream.parseFile(fragment, rdf_graph)
+    manifest = readManifest(manifestPath(outputfile))
+    if args.bidsignore:
+        addbidsignore(directory, bidsignore_name)
+    export_provenance = add_export_provenance(
+        rdf_graph=Graph(),
+        collection=Constants.NIIRI[manifest["dataset_uuid"]],
+        outputfile=outputfile,
+        pynidm_version=pynidm_version,
+        tool_version=__version__,
+        script_name="bidsmri2nidm.py",
+        activity_label="Create NIDM RDF from BIDS dataset",
+        output_format=args.output_format,
+    )
+    logging.info("Writing NIDM file %s ....", outputfile)
+    RDFStream.writeGraphs(
+        [rdf_graph, export_provenance], outputfile, args.output_format, args.gzip
+    )
+
+
 def _write_nidm_graph(
     project,
     collection,
@@ -1036,46 +1633,55 @@ def _write_nidm_graph(
     bidsignore,
     directory,
     bidsignore_name=None,
+    output_format="turtle",
+    compress=False,
 ):
     """Build the rdflib Graph from the project/CDEs, add export provenance, and serialize to outputfile."""
-    rdf_graph = Graph()
-    rdf_graph.parse(source=StringIO(project.serializeTurtle()), format="turtle")
-    rdf_graph = rdf_graph + cde
-    for entry in cde_pheno:
-        rdf_graph = rdf_graph + entry
-
     logging.info("Writing NIDM file %s ....", outputfile)
 
     if bidsignore:
         addbidsignore(directory, bidsignore_name or os.path.basename(outputfile))
 
-    rdf_graph = add_export_provenance(
-        rdf_graph=rdf_graph,
+    export_provenance = add_export_provenance(
+        rdf_graph=Graph(),
         collection=collection,
         outputfile=outputfile,
         pynidm_version=pynidm_version,
         tool_version=__version__,
         script_name="bidsmri2nidm.py",
         activity_label="Create NIDM RDF from BIDS dataset",
-        output_format="turtle",
+        output_format=output_format,
     )
 
-    rdf_graph.serialize(destination=outputfile, format="turtle")
+    # the graphs are written one after the other rather than copied into one graph
+    RDFStream.writeGraphs(
+        [project.to_rdflib_graph(), cde, *cde_pheno, export_provenance],
+        outputfile,
+        output_format,
+        compress,
+    )
 
 
-def bidsmri2project(
-    directory, args, subject_filter=None, project_uuid=None, dataset_uuid=None
-):
-    """Build a NIDM Project and BIDS Dataset collection from a BIDS directory.
+BidsDataset = namedtuple(
+    "BidsDataset", ["description", "layout", "participants", "phenotypes"]
+)
 
-    When ``project_uuid`` and/or ``dataset_uuid`` are provided, the corresponding
-    UUIDs are used instead of newly generated ones.  This is used by
-    ``--per_subject`` mode so that every per-subject NIDM file references the
-    same ``nidm:Project`` activity and the same ``bids:Dataset`` collection.
-    """
-    # initialize empty cde graph...it may get replaced if we're doing variable to term mapping or not
-    cde = Graph()
 
+def loadBidsDataset(directory, args, database_path=None):
+    """Read the parts of a BIDS directory every subject's conversion uses.
+
+    The dataset description, the BIDS layout, the participants.tsv rows and the
+    phenotype files are read once, and their variables mapped to terms once, so
+    subjects can then be converted one at a time (see ``--per_subject``).
+
+    :param directory: BIDS directory
+    :param args: bidsmri2nidm arguments (json_map and no_concepts are used)
+    :param database_path: optional directory the BIDS layout index is saved in, other
+        processes can then open the layout without indexing the dataset again
+    :return: BidsDataset of the dataset_description.json dict, the BIDSLayout, a
+        (rows, column_to_terms, cde) tuple for participants.tsv or None, and a list of
+        (tsv_file, rows, cde) tuples for the phenotype files
+    """
     # Parse dataset_description.json file in BIDS directory
     if os.path.isdir(os.path.join(directory)):
         try:
@@ -1094,61 +1700,12 @@ def bidsmri2project(
         )
         sys.exit(-1)
 
-    # create project / nidm-exp doc
-    # reuse caller-supplied UUID if provided (used by --per_subject mode so all
-    # per-subject files reference the same nidm:Project)
-    project = Project(uuid=project_uuid) if project_uuid is not None else Project()
-
-    # 7/22/23 - Modified to create collection of AcquisitionObjects (prov:Entity) to
-    # essentially model the BIDS dataset that we're using to convert data into the
-    # NIDM representation
-    provgraph = project.getGraph()
-    # reuse caller-supplied UUID if provided so the bids:Dataset is the same
-    # across per-subject files
-    collection = provgraph.collection(
-        Constants.NIIRI[dataset_uuid if dataset_uuid is not None else getUUID()]
-    )
-    # 7/22/23 add type as bids:Dataset
-    collection.add_attributes(
-        {PROV_TYPE: QualifiedName(Namespace("bids", Constants.BIDS), "Dataset")}
-    )
-
-    # if there are git annex sources then add them
-    num_sources = addGitAnnexSources(obj=project.get_uuid(), bids_root=directory)
-    # else just add the local path to the dataset
-    # if num_sources == 0:
-    # 7/22/23 - modified to add location attribute to collection of acquisition objects
-    #    collection.add_attributes({Constants.PROV["Location"]: "file:/" + directory})
-
-    # add various attributes if they exist in BIDS dataset description file
-    for key in dataset:
-        # if key from dataset_description file is mapped to term in BIDS_Constants.py then add to NIDM object
-        if key in BIDS_Constants.dataset_description:
-            if key == "Name":
-                # 7/22/23 - modified to add BIDS "Name" attribute to project
-                project.add_attributes(
-                    {BIDS_Constants.dataset_description[key]: "".join(dataset[key])}
-                )
-            elif isinstance(dataset[key], list):
-                for entry in dataset[key]:
-                    # 7/22/23 - modified to add attributes to collection of acquisition objects
-                    collection.add_attributes(
-                        {BIDS_Constants.dataset_description[key]: entry}
-                    )
-            else:
-                # 7/22/23 - modified to add attributes to collection of acquisition objects
-                collection.add_attributes(
-                    {BIDS_Constants.dataset_description[key]: dataset[key]}
-                )
-
     # get BIDS layout
     bids.config.set_option("extension_initial_dot", True)
-    bids_layout = bids.BIDSLayout(directory)
+    bids_layout = bids.BIDSLayout(directory, database_path=database_path)
 
-    # create empty dictionary for sessions where key is subject id and used later to link scans to same session as demographics
-    session = {}
-    participant = {}
-    # Parse participants.tsv file in BIDS directory and create study and acquisition objects
+    participants = None
+    # Parse participants.tsv file in BIDS directory and map its variables to terms
     if os.path.isfile(os.path.join(directory, "participants.tsv")):
         encoding = check_encoding(os.path.join(directory, "participants.tsv"))
         with open(
@@ -1203,189 +1760,327 @@ def bidsmri2project(
                 associate_concepts=associate_concepts,
             )
 
-            # iterate over rows in participants.tsv file and create NIDM objects for sessions and acquisitions
-            for row in participants_data:
-                # create session object for subject to be used for participant metadata and image data
-                # parse subject id from "sub-XXXX" string
-                temp = row["participant_id"].split("-")
-                # for ambiguity in BIDS datasets.  Sometimes participant_id is sub-XXXX and othertimes it's just XXXX
-                if len(temp) > 1:
-                    subjid = temp[1]
+            participants = (list(participants_data), column_to_terms, cde)
+
+    phenotypes = []
+    # Added temporarily to support phenotype files
+    # for each *.tsv / *.json file pair in the phenotypes directory
+    for tsv_file in glob.glob(os.path.join(directory, "phenotype", "*.tsv")):
+        # for now, open the TSV file, extract the row for this subject, store it in an acquisition object and link to
+        # the associated JSON data dictionary file
+        encoding = check_encoding(tsv_file)
+        with open(tsv_file, encoding=encoding) as phenofile:
+            pheno_data = csv.DictReader(phenofile, delimiter="\t")
+            # Strip leading/trailing whitespace from column names (same defence as participants.tsv).
+            pheno_data.fieldnames = [f.strip() for f in pheno_data.fieldnames]
+            mapping_list = []
+            column_to_terms = {}
+            for field in pheno_data.fieldnames:
+                # column is not in BIDS_Constants
+                if field not in BIDS_Constants.participants:
+                    # add column to list for column_to_terms mapping
+                    mapping_list.append(field)
+
+            # if user didn't supply a json data dictionary file but we're doing some variable-term mapping create an empty one
+            # for column_to_terms to use
+            if args.json_map is False:
+                # defaults to participants.json because here we're mapping the participants.tsv file variables to terms
+                # if participants.json file doesn't exist then run without json mapping file
+                if not os.path.isfile(os.path.splitext(tsv_file)[0] + ".json"):
+                    json_source = None
                 else:
-                    subjid = temp[0]
-                # when per-subject mode is in use, skip rows for other subjects.
-                # Tolerate the common (older-BIDS / ABIDE) case where
-                # participants.tsv ids are not zero-padded but the subject
-                # directories are (e.g. "50792" vs "sub-0050792") by comparing
-                # with leading zeros stripped.  The imaging path
-                # (addimagingsessions) already reconciles the two via
-                # subject_id.lstrip("0").
-                if subject_filter is not None and subjid != subject_filter:
-                    if subjid.lstrip("0") == subject_filter.lstrip("0"):
-                        logging.warning(
-                            "participants.tsv participant_id '%s' does not match "
-                            "BIDS subject directory 'sub-%s' exactly; matched "
-                            "after normalizing leading zeros. For BIDS "
-                            "compliance, participant_id should be 'sub-%s'.",
-                            row["participant_id"],
-                            subject_filter,
-                            subject_filter,
-                        )
-                    else:
-                        continue
-                logging.info(subjid)
-                # add session and keep track if it for later using subjid
-                session[subjid] = Session(project)
-                # add acquisition activity
-                acq = AssessmentAcquisition(session=session[subjid])
-                # add acquisition entity
-                acq_entity = AssessmentObject(acquisition=acq)
-                # Modified 7/22/23 to add acq_entity to collection
-                provgraph.hadMember(collection, acq_entity)
+                    json_source = os.path.splitext(tsv_file)[0] + ".json"
+            else:  # if user supplied a JSON data dictionary then use it
+                json_source = args.json_map
+            # create data dictionary without concept mapping
+            if args.no_concepts:
+                associate_concepts = False
+            else:  # create data dictionary with concept mapping
+                associate_concepts = True
+            # maps variables in CSV file to terms
+            temp = DataFrame(columns=mapping_list)
+            column_to_terms_pheno, cde_tmp = map_variables_to_terms(
+                directory=directory,
+                assessment_name=tsv_file,
+                df=temp,
+                output_file=os.path.splitext(tsv_file)[0] + ".json",
+                json_source=json_source,
+                bids=True,
+                associate_concepts=associate_concepts,
+            )
+
+            phenotypes.append((tsv_file, list(pheno_data), cde_tmp))
+
+    return BidsDataset(dataset, bids_layout, participants, phenotypes)
+
+
+def bidsmri2project(
+    directory,
+    args,
+    subject_filter=None,
+    project_uuid=None,
+    dataset_uuid=None,
+    bids_dataset=None,
+):
+    """Build a NIDM Project and BIDS Dataset collection from a BIDS directory.
+
+    When ``project_uuid`` and/or ``dataset_uuid`` are provided, the corresponding
+    UUIDs are used instead of newly generated ones.  This is used by
+    ``--per_subject`` mode so that every per-subject NIDM file references the
+    same ``nidm:Project`` activity and the same ``bids:Dataset`` collection.
+    ``bids_dataset`` is the BidsDataset from loadBidsDataset, read here if not given.
+    """
+    # initialize empty cde graph...it may get replaced if we're doing variable to term mapping or not
+    cde = Graph()
+
+    if bids_dataset is None:
+        bids_dataset = loadBidsDataset(directory, args)
+    dataset = bids_dataset.description
+
+    # create project / nidm-exp doc
+    # reuse caller-supplied UUID if provided (used by --per_subject mode so all
+    # per-subject files reference the same nidm:Project)
+    project = Project(uuid=project_uuid) if project_uuid is not None else Project()
+
+    # 7/22/23 - Modified to create collection of AcquisitionObjects (prov:Entity) to
+    # essentially model the BIDS dataset that we're using to convert data into the
+    # NIDM representation
+    provgraph = project.getGraph()
+    # reuse caller-supplied UUID if provided so the bids:Dataset is the same
+    # across per-subject files
+    collection = provgraph.collection(
+        Constants.NIIRI[dataset_uuid if dataset_uuid is not None else getUUID()]
+    )
+    # 7/22/23 add type as bids:Dataset
+    collection.add_attributes(
+        {PROV_TYPE: QualifiedName(Namespace("bids", Constants.BIDS), "Dataset")}
+    )
+
+    # if there are git annex sources then add them
+    num_sources = addGitAnnexSources(obj=project.get_uuid(), bids_root=directory)
+    # else just add the local path to the dataset
+    # if num_sources == 0:
+    # 7/22/23 - modified to add location attribute to collection of acquisition objects
+    #    collection.add_attributes({Constants.PROV["Location"]: "file:/" + directory})
 
-                # create participant dictionary indexed by subjid to get agen UUIDs for later use
-                participant[subjid] = {}
-                # add agent for this participant to the graph
-                participant[subjid]["person"] = acq.add_person(
-                    attributes=({Constants.NIDM_SUBJECTID: row["participant_id"]})
+    # add various attributes if they exist in BIDS dataset description file
+    for key in dataset:
+        # if key from dataset_description file is mapped to term in BIDS_Constants.py then add to NIDM object
+        if key in BIDS_Constants.dataset_description:
+            if key == "Name":
+                # 7/22/23 - modified to add BIDS "Name" attribute to project
+                project.add_attributes(
+                    {BIDS_Constants.dataset_description[key]: "".join(dataset[key])}
+                )
+            elif isinstance(dataset[key], list):
+                for entry in dataset[key]:
+                    # 7/22/23 - modified to add attributes to collection of acquisition objects
+                    collection.add_attributes(
+                        {BIDS_Constants.dataset_description[key]: entry}
+                    )
+            else:
+                # 7/22/23 - modified to add attributes to collection of acquisition objects
+                collection.add_attributes(
+                    {BIDS_Constants.dataset_description[key]: dataset[key]}
                 )
 
-                # add nfo:filename entry to assessment entity to reflect provenance of where this data came from
-                acq_entity.add_attributes(
+    bids_layout = bids_dataset.layout
+
+    # create empty dictionary for sessions where key is subject id and used later to link scans to same session as demographics
+    session = {}
+    participant = {}
+    # Parse participants.tsv file in BIDS directory and create study and acquisition objects
+    if bids_dataset.participants is not None:
+        participants_data, column_to_terms, shared_cde = bids_dataset.participants
+        # BIDS constant data elements are added to the CDE graph below, a copy keeps
+        # the graph shared by all subjects as loadBidsDataset made it
+        cde = Graph()
+        for prefix, namespace in shared_cde.namespaces():
+            cde.bind(prefix, namespace, override=False)
+        cde += shared_cde
+        # iterate over rows in participants.tsv file and create NIDM objects for sessions and acquisitions
+        for row in participants_data:
+            # create session object for subject to be used for participant metadata and image data
+            # parse subject id from "sub-XXXX" string
+            temp = row["participant_id"].split("-")
+            # for ambiguity in BIDS datasets.  Sometimes participant_id is sub-XXXX and othertimes it's just XXXX
+            if len(temp) > 1:
+                subjid = temp[1]
+            else:
+                subjid = temp[0]
+            # when per-subject mode is in use, skip rows for other subjects.
+            # Tolerate the common (older-BIDS / ABIDE) case where
+            # participants.tsv ids are not zero-padded but the subject
+            # directories are (e.g. "50792" vs "sub-0050792") by comparing
+            # with leading zeros stripped.  The imaging path
+            # (addimagingsessions) already reconciles the two via
+            # subject_id.lstrip("0").
+            if subject_filter is not None and subjid != subject_filter:
+                if subjid.lstrip("0") == subject_filter.lstrip("0"):
+                    logging.warning(
+                        "participants.tsv participant_id '%s' does not match "
+                        "BIDS subject directory 'sub-%s' exactly; matched "
+                        "after normalizing leading zeros. For BIDS "
+                        "compliance, participant_id should be 'sub-%s'.",
+                        row["participant_id"],
+                        subject_filter,
+                        subject_filter,
+                    )
+                else:
+                    continue
+            logging.info(subjid)
+            # add session and keep track if it for later using subjid
+            session[subjid] = Session(project)
+            # add acquisition activity
+            acq = AssessmentAcquisition(session=session[subjid])
+            # add acquisition entity
+            acq_entity = AssessmentObject(acquisition=acq)
+            # Modified 7/22/23 to add acq_entity to collection
+            provgraph.hadMember(collection, acq_entity)
+
+            # create participant dictionary indexed by subjid to get agen UUIDs for later use
+            participant[subjid] = {}
+            # add agent for this participant to the graph
+            participant[subjid]["person"] = acq.add_person(
+                attributes=({Constants.NIDM_SUBJECTID: row["participant_id"]})
+            )
+
+            # add nfo:filename entry to assessment entity to reflect provenance of where this data came from
+            acq_entity.add_attributes(
+                {
+                    Constants.NIDM_FILENAME: getRelPathToBIDS(
+                        os.path.join("participants.tsv"),
+                        directory,
+                        bidsuri_format=True,
+                    )
+                }
+            )
+
+            # add qualified association of participant with acquisition activity
+            acq.add_qualified_association(
+                person=participant[subjid]["person"],
+                role=Constants.NIDM_PARTICIPANT,
+            )
+            # print(acq)
+
+            # if there are git annex sources for participants.tsv file then add them
+            num_sources = addGitAnnexSources(
+                obj=acq_entity.get_uuid(), bids_root=directory
+            )
+
+            # if there's a participant.json sidecar file then create an entity and
+            # associate it with all the assessment entities
+            if os.path.isfile(os.path.join(directory, "participants.json")):
+                json_sidecar = AcquisitionObject(acquisition=acq)
+
+                # Modified 7/22/23 to add acq_entity to collection
+                provgraph.hadMember(collection, json_sidecar)
+
+                json_sidecar.add_attributes(
                     {
+                        PROV_TYPE: QualifiedName(
+                            Namespace("bids", Constants.BIDS), "sidecar_file"
+                        ),
                         Constants.NIDM_FILENAME: getRelPathToBIDS(
-                            os.path.join("participants.tsv"),
+                            os.path.join("participants.json"),
                             directory,
                             bidsuri_format=True,
-                        )
+                        ),
                     }
                 )
 
-                # add qualified association of participant with acquisition activity
-                acq.add_qualified_association(
-                    person=participant[subjid]["person"],
-                    role=Constants.NIDM_PARTICIPANT,
-                )
-                # print(acq)
-
+                # add Git Annex Sources
                 # if there are git annex sources for participants.tsv file then add them
                 num_sources = addGitAnnexSources(
-                    obj=acq_entity.get_uuid(), bids_root=directory
+                    obj=json_sidecar.get_uuid(),
+                    filepath=os.path.join(directory, "participants.json"),
+                    bids_root=directory,
                 )
 
-                # if there's a participant.json sidecar file then create an entity and
-                # associate it with all the assessment entities
-                if os.path.isfile(os.path.join(directory, "participants.json")):
-                    json_sidecar = AcquisitionObject(acquisition=acq)
-
-                    # Modified 7/22/23 to add acq_entity to collection
-                    provgraph.hadMember(collection, json_sidecar)
-
-                    json_sidecar.add_attributes(
-                        {
-                            PROV_TYPE: QualifiedName(
-                                Namespace("bids", Constants.BIDS), "sidecar_file"
-                            ),
-                            Constants.NIDM_FILENAME: getRelPathToBIDS(
-                                os.path.join("participants.json"),
-                                directory,
-                                bidsuri_format=True,
-                            ),
-                        }
-                    )
-
-                    # add Git Annex Sources
-                    # if there are git annex sources for participants.tsv file then add them
-                    num_sources = addGitAnnexSources(
-                        obj=json_sidecar.get_uuid(),
-                        filepath=os.path.join(directory, "participants.json"),
-                        bids_root=directory,
-                    )
-
-                # check if json_sidecar entity exists and if so associate assessment entity with it
-                if "json_sidecar" in locals():
-                    # connect json_entity with acq_entity
-                    acq_entity.add_attributes(
-                        {Constants.PROV["wasInfluencedBy"]: json_sidecar}
-                    )
-                for key, value in row.items():
-                    if not value:
-                        continue
-                    # for variables in participants.tsv file who have term mappings in BIDS_Constants.py use those,
-                    # add to json_map so we don't have to map these if user
-                    # supplied arguments to map variables
-                    if key in BIDS_Constants.participants:
-                        # WIP
-                        # Here we are adding to CDE graph data elements for BIDS Constants that remain fixed for
-                        # each BIDS-compliant dataset
-                        if not (
-                            BIDS_Constants.participants[key] == Constants.NIDM_SUBJECTID
-                        ):
-                            cde_id = Constants.BIDS[key]
-                            # add the data element to the CDE graph
-                            cde.add((cde_id, RDF.type, Constants.NIDM["DataElement"]))
-                            cde.add((cde_id, RDF.type, Constants.PROV["Entity"]))
-                            # add some basic information about this data element
-                            cde.add(
-                                (
-                                    cde_id,
-                                    Constants.RDFS["label"],
-                                    Literal(BIDS_Constants.participants[key].localpart),
-                                )
+            # check if json_sidecar entity exists and if so associate assessment entity with it
+            if "json_sidecar" in locals():
+                # connect json_entity with acq_entity
+                acq_entity.add_attributes(
+                    {Constants.PROV["wasInfluencedBy"]: json_sidecar}
+                )
+            for key, value in row.items():
+                if not value:
+                    continue
+                # for variables in participants.tsv file who have term mappings in BIDS_Constants.py use those,
+                # add to json_map so we don't have to map these if user
+                # supplied arguments to map variables
+                if key in BIDS_Constants.participants:
+                    # WIP
+                    # Here we are adding to CDE graph data elements for BIDS Constants that remain fixed for
+                    # each BIDS-compliant dataset
+                    if not (
+                        BIDS_Constants.participants[key] == Constants.NIDM_SUBJECTID
+                    ):
+                        cde_id = Constants.BIDS[key]
+                        # add the data element to the CDE graph
+                        cde.add((cde_id, RDF.type, Constants.NIDM["DataElement"]))
+                        cde.add((cde_id, RDF.type, Constants.PROV["Entity"]))
+                        # add some basic information about this data element
+                        cde.add(
+                            (
+                                cde_id,
+                                Constants.RDFS["label"],
+                                Literal(BIDS_Constants.participants[key].localpart),
                             )
-                            cde.add(
-                                (
-                                    cde_id,
-                                    Constants.NIDM["isAbout"],
-                                    URIRef(BIDS_Constants.participants[key].uri),
-                                )
+                        )
+                        cde.add(
+                            (
+                                cde_id,
+                                Constants.NIDM["isAbout"],
+                                URIRef(BIDS_Constants.participants[key].uri),
                             )
-                            cde.add(
-                                (
-                                    cde_id,
-                                    Constants.NIDM["source_variable"],
-                                    Literal(key),
-                                )
+                        )
+                        cde.add(
+                            (
+                                cde_id,
+                                Constants.NIDM["source_variable"],
+                                Literal(key),
                             )
-                            cde.add(
-                                (
-                                    cde_id,
-                                    Constants.NIDM["description"],
-                                    Literal("participant/subject identifier"),
-                                )
+                        )
+                        cde.add(
+                            (
+                                cde_id,
+                                Constants.NIDM["description"],
+                                Literal("participant/subject identifier"),
                             )
-                            cde.add(
-                                (
-                                    cde_id,
-                                    Constants.RDFS["comment"],
-                                    Literal(
-                                        "BIDS participants_id variable fixed in specification"
-                                    ),
-                                )
+                        )
+                        cde.add(
+                            (
+                                cde_id,
+                                Constants.RDFS["comment"],
+                                Literal(
+                                    "BIDS participants_id variable fixed in specification"
+                                ),
                             )
-                            cde.add(
-                                (
-                                    cde_id,
-                                    Constants.RDFS["valueType"],
-                                    URIRef(Constants.XSD["string"]),
-                                )
+                        )
+                        cde.add(
+                            (
+                                cde_id,
+                                Constants.RDFS["valueType"],
+                                URIRef(Constants.XSD["string"]),
                             )
+                        )
 
-                            acq_entity.add_attributes({cde_id: Literal(value)})
+                        acq_entity.add_attributes({cde_id: Literal(value)})
 
-                    # else variable in participants.tsv isn't a BIDS constant CDE it's a user-defined variable
-                    # so we need to add the variable data dictionary as a PersonalDataElement to NIDM graph using
-                    # the cde graph returned from map_variables_to_terms functions above
-                    else:
-                        # here we're adding the assessment data for a particular row in the participants.tsv value
-                        # to the acquisition entity (acq_entity) using the UUIDs in the cde graph to identify the
-                        # data element we're storing assessment data for.
-                        add_attributes_with_cde(
-                            prov_object=acq_entity,
-                            cde=cde,
-                            row_variable=key,
-                            value=value,
-                        )
+                # else variable in participants.tsv isn't a BIDS constant CDE it's a user-defined variable
+                # so we need to add the variable data dictionary as a PersonalDataElement to NIDM graph using
+                # the cde graph returned from map_variables_to_terms functions above
+                else:
+                    # here we're adding the assessment data for a particular row in the participants.tsv value
+                    # to the acquisition entity (acq_entity) using the UUIDs in the cde graph to identify the
+                    # data element we're storing assessment data for.
+                    add_attributes_with_cde(
+                        prov_object=acq_entity,
+                        cde=cde,
+                        row_variable=key,
+                        value=value,
+                    )
 
     # create acquisition objects for each scan for each subject
     # loop through all subjects in dataset (or only the requested one in per-subject mode)
@@ -1393,6 +2088,14 @@ def bidsmri2project(
         subjects_to_process = [subject_filter]
     else:
         subjects_to_process = bids_layout.get_subjects()
+    # the imaging files are hashed in the background while the graph is built
+    prefetchDigests(
+        bids_layout.get(
+            subject=subjects_to_process,
+            extension=[".nii", ".nii.gz", ".bval", ".bvec"],
+            return_type="filename",
+        )
+    )
     for subject_id in subjects_to_process:
         logging.info("Converting subject: %s", subject_id)
         # skip .git directories...added to support datalad datasets
@@ -1436,140 +2139,96 @@ def bidsmri2project(
     # for each *.tsv / *.json file pair in the phenotypes directory
     # WIP: ADD VARIABLE -> TERM MAPPING HERE
     cde_pheno = []
-    for tsv_file in glob.glob(os.path.join(directory, "phenotype", "*.tsv")):
-        # for now, open the TSV file, extract the row for this subject, store it in an acquisition object and link to
-        # the associated JSON data dictionary file
-        encoding = check_encoding(tsv_file)
-        with open(tsv_file, encoding=encoding) as phenofile:
-            pheno_data = csv.DictReader(phenofile, delimiter="\t")
-            # Strip leading/trailing whitespace from column names (same defence as participants.tsv).
-            pheno_data.fieldnames = [f.strip() for f in pheno_data.fieldnames]
-            mapping_list = []
-            column_to_terms = {}
-            for field in pheno_data.fieldnames:
-                # column is not in BIDS_Constants
-                if field not in BIDS_Constants.participants:
-                    # add column to list for column_to_terms mapping
-                    mapping_list.append(field)
-
-            # if user didn't supply a json data dictionary file but we're doing some variable-term mapping create an empty one
-            # for column_to_terms to use
-            if args.json_map is False:
-                # defaults to participants.json because here we're mapping the participants.tsv file variables to terms
-                # if participants.json file doesn't exist then run without json mapping file
-                if not os.path.isfile(os.path.splitext(tsv_file)[0] + ".json"):
-                    json_source = None
-                else:
-                    json_source = os.path.splitext(tsv_file)[0] + ".json"
-            else:  # if user supplied a JSON data dictionary then use it
-                json_source = args.json_map
-            # create data dictionary without concept mapping
-            if args.no_concepts:
-                associate_concepts = False
-            else:  # create data dictionary with concept mapping
-                associate_concepts = True
-            # maps variables in CSV file to terms
-            temp = DataFrame(columns=mapping_list)
-            column_to_terms_pheno, cde_tmp = map_variables_to_terms(
-                directory=directory,
-                assessment_name=tsv_file,
-                df=temp,
-                output_file=os.path.splitext(tsv_file)[0] + ".json",
-                json_source=json_source,
-                bids=True,
-                associate_concepts=associate_concepts,
+    for tsv_file, pheno_data, cde_tmp in bids_dataset.phenotypes:
+        for row in pheno_data:
+            # parse subject id tolerantly: participant_id may be "sub-XXXX"
+            # or a bare "XXXX" (older BIDS / non-compliant datasets)
+            temp = row["participant_id"].split("-")
+            sid = temp[1] if len(temp) > 1 else temp[0]
+            # when per-subject mode is in use, skip phenotype rows for other
+            # subjects (compare with leading zeros stripped, matching the
+            # participants.tsv handling above)
+            if subject_filter is not None and sid.lstrip("0") != subject_filter.lstrip(
+                "0"
+            ):
+                continue
+            # add acquisition object
+            acq = AssessmentAcquisition(session=session[sid])
+            # add qualified association with person
+            acq.add_qualified_association(
+                person=participant[sid]["person"],
+                role=Constants.NIDM_PARTICIPANT,
             )
+            # add acquisition entity and associate it with the acquisition activity
+            acq_entity = AssessmentObject(acquisition=acq)
+
+            # Modified 7/22/23 to add acq_entity to collection
+            provgraph.hadMember(collection, acq_entity)
 
-            for row in pheno_data:
-                # parse subject id tolerantly: participant_id may be "sub-XXXX"
-                # or a bare "XXXX" (older BIDS / non-compliant datasets)
-                temp = row["participant_id"].split("-")
-                sid = temp[1] if len(temp) > 1 else temp[0]
-                # when per-subject mode is in use, skip phenotype rows for other
-                # subjects (compare with leading zeros stripped, matching the
-                # participants.tsv handling above)
-                if (
-                    subject_filter is not None
-                    and sid.lstrip("0") != subject_filter.lstrip("0")
-                ):
+            for key, value in row.items():
+                if not value:
                     continue
-                # add acquisition object
-                acq = AssessmentAcquisition(session=session[sid])
-                # add qualified association with person
-                acq.add_qualified_association(
-                    person=participant[sid]["person"],
-                    role=Constants.NIDM_PARTICIPANT,
-                )
-                # add acquisition entity and associate it with the acquisition activity
-                acq_entity = AssessmentObject(acquisition=acq)
+                # we're using participant_id in NIDM in agent so don't add to assessment as a triple.
+                # BIDS phenotype files seem to have an index column with no column header variable name so skip those
+                if (not key == "participant_id") and (key != ""):
+                    add_attributes_with_cde(
+                        prov_object=acq_entity,
+                        cde=cde_tmp,
+                        row_variable=key,
+                        value=value,
+                    )
 
-                # Modified 7/22/23 to add acq_entity to collection
-                provgraph.hadMember(collection, acq_entity)
-
-                for key, value in row.items():
-                    if not value:
-                        continue
-                    # we're using participant_id in NIDM in agent so don't add to assessment as a triple.
-                    # BIDS phenotype files seem to have an index column with no column header variable name so skip those
-                    if (not key == "participant_id") and (key != ""):
-                        add_attributes_with_cde(
-                            prov_object=acq_entity,
-                            cde=cde_tmp,
-                            row_variable=key,
-                            value=value,
-                        )
+            # link TSV file
+            acq_entity.add_attributes(
+                {
+                    Constants.NIDM_FILENAME: getRelPathToBIDS(
+                        tsv_file, directory, bidsuri_format=True
+                    )
+                }
+            )
 
-                # link TSV file
-                acq_entity.add_attributes(
+            # if there are git annex sources for participants.tsv file then add them
+            num_sources = addGitAnnexSources(
+                obj=acq_entity.get_uuid(), bids_root=directory
+            )
+
+            # link associated JSON file if it exists
+            data_dict = os.path.join(
+                directory,
+                "phenotype",
+                os.path.splitext(os.path.basename(tsv_file))[0] + ".json",
+            )
+            if os.path.isfile(data_dict):
+                # if file exists, create a new entity and associate it with the appropriate activity  and a used relationship
+                # with the TSV-related entity
+                json_entity = AcquisitionObject(acquisition=acq)
+
+                # Modified 7/22/23 to add json_entity to collection
+                provgraph.hadMember(collection, json_entity)
+
+                json_entity.add_attributes(
                     {
+                        PROV_TYPE: Constants.BIDS["sidecar_file"],
                         Constants.NIDM_FILENAME: getRelPathToBIDS(
-                            tsv_file, directory, bidsuri_format=True
-                        )
+                            data_dict, directory, bidsuri_format=True
+                        ),
                     }
                 )
 
+                # add Git Annex Sources
                 # if there are git annex sources for participants.tsv file then add them
                 num_sources = addGitAnnexSources(
-                    obj=acq_entity.get_uuid(), bids_root=directory
+                    obj=json_entity.get_uuid(),
+                    filepath=data_dict,
+                    bids_root=directory,
                 )
 
-                # link associated JSON file if it exists
-                data_dict = os.path.join(
-                    directory,
-                    "phenotype",
-                    os.path.splitext(os.path.basename(tsv_file))[0] + ".json",
+                # connect json_entity with acq_entity
+                acq_entity.add_attributes(
+                    {Constants.PROV["wasInfluencedBy"]: json_entity.get_uuid()}
                 )
-                if os.path.isfile(data_dict):
-                    # if file exists, create a new entity and associate it with the appropriate activity  and a used relationship
-                    # with the TSV-related entity
-                    json_entity = AcquisitionObject(acquisition=acq)
-
-                    # Modified 7/22/23 to add json_entity to collection
-                    provgraph.hadMember(collection, json_entity)
-
-                    json_entity.add_attributes(
-                        {
-                            PROV_TYPE: Constants.BIDS["sidecar_file"],
-                            Constants.NIDM_FILENAME: getRelPathToBIDS(
-                                data_dict, directory, bidsuri_format=True
-                            ),
-                        }
-                    )
-
-                    # add Git Annex Sources
-                    # if there are git annex sources for participants.tsv file then add them
-                    num_sources = addGitAnnexSources(
-                        obj=json_entity.get_uuid(),
-                        filepath=data_dict,
-                        bids_root=directory,
-                    )
-
-                    # connect json_entity with acq_entity
-                    acq_entity.add_attributes(
-                        {Constants.PROV["wasInfluencedBy"]: json_entity.get_uuid()}
-                    )
-            # append cde_tmp to cde_pheno list for later inclusion in NIDM graph
-            cde_pheno.append(cde_tmp)
+        # append cde_tmp to cde_pheno list for later inclusion in NIDM graph
+        cde_pheno.append(cde_tmp)
 
     return project, collection, cde, cde_pheno
 
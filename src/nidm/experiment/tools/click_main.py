@@ -1,4 +1,5 @@
 from nidm.experiment.tools import (  # noqa: F401
+    nidm_cache,
     nidm_concat,
     nidm_convert,
     nidm_linreg,
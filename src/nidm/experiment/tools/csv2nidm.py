@@ -9,14 +9,17 @@ data will then be written to a NIDM data file.
 __version__ = "1.0.0"
 
 from argparse import ArgumentParser
-from io import StringIO
+from collections import namedtuple
 import logging
 import os
 from os.path import basename, dirname, join
 from shutil import copy2
 import sys
+import numpy as np
 import pandas as pd
-from prov.model import Identifier, QualifiedName
+from prov.model import Identifier
+from prov.model import Namespace as provNamespace
+from prov.model import QualifiedName
 from rdflib import RDF, Graph, Literal
 from rdflib.namespace import split_uri
 from nidm import __version__ as pynidm_version
@@ -27,22 +30,21 @@ from nidm.experiment import (
     Derivative,
     DerivativeObject,
     Project,
+    RDFStream,
     Session,
 )
 from nidm.experiment.Core import getUUID
 from nidm.experiment.Query import (
-    GetAcquisitionEntityFromSubjectSessionRun,
-    GetAcquisitionEntityFromSubjectSessionTask,
-    GetAcquisitionEntityFromSubjectSessionTaskRun,
-    GetParticipantIDs,
-    GetParticipantSessionsMetadata,
-    GetParticipantUUIDFromSubjectID,
+    GetAcquisitionEntitiesTaskRun,
+    GetParticipantSessionNumbers,
+    GetParticipantUUIDsForSubjectIDs,
 )
 from nidm.experiment.Utils import (
-    add_attributes_with_cde,
     add_export_provenance,
     addGitAnnexSources,
     csv_dd_to_json_dd,
+    get_cde_attribute_names,
+    get_RDFliteral_type,
     map_variables_to_terms,
     read_nidm,
     redcap_datadictionary_to_json,
@@ -102,147 +104,256 @@ def detect_idfield(dd):
     return id_field
 
 
-def find_session_for_subjectid(session_num, subjectid, nidm_file):
+SubjectIndex = namedtuple("SubjectIndex", ["persons", "sessions", "acquisitions"])
+Acquisition = namedtuple(
+    "Acquisition", ["session_uuid", "task", "run", "acq_activity", "acq_entity"]
+)
+
+
+def normalize_subject_id(subject_id):
+    """
+    :param: subject_id = subject ID from the CSV or NIDM file
+    :return: subject_id as a string without leading zeros, how subject IDs are matched between the files
+    """
+    return str(subject_id).lstrip("0")
+
+
+def build_subject_index(nidm_file):
+    """
+    This function will look up the participants, their sessions and their acquisitions in nidm_file once, so the
+    rows of a CSV file can be matched against them without querying the NIDM file for every row.
+    :param: nidm_file = NIDM file to index
+    :return: SubjectIndex with a pandas Series of prov:Person UUIDs indexed by normalized subject ID, a dict of
+        lists of (session number, session UUID) and a dict of lists of Acquisition, both by normalized subject ID.
+        The lists are sorted by session number, run, task and UUID, so a CSV row that matches several of them is
+        matched with the same one whatever order the query results come in.
+    """
+    persons = GetParticipantUUIDsForSubjectIDs([nidm_file])
+    persons = (
+        persons.assign(ID=persons["ID"].map(normalize_subject_id))
+        .sort_values(["ID", "person_uuid"], key=lambda column: column.astype(str))
+        .drop_duplicates("ID")
+        .set_index("ID")["person_uuid"]
+    )
+
+    sessions = {}
+    for subject_id, session_uuid, session_number in GetParticipantSessionNumbers(
+        [nidm_file]
+    ).itertuples(index=False, name=None):
+        sessions.setdefault(normalize_subject_id(subject_id), []).append(
+            (session_number, session_uuid)
+        )
+
+    acquisitions = {}
+    for (
+        subject_id,
+        session_uuid,
+        acq_activity,
+        acq_entity,
+        task,
+        run,
+    ) in GetAcquisitionEntitiesTaskRun([nidm_file]).itertuples(index=False, name=None):
+        acquisitions.setdefault(normalize_subject_id(subject_id), []).append(
+            Acquisition(
+                session_uuid,
+                None if task is None else str(task),
+                run,
+                acq_activity,
+                acq_entity,
+            )
+        )
+
+    session_numbers = {}
+    for subject_sessions in sessions.values():
+        subject_sessions.sort(key=lambda s: (_sort_key(s[0]), str(s[1])))
+        session_numbers.update((uuid, number) for number, uuid in subject_sessions)
+    for subject_acquisitions in acquisitions.values():
+        subject_acquisitions.sort(
+            key=lambda acq: (
+                _sort_key(session_numbers.get(acq.session_uuid)),
+                _sort_key(acq.run),
+                _sort_key(acq.task),
+                str(acq.acq_entity),
+            )
+        )
+
+    return SubjectIndex(persons, sessions, acquisitions)
+
+
+def _sort_key(value):
+    """
+    :return: key sorting values from the NIDM file as numbers if they are numbers, before the other values
+    """
+    if value is None or pd.isna(value):
+        return (2, 0.0, "")
+    try:
+        return (0, float(value), "")
+    except (TypeError, ValueError):
+        return (1, 0.0, str(value))
+
+
+def find_session_for_subjectid(session_num, subjectid, subject_index):
     """
-    This function will search the supplied nidm_file for subjectid in agents and then get all sessions linked to this
-    agent and search for a session with session number matching session_num.
+    This function will find the session of subjectid with session number matching session_num.
     :param: session_num = string of session number searching for
     :param: subjectid = string subject id of subject interested in
-    :param: nidm_file = NIDM file to search
+    :param: subject_index = SubjectIndex of the NIDM file to search (see build_subject_index)
     :return: session uuid containing session number for this subject
     """
+    if session_num is None:
+        return None
+    for session_number, session_uuid in subject_index.sessions.get(
+        normalize_subject_id(subjectid), ()
+    ):
+        if _same_value(session_number, session_num):
+            return session_uuid
+    return None
 
-    # get list of session objects we'll need to match up a derivative with a session / scan acquisition
-    session_metadata = GetParticipantSessionsMetadata([nidm_file], subjectid)
-
-    # find session number matching session provided in args.csv_file
-    # initially set derivative_session to None in case we don't find it
-    derivative_session = None
-    for _, row in session_metadata.iterrows():
-        # csv_row is the current row being processed.  Check the session_number against the ses column
-        if row["p"] == Constants.BIDS["session_number"]:
-            if str(row["o"]) == session_num:
-                # found the session number so now get the acquisition entities linked to this session
-                # to match up the 'task' and 'run' information so derived data is linked correctly
-                derivative_session = row["session_uuid"]
 
-    return derivative_session
+def _same_value(value, csv_value):
+    """
+    :return: True if value from the NIDM file is csv_value from the CSV file, compared as strings or numbers since
+        pandas reads numeric columns with empty cells as floats
+    """
+    if value is None:
+        return False
+    if str(value) == str(csv_value):
+        return True
+    try:
+        return float(value) == float(csv_value)
+    except ValueError:
+        return False
 
 
 def match_acquistion_task_run_from_session(
-    subject_id, session_uuid, task, run, nidm_file
+    subject_id, session_uuid, task, run, subject_index
 ):
     """
-    This function will use the supplied session_uuid from the NIDM file and find the acquisition entity with
-    metadata matching the supplied task.
+    This function will find the acquisition entity of subject_id with metadata matching the supplied task and run.
+    If session_uuid is None because there was no session number in the CSV file, all sessions of the subject are
+    searched.
+    :param: subject_id = string subject id of subject interested in
     :param: session_uuid = NIDM file session uuid to search for acquisitions associated with
     :param: task = string task name to search acquisition entity metadata for
     :param: run = string run number to search acquisition entity metadata for
-    :param: nidm_file = NIDM file to search
+    :param: subject_index = SubjectIndex of the NIDM file to search (see build_subject_index)
     :return: Returns UUID of acquisition activity and entity matching task and run
     """
 
-    derivative_acq_entity = None
-    acquisition_act = None
-
-    # if session_uuid, task, and run are all specified then we can simply find the acquisition entity directly
-    # and be done otherwise we have to iteratively search
-    if (session_uuid is not None) and (task is not None) and (run is not None):
-        acq_entity = GetAcquisitionEntityFromSubjectSessionTaskRun(
-            nidm_file_list=[nidm_file],
-            subject_id=subject_id,
-            session_uuid=session_uuid,
-            run=run,
-            task=task,
-        )
+    # there is nothing to match an acquisition with
+    if (task is None) and (run is None):
+        return None, None
 
-        for _, acq in acq_entity.iterrows():
-            derivative_acq_entity = acq["acq_entity"]
-            acquisition_act = acq["acq_activity"]
-            break
-
-    # user supplied session_uuid, a run, and not task
-    elif (session_uuid is not None) and (task is None) and (run is not None):
-        acq_entity = GetAcquisitionEntityFromSubjectSessionRun(
-            nidm_file_list=[nidm_file],
-            subject_id=subject_id,
-            session_uuid=session_uuid,
-            run=run,
-        )
-        for _, acq in acq_entity.iterrows():
-            derivative_acq_entity = acq["acq_entity"]
-            acquisition_act = acq["acq_activity"]
-            break
-
-    # user supplied session_uuid, a task, and not run
-    elif (session_uuid is not None) and (task is not None) and (run is None):
-        acq_entity = GetAcquisitionEntityFromSubjectSessionTask(
-            nidm_file_list=[nidm_file],
-            subject_id=subject_id,
-            session_uuid=session_uuid,
-            task=task,
-        )
-        for _, acq in acq_entity.iterrows():
-            derivative_acq_entity = acq["acq_entity"]
-            acquisition_act = acq["acq_activity"]
-            break
-
-    # if session_uuid is None because user didn't supply a session number in the CSV file
-    # implying there was no session number in the BIDS dataset for this task/run, we have to search across all
-    # sessions to find the one that has an acquisition object that wasGenerated by an acquisition that
-    # contains the task and/or run matching what the user
-    # supplied.
-    elif session_uuid is None:
-        # get session_uuids and metadata for this subject_id
-        session_act = GetParticipantSessionsMetadata([nidm_file], subject_id)
-        # session_act = GetSessionUUID([nidm_file])
-
-        # for session, get linked acquisition entities and search for the supplied
-        # task and run
-        for _, session in session_act.iterrows():
-            # if session_uuid, task, and run are all specified then we can simply find the acquisition entity directly
-            # and be done otherwise we have to iteratively search
-            if (task is not None) and (run is not None):
-                acq_entity = GetAcquisitionEntityFromSubjectSessionTaskRun(
-                    nidm_file_list=[nidm_file],
-                    subject_id=subject_id,
-                    session_uuid=session["session_uuid"],
-                    run=run,
-                    task=task,
-                )
+    for acq in subject_index.acquisitions.get(normalize_subject_id(subject_id), ()):
+        if (session_uuid is not None) and (acq.session_uuid != session_uuid):
+            continue
+        if (task is not None) and (acq.task != task):
+            continue
+        if (run is not None) and not _same_value(acq.run, run):
+            continue
+        return acq.acq_entity, acq.acq_activity
+
+    return None, None
 
-                for _, acq in acq_entity.iterrows():
-                    derivative_acq_entity = acq["acq_entity"]
-                    acquisition_act = acq["acq_activity"]
-                    break
-
-            # user supplied session_uuid, a run, and not task
-            elif (task is None) and (run is not None):
-                acq_entity = GetAcquisitionEntityFromSubjectSessionRun(
-                    nidm_file_list=[nidm_file],
-                    subject_id=subject_id,
-                    session_uuid=session["session_uuid"],
-                    run=run,
-                )
-                for _, acq in acq_entity.iterrows():
-                    derivative_acq_entity = acq["acq_entity"]
-                    acquisition_act = acq["acq_activity"]
-                    break
-
-            # user supplied session_uuid, a task, and not run
-            elif (task is not None) and (run is None):
-                acq_entity = GetAcquisitionEntityFromSubjectSessionTask(
-                    nidm_file_list=[nidm_file],
-                    subject_id=subject_id,
-                    session_uuid=session["session_uuid"],
-                    task=task,
-                )
-                for _, acq in acq_entity.iterrows():
-                    derivative_acq_entity = acq["acq_entity"]
-                    acquisition_act = acq["acq_activity"]
-                    break
 
-    return derivative_acq_entity, acquisition_act
+def read_csv_file(csv_file, id_field, chunksize=None):
+    """
+    This function will read the CSV (or TSV) file with the id_field column as strings, for zero-padded subject ids.
+    :param: csv_file = CSV file, tab separated if it ends in .tsv
+    :param: id_field = subject id column
+    :param: chunksize = optional number of rows to read at a time
+    :return: data frame, or an iterator of data frames of chunksize rows if chunksize is given
+    """
+    sep = "\t" if csv_file.endswith(".tsv") else ","
+    dtype = {id_field: str}
+    if chunksize:
+        # every chunk gets the column types of the whole file
+        dtype = csv_column_dtypes(csv_file, id_field, chunksize)
+    return pd.read_csv(csv_file, dtype=dtype, sep=sep, chunksize=chunksize)
+
+
+def csv_column_dtypes(csv_file, id_field, chunksize):
+    """
+    This function will find the types the columns of the CSV (or TSV) file have when the whole file is read, one
+    chunk at a time.  pandas guesses the types of each chunk on its own, e.g. a column of numbers is read as
+    integers in a chunk without empty cells and as floats in a chunk with some, which would change the types of the
+    values written to the NIDM file.
+    :param: csv_file = CSV file, tab separated if it ends in .tsv
+    :param: id_field = subject id column, read as strings
+    :param: chunksize = number of rows to read at a time
+    :return: dict of column name to dtype
+    """
+    sep = "\t" if csv_file.endswith(".tsv") else ","
+    chunk_dtypes = {}
+    for df in pd.read_csv(
+        csv_file, dtype={id_field: str}, sep=sep, chunksize=chunksize
+    ):
+        for column, dtype in df.dtypes.items():
+            chunk_dtypes.setdefault(column, set()).add(dtype)
+
+    dtypes = {}
+    for column, types in chunk_dtypes.items():
+        if len(types) == 1:
+            dtypes[column] = types.pop()
+        elif all(
+            pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t)
+            for t in types
+        ):
+            # integers and floats are read as floats
+            dtypes[column] = np.result_type(*types)
+        else:
+            dtypes[column] = object
+    return dtypes
+
+
+def chunk_project(project_uuid, namespaces):
+    """
+    This function will create the Project the rows of one chunk of the CSV file are added to when the CSV file is
+    read in chunks (-chunksize), so the records of earlier chunks aren't kept in memory.
+    :param: project_uuid = uuid of the project the CSV data is added to
+    :param: namespaces = prov namespaces to add to the project
+    :return: Project with no other records
+    """
+    project = Project(uuid=project_uuid, add_default_type=False)
+    for namespace in namespaces:
+        project.graph.add_namespace(namespace)
+    return project
+
+
+def write_chunk(writer, project, written):
+    """
+    This function will write the records added to project for a chunk of CSV rows.
+    :param: writer = RDFStream.TripleWriter of the NIDM file
+    :param: project = Project of the chunk (see chunk_project)
+    :param: written = triples already in the NIDM file, those of the project itself, which are left out
+    """
+    rdf_graph = project.to_rdflib_graph()
+    for prefix, namespace in rdf_graph.namespaces():
+        writer.bind(prefix, namespace)
+    writer.write(t for t in rdf_graph if t not in written)
+
+
+def add_row_attributes(prov_object, cde, row_items, attribute_names):
+    """
+    This function will add the values of a CSV row to prov_object with the CDEs of their columns, all in one
+    add_attributes call.
+    :param: prov_object = prov object to add the values to
+    :param: cde = rdflib graph of CDEs
+    :param: row_items = (column, value) pairs to add
+    :param: attribute_names = dict of column to CDE attribute names, filled in as columns are first seen so the CDE
+        graph is only searched once for each column
+    """
+    attributes = []
+    for row_variable, value in row_items:
+        names = attribute_names.get(row_variable)
+        if names is None:
+            names = attribute_names[row_variable] = get_cde_attribute_names(
+                prov_object, cde, row_variable
+            )
+        if names:
+            literal = get_RDFliteral_type(Literal(value))
+            attributes.extend((name, literal) for name in names)
+    prov_object.add_attributes(attributes)
 
 
 def csv2nidm_main(args=None):
@@ -350,6 +461,33 @@ def csv2nidm_main(args=None):
             "cmdline: Command line used to run the software generating the results in the provided CSV "
             "ID: A url link to the term in a terminology resource (e.g. InterLex) for the software ",
         )
+        parser.add_argument(
+            "-format",
+            "--format",
+            dest="output_format",
+            choices=RDFStream.OUTPUT_FORMATS,
+            default="turtle",
+            help="Format of the NIDM file.  turtle (the default) is pretty-printed, nt (N-Triples), nq (N-Quads) "
+            "and ttl-stream (Turtle with one triple per line) are written a triple at a time, which is much "
+            "faster and uses less memory for very large files. ",
+        )
+        parser.add_argument(
+            "-gzip",
+            "--gzip",
+            action="store_true",
+            default=False,
+            help="If flag set, the NIDM file is gzip compressed ",
+        )
+        parser.add_argument(
+            "-chunksize",
+            "--chunksize",
+            dest="chunksize",
+            type=int,
+            default=None,
+            help="Read the CSV file this many rows at a time and write the NIDM data of each chunk before reading "
+            "the next one, so memory use doesn't grow with the size of the CSV file.  The NIDM file is written a "
+            "triple at a time, as ttl-stream if the turtle -format is selected. ",
+        )
         args = parser.parse_args()
 
     # if we have a redcap datadictionary then convert it straight away to a json representation
@@ -367,12 +505,19 @@ def csv2nidm_main(args=None):
             sys.exit(-1)
     else:
         json_map = None
-    # open CSV file and load into
+    output_format = getattr(args, "output_format", "turtle")
+    compress = getattr(args, "gzip", False)
+    chunksize = getattr(args, "chunksize", None)
+    # chunks are written as they are converted, which needs one of the streaming formats
+    if chunksize and output_format not in RDFStream.STREAM_FORMATS:
+        output_format = "ttl-stream"
+    # open CSV file and load into, only the header is needed for now if it's read in chunks later
     # DBK added to accommodate TSV files with tab separator 3/15/21
+    nrows = 0 if chunksize else None
     if args.csv_file.endswith(".csv"):
-        df = pd.read_csv(args.csv_file)
+        df = pd.read_csv(args.csv_file, nrows=nrows)
     elif args.csv_file.endswith(".tsv"):
-        df = pd.read_csv(args.csv_file, sep="\t", engine="python")
+        df = pd.read_csv(args.csv_file, sep="\t", engine="python", nrows=nrows)
     else:
         print(
             "ERROR: input file must have .csv (comma-separated) or .tsv (tab separated) extensions/"
@@ -520,15 +665,29 @@ def csv2nidm_main(args=None):
             logging.info("Adding to NIDM file...")
         else:
             print("Adding to NIDM file...")
-        # get subjectID list for later
-        qres = GetParticipantIDs([args.nidm_file])
+        # look up the participants, sessions and acquisitions to match the CSV rows with
+        subject_index = build_subject_index(args.nidm_file)
 
         # read in NIDM file
         if args.logfile:
             logging.info("Reading NIDM file...")
         else:
             print("Reading NIDM file...")
-        project = read_nidm(args.nidm_file)
+        if chunksize:
+            # the triples of the NIDM file are copied to the new one, only the project is needed to add the CSV
+            # data to
+            rdf_graph = RDFStream.parseFile(args.nidm_file)
+            project_uuid = str(
+                next(rdf_graph.subjects(RDF.type, Constants.NIDM["Project"]))
+            ).replace(str(Constants.NIIRI), "", 1)
+            namespaces = [
+                provNamespace(prefix, str(uri))
+                for prefix, uri in rdf_graph.namespaces()
+                if prefix
+            ]
+            project = chunk_project(project_uuid, namespaces)
+        else:
+            project = read_nidm(args.nidm_file)
         # with open("/Users/dkeator/Downloads/test.ttl", "w", encoding="utf-8") as f:
         #    f.write(project.serializeTurtle())
 
@@ -546,16 +705,11 @@ def csv2nidm_main(args=None):
             # ask user for id field
             id_field = ask_idfield(df)
 
-            # make sure id_field is a string for zero-padded subject ids
-            # re-read data file with constraint that key field is read as string
-            if args.csv_file.endswith(".csv"):
-                df = pd.read_csv(args.csv_file, dtype={id_field: str})
-            else:
-                df = pd.read_csv(args.csv_file, dtype={id_field: str}, sep="\t")
-        else:
-            # make sure id_field is a string for zero-padded subject ids
-            # re-read data file with constraint that key field is read as string
-            df = pd.read_csv(args.csv_file, dtype={id_field: str})
+        # make sure id_field is a string for zero-padded subject ids
+        # re-read data file with constraint that key field is read as string
+        chunks = read_csv_file(args.csv_file, id_field, chunksize)
+        if not chunksize:
+            chunks = [chunks]
 
         # ## use RDFLib here for temporary graph making query easier
         # rdf_graph = Graph()
@@ -577,266 +731,261 @@ def csv2nidm_main(args=None):
         # file alone
         data_added = False
 
-        # iterate over rows of csv file
-        for _, df_row in df.iterrows():
-            # see if this participant ID is in the NIDM file
-            found_subject = False
-
-            # search all subject ids in nidm file for one referenced in csv file
-            for _, row in qres.iterrows():
-                if (str(row.iloc[1]).lstrip("0") in df_row[id_field].lstrip("0")) or (
-                    str(row.iloc[1]) in df_row[id_field]
-                ):
-                    found_subject = True
-                    if args.logfile:
-                        logging.info(
-                            f"found participant {str(row.iloc[1]).lstrip('0')} in CSV file"
-                        )
-                    else:
-                        print(
-                            f"found participant {str(row.iloc[1]).lstrip('0')} in CSV file"
-                        )
-                    break
-
-            # if the subject in CSV file isn't found in supplied nidm file then skip adding this derivative
-            # information
-            if not found_subject:
-                continue
-
-            data_added = True
-
-            # find prov:Person associated with df_row[id_field]
-            subject_uuid = GetParticipantUUIDFromSubjectID(
-                nidm_file_list=[args.nidm_file],
-                subject_id=df_row[id_field].lstrip("0"),
+        if chunksize:
+            # written to a temporary file first, the NIDM file is left alone if no data is added
+            nidm_file_tmp = args.nidm_file + ".tmp"
+            writer = RDFStream.TripleWriter(nidm_file_tmp, output_format, compress)
+            writer.writeGraph(rdf_graph)
+            for prefix, namespace in cde.namespaces():
+                writer.bind(prefix, namespace)
+            writer.write(t for t in cde if t not in rdf_graph)
+            written = set(chunk_project(project_uuid, namespaces).to_rdflib_graph())
+            del rdf_graph
+
+        # CDE attribute names of the csv columns, looked up as they are first used
+        attribute_names = {}
+
+        for df in chunks:
+            if chunksize:
+                project = chunk_project(project_uuid, namespaces)
+
+            # find prov:Person associated with each row's df_row[id_field], rows of subjects that aren't in the
+            # supplied nidm file are skipped
+            person_uuids = (
+                df[id_field].map(normalize_subject_id).map(subject_index.persons)
             )
+            found_subjects = person_uuids.notna()
+
+            # iterate over rows of csv file
+            for person_uuid, df_row in zip(
+                person_uuids[found_subjects], df[found_subjects].to_dict("records")
+            ):
+                subject_id = normalize_subject_id(df_row[id_field])
+                if args.logfile:
+                    logging.info(f"found participant {subject_id} in CSV file")
+                else:
+                    print(f"found participant {subject_id} in CSV file")
+
+                data_added = True
+
+                # added to support derivatives
+                if args.derivative:
+                    # here we need to locate the session with bids:session_number equal to ses_task_run_df['ses'] for
+                    # this subject and then the acquisition with 'task' and optional 'run' so we can link the derivatives
+                    # to these data.  If all ('ses','run','task') are blank then we simply create a new session and
+                    # continue
+
+                    # get session number for this csv row
+                    session_num = df_row["ses"]
+
+                    # check if session_num is empty and if so, set to None
+                    # since we converted to a string we'll use string comparisons for 'nan'
+                    if str(session_num) == "nan":
+                        session_num = None
+
+                    # now find session NIDM object for this subject
+                    derivative_session = find_session_for_subjectid(
+                        session_num, subject_id, subject_index
+                    )
 
-            # added to support derivatives
-            if args.derivative:
-                # here we need to locate the session with bids:session_number equal to ses_task_run_df['ses'] for
-                # this subject and then the acquisition with 'task' and optional 'run' so we can link the derivatives
-                # to these data.  If all ('ses','run','task') are blank then we simply create a new session and
-                # continue
-
-                # get session number for this csv row
-                session_num = df_row["ses"]
-
-                # check if session_num is empty and if so, set to None
-                # since we converted to a string we'll use string comparisons for 'nan'
-                if str(session_num) == "nan":
-                    session_num = None
-
-                # now find session NIDM object for this subject
-                derivative_session = find_session_for_subjectid(
-                    session_num, str(df_row[id_field]).lstrip("0"), args.nidm_file
-                )
-
-                # get task from current csv row
-                task = str(df_row["task"])
-
-                # check if task is empty and if so, set to None
-                if task == "nan":
-                    task = None
-
-                # get run from current csv row
-                run = str(df_row["run"])
-
-                # check if run is empty and if so, set to None
-                if run == "nan":
-                    run = None
-
-                # now find acquisition entity matching the supplied task
-                (
-                    source_acq_entity,
-                    source_activity,
-                ) = match_acquistion_task_run_from_session(
-                    subject_id=str(df_row[id_field]).lstrip("0"),
-                    session_uuid=derivative_session,
-                    task=task,
-                    run=run,
-                    nidm_file=args.nidm_file,
-                )
-
-                # check if we have a valid derivative_session, if so, use it.  If not, then skip this
-                # derived entry
-
-                if source_acq_entity is not None:
-                    found_nm = project.find_namespace_with_uri(
-                        software_metadata["url"].to_string(index=False)
+                    # get task from current csv row
+                    task = str(df_row["task"])
+
+                    # check if task is empty and if so, set to None
+                    if task == "nan":
+                        task = None
+
+                    # get run from current csv row
+                    run = str(df_row["run"])
+
+                    # check if run is empty and if so, set to None
+                    if run == "nan":
+                        run = None
+
+                    # now find acquisition entity matching the supplied task
+                    (
+                        source_acq_entity,
+                        source_activity,
+                    ) = match_acquistion_task_run_from_session(
+                        subject_id=subject_id,
+                        session_uuid=derivative_session,
+                        task=task,
+                        run=run,
+                        subject_index=subject_index,
                     )
-                    if found_nm is False:
-                        # add namespace for derived data software
-                        project.addNamespace(
-                            project.safe_string(
-                                software_metadata["title"].to_string(index=False)
-                            ),
-                            software_metadata["url"].to_string(index=False),
-                        )
 
+                    # check if we have a valid derivative_session, if so, use it.  If not, then skip this
+                    # derived entry
+
+                    if source_acq_entity is not None:
                         found_nm = project.find_namespace_with_uri(
                             software_metadata["url"].to_string(index=False)
                         )
+                        if found_nm is False:
+                            # add namespace for derived data software
+                            project.addNamespace(
+                                project.safe_string(
+                                    software_metadata["title"].to_string(index=False)
+                                ),
+                                software_metadata["url"].to_string(index=False),
+                            )
 
-                    # create a derivative activity
-                    der = Derivative(
-                        project=project,
-                    )
+                            found_nm = project.find_namespace_with_uri(
+                                software_metadata["url"].to_string(index=False)
+                            )
 
-                    # create a derivative entity
-                    der_entity = DerivativeObject(derivative=der)
-                    der_entity.add_attributes(
-                        {RDF.type: QualifiedName(nidm_ns, "DerivativeCollection")}
-                    )
+                        # create a derivative activity
+                        der = Derivative(
+                            project=project,
+                        )
 
-                    # add metadata to der_entity
+                        # create a derivative entity
+                        der_entity = DerivativeObject(derivative=der)
+                        der_entity.add_attributes(
+                            {RDF.type: QualifiedName(nidm_ns, "DerivativeCollection")}
+                        )
 
-                    # store other data from row with columns_to_term mappings
-                    for row_variable in df_row.keys():
-                        # check if row_variable is subject id, if so skip it
-                        if (row_variable == id_field) or (
-                            row_variable in ["ses", "task", "run", "subject_id"]
-                        ):
-                            continue
-                        elif row_variable == "source_url":
-                            der_entity.add_attributes(
-                                {
-                                    Constants.PROV["Location"]: Identifier(
-                                        df_row["source_url"]
-                                    )
-                                }
-                            )
-                        else:
+                        # add metadata to der_entity
+
+                        # store other data from row with columns_to_term mappings
+                        row_items = []
+                        for row_variable, row_data in df_row.items():
+                            # check if row_variable is subject id, if so skip it
+                            if (row_variable == id_field) or (
+                                row_variable in ["ses", "task", "run", "subject_id"]
+                            ):
+                                continue
+                            elif row_variable == "source_url":
+                                der_entity.add_attributes(
+                                    {Constants.PROV["Location"]: Identifier(row_data)}
+                                )
                             # check that the df_row[row_variable] contains some data/metadata, if so
                             # add to nidm file, if not skip it.
-                            if str(df_row[row_variable]) != "nan":
-                                add_attributes_with_cde(
-                                    der_entity,
-                                    cde,
-                                    row_variable,
-                                    Literal(df_row[row_variable]),
-                                )
-                    # link derivative activity to derivative_acq_entity with prov:used
-                    namespace, name = split_uri(source_activity)
-
-                    # find niiri namespace in project
-                    niiri_ns = project.find_namespace_with_uri(str(Constants.NIIRI))
-
-                    der.add_attributes(
-                        {Constants.PROV["used"]: QualifiedName(niiri_ns, name)}
-                    )
+                            elif str(row_data) != "nan":
+                                row_items.append((row_variable, row_data))
+                        add_row_attributes(der_entity, cde, row_items, attribute_names)
+                        # link derivative activity to derivative_acq_entity with prov:used
+                        namespace, name = split_uri(source_activity)
 
-                    # add cmdline and platform to derivative activity
-                    der.add_attributes(
-                        {
-                            software_metadata["url"].to_string(index=False)
-                            + "cmdline": software_metadata["cmdline"].to_string(
-                                index=False
-                            ),
-                            software_metadata["url"].to_string(index=False)
-                            + "platform": software_metadata["platform"].to_string(
-                                index=False
-                            ),
-                        }
-                    )
+                        # find niiri namespace in project
+                        niiri_ns = project.find_namespace_with_uri(str(Constants.NIIRI))
 
-                    # create software metadata agent
+                        der.add_attributes(
+                            {Constants.PROV["used"]: QualifiedName(niiri_ns, name)}
+                        )
 
-                    # find nidm namespace
-                    nidm_ns = project.find_namespace_with_uri(str(Constants.NIDM))
+                        # add cmdline and platform to derivative activity
+                        der.add_attributes(
+                            {
+                                software_metadata["url"].to_string(index=False)
+                                + "cmdline": software_metadata["cmdline"].to_string(
+                                    index=False
+                                ),
+                                software_metadata["url"].to_string(index=False)
+                                + "platform": software_metadata["platform"].to_string(
+                                    index=False
+                                ),
+                            }
+                        )
 
-                    software_agent = project.add_person(
-                        attributes={
-                            RDF["type"]: QualifiedName(nidm_ns, "SoftwareAgent")
-                        },
-                        add_default_type=False,
-                    )
+                        # create software metadata agent
 
-                    # add qualified association with subject
+                        # find nidm namespace
+                        nidm_ns = project.find_namespace_with_uri(str(Constants.NIDM))
 
-                    # find sio namespace in project
-                    sio_ns = project.find_namespace_with_uri(str(Constants.SIO))
+                        software_agent = project.add_person(
+                            attributes={
+                                RDF["type"]: QualifiedName(nidm_ns, "SoftwareAgent")
+                            },
+                            add_default_type=False,
+                        )
 
-                    # if we need to add this namespace
-                    if sio_ns is False:
-                        # add sio namespace
-                        project.addNamespace(prefix="sio", uri=str(Constants.SIO))
+                        # add qualified association with subject
 
+                        # find sio namespace in project
                         sio_ns = project.find_namespace_with_uri(str(Constants.SIO))
 
-                    der.add_qualified_association(
-                        person=subject_uuid["person_uuid"][0],
-                        role=QualifiedName(sio_ns, "Subject"),
-                    )
-
-                    # add qualified association with software agent
-                    # would prefer to use Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE here as the role
-                    # but Constants.py has that as a rdflib Namespace but here we're adding data to a provDocument
-                    # so using prov's QualifiedName and can't figure out how to convert rdflib Namespace to a prov
-                    # qualified name...probably a matter of parsing the uri into two parts, one for prefix and the
-                    # other for uri for prov QualifiedName function.
-                    namespace, name = split_uri(
-                        Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE
-                    )
-                    der.add_qualified_association(
-                        person=software_agent,
-                        role=QualifiedName(nidm_ns, name),
-                    )
-                    # add software metadata to software_agent
-                    # uri:"http://ncitt.ncit.nih.gov/", prefix:"ncit", term:"age", value:15
-                    # project.addAttributesWithNamespaces(software_agent,[{"uri":Constants.DCTYPES,
-                    #                                "prefix": "dctypes", "term": "title","value":
-                    #                                    software_metadata["title"].to_string(index=False)}])
+                        # if we need to add this namespace
+                        if sio_ns is False:
+                            # add sio namespace
+                            project.addNamespace(prefix="sio", uri=str(Constants.SIO))
 
-                    # see if namespace for dcmitype exists, if not add it
-                    # add namespaces to prov graph
-                    dcmitype_ns = project.find_namespace_with_uri(
-                        str(Constants.DCTYPES)
-                    )
+                            sio_ns = project.find_namespace_with_uri(str(Constants.SIO))
 
-                    # if we need to add this namespace
-                    if dcmitype_ns is False:
-                        # add dcmitype namespace
-                        project.addNamespace(
-                            prefix="dcmitype", uri=str(Constants.DCTYPES)
+                        der.add_qualified_association(
+                            person=person_uuid,
+                            role=QualifiedName(sio_ns, "Subject"),
                         )
 
+                        # add qualified association with software agent
+                        # would prefer to use Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE here as the role
+                        # but Constants.py has that as a rdflib Namespace but here we're adding data to a provDocument
+                        # so using prov's QualifiedName and can't figure out how to convert rdflib Namespace to a prov
+                        # qualified name...probably a matter of parsing the uri into two parts, one for prefix and the
+                        # other for uri for prov QualifiedName function.
+                        namespace, name = split_uri(
+                            Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE
+                        )
+                        der.add_qualified_association(
+                            person=software_agent,
+                            role=QualifiedName(nidm_ns, name),
+                        )
+                        # add software metadata to software_agent
+                        # uri:"http://ncitt.ncit.nih.gov/", prefix:"ncit", term:"age", value:15
+                        # project.addAttributesWithNamespaces(software_agent,[{"uri":Constants.DCTYPES,
+                        #                                "prefix": "dctypes", "term": "title","value":
+                        #                                    software_metadata["title"].to_string(index=False)}])
+
+                        # see if namespace for dcmitype exists, if not add it
+                        # add namespaces to prov graph
                         dcmitype_ns = project.find_namespace_with_uri(
                             str(Constants.DCTYPES)
                         )
 
-                    project.addAttributes(
-                        software_agent,
-                        {
-                            QualifiedName(dcmitype_ns, "title"): software_metadata[
-                                "title"
-                            ].to_string(index=False)
-                        },
-                    )
+                        # if we need to add this namespace
+                        if dcmitype_ns is False:
+                            # add dcmitype namespace
+                            project.addNamespace(
+                                prefix="dcmitype", uri=str(Constants.DCTYPES)
+                            )
 
-                    # check if dct namespace needs to be added
-                    dct_ns = project.find_namespace_with_uri(str(Constants.DCT))
+                            dcmitype_ns = project.find_namespace_with_uri(
+                                str(Constants.DCTYPES)
+                            )
 
-                    # if we need to add this namespace
-                    if dct_ns is False:
-                        # add dcmitype namespace
-                        project.addNamespace(prefix="dct", uri=str(Constants.DCT))
+                        project.addAttributes(
+                            software_agent,
+                            {
+                                QualifiedName(dcmitype_ns, "title"): software_metadata[
+                                    "title"
+                                ].to_string(index=False)
+                            },
+                        )
 
+                        # check if dct namespace needs to be added
                         dct_ns = project.find_namespace_with_uri(str(Constants.DCT))
 
-                    project.addAttributes(
-                        software_agent,
-                        {
-                            QualifiedName(dct_ns, "description"): software_metadata[
-                                "description"
-                            ].to_string(index=False),
-                            QualifiedName(dct_ns, "hasVersion"): software_metadata[
-                                "version"
-                            ].to_string(index=False),
-                            QualifiedName(sio_ns, "URL"): software_metadata[
-                                "url"
-                            ].to_string(index=False),
-                        },
-                    )
+                        # if we need to add this namespace
+                        if dct_ns is False:
+                            # add dcmitype namespace
+                            project.addNamespace(prefix="dct", uri=str(Constants.DCT))
+
+                            dct_ns = project.find_namespace_with_uri(str(Constants.DCT))
+
+                        project.addAttributes(
+                            software_agent,
+                            {
+                                QualifiedName(dct_ns, "description"): software_metadata[
+                                    "description"
+                                ].to_string(index=False),
+                                QualifiedName(dct_ns, "hasVersion"): software_metadata[
+                                    "version"
+                                ].to_string(index=False),
+                                QualifiedName(sio_ns, "URL"): software_metadata[
+                                    "url"
+                                ].to_string(index=False),
+                            },
+                        )
 
                 # if this isn't derivative data...
                 if not args.derivative:
@@ -851,7 +1000,7 @@ def csv2nidm_main(args=None):
                     acq_entity = AssessmentObject(acquisition=acq)
                     # add qualified association with existing agent
                     acq.add_qualified_association(
-                        person=subject_uuid["person_uuid"][0],
+                        person=person_uuid,
                         role=Constants.NIDM_PARTICIPANT,
                     )
 
@@ -873,21 +1022,21 @@ def csv2nidm_main(args=None):
                         {Constants.NIDM_FILENAME: basename(args.csv_file)}
                     )
 
-                    # store other data from row with columns_to_term mappings
-                    for row_variable in df_row:
-                        # check if row_variable is subject id, if so skip it
-                        if row_variable == id_field:
-                            continue
-                        else:
-                            if str(df_row[row_variable]) != "nan":
-                                add_attributes_with_cde(
-                                    acq_entity,
-                                    cde,
-                                    row_variable,
-                                    Literal(df_row[row_variable]),
-                                )
+                    # store other data from row with columns_to_term mappings, skipping the subject id
+                    add_row_attributes(
+                        acq_entity,
+                        cde,
+                        [
+                            (row_variable, row_data)
+                            for row_variable, row_data in df_row.items()
+                            if row_variable != id_field and str(row_data) != "nan"
+                        ],
+                        attribute_names,
+                    )
+
+            if chunksize:
+                write_chunk(writer, project, written)
 
-                    continue
         if args.logfile:
             logging.info("Adding CDEs to graph....")
         else:
@@ -900,20 +1049,16 @@ def csv2nidm_main(args=None):
         # cde.serialize(destination="/Users/dkeator/Downloads/cdes.ttl", format="turtle")
 
         if data_added:
-            # convert to rdflib Graph and add CDEs
-            rdf_graph = Graph()
-            rdf_graph.parse(source=StringIO(project.serializeTurtle()), format="turtle")
-            rdf_graph = rdf_graph + cde
-
             # add export provenance — link back to the project that was read in
-            rdf_graph = add_export_provenance(
-                rdf_graph=rdf_graph,
+            export_provenance = add_export_provenance(
+                rdf_graph=Graph(),
                 collection=project,
                 outputfile=args.nidm_file,
                 pynidm_version=pynidm_version,
                 tool_version=__version__,
                 script_name="csv2nidm.py",
                 activity_label="Add CSV data to NIDM file",
+                output_format=output_format,
             )
 
             if args.logfile:
@@ -925,8 +1070,22 @@ def csv2nidm_main(args=None):
                 logging.info("Writing NIDM file....")
             else:
                 print("Writing NIDM file....")
-            rdf_graph.serialize(destination=args.nidm_file, format="turtle")
+            if chunksize:
+                writer.writeGraph(export_provenance)
+                writer.close()
+                os.replace(nidm_file_tmp, args.nidm_file)
+            else:
+                # the project, CDE and provenance graphs are written rather than merged
+                RDFStream.writeGraphs(
+                    [project.to_rdflib_graph(), cde, export_provenance],
+                    args.nidm_file,
+                    output_format,
+                    compress,
+                )
         else:
+            if chunksize:
+                writer.close()
+                os.remove(nidm_file_tmp)
             if args.logfile:
                 logging.info("No new data added, leaving existing nidm file alone...")
             else:
@@ -953,22 +1112,18 @@ def csv2nidm_main(args=None):
             # ask user for id field
             id_field = ask_idfield(df)
 
-            # make sure id_field is a string for zero-padded subject ids
-            # re-read data file with constraint that key field is read as string
-            if args.csv_file.endswith(".csv"):
-                df = pd.read_csv(args.csv_file, dtype={id_field: str})
-            else:
-                df = pd.read_csv(args.csv_file, dtype={id_field: str}, sep="\t")
-        else:
-            # make sure id_field is a string for zero-padded subject ids
-            # re-read data file with constraint that key field is read as string
-            df = pd.read_csv(args.csv_file, dtype={id_field: str})
+        # make sure id_field is a string for zero-padded subject ids
+        # re-read data file with constraint that key field is read as string
+        chunks = read_csv_file(args.csv_file, id_field, chunksize)
+        if not chunksize:
+            chunks = [chunks]
 
         # add namespace for derived data software
-        project.addNamespace(
-            project.safe_string(software_metadata["title"].to_string(index=False)),
-            software_metadata["url"].to_string(index=False),
-        )
+        if args.derivative:
+            project.addNamespace(
+                project.safe_string(software_metadata["title"].to_string(index=False)),
+                software_metadata["url"].to_string(index=False),
+            )
 
         # get namespaces from document for use later....
         rdfs_ns = project.find_namespace_with_uri(
@@ -984,241 +1139,271 @@ def csv2nidm_main(args=None):
         # simply add name of file to project metadata collection since we don't know anything about it
         collection.add_attributes({Constants.NIDM_FILENAME: args.csv_file})
 
-        # iterate over rows and store in NIDM file
-        for _, csv_row in df.iterrows():
-            # added to support derivatives
-            if args.derivative:
-                # create a derivative activity
-                der = Derivative(
-                    project=project,
-                )
-
-                # create a derivative entity
-                der_entity = DerivativeObject(derivative=der)
-                der_entity.add_attributes(
-                    {
-                        QualifiedName(rdfs_ns, "type"): QualifiedName(
-                            nidm_ns, "DerivativeCollection"
-                        )
-                    }
-                )
-
-                # add metadata to der_entity
+        # 5/7/25: added to accommodate the situation where user doesn't put .ttl at the end of the -out filename
+        if RDFStream.EXTENSIONS[output_format] not in args.output_file:
+            output_file = RDFStream.outputFilename(
+                args.output_file, output_format, compress
+            )
+        else:
+            output_file = args.output_file
 
-                # store other data from row with columns_to_term mappings
-                for row_variable, row_data in csv_row.items():
-                    # check if row_variable is subject id, if so skip it
-                    if (row_variable == id_field) or (
-                        row_variable in ["ses", "task", "run"]
-                    ):
-                        continue
-                    elif row_variable == "source_url":
-                        der_entity.add_attributes(
-                            {Constants.PROV["Location"]: Identifier(row_data)}
-                        )
-                    if str(row_data) != "nan":
-                        # add data for this variable to derivative entity
-                        add_attributes_with_cde(
-                            der_entity,
-                            cde,
-                            row_variable,
-                            Literal(row_data),
-                        )
+        if chunksize:
+            project_uuid = project.get_uuid()
+            namespaces = list(project.graph.namespaces)
+            writer = RDFStream.TripleWriter(output_file, output_format, compress)
+            writer.writeGraph(project.to_rdflib_graph())
+            written = set(chunk_project(project_uuid, namespaces).to_rdflib_graph())
+
+        # CDE attribute names of the csv columns, looked up as they are first used
+        attribute_names = {}
+
+        for df in chunks:
+            if chunksize:
+                project = chunk_project(project_uuid, namespaces)
+                provgraph = project.getGraph()
+
+            # iterate over rows and store in NIDM file
+            for csv_row in df.to_dict("records"):
+                # added to support derivatives
+                if args.derivative:
+                    # create a derivative activity
+                    der = Derivative(
+                        project=project,
+                    )
 
-                # create subject agent
-                subject_agent = project.add_person(
-                    attributes=({Constants.NIDM_SUBJECTID: str(csv_row[id_field])})
-                )
+                    # create a derivative entity
+                    der_entity = DerivativeObject(derivative=der)
+                    der_entity.add_attributes(
+                        {
+                            QualifiedName(rdfs_ns, "type"): QualifiedName(
+                                nidm_ns, "DerivativeCollection"
+                            )
+                        }
+                    )
 
-                # create software metadata agent
-                software_agent = project.add_person(
-                    attributes={
-                        QualifiedName(rdfs_ns, "type"): QualifiedName(
-                            nidm_ns, "SoftwareAgent"
-                        )
-                    },
-                    add_default_type=False,
-                )
+                    # add metadata to der_entity
 
-                # add qualified association with subject
-                der.add_qualified_association(
-                    person=subject_agent,
-                    role=QualifiedName(sio_ns, "Subject"),
-                )
+                    # store other data from row with columns_to_term mappings
+                    row_items = []
+                    for row_variable, row_data in csv_row.items():
+                        # check if row_variable is subject id, if so skip it
+                        if (row_variable == id_field) or (
+                            row_variable in ["ses", "task", "run"]
+                        ):
+                            continue
+                        elif row_variable == "source_url":
+                            der_entity.add_attributes(
+                                {Constants.PROV["Location"]: Identifier(row_data)}
+                            )
+                        if str(row_data) != "nan":
+                            # add data for this variable to derivative entity
+                            row_items.append((row_variable, row_data))
+                    add_row_attributes(der_entity, cde, row_items, attribute_names)
+
+                    # create subject agent
+                    subject_agent = project.add_person(
+                        attributes=({Constants.NIDM_SUBJECTID: str(csv_row[id_field])})
+                    )
 
-                found_nm = project.find_namespace_with_uri(
-                    software_metadata["url"].to_string(index=False)
-                )
+                    # create software metadata agent
+                    software_agent = project.add_person(
+                        attributes={
+                            QualifiedName(rdfs_ns, "type"): QualifiedName(
+                                nidm_ns, "SoftwareAgent"
+                            )
+                        },
+                        add_default_type=False,
+                    )
 
-                # add cmdline and platform to derivative activity
-                der.add_attributes(
-                    {
-                        QualifiedName(found_nm, "cmdline"): software_metadata[
-                            "cmdline"
-                        ].to_string(index=False),
-                        QualifiedName(found_nm, "platform"): software_metadata[
-                            "platform"
-                        ].to_string(index=False),
-                    }
-                )
+                    # add qualified association with subject
+                    der.add_qualified_association(
+                        person=subject_agent,
+                        role=QualifiedName(sio_ns, "Subject"),
+                    )
 
-                # add qualified association with software agent
-                # would prefer to use Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE here as the role
-                # but Constants.py has that as a rdflib Namespace but here we're adding data to a provDocument
-                # so using prov's QualifiedName and can't figure out how to convert rdflib Namespace to a prov
-                # qualified name...probably a matter of parsing the uri into two parts, one for prefix and the
-                # other for uri for prov QualifiedName function.
-                namespace, name = split_uri(
-                    Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE
-                )
-                der.add_qualified_association(
-                    person=software_agent,
-                    role=QualifiedName(nidm_ns, name),
-                )
-                # add software metadata to software_agent
-                # uri:"http://ncitt.ncit.nih.gov/", prefix:"ncit", term:"age", value:15
-                # project.addAttributesWithNamespaces(software_agent,[{"uri":Constants.DCTYPES,
-                #                                "prefix": "dctypes", "term": "title","value":
-                #                                    software_metadata["title"].to_string(index=False)}])
+                    found_nm = project.find_namespace_with_uri(
+                        software_metadata["url"].to_string(index=False)
+                    )
 
-                # add dctypes namespace
+                    # add cmdline and platform to derivative activity
+                    der.add_attributes(
+                        {
+                            QualifiedName(found_nm, "cmdline"): software_metadata[
+                                "cmdline"
+                            ].to_string(index=False),
+                            QualifiedName(found_nm, "platform"): software_metadata[
+                                "platform"
+                            ].to_string(index=False),
+                        }
+                    )
 
-                # check if dct namespace needs to be added
-                dcmitype_ns = project.find_namespace_with_uri(str(Constants.DCTYPES))
+                    # add qualified association with software agent
+                    # would prefer to use Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE here as the role
+                    # but Constants.py has that as a rdflib Namespace but here we're adding data to a provDocument
+                    # so using prov's QualifiedName and can't figure out how to convert rdflib Namespace to a prov
+                    # qualified name...probably a matter of parsing the uri into two parts, one for prefix and the
+                    # other for uri for prov QualifiedName function.
+                    namespace, name = split_uri(
+                        Constants.NIDM_NEUROIMAGING_ANALYSIS_SOFTWARE
+                    )
+                    der.add_qualified_association(
+                        person=software_agent,
+                        role=QualifiedName(nidm_ns, name),
+                    )
+                    # add software metadata to software_agent
+                    # uri:"http://ncitt.ncit.nih.gov/", prefix:"ncit", term:"age", value:15
+                    # project.addAttributesWithNamespaces(software_agent,[{"uri":Constants.DCTYPES,
+                    #                                "prefix": "dctypes", "term": "title","value":
+                    #                                    software_metadata["title"].to_string(index=False)}])
 
-                # if we need to add this namespace
-                if dcmitype_ns is False:
-                    # add dcmitype namespace
-                    project.addNamespace(prefix="dcmitype", uri=str(Constants.DCTYPES))
+                    # add dctypes namespace
 
+                    # check if dct namespace needs to be added
                     dcmitype_ns = project.find_namespace_with_uri(
                         str(Constants.DCTYPES)
                     )
 
-                # project.addNamespace(prefix="dcmitype", uri=Constants.DCTYPES)
-                project.addAttributes(
-                    software_agent,
-                    {
-                        QualifiedName(dcmitype_ns, "title"): software_metadata[
-                            "title"
-                        ].to_string(index=False)
-                    },
-                )
+                    # if we need to add this namespace
+                    if dcmitype_ns is False:
+                        # add dcmitype namespace
+                        project.addNamespace(
+                            prefix="dcmitype", uri=str(Constants.DCTYPES)
+                        )
 
-                # check if dct namespace needs to be added
-                dct_ns = project.find_namespace_with_uri(str(Constants.DCT))
+                        dcmitype_ns = project.find_namespace_with_uri(
+                            str(Constants.DCTYPES)
+                        )
 
-                # if we need to add this namespace
-                if dct_ns is False:
-                    # add dcmitype namespace
-                    project.addNamespace(prefix="dct", uri=str(Constants.DCT))
+                    # project.addNamespace(prefix="dcmitype", uri=Constants.DCTYPES)
+                    project.addAttributes(
+                        software_agent,
+                        {
+                            QualifiedName(dcmitype_ns, "title"): software_metadata[
+                                "title"
+                            ].to_string(index=False)
+                        },
+                    )
 
+                    # check if dct namespace needs to be added
                     dct_ns = project.find_namespace_with_uri(str(Constants.DCT))
 
-                project.addAttributes(
-                    software_agent,
-                    {
-                        QualifiedName(dct_ns, "description"): software_metadata[
-                            "description"
-                        ].to_string(index=False),
-                        QualifiedName(dct_ns, "hasVersion"): software_metadata[
-                            "version"
-                        ].to_string(index=False),
-                        QualifiedName(sio_ns, "URL"): software_metadata[
-                            "url"
-                        ].to_string(index=False),
-                    },
-                )
+                    # if we need to add this namespace
+                    if dct_ns is False:
+                        # add dcmitype namespace
+                        project.addNamespace(prefix="dct", uri=str(Constants.DCT))
 
-            # not a derivative, assume an assessment
-            else:
-                # create a session object
-                session = Session(project)
+                        dct_ns = project.find_namespace_with_uri(str(Constants.DCT))
+
+                    project.addAttributes(
+                        software_agent,
+                        {
+                            QualifiedName(dct_ns, "description"): software_metadata[
+                                "description"
+                            ].to_string(index=False),
+                            QualifiedName(dct_ns, "hasVersion"): software_metadata[
+                                "version"
+                            ].to_string(index=False),
+                            QualifiedName(sio_ns, "URL"): software_metadata[
+                                "url"
+                            ].to_string(index=False),
+                        },
+                    )
 
-                # create and acquisition activity and entity
-                acq = AssessmentAcquisition(session)
-                acq_entity = AssessmentObject(acq)
+                # not a derivative, assume an assessment
+                else:
+                    # create a session object
+                    session = Session(project)
 
-                # add acq_entity to project collection
-                provgraph.hadMember(collection, acq_entity)
+                    # create and acquisition activity and entity
+                    acq = AssessmentAcquisition(session)
+                    acq_entity = AssessmentObject(acq)
 
-                # create prov:Agent for subject
-                # acq.add_person(attributes=({Constants.NIDM_SUBJECTID:row['participant_id']}))
+                    # add acq_entity to project collection
+                    provgraph.hadMember(collection.identifier, acq_entity)
 
-                # add git-annex info if exists
-                num_sources = addGitAnnexSources(
-                    obj=acq_entity,
-                    filepath=args.csv_file,
-                    bids_root=os.path.dirname(args.csv_file),
-                )
-                # if there aren't any git annex sources then just store the local directory information
-                if num_sources == 0:
-                    # WIP: add absolute location of BIDS directory on disk for later finding of files
+                    # create prov:Agent for subject
+                    # acq.add_person(attributes=({Constants.NIDM_SUBJECTID:row['participant_id']}))
+
+                    # add git-annex info if exists
+                    num_sources = addGitAnnexSources(
+                        obj=acq_entity,
+                        filepath=args.csv_file,
+                        bids_root=os.path.dirname(args.csv_file),
+                    )
+                    # if there aren't any git annex sources then just store the local directory information
+                    if num_sources == 0:
+                        # WIP: add absolute location of BIDS directory on disk for later finding of files
+                        acq_entity.add_attributes(
+                            {Constants.PROV["Location"]: "file:/" + args.csv_file}
+                        )
+
+                    # store file to acq_entity
                     acq_entity.add_attributes(
-                        {Constants.PROV["Location"]: "file:/" + args.csv_file}
+                        {Constants.NIDM_FILENAME: basename(args.csv_file)}
                     )
 
-                # store file to acq_entity
-                acq_entity.add_attributes(
-                    {Constants.NIDM_FILENAME: basename(args.csv_file)}
-                )
+                    # store other data from row with columns_to_term mappings
+                    row_items = []
+                    for row_variable, row_data in csv_row.items():
+                        if not row_data:
+                            continue
 
-                # store other data from row with columns_to_term mappings
-                for row_variable, row_data in csv_row.iteritems():
-                    if not row_data:
-                        continue
-
-                    # check if row_variable is subject id, if so skip it
-                    if row_variable == id_field:
-                        ### WIP: Check if agent already exists with the same ID.  If so, use it else create a new agent
-
-                        # add qualified association with person
-                        acq.add_qualified_association(
-                            person=acq.add_person(
-                                attributes=({Constants.NIDM_SUBJECTID: str(row_data)})
-                            ),
-                            role=Constants.NIDM_PARTICIPANT,
-                        )
+                        # check if row_variable is subject id, if so skip it
+                        if row_variable == id_field:
+                            ### WIP: Check if agent already exists with the same ID.  If so, use it else create a new agent
 
-                        continue
-                    else:
-                        add_attributes_with_cde(
-                            acq_entity, cde, row_variable, Literal(row_data)
-                        )
+                            # add qualified association with person
+                            acq.add_qualified_association(
+                                person=acq.add_person(
+                                    attributes=(
+                                        {Constants.NIDM_SUBJECTID: str(row_data)}
+                                    )
+                                ),
+                                role=Constants.NIDM_PARTICIPANT,
+                            )
+
+                            continue
+                        else:
+                            row_items.append((row_variable, row_data))
+                    add_row_attributes(acq_entity, cde, row_items, attribute_names)
 
-                        # print(project.serializeTurtle())
+            if chunksize:
+                write_chunk(writer, project, written)
 
-        # convert to rdflib Graph and add CDEs
         # with open(
         #    "/Users/dkeator/Downloads/before_cdes.ttl", "w", encoding="utf-8"
         # ) as f:
         #    f.write(project.serializeTurtle())
-        rdf_graph = Graph()
-        rdf_graph.parse(source=StringIO(project.serializeTurtle()), format="turtle")
-        rdf_graph = rdf_graph + cde
 
         if args.logfile:
             logging.info("Writing NIDM file....")
         else:
             print("Writing NIDM file....")
-        # 5/7/25: added to accommodate the situation where user doesn't put .ttl at the end of the -out filename
-        if ".ttl" not in args.output_file:
-            output_file = args.output_file + ".ttl"
-        else:
-            output_file = args.output_file
 
         # add export provenance
-        rdf_graph = add_export_provenance(
-            rdf_graph=rdf_graph,
+        export_provenance = add_export_provenance(
+            rdf_graph=Graph(),
             collection=collection,
             outputfile=output_file,
             pynidm_version=pynidm_version,
             tool_version=__version__,
             script_name="csv2nidm.py",
             activity_label="Create NIDM RDF from CSV data",
+            output_format=output_format,
         )
 
-        rdf_graph.serialize(destination=output_file, format="turtle")
+        if chunksize:
+            writer.writeGraph(cde)
+            writer.writeGraph(export_provenance)
+            writer.close()
+        else:
+            # convert to rdflib Graph and add CDEs, written one after the other
+            RDFStream.writeGraphs(
+                [project.to_rdflib_graph(), cde, export_provenance],
+                output_file,
+                output_format,
+                compress,
+            )
 
 
 if __name__ == "__main__":
@@ -8,7 +8,6 @@ file, and the assessments to *.tsv/*.json file pairs in a phenotypes directory.
 """
 
 from argparse import ArgumentParser
-from io import StringIO
 import json
 import os
 from os import mkdir, system
@@ -19,7 +18,7 @@ import tempfile
 import urllib.parse
 import datalad.api as dl
 import pandas as pd
-from rdflib import Graph, URIRef
+from rdflib import URIRef
 import requests
 import validators
 from nidm.core import BIDS_Constants, Constants
@@ -864,10 +863,7 @@ def main():
     # and added to the participants.tsv file
 
     # use RDFLib here for temporary graph making query easier
-    rdf_graph = Graph()
-    rdf_graph_parse = rdf_graph.parse(
-        source=StringIO(nidm_project.serializeTurtle()), format="turtle"
-    )
+    rdf_graph_parse = nidm_project.to_rdflib_graph()
 
     # temporary write out turtle file for testing
     # rdf_graph_parse.serialize(destination="/Users/dbkeator/Downloads/ds000117.ttl", format='turtle')
@@ -0,0 +1,106 @@
+"""Tools for managing the on-disk cache of parsed NIDM files"""
+
+import click
+from nidm.experiment import Cache, GraphBackend
+from nidm.experiment.CDE import getCDEs
+from nidm.experiment.tools.click_base import cli
+
+
+@cli.group()
+def cache():
+    """
+    Manage the cache of parsed NIDM files and CDE graphs.  The cache is kept in the
+    NIDM_CACHE_DIR directory (the TMP dir by default) and limited to NIDM_CACHE_SIZE
+    bytes (default 4G, suffixes K, M, G and T are allowed).
+    """
+
+
+@cache.command()
+@click.option(
+    "--nidm_file_list",
+    "-nl",
+    required=True,
+    help="A comma separated list of NIDM files with full path",
+)
+@click.option(
+    "--cde_file_list",
+    "-nc",
+    required=False,
+    help="A comma separated list of NIDM CDE files with full path. Can also be set in the CDE_DIR environment variable",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to parse the NIDM files in parallel",
+)
+def warm(nidm_file_list, cde_file_list, jobs):
+    """
+    Parses NIDM files into the cache ahead of the queries that will use them.
+    """
+    files = nidm_file_list.split(",")
+    GraphBackend.loadStores(files, jobs)
+    if len(files) > 1:
+        # queries over several files run on their union
+        GraphBackend.StoreBackend().unionGraph(files)
+    getCDEs(cde_file_list.split(",") if cde_file_list else None)
+    print(f"Cached {len(files)} NIDM file(s) in {Cache.getCacheDir()}")
+
+
+@cache.command()
+def stats():
+    """
+    Prints the size of the cache and its hit rates.
+    """
+    entries = Cache.cacheEntries()
+    max_size = Cache.getCacheSize()
+    print(f"Cache directory: {Cache.getCacheDir()}")
+    print(
+        f"Size: {_formatSize(sum(e.size for e in entries))} of "
+        + (_formatSize(max_size) if max_size else "unlimited")
+    )
+
+    counts = Cache.lookupCounts()
+    print(
+        f"{'kind':<12}{'entries':>9}{'size':>12}{'hits':>9}{'misses':>9}{'hit rate':>10}"
+    )
+    for kind in Cache.ENTRY_KINDS + ("digest",):
+        kind_entries = [e for e in entries if e.kind == kind]
+        hits, misses = counts.get(kind, (0, 0))
+        rate = f"{hits / (hits + misses):.1%}" if hits + misses else "-"
+        size = (
+            _formatSize(sum(e.size for e in kind_entries))
+            if kind in Cache.ENTRY_KINDS
+            else "-"
+        )
+        entry_count = len(kind_entries) if kind in Cache.ENTRY_KINDS else "-"
+        print(f"{kind:<12}{entry_count:>9}{size:>12}{hits:>9}{misses:>9}{rate:>10}")
+
+
+@cache.command()
+@click.option(
+    "--kind",
+    "-k",
+    type=click.Choice(Cache.ENTRY_KINDS),
+    multiple=True,
+    help="Only remove entries of this kind, can be given more than once (default: all)",
+)
+def clear(kind):
+    """
+    Removes entries from the cache.
+    """
+    removed = Cache.clear(kind or Cache.ENTRY_KINDS)
+    print(
+        f"Removed {len(removed)} cache entries, "
+        f"{_formatSize(sum(e.size for e in removed))}"
+    )
+
+
+def _formatSize(size):
+    if size < 1024:
+        return f"{size}B"
+    for unit in "KMGT":
+        size /= 1024
+        if size < 1024 or unit == "T":
+            return f"{size:.1f}{unit}"
@@ -1,6 +1,8 @@
 """Tools for working with NIDM-Experiment files"""
 
+from pathlib import Path
 import click
+from nidm.experiment import GraphBackend, RDFStream
 from nidm.experiment.Query import GetMergedGraph
 from nidm.experiment.tools.click_base import cli
 
@@ -16,15 +18,57 @@ from nidm.experiment.tools.click_base import cli
 @click.option(
     "--out_file", "-o", required=True, help="File to write concatenated NIDM files"
 )
-def concat(nidm_file_list, out_file):
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to parse the NIDM files in parallel",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(RDFStream.OUTPUT_FORMATS),
+    default="turtle",
+    show_default=True,
+    help="Format of the output file.  nt, nq and ttl-stream are written one input file at a time "
+    "without merging the files in memory, nq puts the triples of each file in a named graph, the "
+    "other formats write triples that are in more than one file once",
+)
+@click.option(
+    "--gzip",
+    "compress",
+    is_flag=True,
+    help="Gzip compress the output file",
+)
+def concat(nidm_file_list, out_file, jobs, output_format, compress):
     """
     This function will concatenate NIDM files.  Warning, no merging will be done so you may end up with
     multiple prov:agents with the same subject id if you're concatenating NIDM files from multiple visits of the
     same study.  If you want to merge NIDM files on subject ID see pynidm merge
     """
-    # create empty graph
-    graph = GetMergedGraph(nidm_file_list.split(","))
-    graph.serialize(out_file, format="turtle")
+    files = nidm_file_list.split(",")
+    if output_format not in RDFStream.STREAM_FORMATS:
+        # create empty graph
+        graph = GetMergedGraph(files, jobs=jobs)
+        RDFStream.writeGraph(graph, out_file, output_format, compress)
+        return
+
+    if jobs > 1:
+        GraphBackend.loadStores(files, jobs)
+    # only one file is held in memory at a time, the triples already written are
+    # remembered on disk
+    with RDFStream.TripleWriter(
+        out_file, output_format, compress, unique=True
+    ) as writer:
+        for i, nidm_file in enumerate(files):
+            file_graph = GraphBackend.parseGraph(nidm_file)
+            for prefix, namespace in file_graph.namespaces():
+                writer.bind(prefix, namespace)
+            writer.write(
+                RDFStream.relabelBlankNodes(file_graph, f"f{i}"),
+                context=Path(nidm_file).absolute().as_uri(),
+            )
 
 
 if __name__ == "__main__":
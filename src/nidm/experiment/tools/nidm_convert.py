@@ -2,7 +2,7 @@
 
 from os.path import basename, join, splitext
 import click
-from rdflib import Graph, util
+from nidm.experiment import RDFStream
 from nidm.experiment.tools.click_base import cli
 
 
@@ -17,12 +17,15 @@ from nidm.experiment.tools.click_base import cli
 @click.option(
     "-t",
     "--type",
+    "--format",
     "outtype",
     required=True,
     type=click.Choice(
-        ["turtle", "jsonld", "xml-rdf", "n3", "trig"], case_sensitive=False
+        ["turtle", "jsonld", "xml-rdf", "n3", "trig", "nt", "nq", "ttl-stream"],
+        case_sensitive=False,
     ),
-    help="If parameter set then NIDM file will be exported as JSONLD",
+    help="Format to convert the NIDM files to.  nt, nq and ttl-stream are written a triple at a time, "
+    "which is much faster for very large files",
 )
 @click.option(
     "--outdir",
@@ -30,7 +33,13 @@ from nidm.experiment.tools.click_base import cli
     required=False,
     help="Optional directory to save converted NIDM file",
 )
-def convert(nidm_file_list, outtype, outdir):
+@click.option(
+    "--gzip",
+    "compress",
+    is_flag=True,
+    help="Gzip compress the converted files, .gz is added to their names",
+)
+def convert(nidm_file_list, outtype, outdir, compress):
     """
     This function will convert NIDM files to various RDF-supported formats and name then / put them in the same
     place as the input file.
@@ -39,10 +48,15 @@ def convert(nidm_file_list, outtype, outdir):
     for nidm_file in nidm_file_list.split(","):
         # WIP: for now we use pynidm for jsonld exports to make more human readable and rdflib for everything
         # else.
+        # nidm.nt.gz is named like nidm.nt
+        name = nidm_file[: -len(".gz")] if nidm_file.endswith(".gz") else nidm_file
         if outdir:
-            outfile = join(outdir, splitext(basename(nidm_file))[0])
+            outfile = join(outdir, splitext(basename(name))[0])
         else:
-            outfile = join(splitext(nidm_file)[0])
+            outfile = join(splitext(name)[0])
+
+        # files written by the streaming formats can be read again, gzip compressed or not
+        graph = RDFStream.parseFile(nidm_file)
 
         if outtype == "jsonld":
             ## read in nidm file
@@ -50,9 +64,13 @@ def convert(nidm_file_list, outtype, outdir):
             ## write jsonld file with same name
             # with open(outfile + ".json", "w", encoding="utf-8") as f:
             #    f.write(project.serializeJSONLD())
-            graph = Graph()
-            graph.parse(nidm_file, format=util.guess_format(nidm_file))
-            graph.serialize(outfile + ".json", format="json-ld", indent=4)
+            RDFStream.writeGraph(
+                graph,
+                RDFStream.outputFilename(outfile, "json-ld", compress),
+                "json-ld",
+                compress,
+                indent=4,
+            )
 
         elif outtype == "turtle":
             ## graph = Graph()
@@ -61,26 +79,32 @@ def convert(nidm_file_list, outtype, outdir):
             # project = read_nidm(nidm_file)
             # with open(outfile + ".ttl", "w", encoding="utf-8") as f:
             #    f.write(project.serializeTurtle())
-            graph = Graph()
-            graph.parse(nidm_file, format=util.guess_format(nidm_file))
-            graph.serialize(outfile + ".ttl", format="turtle", indent=4)
+            RDFStream.writeGraph(
+                graph,
+                RDFStream.outputFilename(outfile, "turtle", compress),
+                "turtle",
+                compress,
+                indent=4,
+            )
 
         elif outtype == "xml-rdf":
-            graph = Graph()
-            graph.parse(nidm_file, format=util.guess_format(nidm_file))
-            graph.serialize(outfile + ".xml", format="pretty-xml")
-        elif outtype == "n3":
-            graph = Graph()
-            graph.parse(nidm_file, format=util.guess_format(nidm_file))
-            graph.serialize(outfile + ".n3", format="n3")
-        elif outtype == "trig":
+            RDFStream.writeGraph(
+                graph,
+                RDFStream.outputFilename(outfile, "pretty-xml", compress),
+                "pretty-xml",
+                compress,
+            )
+        elif outtype in ("n3", "trig") + RDFStream.STREAM_FORMATS:
             ## read in nidm file
             # project = read_nidm(nidm_file)
             # with open(outfile + ".trig", "w", encoding="utf-8") as f:
             #    f.write(project.serializeTrig())
-            graph = Graph()
-            graph.parse(nidm_file, format=util.guess_format(nidm_file))
-            graph.serialize(outfile + ".trig", format="trig")
+            RDFStream.writeGraph(
+                graph,
+                RDFStream.outputFilename(outfile, outtype, compress),
+                outtype,
+                compress,
+            )
 
         else:
             print("Error, type is not supported at this time")
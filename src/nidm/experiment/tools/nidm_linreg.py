@@ -1,27 +1,23 @@
 """This program provides a tool to complete a linear regression on nidm files"""
 
-import csv
-import os
-from statistics import mean
 import sys
-import tempfile
 import warnings
 import click
 import numpy as np
-import pandas as pd
 from patsy.contrasts import ContrastMatrix, Diff, Helmert, Sum, Treatment
 from patsy.highlevel import dmatrices
-from sklearn import preprocessing
-from sklearn.linear_model import Lasso, LinearRegression, Ridge
-from sklearn.model_selection import cross_val_score
+from sklearn.linear_model import LinearRegression
 import statsmodels.api as sm
 from statsmodels.formula.api import ols
-from nidm.experiment.Query import GetProjectsUUID
+from nidm.experiment.analysis import (
+    MAX_ALPHA,
+    REGULARIZATION_ALPHAS,
+    column_name,
+    encode_categorical,
+    fit_regularized,
+)
 from nidm.experiment.tools.click_base import cli
-from nidm.experiment.tools.rest import RestParser
-from nidm.experiment.tools.utils import Reporter
-
-MAX_ALPHA = 700
+from nidm.experiment.tools.utils import Reporter, load_model_data
 
 
 # Defining the parameters of the commands.
@@ -56,305 +52,127 @@ MAX_ALPHA = 700
     required=False,
     help="This parameter will return the results of the linear regression with L1 or L2 regularization depending on the type specified, and the weight with the maximum likelihood solution",
 )
-def linear_regression(nidm_file_list, output_file, ml, ctr, regularization):
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used for the cross-validation of the regularization",
+)
+def linear_regression(nidm_file_list, output_file, ml, ctr, regularization, jobs):
     """
     This function provides a tool to complete a linear regression on NIDM data with optional contrast and regularization.
     """
-
-    # NOTE: Every time I make a global variable, it is because I need it in at least one other method.
-    global c  # used in linreg(), contrasting()
-    c = ctr  # Storing all important parameters in global variables so they can be accessed in other methods
-    global m  # Needed to do this because the code only used the parameters in the first method, meaning I had to move it all to method 1.
-    m = (
-        ml.strip()
-    )  # used in data_aggregation, linreg(), spaces stripped from left and right
+    model = ml.strip()  # spaces stripped from left and right
     with Reporter(output_file) as reporter:
-        global n  # used in data_aggregation()
-        n = nidm_file_list
-        global r
-        r = regularization
-        data_aggregation(reporter)  # collects data
-        dataparsing(reporter)  # converts it to proper format
-        linreg(reporter)  # performs linear regression
-        contrasting(reporter)  # performs contrast
-        regularizing(reporter)  # performs regularization
+        print("*" * 107)
+        command = (
+            "pynidm linear-regression -nl "
+            + nidm_file_list
+            + ' -model "'
+            + model
+            + '" '
+        )
+        if ctr:
+            command += '-contrast "' + ctr + '" '
+        if regularization:
+            command += "-r " + regularization + " "
+        reporter.print("Your command was:", command)
+        dep_var, independentvariables, full_model_variable_list = parse_model(
+            reporter, model
+        )
+        frame = load_model_data(  # collects data
+            reporter,
+            nidm_file_list.split(","),
+            independentvariables + [dep_var],
+            "Your model was " + model,
+        )
+        df_final, answer = dataparsing(
+            reporter, frame, model
+        )  # converts it to proper format
+        dep_var = column_name(dep_var)
+        independentvariables = [column_name(v) for v in independentvariables]
+        full_model_variable_list = [column_name(v) for v in full_model_variable_list]
+        X, y, full_model, levels = linreg(  # performs linear regression
+            reporter,
+            df_final,
+            model,
+            ctr,
+            dep_var,
+            independentvariables,
+            full_model_variable_list,
+        )
+        contrasting(  # performs contrast
+            reporter,
+            df_final,
+            ctr,
+            dep_var,
+            full_model_variable_list,
+            full_model,
+            levels,
+        )
+        regularizing(reporter, regularization, answer, X, y, jobs)  # regularization
 
 
-def data_aggregation(reporter):  # all data from all the files is collected
-    """
-    This function provides query support for NIDM graphs.
+def parse_model(reporter, model):
     """
-    # if there is a CDE file list, seed the CDE cache
-    if m:  # ex: fs_00343 ~ age + sex + group
-        print("*" * 107)
-        command = "pynidm linear-regression -nl " + n + ' -model "' + m + '" '
-        if c:
-            command += '-contrast "' + c + '" '
-        if r:
-            command += "-r " + r + " "
-        reporter.print("Your command was:", command)
-        verbosity = 0
-        restParser = RestParser(verbosity_level=int(verbosity))
-        restParser.setOutputFormat(RestParser.OBJECT_FORMAT)
-        global df_list  # used in dataparsing()
-        df_list = []
-        # set up uri to do fields query for each nidm file
-        global file_list
-        file_list = n.split(",")
-        df_list_holder = {}
-        for i in range(len(file_list)):
-            df_list_holder[i] = []
-        df_holder = {}
-        for i in range(len(file_list)):
-            df_holder[i] = []
-        global condensed_data_holder
-        condensed_data_holder = {}
-        for i in range(len(file_list)):
-            condensed_data_holder[i] = []
+    Splits a model (e.g. "fs_000008 = age*sex + sex + age") into its variables
 
-        count = 0
-        not_found_count = 0
-        for nidm_file in file_list:
-            # get project UUID
-            project = GetProjectsUUID([nidm_file])
-            # split the model into its constituent variables
-            global full_model_variable_list
-            # below, we edit the model so it splits by +,~, or =. However, to help it out in catching everything
-            # we replaced ~ and = with a + so that we can still use split. Regex wasn't working.
-            plus_replace = m
-            if "~" in m:
-                plus_replace = m.replace("~", "+")
-            elif "=" in m:
-                plus_replace = m.replace("=", "+")
-            elif "," in m:
-                plus_replace = m.replace(",", "+")
-            model_list = [v.strip() for v in plus_replace.split("+")]
-            full_model_variable_list = []
-            # set the dependent variable to the one dependent variable in the model
-            global dep_var  # used in dataparsing(), linreg(), and contrasting()
-            dep_var = model_list[0]
-            # join the independent variables into a comma-separated list to make it easier to call from the uri
-            global ind_vars  # used in dataparsing()
-            ind_vars = ""
-            for i in range(len(model_list) - 1, 0, -1):
-                full_model_variable_list.append(
-                    model_list[i]
-                )  # will be used in the regularization, but we need the full list
-                if (
-                    "*" in model_list[i]
-                ):  # removing the star term from the columns we're about to pull from data
-                    model_list.pop(i)
-                elif model_list[i] == dep_var:
-                    model_list.pop(i)
-                    reporter.print(
-                        "\n\nAn independent variable cannot be the same as the dependent variable. This prevents the model from running accurately."
-                    )
-                    reporter.print(
-                        'Please try a different model removing "'
-                        + dep_var
-                        + '" from either the right or the left side of the equation.\n\n'
-                    )
-                    sys.exit(1)
-                else:
-                    ind_vars = ind_vars + model_list[i] + ","
-            ind_vars = ind_vars[0 : len(ind_vars) - 1]
-            uri = (
-                "/projects/"
-                + str(project[0]).split("/")[-1]
-                + "?fields="
-                + ind_vars
-                + ","
-                + dep_var
+    :param reporter: Reporter
+    :param model: model string, the dependent variable is separated from the independent
+        ones by ~ or =
+    :return: dependent variable, list of independent variables without the
+        interaction terms, list of all the terms of the right hand side
+    """
+    # below, we edit the model so it splits by +,~, or =. However, to help it out in catching everything
+    # we replaced ~ and = with a + so that we can still use split. Regex wasn't working.
+    plus_replace = model
+    if "~" in model:
+        plus_replace = model.replace("~", "+")
+    elif "=" in model:
+        plus_replace = model.replace("=", "+")
+    elif "," in model:
+        plus_replace = model.replace(",", "+")
+    model_list = [v.strip() for v in plus_replace.split("+")]
+    # set the dependent variable to the one dependent variable in the model
+    dep_var = model_list[0]
+    full_model_variable_list = []
+    independentvariables = []
+    for i in range(len(model_list) - 1, 0, -1):
+        full_model_variable_list.append(
+            model_list[i]
+        )  # will be used in the regularization, but we need the full list
+        if (
+            "*" in model_list[i]
+        ):  # removing the star term from the columns we're about to pull from data
+            continue
+        elif model_list[i] == dep_var:
+            reporter.print(
+                "\n\nAn independent variable cannot be the same as the dependent variable. This prevents the model from running accurately."
             )
-            # get fields output from each file and concatenate
-            df_list_holder[count].append(pd.DataFrame(restParser.run([nidm_file], uri)))
-            # global dep_var
-            df = pd.concat(df_list_holder[count])
-            with tempfile.NamedTemporaryFile(
-                delete=False
-            ) as temp:  # turns the dataframe into a temporary csv
-                df.to_csv(temp.name + ".csv")
-                temp.close()
-            with open(temp.name + ".csv", encoding="utf-8") as fp:
-                data = list(
-                    csv.reader(fp)
-                )  # makes the csv a 2D list to make it easier to call the contents of certain cells
-
-            global independentvariables  # used in linreg
-            independentvariables = ind_vars.split(
-                ","
-            )  # makes a list of the independent variables
-            numcols = (len(data) - 1) // (
-                len(independentvariables) + 1
-            )  # Finds the number of columns in the original dataframe
-            condensed_data_holder[count] = [
-                [0] * (len(independentvariables) + 1)
-            ]  # makes an array 1 row by the number of necessary columns
-            for _ in range(
-                numcols
-            ):  # makes the 2D array big enough to store all of the necessary values in the edited dataset
-                condensed_data_holder[count].append(
-                    [0] * (len(independentvariables) + 1)
-                )
-            for i, v in enumerate(independentvariables):
-                # stores the independent variable names in the first row
-                condensed_data_holder[count][0][i] = v
-            condensed_data_holder[count][0][-1] = str(
-                dep_var
-            )  # stores the dependent variable name in the first row
-            numrows = 1  # begins at the first row to add data
-            fieldcolumn = (
-                0  # the column the variable name is in in the original dataset
+            reporter.print(
+                'Please try a different model removing "'
+                + dep_var
+                + '" from either the right or the left side of the equation.\n\n'
             )
-            valuecolumn = 0  # the column the value is in in the original dataset
-            datacolumn = 0  # if it is identified by the dataElement name instead of the field's name
-            not_found_list = []
-            for i in range(len(data[0])):
-                if (
-                    data[0][i] == "sourceVariable"
-                ):  # finds the column where the variable names are
-                    fieldcolumn = i
-                elif (
-                    data[0][i] == "source_variable"
-                ):  # finds the column where the variable names are
-                    fieldcolumn = i
-                elif data[0][i] == "isAbout":
-                    aboutcolumn = i
-                elif data[0][i] == "label":
-                    namecolumn = i  # finds the column where the variable names are
-                elif data[0][i] == "value":
-                    valuecolumn = i  # finds the column where the values are
-                elif (
-                    data[0][i] == "dataElement"
-                ):  # finds the column where the data element is if necessary
-                    datacolumn = i
-            for i in range(
-                len(condensed_data_holder[count][0])
-            ):  # starts iterating through the dataset, looking for the name in that
-                for j in range(
-                    1, len(data)
-                ):  # column, so it can append the values under the proper variables
-                    try:
-                        split_url = condensed_data_holder[count][0][i].split("/")
-                        for k, fmv in enumerate(full_model_variable_list):
-                            if "/" in fmv:
-                                full_model_variable_list[k] = split_url[-1]
-                        if (
-                            data[j][fieldcolumn] == condensed_data_holder[count][0][i]
-                        ):  # in the dataframe, the name is in column 3
-                            condensed_data_holder[count][numrows][i] = data[j][
-                                valuecolumn
-                            ]  # in the dataframe, the value is in column 2
-                            numrows = (
-                                numrows + 1
-                            )  # moves on to the next row to add the proper values
-                        elif data[j][aboutcolumn] == condensed_data_holder[count][0][i]:
-                            condensed_data_holder[count][numrows][i] = data[j][
-                                valuecolumn
-                            ]  # in the dataframe, the value is in column 2
-                            numrows = (
-                                numrows + 1
-                            )  # moves on to the next row to add the proper values
-                        elif (
-                            data[j][aboutcolumn] == split_url[len(split_url) - 1]
-                        ):  # this is in case the uri only works by querying the part after the last backslash
-                            condensed_data_holder[count][numrows][i] = data[j][
-                                valuecolumn
-                            ]  # in the dataframe, the value is in column 2
-                            numrows = (
-                                numrows + 1
-                            )  # moves on to the next row to add the proper values
-                        elif (
-                            condensed_data_holder[count][0][i] in data[j][aboutcolumn]
-                        ):  # this is in case the uri only works by querying the part after the last backslash
-                            condensed_data_holder[count][numrows][i] = data[j][
-                                valuecolumn
-                            ]  # in the dataframe, the value is in column 2
-                            numrows = (
-                                numrows + 1
-                            )  # moves on to the next row to add the proper values
-                        elif (
-                            data[j][namecolumn] == condensed_data_holder[count][0][i]
-                        ):  # in the dataframe, the name is in column 12
-                            condensed_data_holder[count][numrows][i] = data[j][
-                                valuecolumn
-                            ]  # in the dataframe, the value is in column 2
-                            numrows = (
-                                numrows + 1
-                            )  # moves on to the next row to add the proper values
-                        elif (
-                            condensed_data_holder[count][0][i] == data[j][datacolumn]
-                        ):  # in the dataframe, the name is in column 9
-                            condensed_data_holder[count][numrows][i] = data[j][
-                                valuecolumn
-                            ]  # in the dataframe, the value is in column 2
-                            numrows = (
-                                numrows + 1
-                            )  # moves on to the next row to add the proper values
-                    except IndexError:
-                        numrows = numrows + 1
-                numrows = 1  # resets to the first row for the next variable
-            temp_list = condensed_data_holder[count]
-            for j in range(
-                len(temp_list[0]) - 1, 0, -1
-            ):  # if the software appends a column with 0 as the heading, it removes this null column
-                if temp_list[0][j] == "0" or temp_list[0][j] == "NaN":
-                    for row in condensed_data_holder[count]:
-                        row.pop(j)
-            rowsize = len(condensed_data_holder[count][0])
-            count1 = 0
-            for i in range(0, rowsize):
-                for row in condensed_data_holder[count]:
-                    if row[i] == 0 or row[i] == "NaN" or row[i] == "0":
-                        count1 = count1 + 1
-                if count1 > len(condensed_data_holder[count]) - 2:
-                    not_found_list.append(condensed_data_holder[count][0][i])
-                count1 = 0
-            for i, cdh in enumerate(condensed_data_holder[count][0]):
-                condensed_data_holder[count][0][i] = cdh.replace(" ", "_")
-            independentvariables = [
-                v.split("/")[-1].replace(" ", "_") for v in independentvariables
-            ]
-            dep_var = dep_var.replace(" ", "_")
-            count += 1
-            if len(not_found_list) > 0:
-                print("*" * 107)
-                print()
-                reporter.print("Your model was", m)
-                reporter.print()
-                reporter.print(
-                    "The following variables were not found in "
-                    + nidm_file
-                    + ". The model cannot run because this will skew the data. Try checking your spelling or use nidm_query.py to see other possible variables."
-                )
-                for i, nf in enumerate(not_found_list):
-                    reporter.print(f"{i + 1}. {nf}")
-                not_found_list.clear()
-                not_found_count += 1
-                print()
-        if not_found_count > 0:
             sys.exit(1)
-
-    else:
-        print("ERROR: No query parameter provided.  See help:")
-        print()
-        os.system("pynidm linreg --help")
-        sys.exit(1)
+        else:
+            independentvariables.append(model_list[i])
+    return dep_var, independentvariables, full_model_variable_list
 
 
 def dataparsing(
-    reporter,
+    reporter, frame, model
 ):  # The data is changed to a format that is usable by the linear regression method
-    global condensed_data
-    condensed_data = []
-    for i in range(0, len(file_list)):
-        condensed_data = condensed_data + condensed_data_holder[i]
-    for i in range(len(condensed_data[0])):
-        if (
-            "/" in condensed_data[0][i]
-        ):  # change any URLs to just the last part so contrasting works.
-            split = condensed_data[0][i].split("/")
-            condensed_data[0][i] = split[len(split) - 1]
+    """
+    :param reporter: Reporter
+    :param frame: load_model_frame DataFrame
+    :param model: model string
+    :return: the frame with the categorical variables encoded, the user's answer to
+        the warning about small data sets
+    """
+    # subjects without a value for one of the variables can't be used in the model
+    frame = frame.dropna()
 
     # In this section, if there are less than 20 points, the model will be
     # inaccurate and there are too few variables for regularization.  That
@@ -363,76 +181,43 @@ def dataparsing(
     # responds with N, it exits the code after writing the error to the output
     # file (if there is one).  If the user says Y instead, the code runs, but
     # stops before doing the regularization.
-    global answer
     answer = "?"
-    if (len(condensed_data) - 1) < 20:
+    if len(frame) < 20:
         print(
             "\nYour data set has less than 20 points, which means the model calculated may not be accurate due to a lack of data. "
         )
         print("This means you cannot regularize the data either.")
         warnings.filterwarnings("ignore")
         answer = input("Continue anyways? Y or N: ")
-        reporter.print_file("Your model was", m)
+        reporter.print_file("Your model was", model)
         reporter.print_file(
             "\n\nThere was a lack of data (<20 points) in your model, which may result in inaccuracies. In addition, a regularization cannot and will not be performed.\n"
         )
     if "n" in answer.lower():
         print("\nModel halted.")
-        reporter.print_file("Your model was", m)
+        reporter.print_file("Your model was", model)
         reporter.print_file(
             "Due to a lack of data (<20 points), you stopped the model because the results may have been inaccurate."
         )
         sys.exit(1)
-    x = pd.read_csv(
-        opencsv(condensed_data)
-    )  # changes the dataframe to a csv to make it easier to work with
-    x.head()  # prints what the csv looks like
-    x.dtypes  # checks data format
-    obj_df = x.select_dtypes  # puts all the variables in a dataset
-    x.shape  # says number of rows and columns in form of tuple
-    x.describe()  # says dataset statistics
-    obj_df = x.select_dtypes(
-        include=["object"]
-    ).copy()  # takes everything that is an object (not float or int) and puts it in a new dataset
-    obj_df.head()  # prints the new dataset
-    int_df = x.select_dtypes(
-        include=["int64"]
-    ).copy()  # takes everything that is an int and puts it in a new dataset
-    float_df = x.select_dtypes(
-        include=["float64"]
-    ).copy()  # takes everything that is a float and puts it in a new dataset
-    df_int_float = pd.concat([float_df, int_df], axis=1)
-    variables = []  # starts a list that will store all variables that are not numbers
-    for i in range(1, len(condensed_data)):  # goes through each variable
-        for j in range(len(condensed_data[0])):  # in the 2D array
-            try:  # if the value of the field can be turned into a float (is numerical)
-                float(condensed_data[i][j])  # this means it's a number
-            except ValueError:  # if it can't be (is a string)
-                if (
-                    condensed_data[0][j] not in variables
-                ):  # adds the variable name to the list if it isn't there already
-                    variables.append(condensed_data[0][j])
-    le = (
-        preprocessing.LabelEncoder()
-    )  # anything involving le shows the encoding of categorical variables
-    for v in variables:
-        le.fit(obj_df[v].astype(str))
-    obj_df_trf = obj_df.astype(str).apply(
-        le.fit_transform
+    df_final = encode_categorical(
+        frame
     )  # transforms the categorical variables into numbers.
-    global df_final  # also used in linreg()
-    if not obj_df_trf.empty:
-        df_final = pd.concat(
-            [df_int_float, obj_df_trf], axis=1
-        )  # join_axes=[df_int_float.index])
-    else:
-        df_final = df_int_float
     reporter.print(df_final.to_string(header=True, index=True))
     reporter.print("\n\n" + ("*" * 107))
     reporter.print("\n\nModel Results: ")
+    return df_final, answer
 
 
-def linreg(reporter):  # actual linear regression
+def linreg(
+    reporter,
+    df_final,
+    model,
+    c,
+    dep_var,
+    independentvariables,
+    full_model_variable_list,
+):  # actual linear regression
     print("Model Results: ")
     # printing the corrected model_string
     model_string = []
@@ -442,35 +227,19 @@ def linreg(reporter):  # actual linear regression
         model_string.append(fmv)
         model_string.append(" + ")
     model_string.pop(-1)
-    global full_model
     full_model = "".join(model_string)
     print(full_model)  # prints model
     print()
     print("*" * 107)
     print()
-    index = 0
-    global levels  # also used in contrasting()
-    levels = []
-    for i in range(len(condensed_data[0])):
-        if c == condensed_data[0][i]:
-            index = i
-    for i in range(1, len(condensed_data)):
-        if condensed_data[i][index] not in levels:
-            levels.append(condensed_data[i][index])
-    levels = list(range(len(levels)))
+    contrast_column = column_name(c) if c else None
+    if contrast_column not in df_final.columns:
+        contrast_column = df_final.columns[0]
+    levels = list(range(df_final[contrast_column].nunique()))
 
     # Beginning of the linear regression
-    global X
-    global y
-    if "*" in m:
+    if "*" in model:
         # correcting the format of the model string
-        model_string = []
-        model_string.append(dep_var)
-        model_string.append(" ~ ")
-        for fmv in full_model_variable_list:
-            model_string.append(fmv)
-            model_string.append(" + ")
-        model_string.pop(-1)
         for i, mdl in enumerate(model_string):
             if "*" in mdl:
                 replacement = mdl.split("*")
@@ -495,12 +264,12 @@ def linreg(reporter):  # actual linear regression
         reporter.print_file(full_model)
         reporter.print_file("\n" + ("*" * 85) + "\n")
         reporter.print(finalstats.summary())
-        return finalstats
+    return X, y, full_model, levels
 
 
-def contrasting(reporter):
-    global c
-    global full_model_variable_list
+def contrasting(
+    reporter, df_final, c, dep_var, full_model_variable_list, full_model, levels
+):
     if c:
         # to account for multiple contrast variables
         contrastvars = []
@@ -637,100 +406,47 @@ def contrasting(reporter):
         reporter.print(res.summary())
 
 
-def regularizing(reporter):
-    # does it say L1, and has the user chosen to go ahead with running the code?
-    if r in ("L1", "Lasso", "l1", "lasso") and "y" not in answer.lower():
-        # Loop to compute the cross-validation scores
-        max_cross_val_alpha = 1
-        max_cross_val_score = (
-            -1000000000.000
-        )  # making it a super negative number initially
-        for x in range(1, MAX_ALPHA):
-            lassoModel = Lasso(alpha=x, tol=0.0925)
-            lassoModel.fit(X, y)
-            scores = cross_val_score(lassoModel, X, y, cv=10)
-            avg_cross_val_score = mean(scores) * 100
-            # figure out which setting of the regularization parameter results in the max likelihood score
-            if avg_cross_val_score > max_cross_val_score:
-                max_cross_val_alpha = x
-                max_cross_val_score = avg_cross_val_score
-
-        # Building and fitting the Lasso Regression Model
-        lassoModelChosen = Lasso(alpha=max_cross_val_alpha, tol=0.0925)
-        lassoModelChosen.fit(X, y)
-        reporter.print("\nLasso regression model:")
-        reporter.print(
-            f"Alpha with maximum likelihood (range: 1 to {MAX_ALPHA}) = {max_cross_val_alpha}"
-        )
-        reporter.print(f"Current Model Score = {lassoModelChosen.score(X, y)}")
-        index = 0
-        reporter.print("\nCoefficients:")
-        for var in full_model_variable_list:
-            reporter.print(f"{var} \t {lassoModelChosen.coef_[index]}")
-            index += 1
-        reporter.print(f"Intercept: {lassoModelChosen.intercept_}")
-        reporter.print()
-
-    # does it say L2, and has the user chosen to go ahead with running the code?
-    if r in ("L2", "Ridge", "l2", "ridge") and "y" not in answer.lower():
-        # Loop to compute the different values of cross-validation scores
-        max_cross_val_alpha = 1
-        max_cross_val_score = (
-            -1000000000.000
-        )  # making it a super negative number initially
-        for x in range(1, MAX_ALPHA):
-            ridgeModel = Ridge(alpha=x, tol=0.0925)
-            ridgeModel.fit(X, y)
-            scores = cross_val_score(ridgeModel, X, y, cv=10)
-            avg_cross_val_score = mean(scores) * 100
-            # figure out which setting of the regularization parameter results in the max likelihood score
-            if avg_cross_val_score > max_cross_val_score:
-                max_cross_val_alpha = x
-                max_cross_val_score = avg_cross_val_score
-
-        # Building and fitting the Lasso Regression Model
-        ridgeModelChosen = Ridge(alpha=max_cross_val_alpha, tol=0.0925)
-        ridgeModelChosen.fit(X, y)
-        reporter.print("\nRidge regression model:")
-        reporter.print(
-            f"Alpha with maximum likelihood (range: 1 to {MAX_ALPHA}) = {max_cross_val_alpha}"
-        )
-        reporter.print(f"Current Model Score = {ridgeModelChosen.score(X, y)}")
-        index = 0
-        # This numpy_conversion part was necessary because for the ridge model,
-        # all the coefficients get stored in a numpy array, and the conversion
-        # is necessary to get the coefficients. However, it is only needed if
-        # the model has interacting variables.
-        numpy_conversion = False
-        for var in full_model_variable_list:
-            if ("*" in var) or (":" in var):
-                numpy_conversion = True
-        reporter.print("\nCoefficients:")
-        if numpy_conversion:
-            coeff_list = ridgeModelChosen.coef_[index].tolist()
-            coeff_list.pop(0)
-            for var in full_model_variable_list:
-                reporter.print(f"{var} \t {coeff_list[index]}")
-                index += 1
-            reporter.print(f"Intercept: {ridgeModelChosen.intercept_}")
-            reporter.print()
-        else:
-            for var in full_model_variable_list:
-                reporter.print(f"{var} \t {ridgeModelChosen.coef_[index]}")
-                index += 1
-            reporter.print(f"Intercept: {ridgeModelChosen.intercept_}")
-            reporter.print()
-
-
-def opencsv(data):
-    """saves a list of lists as a csv and opens"""
-    handle, fn = tempfile.mkstemp(suffix=".csv")
-    with os.fdopen(
-        handle, "w", encoding="utf8", errors="surrogateescape", newline=""
-    ) as f:
-        writer = csv.writer(f)
-        writer.writerows(data)
-    return fn
+def regularizing(reporter, r, answer, X, y, jobs=1):
+    """
+    Prints the L1 (Lasso) or L2 (Ridge) regularized model with the best
+    cross-validated penalty weight
+
+    :param reporter: Reporter
+    :param r: regularization asked for, e.g. L1 or ridge (nothing is done if None)
+    :param answer: the user's answer to the warning about small data sets
+    :param X: design matrix returned by linreg
+    :param y: dependent variable returned by linreg
+    :param jobs: number of processes used for the cross-validation
+    """
+    # has the user chosen to go ahead with running the code?
+    if "y" in answer.lower():
+        return
+    if r in ("L1", "Lasso", "l1", "lasso"):
+        method, title = "L1", "Lasso"
+    elif r in ("L2", "Ridge", "l2", "ridge"):
+        method, title = "L2", "Ridge"
+    else:
+        return
+    if hasattr(X, "design_info"):
+        names = X.design_info.column_names
+    else:
+        names = [str(name) for name in X.columns]
+    # the models fit their own intercept
+    columns = [i for i, name in enumerate(names) if name != "Intercept"]
+    X = np.asarray(X)[:, columns]
+    names = [names[i] for i in columns]
+
+    model = fit_regularized(X, y, method, jobs)
+    reporter.print(f"\n{title} regression model:")
+    reporter.print(
+        f"Alpha with maximum likelihood (range: {REGULARIZATION_ALPHAS[0]:g} to {MAX_ALPHA}) = {model.alpha_:f}"
+    )
+    reporter.print(f"Current Model Score = {model.score(X, np.ravel(y)):f}")
+    reporter.print("\nCoefficients:")
+    for name, coefficient in zip(names, model.coef_):
+        reporter.print(f"{name} \t {coefficient:f}")
+    reporter.print(f"Intercept: {model.intercept_:f}")
+    reporter.print()
 
 
 # it can be used calling the script `python nidm_query.py -nl ... -q ..
@@ -1,9 +1,10 @@
 """Tools for working with NIDM-Experiment files"""
 
 import click
-from rdflib import Graph, util
+from rdflib import RDF, Graph, URIRef
 from nidm.core import Constants
-from nidm.experiment.Query import GetParticipantIDs
+from nidm.experiment import RDFStream
+from nidm.experiment.GraphBackend import loadStores, parseGraph
 from nidm.experiment.tools.click_base import cli
 
 
@@ -25,100 +26,132 @@ from nidm.experiment.tools.click_base import cli
 @click.option(
     "--out_file", "-o", required=True, help="File to write concatenated NIDM files"
 )
-def merge(nidm_file_list, s, out_file):
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to parse the NIDM files in parallel",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(RDFStream.OUTPUT_FORMATS),
+    default="turtle",
+    show_default=True,
+    help="Format of the output file.  nt, nq and ttl-stream are written one input file at a time "
+    "without merging the files in memory, triples that are in more than one file are written once",
+)
+@click.option(
+    "--gzip",
+    "compress",
+    is_flag=True,
+    help="Gzip compress the output file",
+)
+def merge(nidm_file_list, s, out_file, jobs, output_format, compress):
     """
     This function will merge NIDM files.  See command line parameters for supported merge operations.
     """
 
-    # graph = Graph()
-    # for nidm_file in nidm_file_list.split(','):
-    #    graph.parse(nidm_file,format=util.guess_format(nidm_file))
+    files = nidm_file_list.split(",")
+    if jobs > 1:
+        # parse all the files up front, later reads copy the parsed triples
+        loadStores(files, jobs)
+
+    if output_format in RDFStream.STREAM_FORMATS:
+        # only one file is held in memory at a time, the triples already written are
+        # remembered on disk
+        with RDFStream.TripleWriter(
+            out_file, output_format, compress, unique=True
+        ) as writer:
+            for i, (_, file_graph, triples) in enumerate(merged_files(files, s)):
+                for prefix, namespace in file_graph.namespaces():
+                    writer.bind(prefix, namespace)
+                writer.write(RDFStream.relabelBlankNodes(triples, f"f{i}"))
+        return
 
-    # create empty graph
     graph = Graph()
-    # start with the first NIDM file and merge the rest into the first
-    first = True
-    for nidm_file in nidm_file_list.split(","):
-        # if merging by subject:
-        if s:
-            if first:
-                # get list of all subject IDs
-                first_file_subjids = GetParticipantIDs([nidm_file])
-                first = False
-                first_graph = Graph()
-                first_graph.parse(nidm_file, format=util.guess_format(nidm_file))
-            else:
-                # load second graph
-                graph.parse(nidm_file, format=util.guess_format(nidm_file))
-
-                # get list of second file subject IDs
-                GetParticipantIDs([nidm_file])
-
-                # for each UUID / subject ID look in graph and see if you can find the same ID.  If so get the UUID of
-                # that prov:agent and change all the UUIDs in nidm_file to match then concatenate the two graphs.
-                query = f"""
-
-                    PREFIX prov:<http://www.w3.org/ns/prov#>
-                    PREFIX sio: <http://semanticscience.org/ontology/sio.owl#>
-                    PREFIX ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/>
-                    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                    PREFIX prov:<http://www.w3.org/ns/prov#>
-
-                    SELECT DISTINCT ?uuid ?ID
-                    WHERE {{
-
-                        ?uuid a prov:Agent ;
-                            {Constants.NIDM_SUBJECTID} ?ID .
-                    FILTER(?ID =
-                    """
-
-                # add filters to above query to only look for subject IDs which are in the first file to merge into
-                temp = True
-                for ID in first_file_subjids["ID"]:
-                    if temp:
-                        query = query + '"' + ID + '"'
-                        temp = False
-                    else:
-                        query = query + '|| ?ID= "' + ID + '"'
+    for _, file_graph, triples in merged_files(files, s):
+        for prefix, namespace in file_graph.namespaces():
+            graph.bind(prefix, namespace)
+        graph.addN((sub, pred, obj, graph) for sub, pred, obj in triples)
+    RDFStream.writeGraph(graph, out_file, output_format, compress)
 
-                query = query + ") }"
 
-                qres = graph.query(query)
-
-                # if len(qres) > 0 then we have matches so load the nidm_file into a temporary graph so we can
-                # make changes to it then concatenate it.
-                if len(qres) > 0:
-                    # tmp = Graph()
-                    # tmp.parse(nidm_file,format=util.guess_format(nidm_file))
-
-                    # for each ID in the merged graph that matches an ID in the nidm_file graph
-                    for row in qres:
-                        # find ID from first file that matches ID in this file
-                        t = first_file_subjids["ID"].str.match(row["ID"])
-                        # then get uuid for that match from first file
-                        uuid_replacement = first_file_subjids.iloc[
-                            [*filter(t.get, t.index)][0], 0
-                        ]
-
-                        for s, p, o in graph.triples((None, None, None)):
-                            if s == row["uuid"]:
-                                # print(f"replacing subject in triple {s} {p} {o} with {uuid_to_replace}")
-                                graph.add((uuid_replacement, p, o))
-                                graph.remove((row["uuid"], p, o))
-                            elif o == row["uuid"]:
-                                # print(f"replacing object in triple {s} {p} {o} with {uuid_to_replace}")
-                                graph.add((s, p, uuid_replacement))
-                                graph.remove((s, p, row["uuid"]))
-                            elif p == row["uuid"]:
-                                # print(f"replacing predicate in triple {s} {p} {o} with {uuid_to_replace}")
-                                graph.add((s, uuid_replacement, o))
-                                graph.remove((s, row["uuid"], o))
-
-                # merge updated graph
-
-                graph = first_graph + graph
-
-        graph.serialize(out_file, format="turtle")
+def merged_files(nidm_files, by_subject=False):
+    """
+    Reads the NIDM files one at a time.  When merging by subject the prov:agents of
+    the later files with a subject ID of a participant of the first file are replaced
+    by the UUID of that participant, the first participant with an ID keeps it.
+
+    :param nidm_files: list of NIDM files
+    :param by_subject: merge the files by ndar:src_subject_id
+    :return: generator of (NIDM file, Graph of the file, iterable of the triples of
+        the file with the UUIDs of the merged agents replaced)
+    """
+    subject_uuids = None
+    for nidm_file in nidm_files:
+        file_graph = parseGraph(nidm_file)
+        if not by_subject:
+            yield nidm_file, file_graph, file_graph
+        elif subject_uuids is None:
+            # get the UUIDs of all the subject IDs of the first file
+            subject_uuids = {}
+            for uuid, subject_id in participant_subject_ids(file_graph):
+                subject_uuids.setdefault(subject_id, uuid)
+            yield nidm_file, file_graph, file_graph
+        else:
+            replacements = {
+                uuid: subject_uuids[subject_id]
+                for uuid, subject_id in agent_subject_ids(file_graph)
+                if subject_id in subject_uuids
+            }
+            yield nidm_file, file_graph, (
+                (
+                    replacements.get(sub, sub),
+                    replacements.get(pred, pred),
+                    replacements.get(obj, obj),
+                )
+                for sub, pred, obj in file_graph
+            )
+
+
+def participant_subject_ids(rdf_graph):
+    """
+    :param rdf_graph: graph of a NIDM file
+    :return: list of (UUID, subject ID) tuples of the participants of rdf_graph, the
+        prov:agents with a ndar:src_subject_id that are associated with a prov:Activity
+        in the participant role (as found by GetParticipantIDs)
+    """
+    return [
+        (uuid, str(subject_id))
+        for association in rdf_graph.subjects(
+            Constants.PROV["hadRole"], URIRef(Constants.NIDM_PARTICIPANT.uri)
+        )
+        if any(
+            (activity, RDF.type, Constants.PROV["Activity"]) in rdf_graph
+            for activity in rdf_graph.subjects(
+                Constants.PROV["qualifiedAssociation"], association
+            )
+        )
+        for uuid in rdf_graph.objects(association, Constants.PROV["agent"])
+        for subject_id in rdf_graph.objects(uuid, URIRef(Constants.NIDM_SUBJECTID.uri))
+    ]
+
+
+def agent_subject_ids(rdf_graph):
+    """
+    :param rdf_graph: graph of a NIDM file
+    :return: list of (UUID, subject ID) tuples of the prov:agents of rdf_graph with a
+        ndar:src_subject_id
+    """
+    return [
+        (uuid, str(subject_id))
+        for uuid, subject_id in rdf_graph.subject_objects(
+            URIRef(Constants.NIDM_SUBJECTID.uri)
+        )
+        if (uuid, RDF.type, Constants.PROV["Agent"]) in rdf_graph
+    ]
 
 
 if __name__ == "__main__":
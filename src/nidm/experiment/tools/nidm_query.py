@@ -6,6 +6,7 @@ import sys
 import click
 from click_option_group import RequiredMutuallyExclusiveOptionGroup, optgroup
 import pandas as pd
+from nidm.experiment import GraphBackend
 from nidm.experiment.CDE import getCDEs
 from nidm.experiment.Query import (
     GetBrainVolumeDataElements,
@@ -93,6 +94,21 @@ from nidm.experiment.tools.rest import RestParser
     required=False,
     help="Optional output file (CSV) to store results of query",
 )
+@click.option(
+    "--chunksize",
+    "-cs",
+    type=click.IntRange(min=1),
+    required=False,
+    help="Stream the results of a SPARQL query (-q) in chunks of this many rows instead of collecting them in memory. "
+    "Results are written to the output file chunk by chunk, as Parquet if it ends in .parquet and CSV otherwise",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to parse the NIDM files in parallel",
+)
 @click.option(
     "-j/-no_j",
     required=False,
@@ -117,6 +133,8 @@ def query(
     cde_file_list,
     query_file,
     output_file,
+    chunksize,
+    jobs,
     get_participants,
     get_instruments,
     get_instrument_vars,
@@ -140,6 +158,10 @@ def query(
         os.environ["BLAZEGRAPH_URL"] = blaze
         print(f"setting BLAZEGRAPH_URL to {blaze}")
 
+    if jobs > 1:
+        # load all the files up front so the queries below find them ready
+        GraphBackend.getBackend().load(nidm_file_list.split(","), jobs)
+
     if get_participants:
         df = GetParticipantIDs(nidm_file_list.split(","), output_file=output_file)
         if (output_file) is None:
@@ -263,6 +285,17 @@ def query(
             brainvol.to_csv(output_file)
         else:
             print(brainvol.to_string())
+    elif query_file and chunksize:
+        results = sparql_query_nidm(
+            nidm_file_list.split(","),
+            query_file.read(),
+            output_file,
+            chunksize=chunksize,
+        )
+        if (output_file) is None:
+            for i, chunk in enumerate(results):
+                print(chunk.to_string(header=i == 0))
+        return None
     elif query_file:
         df = sparql_query_nidm(
             nidm_file_list.split(","), query_file.read(), output_file
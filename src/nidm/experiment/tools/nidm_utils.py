@@ -2,7 +2,7 @@
 
 from argparse import ArgumentParser
 import os.path
-from rdflib import Graph, util
+from nidm.experiment.Query import GetMergedGraph
 from nidm.experiment.Utils import read_nidm
 
 
@@ -40,18 +40,21 @@ def main():
         required=True,
         help="Merged NIDM output file name + path",
     )
+    concat.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to parse the NIDM files in parallel",
+    )
     # visualize.add_argument('-o', '--o', dest='output_file', required=True, help="Output file name+path of dot graph")
 
     args = parser.parse_args()
 
     # concatenate nidm files
     if args.command == "concat":
-        # create empty graph
-        graph = Graph()
-        for nidm_file in args.nidm_files:
-            tmp = Graph()
-            graph = graph + tmp.parse(nidm_file, format=util.guess_format(nidm_file))
-
+        graph = GetMergedGraph(args.nidm_files, jobs=args.jobs)
         graph.serialize(args.output_file, format="turtle")
 
     elif args.command == "visualize":
@@ -15,14 +15,12 @@ https://docs.google.com/document/d/1PyBoM7J0TuzTC1TIIFPDqd05nomcCM5Pvst8yCoqLng/
 """
 
 from argparse import ArgumentParser
-from io import StringIO
 from os.path import dirname, join
 import numpy as np
 import pandas as pd
 from prov.model import Namespace as provNamespace
 from prov.model import PROV_ATTR_USED_ENTITY, PROV_ROLE
 from prov.model import QualifiedName
-from rdflib import Graph
 from nidm.core import Constants
 from nidm.experiment.Core import Core, getUUID
 from nidm.experiment.Utils import getSubjIDColumn, map_variables_to_terms, read_nidm
@@ -242,10 +240,7 @@ def add_brainvolume_data(
         first_row = True
         # logic to add to existing graph
         # use RDFLib here for temporary graph making query easier
-        rdf_graph = Graph()
-        rdf_graph_parse = rdf_graph.parse(
-            source=StringIO(nidmdoc.serializeTurtle()), format="turtle"
-        )
+        rdf_graph_parse = nidmdoc.to_rdflib_graph()
 
         # find subject ids and sessions in NIDM document
         query = """SELECT DISTINCT ?session ?nidm_subj_id ?agent ?entity
@@ -4,13 +4,12 @@ import json
 import logging
 import operator
 import re
-from tempfile import gettempdir
 from urllib import parse
 from urllib.parse import parse_qs, urlparse
 from numpy import mean, median, std
 from tabulate import tabulate
 from nidm.core import Constants
-from nidm.experiment import Navigate, Query
+from nidm.experiment import Cache, Filter, Navigate, Query
 from nidm.experiment.Utils import validate_uuid
 
 
@@ -413,30 +412,19 @@ class RestParser:
             # result['field_values'] = []
 
             for proj in projects:
-                # get all the synonyms for all the fields
-                field_synonyms = functools.reduce(
-                    operator.iconcat,
-                    [
-                        Query.GetDatatypeSynonyms(self.nidm_files, proj, x)
-                        for x in self.query["fields"]
-                    ],
-                    [],
-                )
-
                 # files = self.nidm_files
                 all_subjects = Query.GetParticipantUUIDsForProject(
                     self.nidm_files, proj, self.query["filter"]
                 )  # nidm_file_list= files, project_id=proj['uuid'], filter=self.query['filter']):
-                for sub in all_subjects["uuid"]:
-                    for activity in Navigate.getActivities(self.nidm_files, sub):
-                        activity = Navigate.getActivityData(self.nidm_files, activity)
-                        for data_element in activity.data:
-                            if data_element.dataElement in field_synonyms:
-                                field_values.append(data_element._replace(subject=sub))
-                                subjects_set.add(sub)
-                                dataelements_set.add(
-                                    (data_element.datumType, data_element.label)
-                                )
+                values = Navigate.GetFieldValuesForProject(
+                    self.nidm_files,
+                    proj,
+                    self.query["fields"],
+                    subjects=all_subjects["uuid"],
+                )
+                field_values.extend(Navigate.valueTypesFromFrame(values))
+                subjects_set.update(values["subject"])
+                dataelements_set.update(zip(values["datumType"], values["label"]))
 
             if len(field_values) == 0:
                 raise ValueError(
@@ -648,24 +636,15 @@ class RestParser:
         # subject details -> derivatives / instrument -> values -> element
         if "fields" in self.query and len(self.query["fields"]) > 0:
             self.restLog(f"Using fields {self.query['fields']}", 2)
-            result["field_values"] = []
-            # get all the synonyms for all the fields
-            field_synonyms = functools.reduce(
-                operator.iconcat,
-                [
-                    Query.GetDatatypeSynonyms(self.nidm_files, pid, x)
-                    for x in self.query["fields"]
-                ],
-                [],
+            # pull the values for all the fields and subjects at once
+            result["field_values"] = Navigate.valueTypesFromFrame(
+                Navigate.GetFieldValuesForProject(
+                    self.nidm_files,
+                    pid,
+                    self.query["fields"],
+                    subjects=result["subjects"]["uuid"],
+                )
             )
-            for sub in result["subjects"]["uuid"]:
-                for activity in Navigate.getActivities(self.nidm_files, sub):
-                    activity = Navigate.getActivityData(self.nidm_files, activity)
-                    for data_element in activity.data:
-                        if data_element.dataElement in field_synonyms:
-                            result["field_values"].append(
-                                data_element._replace(subject=sub)
-                            )
 
             if len(result["field_values"]) == 0:
                 raise ValueError(
@@ -688,10 +667,12 @@ class RestParser:
         result = {}
         result["uuid"] = []
         result["subject id"] = []
-        for sub_uuid in all_subjects:
-            if Query.CheckSubjectMatchesFilter(
-                self.nidm_files, project, sub_uuid, self.query["filter"]
-            ):
+        all_subjects = list(all_subjects)
+        matches = Filter.FilterSubjects(
+            self.nidm_files, project, all_subjects, self.query["filter"]
+        )
+        for sub_uuid, match in zip(all_subjects, matches):
+            if match:
                 uuid_string = (str(sub_uuid)).split("/")[
                     -1
                 ]  # srip off the http://whatever/whatever/
@@ -863,7 +844,7 @@ class RestParser:
         try:
             self.restLog("parsing command " + command, 1)
             self.restLog("Files to read:" + str(nidm_files), 1)
-            self.restLog(f"Using {gettempdir()} as the graph cache directory", 1)
+            self.restLog(f"Using {Cache.getCacheDir()} as the graph cache directory", 1)
 
             self.nidm_files = tuple(nidm_files)
             # replace # marks with %23 - they are sometimes used in the is_about terms
@@ -1,8 +1,11 @@
 from __future__ import annotations
 from dataclasses import InitVar, dataclass, field
 from pathlib import Path
+import sys
 from types import TracebackType
 from typing import IO, Any, Optional
+import pandas as pd
+from nidm.experiment.analysis import VariablesNotFoundError, load_model_frame
 
 
 @dataclass
@@ -36,3 +39,36 @@ class Reporter:
     def print_file(self, *args: Any, end: str = "\n", sep: str = "") -> None:
         if self.output is not None:
             print(*args, end=end, sep=sep, file=self.output)
+
+
+def load_model_data(
+    reporter: Reporter, file_list: list[str], variables: list[str], query_label: str
+) -> pd.DataFrame:
+    """
+    load_model_frame for the analysis tools: if a variable isn't found in one of the
+    files, the missing variables are reported and the program exits.
+
+    :param reporter: Reporter
+    :param file_list: list of NIDM files
+    :param variables: list of the variables to collect
+    :param query_label: what the user asked for in the error messages, e.g.
+        "Your model was volume = age + sex"
+    :return: load_model_frame DataFrame
+    """
+    try:
+        return load_model_frame(file_list, variables)
+    except VariablesNotFoundError as e:
+        for nidm_file, not_found_list in e.missing.items():
+            print("*" * 107)
+            print()
+            reporter.print(query_label)
+            reporter.print()
+            reporter.print(
+                "The following variables were not found in "
+                + nidm_file
+                + ". The model cannot run because this will skew the data. Try checking your spelling or use nidm_query.py to see other possible variables."
+            )
+            for i, nf in enumerate(not_found_list):
+                reporter.print(f"{i + 1}. {nf}")
+            print()
+        sys.exit(1)
@@ -0,0 +1,207 @@
+from __future__ import annotations
+import json
+from pathlib import Path
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from nidm.experiment import Cache
+from nidm.experiment.analysis import (
+    REGULARIZATION_ALPHAS,
+    VariablesNotFoundError,
+    _variable_rows,
+    cluster_sweep,
+    column_name,
+    encode_categorical,
+    fit_regularized,
+    gap_cluster_number,
+    load_model_frame,
+)
+
+BRAINVOL = str(Path(__file__).with_name("data") / "read_nidm" / "brainvol_nidm.ttl")
+
+
+def _csv2nidm(tmp_path: Path, name: str, rows: str) -> str:
+    csv_file = tmp_path / f"{name}.csv"
+    csv_file.write_text("participant_id,age,sex,volume\n" + rows)
+    dd = {}
+    for variable, value_type in [
+        ("participant_id", "string"),
+        ("age", "float"),
+        ("sex", "string"),
+        ("volume", "float"),
+    ]:
+        dd[f"DD(source='{csv_file.name}', variable='{variable}')"] = {
+            "label": variable,
+            "description": variable,
+            "source_variable": variable,
+            "responseOptions": {
+                "valueType": f"http://www.w3.org/2001/XMLSchema#{value_type}"
+            },
+        }
+    dd[f"DD(source='{csv_file.name}', variable='participant_id')"]["isAbout"] = [
+        {
+            "@id": "https://ndar.nih.gov/api/datadictionary/v2/dataelement/src_subject_id",
+            "label": "src_subject_id",
+        }
+    ]
+    dd[f"DD(source='{csv_file.name}', variable='age')"]["isAbout"] = [
+        {"@id": "http://uri.interlex.org/ilx_0100400", "label": "age"}
+    ]
+    json_map = tmp_path / f"{name}.json"
+    json_map.write_text(json.dumps(dd))
+    nidm_file = tmp_path / f"{name}.ttl"
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "nidm.experiment.tools.csv2nidm",
+            "-csv",
+            str(csv_file),
+            "-json_map",
+            str(json_map),
+            "-no_concepts",
+            "-out",
+            str(nidm_file),
+        ],
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+    assert result.returncode == 0, result.stderr
+    return str(nidm_file)
+
+
+def test_column_name() -> None:
+    assert column_name(" http://uri.interlex.org/ilx_0100400") == "ilx_0100400"
+    assert column_name("age at scan") == "age_at_scan"
+
+
+def test_variable_rows_match_whole_is_about_tail() -> None:
+    values = pd.DataFrame(
+        {
+            "sourceVariable": ["age_at_scan", "avg_thick", "sex"],
+            "label": ["Age at scan", "average thickness", "Sex"],
+            "dataElement": ["age_at_scan_de", "avg_thick_de", "sex_de"],
+            "isAbout": [
+                "http://uri.interlex.org/age",
+                "http://uri.interlex.org/average_thickness",
+                None,
+            ],
+        }
+    )
+    assert _variable_rows(values, "age").tolist() == [True, False, False]
+    assert _variable_rows(values, "http://example.org/terms#age").tolist() == [
+        True,
+        False,
+        False,
+    ]
+    assert _variable_rows(values, "sex").tolist() == [False, False, True]
+
+
+def test_load_model_frame_brainvol() -> None:
+    frame = load_model_frame(
+        [BRAINVOL], ["fs_000008", "http://uri.interlex.org/ilx_0100400", "gender"]
+    )
+    assert list(frame.columns) == ["fs_000008", "ilx_0100400", "gender"]
+    assert len(frame) == 1
+    assert frame["ilx_0100400"].iloc[0] == pytest.approx(12.36)
+    assert pd.api.types.is_float_dtype(frame["fs_000008"])
+    assert frame["gender"].iloc[0] == "Female"
+
+
+def test_load_model_frame_files(tmp_path: Path) -> None:
+    files = [
+        _csv2nidm(
+            tmp_path, "a", "sub-01,20.5,F,1000\nsub-02,30,M,1100\nsub-03,40,F,\n"
+        ),
+        _csv2nidm(tmp_path, "b", "sub-10,50,M,1300\n"),
+    ]
+    frame = load_model_frame(files, ["volume", "age", "sex"])
+    assert list(frame.columns) == ["volume", "age", "sex"]
+    assert len(frame) == 4
+    rows = sorted(frame.itertuples(index=False), key=lambda r: r.age)
+    assert [(r.age, r.sex) for r in rows] == [
+        (20.5, "F"),
+        (30, "M"),
+        (40, "F"),
+        (50, "M"),
+    ]
+    assert [r.volume for r in rows][:2] == [1000, 1100]
+    # sub-03 has no volume
+    assert frame["volume"].isna().sum() == 1
+
+    encoded = encode_categorical(frame.dropna())
+    assert sorted(encoded["sex"]) == [0, 1, 1]
+    assert encoded["age"].equals(frame.dropna()["age"])
+
+    with pytest.raises(VariablesNotFoundError) as excinfo:
+        load_model_frame(files + [BRAINVOL], ["age", "volume"])
+    assert excinfo.value.missing == {BRAINVOL: ["volume"]}
+
+
+@pytest.mark.parametrize("method", ["L1", "L2"])
+def test_fit_regularized(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, method: str
+) -> None:
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({"age": rng.normal(40, 10, 200), "noise": rng.normal(size=200)})
+    y = 3 * X["age"] + rng.normal(size=200)
+
+    model = fit_regularized(X, y, method, jobs=2)
+    assert model.alpha_ in REGULARIZATION_ALPHAS
+    assert model.coef_[0] == pytest.approx(3, abs=0.1)
+    assert abs(model.coef_[1]) < 0.5
+    assert [e.kind for e in Cache.cacheEntries()] == ["model_fit"]
+
+    # the same model on the same data comes out of the cache
+    cached = fit_regularized(X, y, method)
+    assert cached.alpha_ == model.alpha_
+    assert Cache.lookupCounts()["model_fit"] == (1, 1)
+    fit_regularized(X, y + 1, method)
+    assert len(Cache.cacheEntries()) == 2
+
+
+def test_cluster_sweep(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    rng = np.random.default_rng(0)
+    X = np.vstack([rng.normal(center, 0.5, size=(30, 2)) for center in (0, 5, 10)])
+
+    sweep = cluster_sweep(X, "kmeans", range(2, 6), ["gap", "inertia"], jobs=2)
+    assert list(sweep.index) == [2, 3, 4, 5]
+    assert sweep["gap"].idxmax() == 3
+    assert gap_cluster_number(sweep) == 3
+    assert (sweep["gap_sd"] > 0).all()
+    assert sweep["inertia"].is_monotonic_decreasing
+    # the same seed gives the same scores, in one process or several
+    Cache.clear()
+    assert cluster_sweep(X, "kmeans", range(2, 6), ["gap", "inertia"]).equals(sweep)
+
+    # scores already in the cache aren't computed again
+    assert cluster_sweep(X, "kmeans", [3, 4], ["inertia"]).equals(sweep.loc[[3, 4]])
+    both = cluster_sweep(X, "kmeans", range(2, 6), ["inertia", "silhouette"])
+    assert both["inertia"].equals(sweep["inertia"])
+    assert both["silhouette"].idxmax() == 3
+    assert Cache.lookupCounts()["cluster_sweep"] == (1, 2)
+
+    gmm = cluster_sweep(X, "gmm", range(2, 6), ["aic", "bic"])
+    assert gmm["bic"].idxmin() == 3
+
+
+def test_gap_cluster_number() -> None:
+    sweep = pd.DataFrame(
+        {"gap": [0.5, 0.9, 1.0, 1.05], "gap_sd": [0.1, 0.1, 0.05, 0.1]},
+        index=pd.Index([2, 3, 4, 5], name="k"),
+    )
+    # 0.9 < 1.0 - 0.05 but 1.0 >= 1.05 - 0.1, before the largest gap at 5
+    assert gap_cluster_number(sweep) == 4
+    sweep["gap_sd"] = 0.5
+    assert gap_cluster_number(sweep) == 2
+    # no k is within a standard error of the next one
+    sweep["gap"] = [1.0, 2.0, 3.0, 4.0]
+    sweep["gap_sd"] = 0.1
+    assert gap_cluster_number(sweep) == 5
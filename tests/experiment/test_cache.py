@@ -0,0 +1,116 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+import pickle
+import pytest
+from rdflib import Graph
+from nidm.experiment import Cache, GraphBackend, Query, RDFStream
+
+DATA_DIR = Path(__file__).with_name("data") / "read_nidm"
+
+
+@pytest.fixture
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    return tmp_path / "cache"
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [
+        ("1024", 1024),
+        ("500M", 500 * 1024**2),
+        ("1.5g", int(1.5 * 1024**3)),
+        ("2GB", 2 * 1024**3),
+        ("0", None),
+        ("unlimited", None),
+    ],
+)
+def test_parse_size(size: str, expected: int | None) -> None:
+    assert Cache.parseSize(size) == expected
+
+
+def test_parse_size_error() -> None:
+    with pytest.raises(ValueError):
+        Cache.parseSize("lots")
+
+
+def test_digest_index(cache_dir: Path, tmp_path: Path) -> None:
+    nidm_file = tmp_path / "test.ttl"
+    nidm_file.write_bytes((DATA_DIR / "brainvol_nidm.ttl").read_bytes())
+    digest = GraphBackend.fileDigest(str(nidm_file))
+    assert cache_dir.is_dir()
+    assert Cache.lookupDigest(str(nidm_file)) == digest
+
+    # a recorded digest is trusted while the file is unchanged, without rehashing it
+    Cache.storeDigest(str(nidm_file), "0" * 32)
+    GraphBackend._fileDigestCached.cache_clear()
+    assert GraphBackend.fileDigest(str(nidm_file)) == "0" * 32
+
+    with open(nidm_file, "ab") as fp:
+        fp.write(b"\n")
+    assert Cache.lookupDigest(str(nidm_file)) is None
+    assert GraphBackend.fileDigest(str(nidm_file)) not in ("0" * 32, digest)
+
+
+def test_pickle_header(cache_dir: Path) -> None:  # noqa: U100
+    pickle_path = Cache.cachePath("cde_graph", "0" * 32, "pickle")
+    Cache.writePickle({"a": 1}, pickle_path)
+    assert Cache.readPickle(pickle_path) == {"a": 1}
+    assert Cache.readPickle(pickle_path + ".missing") is None
+
+    # pickles without a header, or from other versions, are ignored
+    with open(pickle_path, "wb") as fp:
+        pickle.dump({"a": 1}, fp)
+    assert Cache.readPickle(pickle_path) is None
+    with open(pickle_path, "wb") as fp:
+        pickle.dump({**Cache._pickleHeader(), "rdflib": "0.1"}, fp)
+        pickle.dump({"a": 1}, fp)
+    assert Cache.readPickle(pickle_path) is None
+
+
+def test_lru_eviction(cache_dir: Path, tmp_path: Path) -> None:  # noqa: U100
+    files = []
+    for name in ["brainvol_nidm.ttl", "derivatives_nidm.ttl", "nidm_w_provenance.ttl"]:
+        (tmp_path / name).write_bytes((DATA_DIR / name).read_bytes())
+        files.append(str(tmp_path / name))
+    store_paths = GraphBackend.loadStores(files)
+    for i, store_path in enumerate(store_paths):
+        os.utime(store_path, (1000 + i, 1000 + i))
+
+    # using an entry makes it the most recently used
+    GraphBackend.parseGraph(files[0])
+    entries = Cache.cacheEntries()
+    assert [e.path for e in entries] == store_paths[1:] + store_paths[:1]
+    assert Cache.lookupCounts()["rdf_graph"] == (1, 3)
+
+    removed = Cache.evict(max_size=entries[-1].size + entries[-2].size)
+    assert [e.path for e in removed] == store_paths[1:2]
+    assert not os.path.exists(store_paths[1])
+
+    assert len(Cache.clear()) == 2
+    assert Cache.cacheEntries() == []
+    assert Cache.lookupCounts() == {}
+    # the files are parsed again once their stores are gone
+    assert len(Query.OpenGraph(files[1])) > 0
+    assert [e.path for e in Cache.cacheEntries()] == [store_paths[1]]
+
+
+def test_small_cache_keeps_stores_of_union(
+    cache_dir: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch  # noqa: U100
+) -> None:
+    # every new entry makes the cache too big
+    monkeypatch.setenv("NIDM_CACHE_SIZE", "1")
+    files = []
+    for name in ["brainvol_nidm.ttl", "derivatives_nidm.ttl", "nidm_w_provenance.ttl"]:
+        (tmp_path / name).write_bytes((DATA_DIR / name).read_bytes())
+        files.append(str(tmp_path / name))
+    expected = Graph()
+    for f in files:
+        RDFStream.parseFile(f, expected)
+
+    df = Query.sparql_query_nidm(files, "SELECT (COUNT(*) AS ?n) WHERE { ?s ?p ?o }")
+    assert int(df["n"][0]) == len(expected)
+    # only the union is left
+    assert [e.kind for e in Cache.cacheEntries()] == ["rdf_union"]
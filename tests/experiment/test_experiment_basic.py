@@ -3,6 +3,7 @@ import json
 from pathlib import Path
 import prov
 import rdflib
+import rdflib.compare
 from nidm.core import Constants
 from nidm.experiment import Project, Session
 
@@ -224,6 +225,26 @@ def test_project_trig_serialization():
     # print(project2.serialize(format='trig').decode('ASCII'))
 
 
+def test_to_rdflib_graph():
+    project = Project(
+        attributes={
+            Constants.NIDM_PROJECT_NAME: "FBIRN_PhaseII",
+            Constants.NIDM_PROJECT_IDENTIFIER: 9610,
+        }
+    )
+    session = Session(project)
+    session.add_attributes({Constants.NIDM["Score"]: 2.5})
+
+    parsed = rdflib.Graph().parse(data=project.serializeTurtle(), format="turtle")
+    graph = project.to_rdflib_graph()
+    assert rdflib.compare.isomorphic(graph, parsed)
+    assert dict(graph.namespaces())["nidm"] == dict(parsed.namespaces())["nidm"]
+
+    named = project.to_rdflib_graph(identifier=Constants.NIIRI["_996"])
+    assert named.identifier == rdflib.URIRef(Constants.NIIRI["_996"])
+    assert len(named) == len(graph)
+
+
 # TODO: checking
 # attributes{pm.QualifiedName(Namespace("uci", "https.../"), "mascot"): "bleble", ...}
 # (has to be "/" at the end (or #)
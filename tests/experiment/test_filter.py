@@ -0,0 +1,73 @@
+from __future__ import annotations
+from pathlib import Path
+import pytest
+from nidm.experiment import Filter, Navigate, Query
+from nidm.experiment.Filter import And, Comparison, Not, Or
+
+BRAINVOL = str(Path(__file__).with_name("data") / "read_nidm" / "brainvol_nidm.ttl")
+
+
+def test_compile_filter() -> None:
+    assert Filter.compileFilter("instruments.AGE gt 12") == Comparison(
+        "instruments", "AGE", "gt", "12"
+    )
+    assert Filter.compileFilter(
+        "instruments.AGE ge 12 and SITE_ID eq 'not a match' or not derivatives.fs_000003 lt 5"
+    ) == Or(
+        (
+            And(
+                (
+                    Comparison("instruments", "AGE", "ge", "12"),
+                    Comparison(None, "SITE_ID", "eq", "not a match"),
+                )
+            ),
+            Not(Comparison("derivatives", "fs_000003", "lt", "5")),
+        )
+    )
+    # parentheses, spaces in field names and uris in fields
+    assert Filter.compileFilter(
+        "handedness eq R and (age at scan le 21 or derivatives.http://uri.interlex.org/ilx_0102597 ne 3)"
+    ) == And(
+        (
+            Comparison(None, "handedness", "eq", "R"),
+            Or(
+                (
+                    Comparison(None, "age at scan", "le", "21"),
+                    Comparison("derivatives", "ilx_0102597", "ne", "3"),
+                )
+            ),
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "filter_str", ["", "AGE gt", "AGE 12", "(AGE gt 12", "AGE gt 12 )", "and gt 1 or"]
+)
+def test_compile_filter_errors(filter_str: str) -> None:
+    with pytest.raises(ValueError):
+        Filter.compileFilter(filter_str)
+
+
+@pytest.mark.parametrize(
+    "filter_str,expected",
+    [
+        ("instruments.age lt 30", True),
+        ("instruments.age gt 30", False),
+        ("age ge 1 and derivatives.fs_000003 gt 1000", True),
+        ("age ge 1 and not derivatives.fs_000003 gt 1000", False),
+        ("instruments.age gt 30 or fs_000003 gt 1000", True),
+        ("derivatives.Brain Segmentation Volume (mm^3) gt 1000", True),
+        ("instruments.age eq 'not a number'", False),
+        ("instruments.age ne 'not a number'", True),
+    ],
+)
+def test_filter_subjects(filter_str: str, expected: bool) -> None:
+    files = [BRAINVOL]
+    project = Navigate.getProjects(files)[0]
+    subjects = list(Navigate.getSubjects(files, project))
+    mask = Filter.FilterSubjects(files, project, subjects, filter_str)
+    assert list(mask) == [expected] * len(subjects)
+    assert (
+        Query.CheckSubjectMatchesFilter(files, project, subjects[0], filter_str)
+        == expected
+    )
@@ -0,0 +1,150 @@
+from __future__ import annotations
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+from urllib.parse import parse_qs
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+from nidm.experiment import GraphBackend, Query, TripleStore
+
+DATA_DIR = Path(__file__).with_name("data") / "read_nidm"
+QUERY = """
+    SELECT ?s ?label
+    WHERE { ?s <http://www.w3.org/2000/01/rdf-schema#label> ?label }
+"""
+
+
+class SPARQLServer(ThreadingHTTPServer):
+    """Minimal SPARQL 1.1 endpoint: POSTed RDF is added to the graph, POSTed forms are queries"""
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), SPARQLHandler)
+        self.graph = Graph()
+        self.uploads = 0
+        self.queries = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/sparql"
+
+
+class SPARQLHandler(BaseHTTPRequestHandler):
+    server: SPARQLServer
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        content_type = self.headers["Content-Type"]
+        if content_type == "application/x-www-form-urlencoded":
+            self.server.queries += 1
+            query = parse_qs(body.decode("utf-8"))["query"][0]
+            result = self.server.graph.query(query).serialize(format="json")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/sparql-results+json")
+            self.end_headers()
+            self.wfile.write(result)
+        else:
+            self.server.uploads += 1
+            self.server.graph.parse(data=body.decode("utf-8"), format="turtle")
+            self.send_response(204)
+            self.end_headers()
+
+    def log_message(self, *args) -> None:  # noqa: U100
+        pass
+
+
+@pytest.fixture
+def sparql_server() -> Iterator[SPARQLServer]:
+    server = SPARQLServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def files(tmp_path: Path) -> list[str]:
+    result = []
+    for name in ["brainvol_nidm.ttl", "nidm_w_provenance.ttl"]:
+        (tmp_path / name).write_bytes((DATA_DIR / name).read_bytes())
+        result.append(str(tmp_path / name))
+    return result
+
+
+@pytest.fixture
+def backend() -> Iterator[None]:
+    yield
+    GraphBackend.setBackend(None)
+
+
+def test_local_backends_agree(files: list[str], backend: None) -> None:  # noqa: U100
+    expected = Graph()
+    for f in files:
+        expected.parse(f, format="turtle")
+
+    for graph_backend in [GraphBackend.MemoryBackend(), GraphBackend.StoreBackend()]:
+        GraphBackend.setBackend(graph_backend)
+        assert isomorphic(Query.OpenGraph(files[0]), Graph().parse(files[0]))
+        assert isomorphic(Query.GetUnionGraph(files), expected)
+        df = Query.sparql_query_nidm(files, QUERY)
+        # subjects may be blank nodes, which differ between parses
+        assert sorted(str(v) for v in df["label"]) == sorted(
+            str(v) for _, v in expected.query(QUERY)
+        )
+
+
+def test_environment_selects_backend(
+    monkeypatch: pytest.MonkeyPatch, backend: None  # noqa: U100
+) -> None:
+    monkeypatch.delenv("BLAZEGRAPH_URL", raising=False)
+    monkeypatch.delenv("NIDM_SPARQL_ENDPOINT", raising=False)
+    assert isinstance(GraphBackend.getBackend(), GraphBackend.StoreBackend)
+    monkeypatch.setenv("NIDM_GRAPH_BACKEND", "memory")
+    assert isinstance(GraphBackend.getBackend(), GraphBackend.MemoryBackend)
+    monkeypatch.setenv("BLAZEGRAPH_URL", "http://localhost:9999/blazegraph/sparql")
+    endpoint = GraphBackend.getBackend()
+    assert isinstance(endpoint, GraphBackend.SPARQLEndpointBackend)
+    # the same configuration reuses the backend and so its HTTP session
+    assert GraphBackend.getBackend() is endpoint
+    monkeypatch.setenv("NIDM_GRAPH_BACKEND", "nope")
+    monkeypatch.delenv("BLAZEGRAPH_URL")
+    with pytest.raises(ValueError):
+        GraphBackend.getBackend()
+
+
+def test_sparql_endpoint_backend(
+    files: list[str],
+    sparql_server: SPARQLServer,
+    tmp_path: Path,
+    backend: None,  # noqa: U100
+) -> None:
+    GraphBackend.setBackend(GraphBackend.SPARQLEndpointBackend(sparql_server.url))
+
+    df = Query.sparql_query_nidm(files, QUERY)
+    assert sparql_server.uploads == 2
+    assert sparql_server.queries == 1
+    assert {(str(s), str(v)) for s, v in df.values} == {
+        (str(s), str(v)) for s, v in sparql_server.graph.query(QUERY)
+    }
+
+    # files are uploaded once per content, whatever they are called
+    copy = tmp_path / "copy.ttl"
+    copy.write_bytes(Path(files[0]).read_bytes())
+    chunks = list(Query.sparql_query_nidm_chunks([str(copy)], QUERY, chunksize=5))
+    assert sparql_server.uploads == 2
+    assert sum(len(c) for c in chunks) == len(df)
+
+
+def test_parallel_load(files: list[str]) -> None:
+    expected = Graph()
+    for f in files:
+        expected.parse(f, format="turtle")
+
+    store_paths = GraphBackend.loadStores(files, jobs=2)
+    assert all(TripleStore.is_store(p) for p in store_paths)
+
+    merged = Query.GetMergedGraph(files, jobs=2)
+    assert isomorphic(merged, expected)
+    assert dict(merged.namespaces()) == dict(expected.namespaces())
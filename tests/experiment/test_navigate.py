@@ -1,8 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from pathlib import Path
 import re
 import pytest
+from nidm.core import Constants
 from nidm.experiment import Navigate
+from nidm.experiment.Query import URITail
 from nidm.util import urlretrieve
 
 
@@ -115,3 +118,56 @@ def test_navigate_get_sub_uuid_from_id(brain_vol: ProjectData) -> None:
     assert re.match(
         "[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", uuids[0]
     )  # check that it's a UUID
+
+
+def test_project_index(tmp_path: Path) -> None:
+    nidm_file = tmp_path / "nidm.ttl"
+    nidm_file.write_bytes(
+        (
+            Path(__file__).with_name("data") / "read_nidm" / "brainvol_nidm.ttl"
+        ).read_bytes()
+    )
+    files = (str(nidm_file),)
+
+    index = Navigate.getProjectIndex(files)
+    assert Navigate.getProjectIndex(list(files)) is index
+    assert Navigate.getProjects(files) == index.projects
+
+    project = index.projects[0]
+    sessions = Navigate.getSessions(files, project)
+    assert len(sessions) == 2
+    subjects = Navigate.getSubjects(files, project)
+    assert len(subjects) == 1
+    subject = subjects.pop()
+    sub_id = Navigate.getSubjectIDfromUUID(files, subject)
+    assert str(sub_id) == "1018959"
+    assert Navigate.getSubjectUUIDsfromID(files, sub_id) == [URITail(subject)]
+    assert len(Navigate.getActivities(files, subject)) > 0
+
+    # rewriting the file gives a fresh index for the new contents
+    nidm_file.write_text(
+        "@prefix nidm: <http://purl.org/nidash/nidm#> .\n"
+        "<http://iri.nidash.org/p1> a nidm:Project .\n",
+        encoding="utf-8",
+    )
+    assert Navigate.getProjects(files) == [Navigate.expandID("p1", Constants.NIIRI)]
+
+
+def test_get_field_values_for_project() -> None:
+    files = [str(Path(__file__).with_name("data") / "read_nidm" / "brainvol_nidm.ttl")]
+    project = Navigate.getProjects(files)[0]
+    values = Navigate.GetFieldValuesForProject(
+        files, URITail(project), ["age", "gender"]
+    )
+    assert set(values["sourceVariable"]) == {"age", "gender"}
+    subject = Navigate.getSubjects(files, project).pop()
+    assert set(values["subject"]) == {URITail(subject)}
+
+    # same values as walking the activities one subject at a time
+    expected = set()
+    for activity in Navigate.getActivities(files, subject):
+        for data in Navigate.getActivityData(files, activity).data:
+            if data.sourceVariable in ("age", "gender"):
+                expected.add((data.value, data.sourceVariable))
+    assert set(zip(values["value"], values["sourceVariable"])) == expected
+    assert len(Navigate.valueTypesFromFrame(values)) == len(values)
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from pathlib import Path
 import tempfile
 from typing import Optional
+import pandas as pd
 import prov.model as pm
 import pytest
 from nidm.core import Constants
@@ -10,6 +11,7 @@ from nidm.experiment import (
     Acquisition,
     AssessmentAcquisition,
     AssessmentObject,
+    Cache,
     Project,
     Query,
     Session,
@@ -425,3 +427,178 @@ def test_sparql_query_nidm_merges_files_for_cross_file_join(tmp_path: Path) -> N
     assert len(df) == 1
     assert str(df.iloc[0]["label"]) == "Test Volume"
     assert float(df.iloc[0]["value"]) == 4235.0
+
+
+def test_GetUnionGraph_is_cached(tmp_path: Path) -> None:
+    first = tmp_path / "first.ttl"
+    second = tmp_path / "second.ttl"
+    first.write_text(
+        '<http://example.org/a> <http://example.org/p> "1" .\n', encoding="utf-8"
+    )
+    second.write_text(
+        '<http://example.org/b> <http://example.org/p> "2" .\n', encoding="utf-8"
+    )
+    files = [str(first), str(second)]
+
+    union = Query.GetUnionGraph(files)
+    assert len(union) == 2
+    # the same file list reuses the union instead of copying triples again
+    assert Query.GetUnionGraph(files) is union
+
+    # changing one of the files invalidates the cached union
+    with open(second, "a", encoding="utf-8") as fp:
+        fp.write('<http://example.org/c> <http://example.org/p> "3" .\n')
+    assert len(Query.GetUnionGraph(files)) == 3
+
+
+def test_sparql_query_nidm_chunks(tmp_path: Path) -> None:
+    nidm_file = tmp_path / "test.ttl"
+    nidm_file.write_text(
+        "".join(
+            f'<http://example.org/s{i}> <http://example.org/p> "{i}" .\n'
+            for i in range(25)
+        ),
+        encoding="utf-8",
+    )
+    files = [str(nidm_file)]
+    query = "SELECT ?s ?v WHERE { ?s <http://example.org/p> ?v } ORDER BY ?s"
+
+    df = Query.sparql_query_nidm(files, query)
+    chunks = list(Query.sparql_query_nidm_chunks(files, query, chunksize=10))
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert pd.concat(chunks).equals(df)
+    assert [str(row.v) for row in Query.sparql_query_nidm_rows(files, query)] == [
+        str(v) for v in df["v"]
+    ]
+
+    # streamed output files match the collected results
+    df.to_csv(tmp_path / "expected.csv")
+    rows = Query.sparql_query_nidm(
+        files, query, str(tmp_path / "streamed.csv"), chunksize=10
+    )
+    assert rows == 25
+    assert (tmp_path / "streamed.csv").read_text() == (
+        tmp_path / "expected.csv"
+    ).read_text()
+    Query.sparql_query_nidm(files, query, str(tmp_path / "out.parquet"), chunksize=10)
+    assert pd.read_parquet(tmp_path / "out.parquet").equals(df.astype(str))
+
+    empty = list(
+        Query.sparql_query_nidm_chunks(
+            files, "SELECT ?s WHERE { ?s <http://example.org/none> ?v }"
+        )
+    )
+    assert len(empty) == 1
+    assert list(empty[0].columns) == ["s"]
+    assert empty[0].empty
+
+
+def test_getDataTypeInfo_table() -> None:
+    brainvol = str(Path(__file__).with_name("data") / "read_nidm" / "brainvol_nidm.ttl")
+    rdf_graph = Query.OpenGraph(brainvol)
+    age = Query.getDataTypeInfo(rdf_graph, "age_1nif2oc")
+    assert str(age["source_variable"]) == "age"
+    assert str(age["isAbout"]) == "http://uri.interlex.org/ilx_0100400"
+    assert age["dataElementURI"] == Constants.NIIRI["age_1nif2oc"]
+    assert age["prefix"] == "niiri"
+    # the table is shared by every graph holding the same content
+    reopened = Query.GetUnionGraph([brainvol])
+    assert Query.getDataTypeInfo(reopened, Constants.NIIRI["age_1nif2oc"]) is age
+
+    # DataElements not defined in the graph come from the CDEs
+    fs = Query.getDataTypeInfo(rdf_graph, Constants.FREESURFER["fs_000003"])
+    assert fs == Query.getDataTypeInfo(None, Constants.FREESURFER["fs_000003"])
+    assert fs["prefix"] == "fs"
+    assert Query.getDataTypeInfo(rdf_graph, "no-real-value") is False
+
+
+def test_prefix_trie() -> None:
+    trie = Query.PrefixTrie(
+        [
+            ("ex", "http://example.org/"),
+            ("exa", "http://example.org/a/"),
+            ("again", "http://example.org/"),
+        ]
+    )
+    # the first bound namespace a URI starts with wins, as when scanning them in order
+    assert trie.prefix("http://example.org/a/b") == "ex"
+    assert trie.prefix("http://example.org/") == "ex"
+    assert trie.prefix("http://example.com/a") == ""
+    assert (
+        Query.PrefixTrie([("exa", "http://example.org/a/")]).prefix(
+            "http://example.org/a/b"
+        )
+        == "exa"
+    )
+
+
+def test_synonym_index() -> None:
+    index = Query.SynonymIndex(
+        {
+            "uuid": ["age_1", "sex_2"],
+            "label": ["age", "sex"],
+            "data_type_info": [
+                {
+                    "source_variable": "AGE_AT_SCAN",
+                    "label": "age",
+                    "datumType": "ilx_0738276",
+                    "measureOf": "http://uri.interlex.org/ilx_0112052",
+                    "isAbout": "http://uri.interlex.org/ilx_0100400",
+                    "dataElement": "age_1",
+                    "dataElementURI": Constants.NIIRI["age_1"],
+                    "prefix": "niiri",
+                },
+                False,
+                {
+                    "source_variable": "SEX",
+                    "label": "sex",
+                    "datumType": "",
+                    "measureOf": "",
+                    "isAbout": "",
+                    "dataElement": "sex_2",
+                    "dataElementURI": Constants.NIIRI["sex_2"],
+                    "prefix": "niiri",
+                },
+            ],
+        }
+    )
+    age = index.synonyms("ilx_0100400")
+    assert {"AGE_AT_SCAN", "age", "age_1", str(Constants.NIIRI["age_1"])} <= age
+    assert "" not in age and "sex" not in age
+    # substrings of any field match, shorter than a trigram too
+    assert index.synonyms("AT_SC") == age - {"ilx_0100400"} | {"AT_SC"}
+    assert index.synonyms("EX") == {
+        "EX",
+        "SEX",
+        "sex",
+        "sex_2",
+        str(Constants.NIIRI["sex_2"]),
+    }
+    assert "age" in index.synonyms("ni") and "sex" in index.synonyms("ni")
+    assert index.synonyms("weight") == {"weight"}
+
+
+def test_GetDatatypeSynonyms_index_is_cached(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    brainvol = tmp_path / "brainvol_nidm.ttl"
+    brainvol.write_bytes(
+        (
+            Path(__file__).with_name("data") / "read_nidm" / "brainvol_nidm.ttl"
+        ).read_bytes()
+    )
+    files = (str(brainvol),)
+    project = str(nidm.experiment.Navigate.getProjects(files)[0])
+
+    data_elements = Query.GetProjectDataElements(files, project)
+    assert "age_1nif2oc" in data_elements["uuid"]
+    synonyms = Query.GetDatatypeSynonyms(files, project, "instruments.age_1nif2oc")
+    assert {"age", "age_1nif2oc", "http://uri.interlex.org/ilx_0100400"} <= synonyms
+    assert Cache.lookupCounts()["synonym_index"] == (0, 1)
+
+    # a later run loads the index from the cache
+    Query.getSynonymIndex.cache_clear()
+    assert Query.GetProjectDataElements(files, project) == data_elements
+    assert Cache.lookupCounts()["synonym_index"] == (1, 1)
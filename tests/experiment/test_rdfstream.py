@@ -0,0 +1,122 @@
+from __future__ import annotations
+from pathlib import Path
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import XSD
+from nidm.experiment import GraphBackend, Query, RDFStream
+
+DATA_DIR = Path(__file__).with_name("data") / "read_nidm"
+EX = "http://example.org/"
+
+
+@pytest.fixture
+def graph() -> Graph:
+    g = Graph()
+    g.parse(DATA_DIR / "brainvol_nidm.ttl", format="turtle")
+    g.add(
+        (URIRef(EX + "a"), URIRef(EX + "p"), Literal('multi\nline "q" \\', lang="en"))
+    )
+    g.add((BNode(), URIRef(EX + "p.q"), Literal("1.50", datatype=XSD.decimal)))
+    return g
+
+
+@pytest.mark.parametrize("output_format", RDFStream.OUTPUT_FORMATS)
+@pytest.mark.parametrize("compress", [False, True])
+def test_write_and_parse(
+    graph: Graph, tmp_path: Path, output_format: str, compress: bool
+) -> None:
+    out = RDFStream.writeGraph(
+        graph,
+        RDFStream.outputFilename(str(tmp_path / "nidm"), output_format, compress),
+        output_format,
+        compress,
+    )
+    assert out.endswith(".gz") == compress == RDFStream.isCompressed(out)
+    assert isomorphic(RDFStream.parseFile(out), graph)
+
+
+def test_ttl_stream_uses_prefixes(graph: Graph, tmp_path: Path) -> None:
+    out = RDFStream.writeGraph(graph, str(tmp_path / "nidm.ttl"), "ttl-stream")
+    text = Path(out).read_text(encoding="utf-8")
+    assert "@prefix nidm: <http://purl.org/nidash/nidm#> ." in text
+    assert "nidm:Project" in text
+    assert "<http://purl.org/nidash/nidm#Project>" not in text
+    # local names Turtle can't always read back stay full IRIs
+    assert f"<{EX}p.q>" in text
+
+
+def test_write_graphs(graph: Graph, tmp_path: Path) -> None:
+    other = Graph()
+    other.add((URIRef(EX + "b"), URIRef(EX + "p"), Literal(1)))
+    other += list(graph)[:10]
+    out = RDFStream.writeGraphs([graph, other], str(tmp_path / "nidm.nt"), "nt")
+    lines = Path(out).read_text(encoding="utf-8").splitlines()
+    # triples already written for an earlier graph aren't repeated
+    assert len(lines) == len(graph) + 1
+    assert isomorphic(RDFStream.parseFile(out), graph + other)
+
+
+def test_named_graphs(graph: Graph, tmp_path: Path) -> None:
+    triples = list(graph)
+    with RDFStream.TripleWriter(str(tmp_path / "nidm.nq"), "nq") as writer:
+        writer.write(triples[:10], context="file:///first.ttl")
+        writer.write(triples[10:])
+    assert writer.count == len(graph)
+    assert isomorphic(RDFStream.parseFile(str(tmp_path / "nidm.nq")), graph)
+
+    with pytest.raises(ValueError):
+        RDFStream.TripleWriter(str(tmp_path / "nidm.ttl"), "turtle")
+
+
+def test_unique_writer(graph: Graph, tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(RDFStream, "DEDUP_BATCH_SIZE", 7)
+    triples = list(graph)
+    out = str(tmp_path / "nidm.nq")
+    with RDFStream.TripleWriter(out, "nq", unique=True) as writer:
+        writer.write(triples[:20] + triples)
+        writer.write(triples[:10], context="file:///first.ttl")
+        writer.write(triples[:10], context="file:///first.ttl")
+    # triples are written once per named graph
+    assert writer.count == len(graph) + 10
+    assert writer.duplicates == 30
+    assert len(Path(out).read_text(encoding="utf-8").splitlines()) == writer.count
+    assert isomorphic(RDFStream.parseFile(out), graph)
+
+
+def test_relabel_blank_nodes_cold_and_warm(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    nidm_file = tmp_path / "nidm.ttl"
+    nidm_file.write_bytes((DATA_DIR / "nidm_w_provenance.ttl").read_bytes())
+    # parsed from the file, then read from its store
+    cold = GraphBackend.parseGraph(str(nidm_file))
+    GraphBackend.loadStores([str(nidm_file)])
+    warm = GraphBackend.parseGraph(str(nidm_file))
+
+    out = str(tmp_path / "nidm.nt")
+    with RDFStream.TripleWriter(out, "nt", unique=True) as writer:
+        for i, rdf_graph in enumerate([cold, warm]):
+            writer.write(RDFStream.relabelBlankNodes(rdf_graph, f"f{i}"))
+    text = Path(out).read_text(encoding="utf-8")
+    assert "_:f0b0 " in text and "_:f1b0 " in text
+    written = RDFStream.parseFile(out)
+    # the blank nodes of the two reads are kept apart, not linked to each other
+    expected = Graph()
+    for _ in range(2):
+        expected.parse(nidm_file, format="turtle")
+    assert len(written) == len(expected)
+    assert isomorphic(written, expected)
+
+
+def test_query_compressed_files(graph: Graph, tmp_path: Path) -> None:
+    out = RDFStream.writeGraph(graph, str(tmp_path / "nidm.nt.gz"), "nt", True)
+    assert RDFStream.guessFormat(out) == "nt"
+    for graph_backend in [GraphBackend.MemoryBackend(), GraphBackend.StoreBackend()]:
+        GraphBackend.setBackend(graph_backend)
+        try:
+            assert isomorphic(Query.OpenGraph(out), graph)
+        finally:
+            GraphBackend.setBackend(None)
@@ -1,6 +1,6 @@
 from pathlib import Path
 import pytest
-from rdflib import Graph, URIRef
+from rdflib import RDF, Graph, URIRef
 from nidm.core import Constants
 from nidm.experiment.Utils import read_nidm
 
@@ -82,3 +82,119 @@ def test_read_nidm_fixtures_exist():
     """
     missing = [str(path) for path in FIXTURES if not path.exists()]
     assert not missing, "Missing read_nidm regression fixture(s): " + ", ".join(missing)
+
+
+@pytest.mark.parametrize("nidm_ttl", FIXTURES, ids=lambda p: p.name)
+def test_read_nidm_to_rdflib_graph(nidm_ttl: Path):
+    project = read_nidm(str(nidm_ttl))
+    assert _load_graph(nidm_ttl).isomorphic(project.to_rdflib_graph())
+
+    # changes made after reading are applied to the graph that was read
+    project.add_attributes({Constants.NIDM["Note"]: "changed"})
+    graph = project.to_rdflib_graph()
+    assert (None, URIRef(Constants.NIDM["Note"]), None) in graph
+    assert graph.isomorphic(
+        Graph().parse(data=project.serializeTurtle(), format="turtle")
+    )
+
+
+def test_read_nidm_builds_objects_of_typed_subjects():
+    nidm_ttl = FIXTURES[0]
+    g = _load_graph(nidm_ttl)
+    project = read_nidm(str(nidm_ttl))
+
+    sessions = set(g.subjects(RDF.type, URIRef(Constants.NIDM_SESSION.uri)))
+    assert {str(s.identifier.uri) for s in project.get_sessions()} == {
+        str(s) for s in sessions
+    }
+    data_elements = {
+        str(row.uuid)
+        for row in g.query(
+            """
+            prefix nidm: <http://purl.org/nidash/nidm#>
+            prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            select distinct ?uuid where { ?uuid a/rdfs:subClassOf* nidm:DataElement . }
+            """
+        )
+    }
+    assert data_elements
+    assert {
+        str(de.identifier.uri) for de in project.get_dataelements()
+    } == data_elements
+
+
+def test_read_nidm_original_text_read_when_serializing(tmp_path: Path):
+    nidm_ttl = tmp_path / "nidm.ttl"
+    text = FIXTURES[2].read_text(encoding="utf-8")
+    nidm_ttl.write_text(text, encoding="utf-8")
+    project = read_nidm(str(nidm_ttl))
+    assert project.graph.serialize(None, format="rdf", rdf_format="ttl") == text
+
+    # the file changed since it was read, so the graph that was read is serialized
+    nidm_ttl.write_text(text + "\n# changed\n", encoding="utf-8")
+    ttl = project.graph.serialize(None, format="rdf", rdf_format="ttl")
+    assert "# changed" not in ttl
+    assert Graph().parse(data=ttl, format="turtle").isomorphic(_load_graph(FIXTURES[2]))
+
+
+def _acquisition_tree(project):
+    return {
+        str(session.identifier.uri): sorted(
+            (
+                type(acquisition).__name__,
+                str(acquisition.identifier.uri),
+                sorted(
+                    str(obj.identifier.uri)
+                    for obj in acquisition.get_acquisition_objects()
+                ),
+            )
+            for acquisition in session.get_acquisitions()
+        )
+        for session in project.get_sessions()
+    }
+
+
+@pytest.mark.parametrize("nidm_ttl", FIXTURES, ids=lambda p: p.name)
+def test_read_nidm_lazy_reads_parts_when_needed(
+    nidm_ttl: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    project = read_nidm(str(nidm_ttl))
+    lazy = read_nidm(str(nidm_ttl), lazy=True)
+
+    # only the project and its sessions are read up front
+    assert len(lazy.graph.get_records()) == 1 + len(lazy.get_sessions())
+    assert _acquisition_tree(lazy) == _acquisition_tree(project)
+    assert {str(de.identifier.uri) for de in lazy.get_dataelements()} == {
+        str(de.identifier.uri) for de in project.get_dataelements()
+    }
+    assert len(lazy.get_derivatives()) == len(project.get_derivatives())
+    # reading objects on demand doesn't change the document
+    assert lazy.graph.serialize(
+        None, format="rdf", rdf_format="ttl"
+    ) == nidm_ttl.read_text(encoding="utf-8")
+
+
+def test_read_nidm_lazy_serializes_changes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+    nidm_ttl = FIXTURES[0]
+    graphs = []
+    for lazy in (False, True):
+        project = read_nidm(str(nidm_ttl), lazy=lazy)
+        session = project.get_sessions()[0]
+        acquisition = session.get_acquisitions()[0]
+        acquisition.get_acquisition_objects()[0].add_attributes(
+            {Constants.NIDM["Note"]: "checked"}
+        )
+        graphs.append(
+            Graph().parse(
+                data=project.graph.serialize(None, format="rdf", rdf_format="ttl"),
+                format="turtle",
+            )
+        )
+    assert (None, URIRef(Constants.NIDM["Note"]), None) in graphs[1]
+    assert graphs[0].isomorphic(graphs[1])
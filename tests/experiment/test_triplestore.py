@@ -0,0 +1,91 @@
+from __future__ import annotations
+from pathlib import Path
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import XSD
+from nidm.experiment import GraphBackend, Query, TripleStore
+
+DATA_DIR = Path(__file__).with_name("data") / "read_nidm"
+
+
+@pytest.fixture
+def graph() -> Graph:
+    g = Graph()
+    g.parse(DATA_DIR / "brainvol_nidm.ttl", format="turtle")
+    g.add(
+        (
+            URIRef("http://example.org/a"),
+            URIRef("http://example.org/p"),
+            Literal('multi\nline "quoted"', lang="en"),
+        )
+    )
+    g.add(
+        (BNode(), URIRef("http://example.org/p"), Literal("12", datatype=XSD.integer))
+    )
+    return g
+
+
+def test_store_roundtrip(graph: Graph, tmp_path: Path) -> None:
+    store_path = TripleStore.write_store(graph, str(tmp_path / "graph.store"))
+    assert TripleStore.is_store(store_path)
+
+    stored = TripleStore.open_graph(store_path)
+    assert len(stored) == len(graph)
+    assert set(stored) == set(graph)
+    assert dict(stored.namespaces())["nidm"] == URIRef("http://purl.org/nidash/nidm#")
+
+    for s, p, o in list(graph)[:100]:
+        for pattern in [
+            (s, None, None),
+            (None, p, None),
+            (None, None, o),
+            (s, p, None),
+            (None, p, o),
+            (s, None, o),
+            (s, p, o),
+        ]:
+            assert set(stored.triples(pattern)) == set(graph.triples(pattern))
+
+    assert not list(stored.triples((URIRef("http://example.org/missing"), None, None)))
+
+    query = """
+        SELECT ?s ?label
+        WHERE { ?s <http://www.w3.org/2000/01/rdf-schema#label> ?label }
+    """
+    assert set(stored.query(query)) == set(graph.query(query))
+
+
+def test_store_is_read_only(graph: Graph, tmp_path: Path) -> None:
+    store_path = TripleStore.write_store(graph, str(tmp_path / "graph.store"))
+    stored = TripleStore.open_graph(store_path)
+    with pytest.raises(TypeError):
+        stored.add((URIRef("urn:a"), URIRef("urn:b"), URIRef("urn:c")))
+
+    # but it can still be copied into a regular graph
+    copy = Graph()
+    copy += stored
+    assert len(copy) == len(graph)
+
+
+def test_merge_stores(graph: Graph, tmp_path: Path) -> None:
+    other = Graph()
+    other.parse(DATA_DIR / "derivatives_nidm.ttl", format="turtle")
+    first = TripleStore.write_store(graph, str(tmp_path / "first.store"))
+    second = TripleStore.write_store(other, str(tmp_path / "second.store"))
+
+    merged = TripleStore.merge_stores(
+        [first, second, first], str(tmp_path / "merged.store")
+    )
+    assert set(TripleStore.open_graph(merged)) == set(graph) | set(other)
+
+
+def test_OpenGraph_uses_store(tmp_path: Path) -> None:
+    nidm_file = tmp_path / "test.ttl"
+    nidm_file.write_bytes((DATA_DIR / "nidm_w_provenance.ttl").read_bytes())
+
+    parsed = Query.OpenGraph(str(nidm_file))
+    GraphBackend._openStoreGraph.cache_clear()
+    reopened = Query.OpenGraph(str(nidm_file))
+
+    assert isinstance(reopened.store, TripleStore.BinaryTripleStore)
+    assert set(reopened) == set(parsed)
@@ -8,11 +8,16 @@ entirely from a synthetic BIDS directory built in a pytest tmp_path.
 
 from __future__ import annotations
 import argparse
+import hashlib
 from io import StringIO
 import json
+import os
 from pathlib import Path
+import pytest
 from rdflib import Graph
 from rdflib.namespace import Namespace
+from nidm.experiment import Cache
+from nidm.experiment.tools import bidsmri2nidm
 from nidm.experiment.tools.bidsmri2nidm import bidsmri2project
 
 # ---------------------------------------------------------------------------
@@ -240,3 +245,74 @@ class TestPhenotypeTsvWhitespaceStripping:
         assert (
             'nidm:sourceVariable "iq_score "' not in ttl
         ), "Spaced phenotype column name should not appear in the NIDM output."
+
+
+# ---------------------------------------------------------------------------
+# getsha512
+# ---------------------------------------------------------------------------
+
+
+class TestGetSha512:
+    @pytest.fixture(autouse=True)
+    def cache_dir(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+        monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+        # several blocks per file
+        monkeypatch.setattr(bidsmri2nidm, "HASH_BLOCK_SIZE", 1000)
+        monkeypatch.setattr(bidsmri2nidm, "_digests", {})
+        monkeypatch.setattr(bidsmri2nidm, "_hash_pools", {})
+        return tmp_path / "cache"
+
+    def test_digests(self, tmp_path: Path) -> None:
+        files = []
+        for size in [0, 10, 1000, 4321]:
+            f = tmp_path / f"file{size}.nii.gz"
+            f.write_bytes(os.urandom(size))
+            files.append(str(f))
+        bidsmri2nidm.prefetchDigests(files + [str(tmp_path / "missing")])
+        for f in files:
+            expected = hashlib.sha512(Path(f).read_bytes()).hexdigest()
+            assert bidsmri2nidm.getsha512(f) == expected
+            assert Cache.lookupDigest(f, algorithm="sha512") == expected
+        with pytest.raises(OSError):
+            bidsmri2nidm.getsha512(str(tmp_path / "missing"))
+        # finished digests aren't kept in memory
+        bidsmri2nidm._hash_pools.pop(os.getpid()).shutdown(wait=True)
+        assert bidsmri2nidm._digests == {}
+        # and are looked up in the cache
+        assert bidsmri2nidm.getsha512(files[-1]) == expected
+
+    def test_cached_digest(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        f = tmp_path / "scan.nii.gz"
+        f.write_bytes(b"scan")
+        digest = bidsmri2nidm.getsha512(str(f))
+
+        # recorded digests are used while the file is unchanged, in later runs too
+        Cache.storeDigest(str(f), "0" * 128, algorithm="sha512")
+        monkeypatch.setattr(bidsmri2nidm, "_digests", {})
+        assert bidsmri2nidm.getsha512(str(f)) == "0" * 128
+
+        with open(f, "ab") as fp:
+            fp.write(b"\n")
+        assert bidsmri2nidm.getsha512(str(f)) not in ("0" * 128, digest)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["-jobs", "2"], ["-jobs", "0", "-per_subject"]],
+)
+def test_main_rejects_jobs_without_parallel_mode(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    args: list[str],
+) -> None:
+    monkeypatch.setattr(
+        "sys.argv", ["bidsmri2nidm", "-d", str(tmp_path), "--no_concepts", *args]
+    )
+    with pytest.raises(SystemExit) as excinfo:
+        bidsmri2nidm.main()
+    assert excinfo.value.code == 2
+    assert "-jobs" in capsys.readouterr().err
+    assert not (tmp_path / "nidm.ttl").exists()
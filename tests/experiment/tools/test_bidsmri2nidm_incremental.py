@@ -0,0 +1,125 @@
+"""Tests for bidsmri2nidm --incremental mode."""
+
+from __future__ import annotations
+import json
+from pathlib import Path
+import subprocess
+import sys
+import pytest
+from rdflib import Graph
+
+
+def _make_minimal_bids(root: Path, subjects: list[str]) -> None:
+    (root / "dataset_description.json").write_text(
+        json.dumps({"Name": "pynidm-test-ds", "BIDSVersion": "1.0.0"})
+    )
+    (root / "participants.tsv").write_text(
+        "participant_id\n" + "".join(f"sub-{s}\n" for s in subjects)
+    )
+    for s in subjects:
+        _add_subject(root, s)
+
+
+def _add_subject(root: Path, subject: str) -> None:
+    anat = root / f"sub-{subject}" / "anat"
+    anat.mkdir(parents=True)
+    (anat / f"sub-{subject}_T1w.nii.gz").write_bytes(subject.encode())
+
+
+def _run_bidsmri2nidm(args: list[str]) -> subprocess.CompletedProcess:
+    result = subprocess.run(
+        [sys.executable, "-m", "nidm.experiment.tools.bidsmri2nidm", *args],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, f"bidsmri2nidm failed:\n{result.stderr}"
+    return result
+
+
+@pytest.fixture
+def minimal_bids(tmp_path: Path) -> Path:
+    bids = tmp_path / "bids"
+    bids.mkdir()
+    _make_minimal_bids(bids, ["01", "02", "03"])
+    return bids
+
+
+def _subject_ids(ttl: Path) -> set[str]:
+    g = Graph()
+    g.parse(ttl, format="turtle")
+    return {
+        str(o)
+        for o in g.objects(None, None)
+        if str(o).startswith("sub-") and "/" not in str(o)
+    }
+
+
+def test_incremental_single_file(minimal_bids: Path) -> None:
+    args = ["-d", str(minimal_bids), "--incremental", "--no_concepts"]
+    _run_bidsmri2nidm(args)
+    nidm_file = minimal_bids / "nidm.ttl"
+    manifest = json.loads(
+        (minimal_bids / ".nidm.ttl.manifest.json").read_text(encoding="utf-8")
+    )
+    assert sorted(manifest["subjects"]) == ["01", "02", "03"]
+    assert _subject_ids(nidm_file) == {"sub-01", "sub-02", "sub-03"}
+
+    fragments = minimal_bids / ".nidm.ttl.subjects"
+    written = {f.name: f.stat().st_mtime_ns for f in fragments.iterdir()}
+    result = _run_bidsmri2nidm(args)
+    assert "is up to date" in result.stdout
+
+    # a changed subject is converted again, the others are left alone
+    (minimal_bids / "sub-02" / "anat" / "sub-02_T1w.nii.gz").write_bytes(b"changed")
+    _add_subject(minimal_bids, "04")
+    _run_bidsmri2nidm(args)
+    rewritten = {
+        f.name
+        for f in fragments.iterdir()
+        if f.stat().st_mtime_ns != written.get(f.name)
+    }
+    assert rewritten == {"sub-02.ttl", "sub-04.ttl"}
+    # sub-04 isn't in participants.tsv, its scan is still part of the dataset
+    g = Graph()
+    g.parse(nidm_file, format="turtle")
+    assert any("sub-04_T1w.nii.gz" in str(o) for o in g.objects())
+
+    # all subjects of an unchanged dataset share the project of the first run
+    manifest_after = json.loads(
+        (minimal_bids / ".nidm.ttl.manifest.json").read_text(encoding="utf-8")
+    )
+    assert manifest_after["project_uuid"] == manifest["project_uuid"]
+
+
+def test_incremental_per_subject(tmp_path: Path, minimal_bids: Path) -> None:
+    out_dir = tmp_path / "out"
+    args = [
+        "-d",
+        str(minimal_bids),
+        "--per_subject",
+        "--incremental",
+        "-o",
+        str(out_dir),
+        "--no_concepts",
+    ]
+    _run_bidsmri2nidm(args)
+    written = {
+        p.parent.name: p.stat().st_mtime_ns for p in out_dir.glob("sub-*/nidm.ttl")
+    }
+    assert sorted(written) == ["sub-01", "sub-02", "sub-03"]
+
+    (minimal_bids / "sub-01" / "anat" / "sub-01_T1w.nii.gz").write_bytes(b"changed")
+    for f in (minimal_bids / "sub-03" / "anat").iterdir():
+        f.unlink()
+    (minimal_bids / "sub-03" / "anat").rmdir()
+    (minimal_bids / "sub-03").rmdir()
+    _run_bidsmri2nidm(args)
+
+    # only sub-01's scan changed, sub-03 is gone
+    assert sorted(p.parent.name for p in out_dir.glob("sub-*/nidm.ttl")) == [
+        "sub-01",
+        "sub-02",
+    ]
+    assert (out_dir / "sub-01" / "nidm.ttl").stat().st_mtime_ns != written["sub-01"]
+    assert (out_dir / "sub-02" / "nidm.ttl").stat().st_mtime_ns == written["sub-02"]
+    assert not (out_dir / "sub-03").exists()
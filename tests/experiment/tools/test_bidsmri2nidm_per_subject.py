@@ -3,10 +3,11 @@
 from __future__ import annotations
 import json
 from pathlib import Path
+import re
 import subprocess
 import sys
 import pytest
-from rdflib import RDF, Graph, Literal
+from rdflib import RDF, BNode, Graph, Literal
 from rdflib.namespace import Namespace
 
 NIDM = Namespace("http://purl.org/nidash/nidm#")
@@ -289,3 +290,76 @@ def test_per_subject_demographics_with_zero_stripped_participant_ids(
     assert (
         "20" in literals
     ), "demographic age value not written for zero-stripped participant_id"
+
+
+def test_per_subject_jobs_match_serial_output(
+    tmp_path: Path, minimal_bids: Path
+) -> None:
+    """--jobs converts subjects in worker processes; the files must hold the
+    same triples as a serial run, apart from the UUIDs and timestamps of each run."""
+
+    def normalized(ttl: Path) -> list:
+        g = Graph()
+        g.parse(ttl, format="turtle")
+        uuid = re.compile(r"[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}")
+        timestamp = re.compile(r"\d{4}-\d\d-\d\dT[\d:.+-]+")
+        return sorted(
+            tuple(
+                "_" if isinstance(t, BNode) else timestamp.sub("T", uuid.sub("U", t))
+                for t in triple
+            )
+            for triple in g
+        )
+
+    outputs = {}
+    for jobs in ("1", "2"):
+        out_dir = tmp_path / f"jobs{jobs}"
+        result = _run_bidsmri2nidm(
+            [
+                "-d",
+                str(minimal_bids),
+                "--per_subject",
+                "-o",
+                str(out_dir),
+                "--no_concepts",
+                "--jobs",
+                jobs,
+            ]
+        )
+        assert result.returncode == 0, f"bidsmri2nidm failed:\n{result.stderr}"
+        outputs[jobs] = {
+            p.relative_to(out_dir).as_posix(): normalized(p)
+            for p in out_dir.glob("sub-*/nidm.ttl")
+        }
+
+    assert sorted(outputs["2"]) == [
+        "sub-01/nidm.ttl",
+        "sub-02/nidm.ttl",
+        "sub-03/nidm.ttl",
+    ]
+    assert outputs["1"] == outputs["2"]
+
+
+def test_per_subject_reports_failed_subjects(
+    tmp_path: Path, minimal_bids: Path
+) -> None:
+    out_dir = tmp_path / "nidm_out"
+    # a directory where sub-02's file should go makes that subject fail
+    (out_dir / "sub-02" / "nidm.ttl").mkdir(parents=True)
+
+    result = _run_bidsmri2nidm(
+        [
+            "-d",
+            str(minimal_bids),
+            "--per_subject",
+            "-o",
+            str(out_dir),
+            "--no_concepts",
+            "--jobs",
+            "2",
+        ]
+    )
+    assert result.returncode != 0
+    assert "1 of 3 subjects failed: 02" in result.stdout
+    for sid in ("01", "03"):
+        assert (out_dir / f"sub-{sid}" / "nidm.ttl").is_file()
@@ -0,0 +1,300 @@
+"""Tests for csv2nidm adding CSV data to an existing NIDM file."""
+
+from __future__ import annotations
+import json
+from pathlib import Path
+import subprocess
+import sys
+import pytest
+from rdflib import RDF, BNode, Graph, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import Namespace
+from nidm.experiment import Query
+from nidm.experiment.tools import csv2nidm
+
+NIDM = Namespace("http://purl.org/nidash/nidm#")
+NIIRI = "http://iri.nidash.org/"
+PROV = Namespace("http://www.w3.org/ns/prov#")
+
+SUBJECT_ID_URL = "https://ndar.nih.gov/api/datadictionary/v2/dataelement/src_subject_id"
+
+
+def _make_bids(root: Path, subjects: list[str]) -> None:
+    """BIDS dataset with two sessions of two rest runs for every subject."""
+    (root / "dataset_description.json").write_text(
+        json.dumps({"Name": "pynidm-test-ds", "BIDSVersion": "1.6.0"})
+    )
+    (root / "task-rest_bold.json").write_text(
+        json.dumps({"TaskName": "rest", "RepetitionTime": 2})
+    )
+    (root / "participants.tsv").write_text(
+        "participant_id\n" + "".join(f"sub-{s}\n" for s in subjects)
+    )
+    for s in subjects:
+        for ses in ("1", "2"):
+            func = root / f"sub-{s}" / f"ses-{ses}" / "func"
+            func.mkdir(parents=True)
+            for run in ("1", "2"):
+                name = f"sub-{s}_ses-{ses}_task-rest_run-{run}_bold.nii.gz"
+                (func / name).write_bytes(name.encode())
+
+
+def _data_dictionary(csv_file: Path, variables: dict[str, str]) -> Path:
+    """JSON data dictionary of csv_file with participant_id as the subject ID."""
+    source = csv_file.name
+    dd = {
+        f"DD(source='{source}', variable='participant_id')": {
+            "label": "participant_id",
+            "description": "subject id",
+            "source_variable": "participant_id",
+            "responseOptions": {"valueType": "http://www.w3.org/2001/XMLSchema#string"},
+            "isAbout": [{"@id": SUBJECT_ID_URL, "label": "src_subject_id"}],
+        }
+    }
+    for variable, value_type in variables.items():
+        dd[f"DD(source='{source}', variable='{variable}')"] = {
+            "label": variable,
+            "description": variable,
+            "source_variable": variable,
+            "responseOptions": {
+                "valueType": f"http://www.w3.org/2001/XMLSchema#{value_type}"
+            },
+        }
+    json_map = csv_file.with_suffix(".json")
+    json_map.write_text(json.dumps(dd))
+    return json_map
+
+
+def _run(module: str, args: list[str]) -> None:
+    result = subprocess.run(
+        [sys.executable, "-m", f"nidm.experiment.tools.{module}", *args],
+        capture_output=True,
+        text=True,
+        stdin=subprocess.DEVNULL,
+    )
+    assert result.returncode == 0, f"{module} failed:\n{result.stderr}"
+
+
+def _comparable(nidm_file: Path) -> Graph:
+    """
+    Graph of nidm_file with its niiri UUIDs replaced by blank nodes and the times of
+    its activities left out, so files written by different runs can be compared.
+    """
+    nodes: dict[URIRef, BNode] = {}
+
+    def anonymous(node):
+        if isinstance(node, URIRef) and node.startswith(NIIRI):
+            return nodes.setdefault(node, BNode())
+        return node
+
+    g = Graph()
+    for s, p, o in Graph().parse(nidm_file, format="turtle"):
+        if p not in (PROV["startedAtTime"], PROV["endedAtTime"]):
+            g.add((anonymous(s), p, anonymous(o)))
+    return g
+
+
+def _software(tmp_path: Path) -> Path:
+    software = tmp_path / "software.csv"
+    software.write_text(
+        "title,description,version,url,cmdline,platform,ID\n"
+        "fsl,FSL tools,6.0,http://fsl.org/,fast,linux,http://uri.interlex.org/ilx_1\n"
+    )
+    return software
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # the tools run in subprocesses, which inherit the environment
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("NIDM_CACHE_SIZE", raising=False)
+
+
+@pytest.fixture
+def nidm_file(tmp_path: Path) -> Path:
+    bids = tmp_path / "bids"
+    bids.mkdir()
+    _make_bids(bids, ["01", "02", "03"])
+    nidm = tmp_path / "nidm.ttl"
+    _run("bidsmri2nidm", ["-d", str(bids), "-o", str(nidm), "--no_concepts"])
+    return nidm
+
+
+def _values(g: Graph, entity, variable: str) -> list[str]:
+    predicates = {
+        p for p in g.subjects(NIDM["sourceVariable"], None) if variable in str(p)
+    }
+    return [str(o) for p, o in g.predicate_objects(entity) if p in predicates]
+
+
+@pytest.mark.parametrize("extra_args", [[], ["-chunksize", "1"]])
+def test_csv2nidm_adds_assessments_of_known_subjects(
+    tmp_path: Path, nidm_file: Path, extra_args: list[str]
+) -> None:
+    csv_file = tmp_path / "iq.csv"
+    csv_file.write_text("participant_id,iq\nsub-01,101\nsub-99,99\nsub-03,103\n")
+    json_map = _data_dictionary(csv_file, {"iq": "integer"})
+    _run(
+        "csv2nidm",
+        [
+            "-csv",
+            str(csv_file),
+            "-json_map",
+            str(json_map),
+            "-no_concepts",
+            "-nidm",
+            str(nidm_file),
+            *extra_args,
+        ],
+    )
+
+    # -chunksize writes ttl-stream, which is still Turtle
+    g = Graph()
+    g.parse(nidm_file, format="turtle")
+    query = """
+        prefix prov: <http://www.w3.org/ns/prov#>
+        prefix nidm: <http://purl.org/nidash/nidm#>
+        prefix ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/>
+        prefix nfo: <http://www.semanticdesktop.org/ontologies/2007/03/22/nfo#>
+        select ?entity ?id where {
+            ?entity a nidm:AcquisitionObject ;
+                nfo:filename ?filename ;
+                prov:wasGeneratedBy ?acq .
+            ?acq prov:qualifiedAssociation [prov:agent [ndar:src_subject_id ?id]] .
+            FILTER (str(?filename) = "iq.csv")
+        }
+    """
+    iq = {str(row.id): _values(g, row.entity, "iq") for row in g.query(query)}
+    # sub-99 isn't in the NIDM file
+    assert iq == {"sub-01": ["101"], "sub-03": ["103"]}
+
+
+def test_csv2nidm_derivatives_link_to_matching_acquisition(
+    tmp_path: Path, nidm_file: Path
+) -> None:
+    csv_file = tmp_path / "volumes.csv"
+    csv_file.write_text(
+        "participant_id,ses,task,run,source_url,volume\n"
+        "sub-01,1,rest,2,http://example.org/a,1.5\n"
+        # pandas reads ses as floats because of the empty cell
+        "sub-02,2,rest,,http://example.org/b,2.5\n"
+        "sub-03,,rest,1,http://example.org/c,3.5\n"
+        "sub-03,1,rest,7,http://example.org/d,4.5\n"
+    )
+    json_map = _data_dictionary(csv_file, {"volume": "float"})
+    software = _software(tmp_path)
+    _run(
+        "csv2nidm",
+        [
+            "-csv",
+            str(csv_file),
+            "-json_map",
+            str(json_map),
+            "-no_concepts",
+            "-derivative",
+            str(software),
+            "-nidm",
+            str(nidm_file),
+        ],
+    )
+
+    g = Graph()
+    g.parse(nidm_file, format="turtle")
+    query = """
+        prefix prov: <http://www.w3.org/ns/prov#>
+        prefix nidm: <http://purl.org/nidash/nidm#>
+        prefix dct: <http://purl.org/dc/terms/>
+        prefix bids: <http://bids.neuroimaging.io/>
+        prefix ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/>
+        select ?url ?id ?session ?run where {
+            ?der_entity prov:wasGeneratedBy ?der ;
+                prov:Location ?url .
+            ?der prov:used ?acq ;
+                prov:qualifiedAssociation [prov:agent [ndar:src_subject_id ?id]] .
+            ?acq dct:isPartOf [bids:session_number ?session] .
+            ?acq_entity prov:wasGeneratedBy ?acq ;
+                nidm:AcquisitionObject ?run .
+        }
+    """
+    linked = {
+        str(row.url): (str(row.id), str(row.session), str(row.run))
+        for row in g.query(query)
+    }
+    assert linked["http://example.org/a"] == ("sub-01", "1", "2")
+    assert linked["http://example.org/b"][:2] == ("sub-02", "2")
+    assert linked["http://example.org/c"][::2] == ("sub-03", "1")
+    # there is no run 7
+    assert "http://example.org/d" not in linked
+    assert len(list(g.subjects(RDF.type, NIDM["DerivativeCollection"]))) == 3
+
+
+@pytest.mark.parametrize("derivative", [False, True])
+def test_csv2nidm_chunksize_new_file(tmp_path: Path, derivative: bool) -> None:
+    csv_file = tmp_path / "iq.csv"
+    # age is read as integers in the chunks without the empty cell
+    rows = ["sub-01,101,20", "sub-02,99,", "sub-03,103,30", "sub-04,104,40"]
+    columns = "participant_id,iq,age"
+    if derivative:
+        columns += ",ses,task,run,source_url"
+        rows = [f"{row},1,rest,1,http://example.org/{i}" for i, row in enumerate(rows)]
+    csv_file.write_text("\n".join([columns] + rows) + "\n")
+    json_map = _data_dictionary(csv_file, {"iq": "integer", "age": "float"})
+    args = ["-csv", str(csv_file), "-json_map", str(json_map), "-no_concepts"]
+    if derivative:
+        args += ["-derivative", str(_software(tmp_path))]
+
+    outputs = []
+    for extra_args in [["-format", "ttl-stream"], ["-chunksize", "2"]]:
+        out_dir = tmp_path / extra_args[0].lstrip("-")
+        out_dir.mkdir()
+        _run("csv2nidm", args + ["-out", str(out_dir / "nidm.ttl"), *extra_args])
+        outputs.append(_comparable(out_dir / "nidm.ttl"))
+    assert len(outputs[0]) > 0
+    assert isomorphic(*outputs)
+
+
+def test_csv2nidm_chunksize_derivative(tmp_path: Path, nidm_file: Path) -> None:
+    csv_file = tmp_path / "volumes.csv"
+    csv_file.write_text(
+        "participant_id,ses,task,run,source_url,volume\n"
+        "sub-01,1,rest,2,http://example.org/a,1.5\n"
+        "sub-02,2,rest,,http://example.org/b,2.5\n"
+        "sub-03,,rest,1,http://example.org/c,3\n"
+    )
+    json_map = _data_dictionary(csv_file, {"volume": "float"})
+    args = ["-csv", str(csv_file), "-json_map", str(json_map), "-no_concepts"]
+    args += ["-derivative", str(_software(tmp_path))]
+
+    outputs = []
+    for extra_args in [["-format", "ttl-stream"], ["-chunksize", "1"]]:
+        out_dir = tmp_path / extra_args[0].lstrip("-")
+        out_dir.mkdir()
+        copy = out_dir / "nidm.ttl"
+        copy.write_bytes(nidm_file.read_bytes())
+        _run("csv2nidm", args + ["-nidm", str(copy), *extra_args])
+        outputs.append(_comparable(copy))
+    assert len(outputs[0]) > len(_comparable(nidm_file))
+    assert isomorphic(*outputs)
+
+
+def test_build_subject_index_ignores_query_order(
+    nidm_file: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    indexes = []
+    for step in [1, -1]:
+        for name in [
+            "GetParticipantUUIDsForSubjectIDs",
+            "GetParticipantSessionNumbers",
+            "GetAcquisitionEntitiesTaskRun",
+        ]:
+            query = getattr(Query, name)
+            monkeypatch.setattr(
+                csv2nidm,
+                name,
+                lambda files, query=query, step=step: query(files).iloc[::step],
+            )
+        indexes.append(csv2nidm.build_subject_index(str(nidm_file)))
+    assert indexes[0].persons.sort_index().equals(indexes[1].persons.sort_index())
+    assert indexes[0].sessions == indexes[1].sessions
+    assert indexes[0].acquisitions == indexes[1].acquisitions
+    assert any(len(acqs) > 1 for acqs in indexes[0].acquisitions.values())
@@ -0,0 +1,56 @@
+from __future__ import annotations
+from pathlib import Path
+from click.testing import CliRunner
+import pytest
+from nidm.experiment.CDE import getCDEs
+from nidm.experiment.tools.nidm_cache import cache
+
+DATA_DIR = Path(__file__).parents[1] / "data" / "read_nidm"
+CDE_DIR = Path(__file__).parents[3] / "src" / "nidm" / "core" / "cde_dir"
+
+
+def test_cache_command(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("NIDM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(getCDEs, "cache", None)
+    files = []
+    for name in ["brainvol_nidm.ttl", "derivatives_nidm.ttl"]:
+        (tmp_path / name).write_bytes((DATA_DIR / name).read_bytes())
+        files.append(str(tmp_path / name))
+
+    runner = CliRunner()
+    r = runner.invoke(
+        cache,
+        [
+            "warm",
+            "-nl",
+            ",".join(files),
+            "-nc",
+            str(CDE_DIR / "fs_cde.ttl"),
+            "--jobs",
+            "2",
+        ],
+    )
+    assert r.exit_code == 0, r.output
+    names = sorted(p.name.split(".")[0] for p in (tmp_path / "cache").iterdir())
+    assert names == [
+        "cde_graph",
+        "nidm_cache",
+        "rdf_graph",
+        "rdf_graph",
+        "rdf_graph",
+        "rdf_union",
+    ]
+
+    r = runner.invoke(cache, ["stats"])
+    assert r.exit_code == 0, r.output
+    assert f"Cache directory: {tmp_path / 'cache'}" in r.output
+    assert "rdf_graph           3" in r.output
+
+    r = runner.invoke(cache, ["clear", "--kind", "rdf_union"])
+    assert r.exit_code == 0, r.output
+    assert "Removed 1 cache entries" in r.output
+
+    r = runner.invoke(cache, ["clear"])
+    assert r.exit_code == 0, r.output
+    assert "Removed 4 cache entries" in r.output
+    assert [p.name for p in (tmp_path / "cache").iterdir()] == ["nidm_cache.sqlite"]
@@ -0,0 +1,93 @@
+from __future__ import annotations
+from pathlib import Path
+from click.testing import CliRunner
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+from nidm.experiment import RDFStream
+from nidm.experiment.tools.nidm_concat import concat
+from nidm.experiment.tools.nidm_convert import convert
+
+DATA_DIR = Path(__file__).parents[1] / "data" / "read_nidm"
+
+
+@pytest.fixture
+def files(tmp_path: Path) -> list[str]:
+    result = []
+    for name in ["brainvol_nidm.ttl", "nidm_w_provenance.ttl"]:
+        (tmp_path / name).write_bytes((DATA_DIR / name).read_bytes())
+        result.append(str(tmp_path / name))
+    return result
+
+
+@pytest.mark.parametrize(
+    "output_format,compress,jobs",
+    [("turtle", False, 1), ("turtle", False, 2), ("nt", False, 1), ("nq", True, 2)],
+)
+def test_concat_formats(
+    files: list[str], tmp_path: Path, output_format: str, compress: bool, jobs: int
+) -> None:
+    expected = Graph()
+    for f in files:
+        expected.parse(f, format="turtle")
+
+    out_file = RDFStream.outputFilename(
+        str(tmp_path / "concat"), output_format, compress
+    )
+    args = ["-nl", ",".join(files), "-o", out_file, "--format", output_format]
+    args += ["--jobs", str(jobs)] + (["--gzip"] if compress else [])
+    r = CliRunner().invoke(concat, args)
+    assert r.exit_code == 0, r.output
+    assert RDFStream.isCompressed(out_file) == compress
+    assert isomorphic(RDFStream.parseFile(out_file), expected)
+
+
+@pytest.mark.parametrize("output_format,jobs", [("nt", 1), ("ttl-stream", 2)])
+def test_concat_streaming_deduplicates(
+    files: list[str], tmp_path: Path, output_format: str, jobs: int
+) -> None:
+    # the same file several times and a copy of it with other blank node labels
+    copy = tmp_path / "copy.ttl"
+    Graph().parse(files[1], format="turtle").serialize(copy, format="turtle")
+    nidm_files = files + [files[1], str(copy), files[1]]
+    # every input has blank nodes of its own, other triples are written once
+    expected = Graph()
+    for f in nidm_files:
+        expected.parse(f, format="turtle")
+    out_file = str(tmp_path / "concat.out")
+    r = CliRunner().invoke(
+        concat,
+        ["-nl", ",".join(nidm_files), "-o", out_file, "--format", output_format]
+        + ["--jobs", str(jobs)],
+    )
+    assert r.exit_code == 0, r.output
+
+    lines = [
+        line
+        for line in Path(out_file).read_text(encoding="utf-8").splitlines()
+        if not line.startswith("@prefix")
+    ]
+    assert len(lines) == len(set(lines)) == len(expected)
+    parsed = Graph().parse(out_file, format="nt" if output_format == "nt" else "ttl")
+    assert isomorphic(parsed, expected)
+
+
+def test_convert_streaming(files: list[str], tmp_path: Path) -> None:
+    r = CliRunner().invoke(
+        convert, ["-nl", files[0], "--format", "nt", "--gzip", "-out", str(tmp_path)]
+    )
+    assert r.exit_code == 0, r.output
+    converted = tmp_path / "brainvol_nidm.nt.gz"
+    assert RDFStream.isCompressed(str(converted))
+
+    # and back to turtle from the compressed file
+    (tmp_path / "turtle").mkdir()
+    r = CliRunner().invoke(
+        convert,
+        ["-nl", str(converted), "-t", "turtle", "-out", str(tmp_path / "turtle")],
+    )
+    assert r.exit_code == 0, r.output
+    assert isomorphic(
+        Graph().parse(tmp_path / "turtle" / "brainvol_nidm.ttl", format="turtle"),
+        Graph().parse(DATA_DIR / "brainvol_nidm.ttl", format="turtle"),
+    )
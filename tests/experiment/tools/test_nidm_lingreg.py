@@ -1,10 +1,28 @@
 from __future__ import annotations
 from pathlib import Path
+import re
 from click.testing import CliRunner
-import pytest
+from nidm.experiment.analysis import REGULARIZATION_ALPHAS
 from nidm.experiment.tools.nidm_linreg import linear_regression
 
 
+def _check_regularized(out: str, *names: str) -> None:
+    """
+    Checks the regularized model printed by nidm_linreg.  The penalty weight is
+    picked by cross-validation, so only the form of the output is checked.
+    """
+    alpha = re.search(
+        r"Alpha with maximum likelihood \(range: 0\.001 to 700\) = (\d+\.\d{6})\n", out
+    )
+    assert alpha is not None
+    assert min(abs(REGULARIZATION_ALPHAS - float(alpha.group(1)))) < 1e-6
+    number = r"-?\d+\.\d{6}\n"
+    assert re.search("Current Model Score = " + number, out)
+    for name in names:
+        assert re.search(f"{name} \t " + number, out)
+    assert re.search("Intercept: " + number, out)
+
+
 def test_simple_model(brain_vol_files: list[str]) -> None:
     runner = CliRunner()
     with runner.isolated_filesystem():
@@ -113,9 +131,6 @@ def test_model_with_contrasts(brain_vol_files: list[str]) -> None:
     )
 
 
-@pytest.mark.skip(
-    reason="regularization weights seem to be different depending on the platform"
-)
 def test_model_with_contrasts_reg_L1(brain_vol_files: list[str]) -> None:
     runner = CliRunner()
     with runner.isolated_filesystem():
@@ -143,17 +158,9 @@ def test_model_with_contrasts_reg_L1(brain_vol_files: list[str]) -> None:
     # check correct number of observations
     assert "No. Observations:                  53" in out
 
-    # check lasso regression
-    assert "Alpha with maximum likelihood (range: 1 to 700) = 43.000000" in out
-    assert "Current Model Score = 0.000000" in out
-    assert "ilx_0100400 	 -0.000000" in out
-    assert "DX_GROUP 	 0.000000" in out
-    assert "Intercept: 26.000000" in out
+    _check_regularized(out, "ilx_0100400", "DX_GROUP")
 
 
-@pytest.mark.skip(
-    reason="regularization weights seem to be different depending on the platform"
-)
 def test_model_with_contrasts_reg_L2(brain_vol_files: list[str]) -> None:
     runner = CliRunner()
     with runner.isolated_filesystem():
@@ -181,9 +188,4 @@ def test_model_with_contrasts_reg_L2(brain_vol_files: list[str]) -> None:
     # check correct number of observations
     assert "No. Observations:                  53" in out
 
-    # check lasso regression
-    assert "Alpha with maximum likelihood (range: 1 to 700) = 699.000000" in out
-    assert "Current Model Score = 0.017618" in out
-    assert "ilx_0100400 	 -0.148397" in out
-    assert "DX_GROUP 	 0.071356" in out
-    assert "Intercept: 28.951297" in out
+    _check_regularized(out, "ilx_0100400", "DX_GROUP")
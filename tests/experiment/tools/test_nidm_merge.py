@@ -0,0 +1,69 @@
+from __future__ import annotations
+from pathlib import Path
+from click.testing import CliRunner
+import pytest
+from rdflib import Literal, Namespace
+from nidm.experiment import RDFStream
+from nidm.experiment.tools.nidm_merge import merge
+
+NIIRI = Namespace("http://iri.nidash.org/")
+EX = Namespace("http://example.org/")
+
+PREFIXES = """
+@prefix prov: <http://www.w3.org/ns/prov#> .
+@prefix niiri: <http://iri.nidash.org/> .
+@prefix ndar: <https://ndar.nih.gov/api/datadictionary/v2/dataelement/> .
+@prefix sio: <http://semanticscience.org/ontology/sio.owl#> .
+@prefix ex: <http://example.org/> .
+"""
+
+
+def _nidm_file(path: Path, name: str, subject_ids: list[str]) -> str:
+    """NIDM file with an activity and an entity for each participant"""
+    ttl = [PREFIXES]
+    for i, subject_id in enumerate(subject_ids):
+        agent = f"niiri:{name}_agent{i}"
+        activity = f"niiri:{name}_act{i}"
+        ttl.append(
+            f'{agent} a prov:Agent, prov:Person ; ndar:src_subject_id "{subject_id}" .\n'
+            f"{activity} a prov:Activity ; prov:wasAssociatedWith {agent} ;\n"
+            f"    prov:qualifiedAssociation [ prov:agent {agent} ; prov:hadRole sio:Subject ] .\n"
+            f"niiri:{name}_ent{i} prov:wasGeneratedBy {activity} ; ex:about {agent} .\n"
+        )
+    nidm_file = path / f"{name}.ttl"
+    nidm_file.write_text("".join(ttl), encoding="utf-8")
+    return str(nidm_file)
+
+
+@pytest.mark.parametrize(
+    "output_format,compress", [("turtle", False), ("nt", False), ("ttl-stream", True)]
+)
+def test_merge_by_subject(tmp_path: Path, output_format: str, compress: bool) -> None:
+    files = [
+        _nidm_file(tmp_path, "a", ["sub-1", "sub-10"]),
+        _nidm_file(tmp_path, "b", ["sub-1", "sub-2"]),
+        _nidm_file(tmp_path, "c", ["sub-10"]),
+    ]
+    out_file = RDFStream.outputFilename(
+        str(tmp_path / "merged"), output_format, compress
+    )
+    args = ["-nl", ",".join(files), "-s", "-o", out_file, "--format", output_format]
+    r = CliRunner().invoke(merge, args + (["--gzip"] if compress else []))
+    assert r.exit_code == 0, r.output
+
+    g = RDFStream.parseFile(out_file)
+    # the agents of the first file's subjects are reused by the other files
+    assert set(g.subjects(None, Literal("sub-1"))) == {NIIRI["a_agent0"]}
+    assert set(g.subjects(None, Literal("sub-10"))) == {NIIRI["a_agent1"]}
+    assert (NIIRI["b_ent0"], EX["about"], NIIRI["a_agent0"]) in g
+    assert (NIIRI["c_ent0"], EX["about"], NIIRI["a_agent1"]) in g
+    assert not set(g.triples((NIIRI["b_agent0"], None, None)))
+    assert not set(g.triples((None, None, NIIRI["c_agent0"])))
+    # subjects that aren't in the first file keep their agent
+    assert set(g.subjects(None, Literal("sub-2"))) == {NIIRI["b_agent1"]}
+    assert (NIIRI["b_ent1"], EX["about"], NIIRI["b_agent1"]) in g
+    if output_format != "turtle":
+        # the triples of the merged agents are only written once
+        with RDFStream.openFile(out_file) as fp:
+            lines = [line for line in fp if not line.startswith(b"@prefix")]
+        assert len(lines) == len(g)